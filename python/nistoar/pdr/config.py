@@ -2,9 +2,10 @@
 Utilities for obtaining configuration data for services
 """
 from __future__ import print_function
-import os, sys, logging, json, yaml, collections, time, re
+import os, sys, logging, json, yaml, collections, time, re, threading
 import requests
 from urlparse import urlparse
+from copy import deepcopy
 
 from .exceptions import ConfigurationException
 
@@ -18,6 +19,8 @@ except ImportError:
 if not oar_home:
     oar_home = os.environ.get('OAR_HOME', '/app/pdr')
 
+log = logging.getLogger("pdr.config")
+
 def resolve_configuration(location):
     """
     return a dictionary for configuring the metadata service.  
@@ -175,12 +178,30 @@ def determine_default_logdir():
         out = "/tmp"
     return out
         
+DEF_CONFIG_TTL = 60             # seconds
+DEF_CONFIG_REQUEST_TIMEOUT = 10  # seconds
+
 class ConfigService(object):
     """
-    an interface to the configuration service
+    an interface to the configuration service.
+
+    Retrieved configurations are cached in memory; a cached configuration is 
+    returned by get() immediately.  Once it is older than the cache's 
+    time-to-live (TTL), it is refreshed in the background via a conditional 
+    request (using the ETag from the previous response).  If a cache directory 
+    is provided, the last successfully retrieved configuration for each 
+    component is also saved there as a snapshot; a snapshot is used like a 
+    cached copy, so get() only waits on the service when it has nothing saved
+    to return.  
+
+    Components can register to be notified when their configuration changes 
+    (see watch()); changes are detected either when get() refreshes the 
+    configuration or via a periodic background refresh (see 
+    start_auto_refresh()).  
     """
 
-    def __init__(self, urlbase, envprof=None):
+    def __init__(self, urlbase, envprof=None, cachedir=None, ttl=DEF_CONFIG_TTL,
+                 timeout=DEF_CONFIG_REQUEST_TIMEOUT):
         """
         initialize the service.
         :param urlbase str:  the base URL for the service which must include 
@@ -190,11 +211,30 @@ class ConfigService(object):
         :param envprof str:  the label indicating the default environment 
                              profile (usually, one of 'local', 'dev', 'test',
                              or 'prod').
+        :param cachedir str: a directory where snapshots of retrieved 
+                             configurations can be saved.  If None, snapshots
+                             will not be saved.  
+        :param ttl float:    the number of seconds a retrieved configuration 
+                             may be used before it is refreshed from the service;
+                             a value of 0 or less triggers a (background) check 
+                             with the service on every call to get().
+        :param timeout float: the number of seconds to wait for the service to 
+                             respond to a request.  
         """
         self._base = urlbase
         self._prof = envprof
         if not self._base.endswith('/'):
             self._base += '/'
+        self.cachedir = cachedir
+        self.ttl = ttl
+        self.timeout = timeout
+
+        self._cache = {}
+        self._listeners = {}
+        self._lock = threading.RLock()
+        self._session = requests.Session()
+        self._refresher = None
+        self._updating = {}
 
         u = urlparse(self._base)
         msg = "Insufficient config service URL: "+self._base+" ({0})"
@@ -226,7 +266,7 @@ class ConfigService(object):
         return true if the service appears to be up.  
         """
         try:
-            resp = requests.get(self.url_for("ready"))
+            resp = self._session.get(self.url_for("ready"), timeout=self.timeout)
             return resp.status_code and resp.status_code < 500
         except requests.exceptions.RequestException:
             return False
@@ -254,13 +294,16 @@ class ConfigService(object):
         if verboseout:
             print("PDR: Waiting for configuration service...", file=verboseout)
 
+        # poll quickly at first, backing off to every 2 seconds
         updated = start
+        wait = 0.25
         while time.time()-start < timeout:
             if verboseout and time.time()-updated > 10:
                 print("PDR: ...waiting...")
                 updated = time.time()
                 
-            time.sleep(2)
+            time.sleep(min(wait, max(timeout-(time.time()-start), 0)))
+            wait = min(2*wait, 2)
             
             if self.is_up():
                 if verboseout:
@@ -275,13 +318,23 @@ class ConfigService(object):
         return False
         
 
-    def get(self, component, envprof=None, flat=False):
+    def get(self, component, envprof=None, flat=False, refresh=False):
         """
         retrieve the configuration for the service or component with the 
         given name.  Internally, this will transform the raw output from 
         the service into a configuration ready to give to the PDR component
         (including combining the profile specializations with default values).
 
+        A cached copy of the configuration retrieved from the service is 
+        returned without waiting on the service; if it is older than the 
+        configured TTL, an update is requested from the service in the 
+        background.  The service is consulted directly if nothing has yet been 
+        retrieved from it--i.e. nothing is cached or only a snapshot (saved by 
+        an earlier process) is available--or if refresh is True; if it then 
+        cannot be reached, the cached copy or snapshot is returned, if available.
+        (After one failed attempt, a snapshot is treated like any other stale 
+        cached copy.)
+
         :param component str: the name for the service or component that 
                               configuration data is desired for
         :param envprof   str: the desired version of the configuration given 
@@ -290,18 +343,237 @@ class ConfigService(object):
                               be assumed.
         :param flat     bool: if true, keep the flat structure provided directly
                               by the config server.
+        :param refresh  bool: if true, wait for a check with the service for an
+                              update regardless of the age of the cached copy.
         :return dict:  the parsed configuration data 
         """
+        url = self.url_for(component, envprof)
+        with self._lock:
+            entry = self._cache.get(url)
+            if entry is None:
+                entry = self._load_snapshot(component, envprof, url)
+
+            # a snapshot-only entry is returned without first consulting the 
+            # service only if a previous attempt to do so failed
+            if entry and not refresh and (entry['fetched'] or entry.get('tried')):
+                if time.time() - entry['fetched'] >= self.ttl:
+                    self._update_in_background(component, envprof, url)
+                return self._parsed(entry, component, flat)
+
+        # the service is not contacted while holding the lock so that other 
+        # threads can continue to get cached configurations
         try:
-            resp = requests.get(self.url_for(component, envprof))
+            entry = self._fetch(component, envprof, url, entry)
+        except ConfigurationException as ex:
+            if not entry:
+                raise
+            log.warning("Using cached configuration for %s: %s", component, str(ex))
+            with self._lock:
+                entry['tried'] = True
+
+        with self._lock:
+            return self._parsed(entry, component, flat)
+
+    def _update_in_background(self, component, envprof, url):
+        # start a thread to refresh the given configuration unless one is 
+        # already running; this must be called while holding the lock.
+        if url in self._updating:
+            return
+
+        def update():
+            try:
+                self._fetch(component, envprof, url, self._cache.get(url))
+            except ConfigurationException as ex:
+                log.warning("Failed to refresh configuration for %s: %s", component, str(ex))
+            finally:
+                with self._lock:
+                    self._updating.pop(url, None)
+
+        thrd = threading.Thread(target=update, name="config-update")
+        thrd.daemon = True
+        self._updating[url] = thrd
+        thrd.start()
+
+    def wait_for_updates(self, timeout=None):
+        """
+        wait for any background updates of cached configurations to complete
+        """
+        with self._lock:
+            updating = list(self._updating.values())
+        for thrd in updating:
+            thrd.join(timeout)
+
+    def _parsed(self, entry, component, flat):
+        key = (flat and 'flat') or 'inflated'
+        if key not in entry:
+            entry[key] = self._extract(deepcopy(entry['data']), component, flat)
+        return deepcopy(entry[key])
+
+    def _fetch(self, component, envprof, url, entry=None):
+        # retrieve the raw configuration data from the service; if an entry is 
+        # given, a conditional request is made and the entry is returned (with 
+        # an updated fetch time) if the data has not changed.  This must be 
+        # called without holding the lock.
+        hdrs = {}
+        if entry and entry.get('etag'):
+            hdrs['If-None-Match'] = entry['etag']
+        try:
+            resp = self._session.get(url, headers=hdrs, timeout=self.timeout)
+            if resp.status_code == 304 and entry:
+                with self._lock:
+                    entry['fetched'] = time.time()
+                return entry
             resp.raise_for_status()
-            return self._extract(resp.json(), component, flat)
+            data = resp.json()
         except ValueError as ex:
             raise ConfigurationException("Config service response: "+str(ex))
         except requests.exceptions.RequestException as ex:
             raise ConfigurationException("Failed to access configuration for "+
                                          component + ": " + str(ex))
 
+        # make sure the data is usable before caching it
+        self._extract(deepcopy(data), component)
+
+        with self._lock:
+            # compare against the latest cached copy in case another thread 
+            # updated it while this one waited on the service
+            entry = self._cache.get(url, entry)
+            changed = entry is not None and entry['data'] != data
+            if entry is not None and not changed:
+                entry['fetched'] = time.time()
+                entry['etag'] = resp.headers.get('ETag')
+                return entry
+
+            entry = { 'data': data, 'etag': resp.headers.get('ETag'), 'fetched': time.time() }
+            self._cache[url] = entry
+            self._save_snapshot(component, envprof, url, entry)
+        if changed:
+            self._notify(component, envprof, entry)
+        return entry
+
+    def _snapshot_file(self, component, envprof):
+        if not envprof:
+            envprof = self._prof
+        name = component
+        if envprof:
+            name += "-" + envprof
+        return os.path.join(self.cachedir, re.sub(r'[^\w\.\-]', '_', name) + ".json")
+
+    def _load_snapshot(self, component, envprof, url):
+        if not self.cachedir:
+            return None
+        snapf = self._snapshot_file(component, envprof)
+        if not os.path.isfile(snapf):
+            return None
+        try:
+            with open(snapf) as fd:
+                snap = json.load(fd)
+            if snap.get('url') != url:
+                return None
+            # a snapshot is always considered stale so that it gets refreshed
+            entry = { 'data': snap['data'], 'etag': snap.get('etag'), 'fetched': 0 }
+        except (IOError, ValueError, KeyError) as ex:
+            log.warning("Unable to read configuration snapshot, %s: %s", snapf, str(ex))
+            return None
+        self._cache[url] = entry
+        return entry
+
+    def _save_snapshot(self, component, envprof, url, entry):
+        if not self.cachedir:
+            return
+        snapf = self._snapshot_file(component, envprof)
+        try:
+            if not os.path.exists(self.cachedir):
+                os.makedirs(self.cachedir)
+            tmpf = snapf + ".tmp"
+            with open(tmpf, 'w') as fd:
+                json.dump({ 'url': url, 'etag': entry['etag'], 'saved': time.time(),
+                            'data': entry['data'] }, fd, indent=2)
+            os.rename(tmpf, snapf)
+        except (IOError, OSError) as ex:
+            log.warning("Unable to save configuration snapshot, %s: %s", snapf, str(ex))
+
+    def has_snapshot(self, component, envprof=None):
+        """
+        return True if a snapshot of the configuration for the given component
+        has been previously saved to the cache directory.  When this is True,
+        get() can return a configuration even if the service is not up.
+        """
+        return bool(self.cachedir) and os.path.isfile(self._snapshot_file(component, envprof))
+
+    def watch(self, component, listener, envprof=None, flat=False):
+        """
+        register a function to be called when the configuration for the given 
+        component changes.  The function will be called with two arguments:  the
+        component name and its new configuration data.  
+
+        :param component str:  the name of the component to watch
+        :param listener func:  the function to call
+        :param envprof   str:  the environment/profile name of the configuration 
+                               to watch (defaults to that set at construction)
+        :param flat     bool:  if true, pass the configuration to the listener in 
+                               its flat form.
+        """
+        url = self.url_for(component, envprof)
+        with self._lock:
+            self._listeners.setdefault(url, []).append((component, envprof, listener, flat))
+
+    def unwatch(self, component, listener, envprof=None):
+        """
+        unregister a function previously registered via watch()
+        """
+        url = self.url_for(component, envprof)
+        with self._lock:
+            self._listeners[url] = [l for l in self._listeners.get(url, []) if l[2] != listener]
+
+    def _notify(self, component, envprof, entry):
+        # listeners are called without holding the lock
+        with self._lock:
+            listeners = list(self._listeners.get(self.url_for(component, envprof), []))
+        for comp, prof, listener, flat in listeners:
+            try:
+                with self._lock:
+                    cfg = self._parsed(entry, component, flat)
+                listener(component, cfg)
+            except Exception as ex:
+                log.exception("Configuration listener failed for %s: %s", component, str(ex))
+
+    def refresh(self):
+        """
+        check the service for updates to all watched configurations, notifying 
+        listeners of any changes.
+        """
+        with self._lock:
+            watched = [(l[0][0], l[0][1]) for l in self._listeners.values() if l]
+        for comp, prof in watched:
+            try:
+                self.get(comp, prof, refresh=True)
+            except ConfigurationException as ex:
+                log.warning("Failed to refresh configuration for %s: %s", comp, str(ex))
+
+    def start_auto_refresh(self, interval=None):
+        """
+        start a background thread that periodically checks for updates to all 
+        watched configurations (see watch()).  
+
+        :param interval float:  the number of seconds between checks; if not 
+                                provided, the cache TTL is used.  
+        """
+        if self._refresher and self._refresher.is_alive():
+            return
+        if not interval:
+            interval = max(self.ttl, 1)
+        self._refresher = _ConfigRefresher(self, interval)
+        self._refresher.start()
+
+    def stop_auto_refresh(self):
+        """
+        stop the background thread started by start_auto_refresh()
+        """
+        if self._refresher:
+            self._refresher.stop()
+            self._refresher = None
+
     def _extract(self, rawdata, comp="unknown", flat=False):
         return self.__class__.extract(rawdata, comp, flat)
 
@@ -392,16 +664,35 @@ class ConfigService(object):
         or None if the proper environment is not set up.  To return an instance,
         the OAR_CONFIG_SERVICE environment variable needs to contain the 
         service's base URL.  If OAR_CONFIG_ENV is set, it will be taken as 
-        the environment/platform label.  
+        the environment/platform label.  If OAR_CONFIG_CACHE_DIR is set, 
+        configuration snapshots will be saved there, and OAR_CONFIG_TTL can
+        set the cache time-to-live (in seconds).  
 
         :raise ConfigurationException: if base URL in OAR_CONFIGSERVICE is 
                                        malformed.
         """
         if 'OAR_CONFIG_SERVICE' in os.environ:
             prof = os.environ.get('OAR_CONFIG_ENV')
-            return ConfigService(os.environ['OAR_CONFIG_SERVICE'], prof)
+            ttl = float(os.environ.get('OAR_CONFIG_TTL', DEF_CONFIG_TTL))
+            return ConfigService(os.environ['OAR_CONFIG_SERVICE'], prof,
+                                 os.environ.get('OAR_CONFIG_CACHE_DIR'), ttl)
         return None
 
+class _ConfigRefresher(threading.Thread):
+    def __init__(self, service, interval):
+        super(_ConfigRefresher, self).__init__(name="ConfigRefresher")
+        self.daemon = True
+        self.service = service
+        self.interval = interval
+        self._stop_evt = threading.Event()
+
+    def stop(self):
+        self._stop_evt.set()
+
+    def run(self):
+        while not self._stop_evt.wait(self.interval):
+            self.service.refresh()
+
 service = None
 try:
     service = ConfigService.from_env()
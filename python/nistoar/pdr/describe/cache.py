@@ -0,0 +1,198 @@
+"""
+a module providing a local, persistent cache of NERDm records retrieved from
+the Resource Metadata Manager (RMM).
+
+The CachingMetadataClient wraps a MetadataClient (see rmm.py) and saves each
+record it retrieves to a cache directory.  A cached record is returned as-is
+until it is older than the cache's time-to-live (TTL); after that, it is
+revalidated with the RMM via a conditional GET request so that an unchanged
+record is not downloaded again, while a record that has changed (e.g. because
+the dataset was republished) replaces the cached copy.  The number of cached
+records is bounded; when the bound is exceeded, the least recently used
+records are evicted.
+"""
+import os, re, time, hashlib, threading, logging
+from collections import OrderedDict
+from copy import deepcopy
+
+from .rmm import describe_concurrently
+from ..exceptions import IDNotFound, PDRServerError
+from .. import utils
+from .. import PDRSystem
+
+log = logging.getLogger(PDRSystem().system_abbrev).getChild("describe")
+
+DEF_TTL = 600
+DEF_MAX_ENTRIES = 2000
+
+_safeid = re.compile(r'^[\w\.\-]+$')
+
+class CachingMetadataClient(object):
+    """
+    a MetadataClient that caches the records it retrieves on local disk.  It
+    supports the describe() and describe_many() methods of MetadataClient.
+    """
+
+    def __init__(self, client, cachedir, ttl=DEF_TTL, max_entries=DEF_MAX_ENTRIES,
+                 serve_stale=True):
+        """
+        wrap a MetadataClient with a cache.
+
+        :param MetadataClient client:  the client to use to retrieve records
+                                  from the RMM
+        :param str cachedir:      the directory to cache records in; it will
+                                  be created if it does not exist.
+        :param int ttl:           the time, in seconds, that a cached record
+                                  is returned without revalidating it with
+                                  the RMM
+        :param int max_entries:   the maximum number of records to keep in the
+                                  cache; if <= 0, the number is not limited.
+        :param bool serve_stale:  if True, a cached record that cannot be
+                                  revalidated because the RMM cannot be reached
+                                  will be returned anyway (with a warning).
+        """
+        self.cli = client
+        self.cachedir = cachedir
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.serve_stale = serve_stale
+        if not os.path.exists(self.cachedir):
+            try:
+                os.makedirs(self.cachedir)
+            except OSError:
+                if not os.path.isdir(self.cachedir):
+                    raise
+        self._evictlock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config, client, cachedir):
+        """
+        create a cache from the given metadata service configuration (which
+        may include the "cache_ttl" and "cache_max_entries" parameters)
+        """
+        return cls(client, cachedir, config.get('cache_ttl', DEF_TTL),
+                   config.get('cache_max_entries', DEF_MAX_ENTRIES))
+
+    @property
+    def baseurl(self):
+        return self.cli.baseurl
+
+    def _file_for(self, id):
+        if _safeid.match(id):
+            name = id
+        else:
+            name = hashlib.sha1(id.encode('utf-8')).hexdigest()
+        return os.path.join(self.cachedir, name+".json")
+
+    def _load(self, id):
+        cf = self._file_for(id)
+        if not os.path.exists(cf):
+            return None
+        try:
+            return utils.read_json(cf)
+        except (IOError, ValueError) as ex:
+            log.warning("Ignoring unreadable cached record for %s: %s", id, str(ex))
+            return None
+
+    def _save(self, id, entry):
+        cf = self._file_for(id)
+        tmp = "%s.%d.%d.tmp" % (cf, os.getpid(), threading.current_thread().ident)
+        utils.write_json(entry, tmp, compact=True)
+        os.rename(tmp, cf)
+
+    def describe(self, id):
+        """
+        return the NERDm metadata describing the data entity with the given
+        ID, consulting the cache first.
+        """
+        entry = self._load(id)
+        now = time.time()
+        if entry and now - entry.get('fetched', 0) <= self.ttl:
+            self._touch(id)
+            return deepcopy(entry['data'])
+
+        try:
+            if entry:
+                data, etag, lastmod = self.cli.revalidate(id, entry.get('etag'),
+                                                          entry.get('last_modified'))
+                if data is None:
+                    # unchanged
+                    data = entry['data']
+            else:
+                data, etag, lastmod = self.cli.revalidate(id)
+        except IDNotFound:
+            self.invalidate(id)
+            raise
+        except PDRServerError as ex:
+            if not entry or not self.serve_stale:
+                raise
+            log.warning("Unable to revalidate cached record for %s (using stale copy): %s",
+                        id, str(ex))
+            return deepcopy(entry['data'])
+
+        self._save(id, OrderedDict([("id", id), ("fetched", now), ("etag", etag),
+                                    ("last_modified", lastmod), ("data", data)]))
+        if not entry:
+            self._evict()
+        return deepcopy(data)
+
+    def describe_many(self, ids, max_workers=4):
+        """
+        return the NERDm metadata describing each of the data entities with
+        the given IDs, retrieving those not freshly cached concurrently.
+
+        :return OrderedDict:  the NERDm records keyed by the given IDs, in the
+                              order given; IDs that were not found are left out.
+        """
+        return describe_concurrently(self.describe, ids, max_workers)
+
+    def invalidate(self, id):
+        """
+        remove the record with the given ID from the cache
+        """
+        try:
+            os.remove(self._file_for(id))
+        except OSError:
+            pass
+
+    def _touch(self, id):
+        # mark the record as recently used
+        try:
+            os.utime(self._file_for(id), None)
+        except OSError:
+            pass
+
+    def _entries(self):
+        return [f for f in os.listdir(self.cachedir) if f.endswith(".json")]
+
+    def _evict(self):
+        # remove the least recently used records beyond the maximum
+        if self.max_entries <= 0:
+            return
+        with self._evictlock:
+            files = self._entries()
+            if len(files) <= self.max_entries:
+                return
+            files = [os.path.join(self.cachedir, f) for f in files]
+            aged = []
+            for f in files:
+                try:
+                    aged.append((os.stat(f).st_mtime, f))
+                except OSError:
+                    pass
+            aged.sort()
+            for mtime, f in aged[:len(aged)-self.max_entries]:
+                try:
+                    os.remove(f)
+                except OSError:
+                    pass
+
+    def purge(self):
+        """
+        remove all records from the cache
+        """
+        for f in self._entries():
+            try:
+                os.remove(os.path.join(self.cachedir, f))
+            except OSError:
+                pass
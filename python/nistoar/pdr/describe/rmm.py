@@ -2,8 +2,8 @@
 a module for accessing public metadata about PDR objects via the Resource 
 Metadata Manager (RMM).  
 """
-import os, sys, shutil, logging, json
-from collections import OrderedDict
+import os, sys, shutil, logging, json, threading
+from collections import OrderedDict, deque
 
 import requests
 
@@ -11,24 +11,60 @@ from ..exceptions import PDRServiceException, PDRServerError, IDNotFound
 
 class MetadataClient(object):
     """
-    a client interface for retrieving metadata from the RMM
+    a client interface for retrieving metadata from the RMM.  Connections to
+    the service are kept open and reused (one set per thread).  
     """
     def __init__(self, baseurl):
         self.baseurl = baseurl
         if not self.baseurl.endswith('/'):
             self.baseurl += '/'
+        self._local = threading.local()
+
+    @property
+    def _session(self):
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        return self._local.session
 
     def describe(self, id):
         """
         return the NERDm metadata describing the data entity with the given
         ID.  
         """
+        return self.revalidate(id)[0]
+
+    def revalidate(self, id, etag=None, last_modified=None):
+        """
+        retrieve the NERDm metadata describing the data entity with the given
+        ID only if it has changed since it was last retrieved (as indicated by 
+        the given validators taken from the previous retrieval).  
+
+        :param str id:             the identifier of the data entity
+        :param str etag:           the ETag header value returned previously
+        :param str last_modified:  the Last-Modified header value returned
+                                   previously
+        :return tuple:  a 3-tuple containing the NERDm record--or None if the 
+                        server indicates that it has not changed--, the ETag,
+                        and the Last-Modified values (either of which may be 
+                        None if the server does not provide them).
+        """
         url = None
         if id.startswith("ark:"):
             url = self._url_for_pdr_id(id)
         else:
             url = self._url_for_ediid(id)
-        out = self._retrieve(url, id)
+
+        hdrs = {}
+        if etag:
+            hdrs['If-None-Match'] = etag
+        if last_modified:
+            hdrs['If-Modified-Since'] = last_modified
+        out, resphdrs = self._retrieve(url, id, hdrs)
+        validators = (resphdrs.get('ETag') or etag,
+                      resphdrs.get('Last-Modified') or last_modified)
+        if out is None:
+            return (None,) + validators
+
         if "ResultData" in out:
             out = out["ResultData"]
             if len(out) == 0:
@@ -36,7 +72,23 @@ class MetadataClient(object):
             out = out[0]
         if "_id" in out:
             del out['_id']
-        return out
+        return (out,) + validators
+
+    def describe_many(self, ids, max_workers=4):
+        """
+        return the NERDm metadata describing each of the data entities with
+        the given IDs, retrieving them concurrently.  
+
+        :param list   ids:       the identifiers of the entities to describe
+        :param int max_workers:  the maximum number of records to retrieve at
+                                 once
+        :return OrderedDict:  the NERDm records keyed by the given IDs, in the 
+                              order given; IDs that were not found are left out.
+        :raises PDRServiceException:  if any of the records could not be 
+                                 retrieved for a reason other than not 
+                                 being found.
+        """
+        return describe_concurrently(self.describe, ids, max_workers)
 
     def _url_for_pdr_id(self, id):
         return self.baseurl + "records?@id=" + id
@@ -44,10 +96,13 @@ class MetadataClient(object):
     def _url_for_ediid(self, id):
         return self.baseurl + "records/" + id
 
-    def _retrieve(self, url, id):
-        hdrs = { "Accept": "application/json" }
+    def _retrieve(self, url, id, hdrs=None):
+        # return the parsed JSON response (or None if the server responds with
+        # 304, Not Modified) along with the response headers
+        hdrs = dict(hdrs or {})
+        hdrs["Accept"] = "application/json"
         try:
-            resp = requests.get(url, headers=hdrs)
+            resp = self._session.get(url, headers=hdrs)
 
             if resp.status_code >= 500:
                 raise RMMServerError(id, resp.status_code, resp.reason)
@@ -59,6 +114,8 @@ class MetadataClient(object):
                                          " this URL (is URL correct?)")
             elif resp.status_code >= 400:
                 raise RMMClientError(id, resp.status_code, resp.reason)
+            elif resp.status_code == 304:
+                return None, resp.headers
             elif resp.status_code != 200:
                 raise RMMServerError(id, resp.status_code, resp.reason,
                                message="Unexpected response from server: {0} {1}"
@@ -73,7 +130,7 @@ class MetadataClient(object):
                 raise RMMServerError(id, message="Unexpected response: "+
                                      out['Message'])
                 
-            return out
+            return out, resp.headers
         except ValueError as ex:
             if resp.text and ("<body" in resp.text or "<BODY" in resp.text):
                 raise RMMServerError(id,
@@ -88,6 +145,45 @@ class MetadataClient(object):
                                  message="Trouble connecting to distribution"
                                  +" service: "+ str(ex), cause=ex)
 
+def describe_concurrently(describe, ids, max_workers=4):
+    """
+    apply a describe function to each of the given IDs using a bounded number
+    of threads, returning the results as an OrderedDict keyed by ID (in the 
+    order given).  IDs that raise IDNotFound are left out of the results; any
+    other exception is raised once all the threads have finished.  
+    """
+    ids = list(OrderedDict([(id, True) for id in ids]).keys())
+    todo = deque(ids)
+    found = {}
+    errors = []
+
+    def work():
+        while not errors:
+            try:
+                id = todo.popleft()
+            except IndexError:
+                return
+            try:
+                found[id] = describe(id)
+            except IDNotFound:
+                pass
+            except Exception as ex:
+                errors.append(ex)
+
+    if max_workers < 2 or len(ids) < 2:
+        work()
+    else:
+        threads = [threading.Thread(target=work) for i in range(min(max_workers, len(ids)))]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        for t in threads:
+            t.join()
+    if errors:
+        raise errors[0]
+
+    return OrderedDict([(id, found[id]) for id in ids if id in found])
+
             
 class RMMServerError(PDRServerError):
     """
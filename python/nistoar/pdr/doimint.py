@@ -1,11 +1,12 @@
 """
 Module providing client-side support for the RMM ingest service.  
 """
-import os, sys, shutil, logging, json
-from collections import Mapping, Sequence, OrderedDict
+import os, sys, shutil, logging, json, threading, time
+from collections import Mapping, Sequence, OrderedDict, deque
 
 from .exceptions import (StateException, ConfigurationException, PDRException, NERDError)
 from .utils import write_json, read_nerd, read_json
+from . import validation
 from ..doi import datacite as dc
 from ..pdr import def_jq_libdir, def_schema_dir
 from .. import jq
@@ -88,9 +89,18 @@ class DOIMintingClient(object):
 
         jqlib = self._cfg.get('jq_lib', def_jq_libdir)
         self._jqt = jq.Jq('datacite::resource2datacite', jqlib, ["nerdm2datacite:datacite"])
-
-    def _nerd2dc(self, nerdm, validate=False):
-        # convert a nerdm record to datacite.  This will do some basic checks on the nerdm record
+        self._jqtbatch = jq.Jq('map(datacite::resource2datacite)', jqlib, ["nerdm2datacite:datacite"])
+
+        # parameters controlling batch submission (submit_all())
+        self._submit_threads = max(int(self._cfg.get('submit_threads', 1)), 1)
+        self._submit_retries = max(int(self._cfg.get('submit_retries', 0)), 0)
+        self._retry_delay = float(self._cfg.get('retry_delay', 5.0))
+        self._throttle = None
+        if self._cfg.get('max_request_rate'):
+            self._throttle = RateLimiter(float(self._cfg['max_request_rate']))
+
+    def _check_nerdm(self, nerdm, validate=False):
+        # do some basic checks on the nerdm record to ensure that it can be converted to datacite
         schema = nerdm.get('_schema')
         if not schema:
             schema = nerdm.get('$schema','')
@@ -101,7 +111,7 @@ class DOIMintingClient(object):
 
         if validate:
             try:
-                valid8r = valid8.create_validator(self._cfg.get('schema_dir', def_schema_dir), nerdm)
+                valid8r = validation.get_validator(self._cfg.get('schema_dir', def_schema_dir), nerdm)
                 valid8r.validate(nerdm, strict=True, raiseex=True)
             except valid8.ValidationError as ex:
                 raise NERDError("Input record (id=%s) is not a valid record" % nerdm.get("@id"), ex)
@@ -118,12 +128,29 @@ class DOIMintingClient(object):
             if missing:
                 raise NERDError("NERDm record is missing properties: "+str(missing))
 
+    def _nerd2dc(self, nerdm, validate=False):
+        # convert a nerdm record to datacite.  This will do some basic checks on the nerdm record
+        self._check_nerdm(nerdm, validate)
+
         try:
             return self._jqt.transform(json.dumps(nerdm))
         except RuntimeError as ex:
             raise NERDError("NERDm record (id=%s) not transformable: %s" %
                             (nerdm.get("@id"), str(ex)), ex)
 
+    def _nerds2dc(self, nerdms, validate=False):
+        # convert a list of nerdm records to datacite in a single pass of the jq transform
+        for nerdm in nerdms:
+            self._check_nerdm(nerdm, validate)
+
+        try:
+            out = self._jqtbatch.transform(json.dumps(nerdms))
+        except RuntimeError as ex:
+            raise NERDError("NERDm records not transformable (as batch): %s" % str(ex), ex)
+        if not isinstance(out, list) or len(out) != len(nerdms):
+            raise NERDError("Unexpected output from batch conversion to DataCite")
+        return out
+
     def stage(self, record, publish=None, name=None, validate=False):
         """
         convert the given NERDm record to a DataCite metadata submission and 
@@ -139,19 +166,51 @@ class DOIMintingClient(object):
         :except NERDError:  if there is a problem with the input NERDm record--
                             i.e. it is invalid or otherwise insufficient
         """
+        name = self._stage_name_for(record, name)
+        self._write_staged(self._nerd2dc(record, validate), name, publish)
+
+    def stage_all(self, records, publish=None, validate=False):
+        """
+        convert the given NERDm records to DataCite metadata submissions and
+        file them in the staging area for later submission to DataCite.  This 
+        is more efficient than calling stage() for each record as the 
+        conversions to DataCite are done together in a single pass.  
+        Each record will be given its default name (see stage()).
+
+        :param list records:  the NERDm record objects to be staged
+        :param bool publish:  if True, submit the records to be set to the 
+                              published state; otherwise, they will just be 
+                              reserved.  
+        :return list:  the names given to the staged records, in the order of 
+                       the input records
+        :except NERDError:  if there is a problem with any of the input NERDm 
+                            records; in this case, none of the records will be
+                            staged.
+        """
+        names = [self._stage_name_for(r) for r in records]
+        if not names:
+            return names
+
+        dcmds = self._nerds2dc(records, validate)
+        for name, dcmd in zip(names, dcmds):
+            self._write_staged(dcmd, name, publish)
+        return names
+
+    def _stage_name_for(self, record, name=None):
         if not isinstance(record, Mapping):
             raise TypeError("stage(): record not a JSON object; got "+
-                            type(record))
+                            str(type(record)))
         if not record.get('@id'):
             raise NERDError("Input does not look like a valid NERDm record; "+
                             "missing @id")
         if not name:
             name = os.path.split(record.get('@id'))[-1]
+        return name
 
+    def _write_staged(self, dcmd, name, publish=None):
         if publish is None:
             publish = self._publish_by_default
 
-        dcmd = self._nerd2dc(record, validate)
         if publish:
             dcmd['event'] = "publish"
         elif 'event' in dcmd:
@@ -288,7 +347,12 @@ class DOIMintingClient(object):
         self.log.debug("%s metadata for doi:%s",
                        (rec.get('event') == 'publish' and "Publishing") or "Submitting", rec['doi'])
 
+        if self._throttle:
+            self._throttle.wait()
         doi = self.dccli.lookup(rec['doi'], relax=True)
+
+        if self._throttle:
+            self._throttle.wait()
         if doi.exists:
             if rec.get('event') == 'publish' and doi.state != dc.STATE_FINDABLE:
                 self.log.debug("doi:%s: publishing currently %s record", rec['doi'], doi.state)
@@ -306,33 +370,107 @@ class DOIMintingClient(object):
                 doi.reserve(rec)
 
 
-    def submit_all(self):
+    def submit_all(self, threads=None):
         """
-        submit all staged datacite records to the datacite service.
-
+        submit all staged datacite records to the datacite service.  
+
+        Records are submitted concurrently using a pool of threads when the 'submit_threads' 
+        config parameter (or the threads argument) is greater than 1.  Requests to DataCite
+        are throttled to the rate set by the 'max_request_rate' config parameter (in requests
+        per second), and records that fail due to a service or communication error are put 
+        back on the queue to be tried again up to 'submit_retries' times (after a delay of 
+        'retry_delay' seconds).  Records that still fail after all retries are listed as 
+        'failed'.  
+
+        :param int threads:  the number of threads to submit records with; if not provided,
+                             the 'submit_threads' config parameter will be used.
         :return dict:  3 lists accessed via the keys, 'succeeded', 'failed', 
                           'skipped', each listing the names of records that 
                           ended up in that state after submitting all to the 
                           ingest service.
         """
-        succeeded = []
-        failed = []
-        skipped = []
-        for rec in self.staged_names():
-            try:
-                self.submit_staged(rec)
-                succeeded.append(rec)
-            except dc.DOIResolverError as ex:
-                failed.append(rec)
+        if not self.dccli:
+            raise ConfigurationException("No service endpoint provided in "+
+                                         "configuration (service_endpoint)")
+        if threads is None:
+            threads = self._submit_threads
+        threads = max(threads, 1)
+
+        # each queue item is (name, number of attempts so far, earliest time for next attempt)
+        queue = deque([(n, 0, 0) for n in self.staged_names()])
+        out = {
+            "succeeded": [],
+            "failed": [],
+            "skipped": []
+        }
+        errors = []
+        lock = threading.Condition()
+        state = { "active": 0 }
+
+        def next_item():
+            with lock:
+                while True:
+                    if errors:
+                        return None
+                    if queue:
+                        if queue[0][2] <= time.time():
+                            state['active'] += 1
+                            return queue.popleft()
+                        # wait until the next retry is due (or something is put back on the queue)
+                        lock.wait(max(queue[0][2] - time.time(), 0.01))
+                    elif state['active'] > 0:
+                        # other threads may yet put items back on the queue
+                        lock.wait(0.5)
+                    else:
+                        return None
+
+        def work():
+            while True:
+                item = next_item()
+                if not item:
+                    break
+
+                name, attempts, _ = item
+                result = None
+                try:
+                    self.submit_staged(name)
+                    result = "succeeded"
+                except (dc.DOIResolverError, dc.DOICommunicationError) as ex:
+                    if isinstance(ex, dc.DOIClientException) or attempts >= self._submit_retries:
+                        result = "failed"
+                    else:
+                        self.log.info("%s: requeuing for submission (attempts so far: %d)",
+                                      name, attempts+1)
+                except Exception as ex:
+                    # Let DOIClientException and other PDR exceptions break the loop, 
+                    # because it's probably a programming error somewhere.
+                    if threads > 1:
+                        self.log.exception("%s: unexpected error during submission: %s", name, str(ex))
+                    with lock:
+                        errors.append(ex)
+                finally:
+                    with lock:
+                        state['active'] -= 1
+                        if result:
+                            out[result].append(name)
+                        elif not errors:
+                            queue.append((name, attempts+1, time.time()+self._retry_delay))
+                        lock.notify_all()
+
+        if threads == 1 or len(queue) < 2:
+            work()
+        else:
+            pool = [threading.Thread(target=work, name="doisubmit-%d" % i)
+                    for i in range(min(threads, len(queue)))]
+            for t in pool:
+                t.start()
+            for t in pool:
+                t.join()
 
-            # Let DOIClientExcpetion and other PDR exceptions break the loop, 
-            # because it's probably a programming error somewhere.
+        if errors:
+            raise errors[0]
 
-        return {
-            "succeeded": succeeded,
-            "failed": failed,
-            "skipped": skipped
-        }
+        return out
 
     def submit(self, name=None):
         """
@@ -386,3 +524,40 @@ class DOIMintingClient(object):
 
                                           
     
+
+
+class RateLimiter(object):
+    """
+    a thread-safe limiter that ensures that operations do not happen at more than a given 
+    rate.  A thread calls wait() before each operation; it will block as necessary to keep 
+    the rate of operations (across all threads) below the maximum.  
+    """
+
+    def __init__(self, rate, burst=1):
+        """
+        create the limiter
+        :param float rate:  the maximum number of operations allowed per second
+        :param int burst:   the number of operations that may happen back-to-back 
+                            before throttling kicks in.
+        """
+        if rate <= 0:
+            raise ValueError("RateLimiter: rate must be a positive number")
+        self.interval = 1.0 / rate
+        self.burst = max(burst, 1)
+        self._lock = threading.Lock()
+        self._next = time.time()
+
+    def wait(self):
+        """
+        block until the next operation is allowed to proceed
+        """
+        with self._lock:
+            now = time.time()
+            earliest = now - (self.burst - 1) * self.interval
+            if self._next < earliest:
+                self._next = earliest
+            delay = self._next - now
+            self._next += self.interval
+
+        if delay > 0:
+            time.sleep(delay)
@@ -0,0 +1,51 @@
+"""
+functions for evaluating the health of the long-term bag store based on the 
+metrics written by the fixity auditor (see nistoar.pdr.preserv.service.fixity)
+"""
+import time
+from collections import Mapping
+
+def fixity_problems(metrics, mincoverage=1.0, hourssince=48):
+    """
+    Given the coverage metrics from the fixity auditor, return a list of 
+    messages describing problems with the state of the store.  An empty list
+    indicates the store is healthy.  
+    :param dict     metrics:  the metrics written by the fixity auditor
+    :param float mincoverage: the minimum acceptable fraction of bags verified
+                              within the auditor's reverification period
+    :param float hourssince:  the amount of time (in fractional hours) within
+                              which the metrics must have been updated (i.e. 
+                              the auditor must have run)
+    """
+    out = []
+    if metrics.get('failed', 0) > 0:
+        out.append("%d bags failed fixity checks: %s" %
+                   (metrics['failed'], ", ".join(metrics.get('failures', []))))
+    if metrics.get('coverage', 0) < mincoverage:
+        out.append("only %.1f%% of bags verified in the last %s days" %
+                   (100 * metrics.get('coverage', 0), str(metrics.get('period_days', '?'))))
+    if metrics.get('updated', 0) < time.time() - hourssince * 3600:
+        out.append("fixity audit has not run in the last %d hours" % hourssince)
+    return out
+
+def check_fixity_coverage(chkres, srvresp, **kw):
+    """
+    a wrapper for :py:function:`fixity_problems` for use as a service check plug-in.  
+    """
+    if not chkres.data:
+        chkres.ok = False
+        chkres.message = "Missing JSON output"
+        return chkres
+    if not isinstance(chkres.data, Mapping):
+        chkres.ok = False
+        chkres.message = "Unexpected JSON output: not an object"
+        return chkres
+
+    problems = fixity_problems(chkres.data, kw.get('mincoverage', 1.0), kw.get('hourssince', 48))
+    if problems:
+        chkres.ok = False
+        chkres.message = "; ".join(problems)
+    else:
+        chkres.ok = True
+
+    return chkres
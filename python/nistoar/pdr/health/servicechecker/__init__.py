@@ -1,8 +1,14 @@
 """
 A module that can check the health of running services by sending test queries.  
+
+The checks making up a health check are executed concurrently (see :py:func:`check_services`), 
+each bounded by a timeout so that a single unresponsive service cannot hold up the others.  
+The outcome of each named health check can be saved to a :py:class:`CheckResultCache`; this 
+allows, for example, a web endpoint to report recent results without re-probing the services 
+and allows notifications to be sent only when the status of a check changes.
 """
-import re, textwrap
-from collections import Sequence
+import re, textwrap, os, json, fcntl, time, threading
+from collections import Sequence, OrderedDict
 
 import requests
 try:
@@ -11,6 +17,8 @@ except ImportError:
     JSONDecodeError = ValueError
 
 CONNECTION_FAILED = "Connection failed"
+TIMED_OUT = "Timed out"
+DEF_CHECK_TIMEOUT = 30
 
 class CheckResult(object):
     """
@@ -46,9 +54,25 @@ class CheckResult(object):
         self.ok = ok
         self.text = text
         self.data = data
+
+    def to_dict(self):
+        """
+        return a JSON-serializable dictionary form of this result.  The response content is 
+        not included.
+        """
+        return OrderedDict([("url", self.url), ("method", self.method), ("ok", self.ok),
+                            ("status", self.status), ("message", self.message)])
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        create a CheckResult from the dictionary form produced by :py:meth:`to_dict`.
+        """
+        return cls(data.get('url'), data.get('method'), data.get('message'),
+                   data.get('status', CONNECTION_FAILED), data.get('ok'))
         
 def check_service(url, method='HEAD', ok_status=200, failure_status=[], desc=None, cred=None,
-                  verifysite=None, **kw):
+                  verifysite=None, timeout=DEF_CHECK_TIMEOUT, **kw):
     """
     return a CheckResult instance reporting the result of checking a service.  To be considered 
     healthy, the service must not return an HTTP status from one of the `failure_status` values.
@@ -62,6 +86,8 @@ def check_service(url, method='HEAD', ok_status=200, failure_status=[], desc=Non
                         :type ok_status: int or list of ints
     :param str desc:    a short statement that makes summarizes what a check failure means (e.g. 
                         "the XXX service is not available").  
+    :param float timeout:  the number of seconds to wait for the service to respond before 
+                        giving up; if None, wait indefinitely.
     """
     if ok_status is None:
         ok_status = 200
@@ -85,6 +111,8 @@ def check_service(url, method='HEAD', ok_status=200, failure_status=[], desc=Non
             extra['headers'] = dict([('Authorization', "Bearer "+cred)])
         if verifysite is not None:
             extra['verify'] = verifysite
+        if timeout is not None:
+            extra['timeout'] = timeout
         resp = requests.request(method, url, **extra)
         if not out.message:
             out.message = resp.reason
@@ -105,6 +133,11 @@ def check_service(url, method='HEAD', ok_status=200, failure_status=[], desc=Non
                 out.message = "result evaluator function %s failed: %s" % (kw['evaluate'], str(ex))
                 out.ok = False
                 
+    except requests.Timeout as ex:
+        out.message = str(ex)
+        out.status = TIMED_OUT
+        out.ok = False
+
     except requests.RequestException as ex:
         out.message = str(ex)
         out.status = CONNECTION_FAILED
@@ -128,8 +161,169 @@ def _to_function(qualified_name):
         raise ImportError("function %s is not callable" % parts[1])
     return func
 
+class _CheckThread(threading.Thread):
+    # executes a single service check
+
+    def __init__(self, svc):
+        super(_CheckThread, self).__init__(name="check:"+str(svc.get('url')))
+        self.daemon = True
+        self.svc = svc
+        self.result = None
+        self.error = None
+
+    def run(self):
+        try:
+            self.result = check_service(**self.svc)
+        except Exception as ex:
+            self.error = ex
+
+def check_services(services, timeout=DEF_CHECK_TIMEOUT):
+    """
+    execute the given service checks concurrently and return their results.  Each check 
+    is given a deadline according to its "timeout" parameter (or the given default); a 
+    check that has not completed by its deadline--whether because the service is not 
+    responding or because the evaluation of its response is taking too long--is abandoned 
+    and reported as failed with a status of "Timed out".
+    :param services:        the service checks to execute.  Each element is a dictionary whose 
+                            keys are parameteers for the :py:method:`check_service` function.  
+                            :type services: a dict or list of dicts
+    :param float timeout:   the default number of seconds to allow each check to complete; 
+                            if None, the checks are allowed to run indefinitely.  
+    :return:  the list of CheckResult instances, in the order of the given services
+    :raises ValueError:  if any of the service checks are improperly configured
+    """
+    if not isinstance(services, Sequence):
+        services = [ services ]
+
+    start = time.time()
+    threads = []
+    for svc in services:
+        svc = dict(svc)
+        svc.setdefault('timeout', timeout)
+        t = _CheckThread(svc)
+        t.start()
+        threads.append(t)
+
+    res = []
+    for t in threads:
+        tmo = t.svc.get('timeout')
+        if tmo is None:
+            t.join()
+        else:
+            t.join(max(start + tmo - time.time(), 0))
+
+        if t.error:
+            raise t.error
+        if t.is_alive() or t.result is None:
+            res.append(CheckResult(t.svc.get('url'), t.svc.get('method') or 'HEAD',
+                                   t.svc.get('desc') or
+                                   "check did not complete within %s seconds" % str(tmo),
+                                   TIMED_OUT, False))
+        else:
+            res.append(t.result)
+    return res
+
+class CheckResultCache(object):
+    """
+    a persistent record of the latest results of named health checks.  The results are 
+    stored in a JSON file that is updated under an exclusive file lock so that it can be 
+    shared by the health check script and, say, a web service that reports on the health 
+    of the system.  For each check, the following is saved:
+      :prop ok bool:         True if all of the check's service checks were successful
+      :prop checked float:   the epoch time when the check was completed
+      :prop since float:     the epoch time when the check's ok status last changed
+      :prop results list:    the dictionary forms (see :py:meth:`CheckResult.to_dict`) of 
+                             the results of the check's service checks
+    """
+
+    def __init__(self, cachefile):
+        """
+        open the cache.  
+        :param str cachefile:  the path to the file where results are saved; its parent 
+                               directory must exist.
+        """
+        self._file = cachefile
+        self._lockfile = self._file + ".lock"
+
+    def _load(self):
+        if not os.path.exists(self._file):
+            return OrderedDict()
+        try:
+            with open(self._file) as fd:
+                return json.load(fd, object_pairs_hook=OrderedDict)
+        except ValueError:
+            return OrderedDict()
+
+    def record(self, name, results):
+        """
+        save the results of a health check.  
+        :param str name:      the name of the health check
+        :param list results:  the list of CheckResult instances from the check
+        :return:  the previously saved outcome of the check, or None if there was none
+        :rtype: dict
+        """
+        ok = all([r.ok for r in results])
+        now = time.time()
+        with open(self._lockfile, 'a') as lockfd:
+            fcntl.flock(lockfd, fcntl.LOCK_EX)
+            try:
+                data = self._load()
+                prev = data.get(name)
+                since = now
+                if prev and prev.get('ok') == ok:
+                    since = prev.get('since', now)
+                data[name] = OrderedDict([("ok", ok), ("checked", now), ("since", since),
+                                          ("results", [r.to_dict() for r in results])])
+
+                tmpf = self._file + ".tmp"
+                with open(tmpf, 'w') as fd:
+                    json.dump(data, fd, indent=2, separators=(',', ': '))
+                os.rename(tmpf, self._file)
+            finally:
+                fcntl.flock(lockfd, fcntl.LOCK_UN)
+        return prev
+
+    def _read(self):
+        with open(self._lockfile, 'a') as lockfd:
+            fcntl.flock(lockfd, fcntl.LOCK_SH)
+            try:
+                return self._load()
+            finally:
+                fcntl.flock(lockfd, fcntl.LOCK_UN)
+
+    def get(self, name, maxage=None):
+        """
+        return the last saved outcome of the named health check
+        :param str name:      the name of the health check
+        :param float maxage:  if provided, return None if the outcome was saved more than 
+                              this number of seconds ago.  
+        :return:  the saved outcome (see class documentation), or None if it is not available
+        :rtype: dict
+        """
+        out = self._read().get(name)
+        if out and maxage is not None and time.time() - out.get('checked', 0) > maxage:
+            return None
+        return out
+
+    def results_for(self, name, maxage=None):
+        """
+        return the last saved results of the named health check as a list of CheckResult 
+        instances or None if they are not available (see :py:meth:`get`).
+        """
+        out = self.get(name, maxage)
+        if out is None:
+            return None
+        return [CheckResult.from_dict(r) for r in out.get('results', [])]
+
+    def names(self):
+        """
+        return the names of the health checks that have saved outcomes
+        """
+        return list(self._read().keys())
+
 def check_and_notify(services, notifier, on_failure=None, on_success=None, message=None,
-                     origin=None, platform="unknown", name="unnamed"):
+                     origin=None, platform="unknown", name="unnamed", cache=None,
+                     changes_only=False, timeout=DEF_CHECK_TIMEOUT):
     """
     execute checks on the given services and send notifications about the results.  
     :param services:        the service checks to execute.  Each element is a dictionary whose 
@@ -145,18 +339,23 @@ def check_and_notify(services, notifier, on_failure=None, on_success=None, messa
     :param str platform:    a label indicating the PDR system platform this health check is being 
                             run on (e.g. 'prod', 'test', etc.).  
     :param str name:        a name for this check of the given services.  
-    :return:  True if all of the service checks were successful in their outcomes; False, if
-              any of the checks failed.  
+    :param CheckResultCache cache:  a cache to save the results of the check to 
+    :param bool changes_only:  if True, send a notification only if the outcome of the check 
+                            differs from the previous outcome saved in the cache (or if there
+                            is no previous outcome).  This has no effect if cache is not provided.
+    :param float timeout:   the default number of seconds to allow each service check to 
+                            complete (see :py:func:`check_services`)
+    :return:  True if a notification was sent; False, otherwise
     """
-    if not isinstance(services, Sequence):
-        services = [ services ]
-
-    # execute each service check and save the results
-    res = []
-    for svc in services:
-        res.append(check_service(**svc))
+    res = check_services(services, timeout)
 
     ok = all([s.ok for s in res])
+    prev = None
+    if cache:
+        prev = cache.record(name, res)
+    if changes_only and prev and prev.get('ok') == ok:
+        return False
+
     notifytarget = ok and on_success or not ok and on_failure
     if notifytarget:
         summary = message
@@ -11,7 +11,7 @@ from ...exceptions import ConfigurationException
 from ...notify.service import TargetManager, NotificationService
 from ...notify.cli import StdoutMailer, StdoutArchiver, Failure
 from ... import platform_profile
-from . import check_and_notify
+from . import check_and_notify, CheckResultCache, DEF_CHECK_TIMEOUT
 
 prog = re.sub(r'\.py$', '', os.path.basename(sys.argv[0]))
 
@@ -45,6 +45,16 @@ def define_options(progname):
                         help="send the notification message to standard output instead of "+
                              "submitting it to its configured channels (overrides -m).")
 
+    parser.add_argument('-C', '--cache-file', type=str, dest='cachefile', metavar='FILE',
+                        help="save the results of the checks to FILE (overrides the result_cache "+
+                             "configuration parameter)")
+    parser.add_argument('-s', '--changes-only', action='store_true', dest='changesonly',
+                        help="send notifications only when the outcome of a check differs from its "+
+                             "last saved outcome (requires a result cache)")
+    parser.add_argument('-t', '--timeout', type=float, dest='timeout', metavar='SECS',
+                        help="allow each service check at most SECS seconds to complete (overrides "+
+                             "the check_timeout configuration parameter)")
+
     parser.add_argument('checks', metavar='CHECK', type=str, nargs='*', default=[],
                         
                         help='name of health checks to perform')
@@ -158,14 +168,25 @@ def main(progname, args):
         if 'name' in chk:
             checks[chk['name']] = chk
 
+    cache = None
+    cachefile = opts.cachefile or cfg.get('result_cache')
+    if cachefile:
+        cache = CheckResultCache(cachefile)
+    timeout = opts.timeout
+    if timeout is None:
+        timeout = cfg.get('check_timeout', DEF_CHECK_TIMEOUT)
+
     unconfigured = []
     for chkname in opts.checks:
         if chkname in checks:
             chkcfg = checks.get(chkname)
             services = [s for s in cfg.get('services', []) if s.get('name') in chkcfg.get('services',[])]
+            changesonly = opts.changesonly or \
+                          chkcfg.get('notify_on_change', cfg.get('notify_on_change', False))
             try:
                 check_and_notify(services, notifier, chkcfg.get('failure'), chkcfg.get('success'),
-                                 chkcfg.get('message'), opts.origin, opts.platform, chkname)
+                                 chkcfg.get('message'), opts.origin, opts.platform, chkname,
+                                 cache, changesonly, timeout)
             except Exception as ex:
                 raise Failure("Health check failure: "+str(ex), 3, ex)
         else:
@@ -8,6 +8,7 @@ import multibag as mb
 import requests
 
 from .utils import parse_bag_name
+from .storecat import catalog_for, list_store
 from ...exceptions import ConfigurationException, StateException
 from ...distrib import (RESTServiceClient, BagDistribClient, DistribServerError,
                         DistribServiceException, DistribResourceNotFound)
@@ -46,6 +47,7 @@ class DataChecker(object):
         self.log = log
         
         self._store = config.get('store_dir')
+        self._storecat = catalog_for(config)
         self._mbag = mb.open_headbag(bag.dir)
         self._disturlpat = self.cfg.get('pdr_dist_url_pattern',
                                         r'^https?://[^/]+/od/ds/(.+)')
@@ -151,8 +153,8 @@ class DataChecker(object):
 
         locs = [ os.path.join(self._store, inbag) ]
         if not os.path.isdir(locs[0]):
-            locs = [os.path.join(self._store, f) for f in os.listdir(self._store)
-                                                 if f.startswith(inbag+".")]
+            locs = [os.path.join(self._store, f)
+                    for f in list_store(self._storecat, self._store, inbag+".")]
             if len(locs) == 0:
                 return False
 
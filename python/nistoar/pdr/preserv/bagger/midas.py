@@ -324,21 +324,11 @@ class MIDASMetadataBagger(SIPBagger):
         # precedence
         for root in self._indirs:
             root = root.rstrip('/')
-            for dir, subdirs, files in os.walk(root):
-                reldir = dir[len(root)+1:]
-                for f in files:
-                    # don't descend into subdirectories with ignorable names
-                    for d in range(len(subdirs)-1, -1, -1):
-                        if subdirs[d].startswith('.') or \
-                           subdirs[d].startswith('_'):
-                            del subdirs[d]
-                    
-                    if f.startswith('.') or f.startswith('_') or \
-                       os.path.join(reldir,f) in podlocs:
-                        # skip dot-files and pod files written by MIDAS
-                        continue
-
-                    datafiles[os.path.join(reldir, f)] = os.path.join(dir, f)
+            # skip dot-files and pod files written by MIDAS, and don't descend
+            # into subdirectories with ignorable names
+            for path, ent in utils.scan_tree(root, skip_dot=True, skip_private=True):
+                if path not in podlocs:
+                    datafiles[path] = ent.path
 
         return datafiles
 
@@ -34,7 +34,7 @@ from .... import pdr
 from .prepupd import UpdatePrepService
 from .datachecker import DataChecker
 from nistoar.nerdm.merge import MergerFactory
-from nistoar.nerdm.validate import create_validator
+from ...validation import get_validator
 
 # _sys = PreservationSystem()
 log = logging.getLogger(_sys.system_abbrev)   \
@@ -335,20 +335,10 @@ class MIDASSIP(object):
         # precedence
         for root in self._indirs:
             root = root.rstrip('/')
-            for dir, subdirs, files in os.walk(root):
-                reldir = dir[len(root)+1:]
-                for f in files:
-                    # don't descend into subdirectories with ignorable names
-                    for d in range(len(subdirs)-1, -1, -1):
-                        if subdirs[d].startswith('.') or \
-                           subdirs[d].startswith('_'):
-                            del subdirs[d]
-                    
-                    if f.startswith('.') or f.startswith('_'):
-                        # skip dot-files and pod files written by MIDAS
-                        continue
-
-                    datafiles[os.path.join(reldir, f)] = os.path.join(dir, f)
+            # skip dot-files and pod files written by MIDAS, and don't descend
+            # into subdirectories with ignorable names
+            for path, ent in utils.scan_tree(root, skip_dot=True, skip_private=True):
+                datafiles[path] = ent.path
 
         return datafiles
 
@@ -443,7 +433,9 @@ class MIDASMetadataBagger(SIPBagger):
                                  references
     :prop doi_resolver    dict:  data for configuring the DOI resolver client; 
                                  see bagit.tools.enhance.ReferenceEnhancer for 
-                                 for info.
+                                 for info.  Setting its "cache" sub-property 
+                                 enables a persistent cache of resolved DOIs
+                                 (see bagit.tools.doicache).
     """
     BGRMD_FILENAME = "__bagger-midas3.json"
 
@@ -878,7 +870,7 @@ class MIDASMetadataBagger(SIPBagger):
         # validate the given POD (raises exception if not valid)
         if validate:
             if self.schemadir:
-                valid8r = create_validator(self.schemadir, pod)
+                valid8r = get_validator(self.schemadir, pod)
                 valid8r.validate(pod, schemauri=DEF_POD_DATASET_SCHEMA,
                                  strict=True, raiseex=True)
             else:
@@ -3,7 +3,7 @@ This bagger submodule provides functions for preparing an update to a previously
 preserved collection.  This includes a service client for retrieving previous
 head bags from cache or long-term storage.  
 """
-import os, shutil, json, logging, re, time
+import os, shutil, logging, re, time
 from abc import ABCMeta, abstractmethod, abstractproperty
 from collections import OrderedDict
 from zipfile import ZipFile
@@ -13,10 +13,12 @@ from .base import sys as _sys
 from .. import (ConfigurationException, StateException, CorruptedBagError,
                 NERDError)
 from . import utils as bagutils
+from .storecat import catalog_for, list_store
 from ...config import merge_config
 from ...describe import rmm
+from ...describe.cache import CachingMetadataClient
 from ... import distrib
-from ...exceptions import IDNotFound
+from ...exceptions import IDNotFound, PDRServerError
 from ... import utils
 from ..bagit.builder import BagBuilder, ARK_NAAN
 from ..bagit.bag import NISTBag
@@ -131,8 +133,7 @@ class HeadBagCacher(object):
         self._save_head_info(aipid, out)
 
     def _save_head_info(self, aipid, info):
-        with open(self._head_info_file(aipid), 'w') as fd:
-            json.dump(info, fd, indent=2)
+        utils.write_json(info, self._head_info_file(aipid), compact=True)
 
     def _head_info_file(self, aipid):
         return os.path.join(self.infodir, aipid)
@@ -141,13 +142,19 @@ class HeadBagCacher(object):
         hif = self._head_info_file(aipid)
         if not os.path.exists(hif):
             return OrderedDict()
-        with open(hif) as fd:
-            return json.load(fd, object_pairs_hook=OrderedDict)
+        return utils.read_json(hif)
             
 
 class UpdatePrepService(object):
     """
-    a factory class that creates UpdatePrepper instances
+    a factory class that creates UpdatePrepper instances.
+
+    NERDm records retrieved from the repository's metadata service are cached 
+    under the head bag cache (in "_rmm"); the cache can be tuned with the 
+    following parameters in the "metadata_service" configuration:
+    :prop cache_ttl int (600):  the time in seconds a cached record is used 
+                        before it is revalidated with the metadata service
+    :prop cache_max_entries int (2000):  the maximum number of records to cache
     """
     def __init__(self, config, bgrmdf=None):
         self.cfg = config
@@ -161,11 +168,14 @@ class UpdatePrepService(object):
         scfg = self.cfg.get('distrib_service', {})
         self.distsvc = distrib.RESTServiceClient(scfg.get('service_endpoint'))
         self.cacher = HeadBagCacher(self.distsvc, self.sercache)
+        self.storecat = catalog_for(self.cfg)
 
         self.mdsvc = None
         scfg = self.cfg.get('metadata_service', {})
         if scfg.get('service_endpoint'):
             self.mdsvc  = rmm.MetadataClient(scfg.get('service_endpoint'))
+            self.mdsvc  = CachingMetadataClient.from_config(scfg, self.mdsvc,
+                                                    os.path.join(self.sercache, "_rmm"))
 
         self._bgrmdf = bgrmdf
 
@@ -175,7 +185,7 @@ class UpdatePrepService(object):
         """
         return UpdatePrepper(aipid, self.cfg, self.cacher, self.mdsvc,
                              (self.storedir, self.restricted_storedir),
-                             version, replaces, log, self._bgrmdf)
+                             version, replaces, log, self._bgrmdf, self.storecat)
 
 
 class UpdatePrepper(object):
@@ -187,7 +197,7 @@ class UpdatePrepper(object):
     PREPRMD_FILENAME = "__bagger-prepper.json"
 
     def __init__(self, aipid, config, headcacher, pubmdclient, storedir=None,
-                 version=None, replaces=None, log=None, bgrmdf=None):
+                 version=None, replaces=None, log=None, bgrmdf=None, storecat=None):
         """
         create the prepper for the given dataset identifier.  
 
@@ -205,6 +215,7 @@ class UpdatePrepper(object):
                 self.restricted_storedir = storedir[1]
             storedir = storedir[0]
         self.storedir = storedir
+        self.storecat = storecat
         self.version = version
         self.mdcli = pubmdclient
         self.mdcache = os.path.join(self.cacher.cachedir, "_nerd")
@@ -263,16 +274,27 @@ class UpdatePrepper(object):
 
     def _cache_nerdm_rec_for(self, aipid):
         out = os.path.join(self.mdcache, aipid+".json")
-        if not os.path.exists(out):
-            if not self.mdcli:
-                # not configured to consult repository
-                return None
-            try:
-                data = self.mdcli.describe(aipid)
-                with open(out, 'w') as fd:
-                    json.dump(data, fd, indent=2)
-            except IDNotFound as ex:
-                return None
+        if not self.mdcli:
+            # not configured to consult repository
+            return (os.path.exists(out) and out) or None
+
+        # the metadata client (normally a CachingMetadataClient) decides 
+        # whether the record needs to be refreshed from the repository
+        try:
+            data = self.mdcli.describe(aipid)
+        except IDNotFound as ex:
+            if os.path.exists(out):
+                os.remove(out)
+            return None
+        except PDRServerError as ex:
+            if not os.path.exists(out):
+                raise
+            self.log.warning("Unable to refresh NERDm record for %s (using cached copy): %s",
+                             aipid, str(ex))
+            return out
+
+        if not os.path.exists(out) or utils.read_json(out) != data:
+            utils.write_json(data, out, compact=True)
         return out
 
     def find_bag_in_store(self, aipid, version):
@@ -285,12 +307,10 @@ class UpdatePrepper(object):
             return None
 
         indir = self.storedir
-        foraip = [f for f in os.listdir(indir)
-                    if f.startswith(aipid+'.') and not f.endswith('.sha256')]
+        foraip = self._bags_in_dir(indir, aipid)
         if not foraip and self.restricted_storedir:
             indir = self.restricted_storedir
-            foraip = [f for f in os.listdir(indir)
-                        if f.startswith(aipid+'.') and not f.endswith('.sha256')]
+            foraip = self._bags_in_dir(indir, aipid)
 
         foraip = bagutils.select_version(foraip, version)
         if len(foraip) == 0:
@@ -298,6 +318,12 @@ class UpdatePrepper(object):
 
         return os.path.join(indir, bagutils.find_latest_head_bag(foraip))
 
+    def _bags_in_dir(self, bagparent, aipid):
+        # the names of the serialized bags for aipid in bagparent (via the store
+        # catalog, if it covers bagparent)
+        return [f for f in list_store(self.storecat, bagparent, aipid+'.')
+                  if not f.endswith('.sha256')]
+
     def aip_exists(self, deep=False):
         """
         return true if a previously ingested AIP with the current ID exists in 
@@ -626,13 +652,9 @@ class UpdatePrepper(object):
         return self._latest_version_from_nerdmfile(nerdf)
 
     def _latest_version_from_dir(self, bagparent):
-        foraip = [f for f in os.listdir(bagparent)
-                    if f.startswith(self.aipid+'.') and
-                       not f.endswith('.sha256')        ]
+        foraip = self._bags_in_dir(bagparent, self.aipid)
         if not foraip and self._prevaipid and self._prevaipid != self.aipid:
-            foraip = [f for f in os.listdir(bagparent)
-                        if f.startswith(self._prevaipid+'.') and
-                           not f.endswith('.sha256')        ]
+            foraip = self._bags_in_dir(bagparent, self._prevaipid)
         if not foraip:
             return "0"
         latest = bagutils.find_latest_head_bag(foraip)
@@ -0,0 +1,395 @@
+"""
+This module provides a persistent catalog of the files in the long-term bag
+store.
+
+The bag store (the directories configured as "store_dir" and
+"restricted_store_dir") can hold hundreds of thousands of serialized bags, so
+listing it in order to find the bags for a particular AIP is expensive.  The
+BagStoreCatalog keeps a record of each file in the store--its name, size, and
+modification time and, for serialized bags, the AIP ID, version, and multibag
+sequence number parsed from its name, its checksum (taken from its ".sha256"
+companion file), its access level, and whether it has been marked as removed
+(via a ".removed" semaphore file)--in an SQLite database.  Lookups of the files
+for an AIP are then indexed queries.
+
+The catalog is kept up to date by registering files as they are delivered into
+the store (see SIPHandler.bagit()).  Because files can also leave the store by
+other means (e.g. migration to other storage), lookups via list_store() check
+the files the catalog returns against the file system; stale entries are
+removed and the directory is listed directly instead.  Files added to the store
+by other means are picked up when the catalog is reconciled with the store's
+contents, which the fixity auditor does on each run, or when it is rebuilt from
+a full scan; both can also be done via the "preserve catalog" command.  (A
+store directory is scanned automatically the first time the catalog is opened
+with it.)  The catalog is used if the "store_catalog" configuration parameter
+is set to the path of the database file; see catalog_for().
+"""
+import os, re, time, sqlite3, logging
+from contextlib import closing
+
+from .utils import is_legal_bag_name, BagName
+from .base import sys as _sys
+
+log = logging.getLogger(_sys.system_abbrev).getChild(_sys.subsystem_abbrev).getChild("storecat")
+
+PUBLIC = "public"
+RESTRICTED = "restricted"
+
+_sfxre = re.compile(r'\.(sha256|removed)$')
+
+_schema = """
+CREATE TABLE IF NOT EXISTS files (
+    dir       TEXT NOT NULL,
+    name      TEXT NOT NULL,
+    size      INTEGER,
+    mtime     REAL,
+    aipid     TEXT,
+    version   TEXT,
+    seq       INTEGER,
+    access    TEXT,
+    checksum  TEXT,
+    removed   INTEGER DEFAULT 0,
+    PRIMARY KEY (dir, name)
+);
+CREATE INDEX IF NOT EXISTS files_aipid ON files (aipid, version);
+CREATE TABLE IF NOT EXISTS dirs (
+    dir       TEXT PRIMARY KEY,
+    scanned   REAL
+);
+"""
+
+class BagStoreCatalog(object):
+    """
+    a persistent catalog of the files in the public and restricted bag store
+    directories.  Updates are made in transactions, so the catalog is safe to
+    use across threads and processes.
+    """
+
+    def __init__(self, dbfile, storedir, restricted_storedir=None, timeout=30.0):
+        """
+        open the catalog, adding to it, via a full scan, any of the store 
+        directories that it does not yet cover.
+
+        :param str dbfile:     the path to the catalog's database file
+        :param str storedir:   the bag store directory for public data
+        :param str restricted_storedir:  the bag store directory for
+                               restricted-public data
+        :param float timeout:  the time to wait for other processes to finish
+                               updating the catalog
+        """
+        self.dbfile = dbfile
+        self._access = {}
+        if storedir:
+            self._access[os.path.abspath(storedir)] = PUBLIC
+        if restricted_storedir:
+            self._access[os.path.abspath(restricted_storedir)] = RESTRICTED
+        self.timeout = timeout
+
+        with closing(self._connect()) as conn:
+            conn.executescript(_schema)
+            scanned = set([r[0] for r in conn.execute("SELECT dir FROM dirs")])
+        for d in self.storedirs:
+            if d not in scanned:
+                self.rebuild(d)
+
+    def _connect(self):
+        return sqlite3.connect(self.dbfile, timeout=self.timeout)
+
+    @property
+    def storedirs(self):
+        """
+        the list of store directories covered by this catalog
+        """
+        return list(self._access.keys())
+
+    def covers(self, storedir):
+        """
+        return True if the given directory is one of the store directories 
+        covered by this catalog
+        """
+        return os.path.abspath(storedir) in self._access
+
+    def is_current(self, storedir):
+        """
+        return True if the given directory is covered by this catalog and its
+        entries are believed to be up to date (i.e. it has not been 
+        invalidated since it was last scanned or reconciled).
+        """
+        if not self.covers(storedir):
+            return False
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT scanned FROM dirs WHERE dir=?",
+                                (os.path.abspath(storedir),)).fetchone() is not None
+
+    def invalidate(self, storedir):
+        """
+        mark the entries for the given store directory as possibly out of date
+        (e.g. because files delivered to it could not be registered).  Lookups
+        via list_store() will list the directory directly until it is 
+        reconciled or rebuilt.
+        """
+        with closing(self._connect()) as conn:
+            with conn:
+                conn.execute("DELETE FROM dirs WHERE dir=?", (os.path.abspath(storedir),))
+
+    def _describe(self, dirpath, name):
+        # return the row values for a file in the store
+        st = os.stat(os.path.join(dirpath, name))
+        aipid, version, seq = None, None, None
+        if is_legal_bag_name(name):
+            bn = BagName(name)
+            aipid = bn.aipid
+            version = bn.version or "1"
+            seq = (bn.sequence and int(bn.sequence)) or 0
+        return (dirpath, name, st.st_size, st.st_mtime, aipid, version, seq,
+                self._access.get(dirpath, PUBLIC))
+
+    def _read_checksum(self, path):
+        try:
+            with open(path) as fd:
+                return (fd.read().split() or [None])[0]
+        except IOError:
+            return None
+
+    def _insert(self, conn, dirpath, name):
+        conn.execute("INSERT OR REPLACE INTO files " +
+                     "(dir, name, size, mtime, aipid, version, seq, access) " +
+                     "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", self._describe(dirpath, name))
+
+    def _apply_companion(self, conn, dirpath, name):
+        # update the record of the file that the given companion file describes
+        m = _sfxre.search(name)
+        if not m:
+            return
+        target = name[:m.start()]
+        if m.group(1) == "removed":
+            conn.execute("UPDATE files SET removed=1 WHERE dir=? AND name=?", (dirpath, target))
+        else:
+            cks = self._read_checksum(os.path.join(dirpath, name))
+            conn.execute("UPDATE files SET checksum=? WHERE dir=? AND name=?",
+                         (cks, dirpath, target))
+
+    def rebuild(self, storedir=None):
+        """
+        replace the catalog contents with the results of a full scan of the
+        store directories.
+
+        :param str storedir:  if given, rebuild only the entries for this
+                              directory
+        :return int:  the number of files cataloged
+        """
+        dirs = self.storedirs
+        if storedir:
+            dirs = [os.path.abspath(storedir)]
+        count = 0
+        with closing(self._connect()) as conn:
+            with conn:
+                for d in dirs:
+                    conn.execute("DELETE FROM files WHERE dir=?", (d,))
+                    conn.execute("INSERT OR REPLACE INTO dirs (dir, scanned) VALUES (?, ?)",
+                                 (d, time.time()))
+                    if not os.path.isdir(d):
+                        continue
+                    names = os.listdir(d)
+                    for name in names:
+                        self._insert(conn, d, name)
+                    # companions are applied after all files are in place
+                    for name in names:
+                        self._apply_companion(conn, d, name)
+                    count += len(names)
+        log.info("Rebuilt bag store catalog: %d files", count)
+        return count
+
+    def register(self, filepaths):
+        """
+        record (or update the records for) the given files that have been added
+        to the store.  All the files are registered in a single transaction.
+
+        :param list filepaths:  the paths to the files in the store
+        """
+        if isinstance(filepaths, (str, unicode)):
+            filepaths = [filepaths]
+        files = [(os.path.dirname(os.path.abspath(f)), os.path.basename(f)) for f in filepaths]
+        with closing(self._connect()) as conn:
+            with conn:
+                for d, name in files:
+                    self._insert(conn, d, name)
+                for d, name in files:
+                    self._apply_companion(conn, d, name)
+                    # a bag registered after its companions picks up their info
+                    for sfx in (".sha256", ".removed"):
+                        if os.path.exists(os.path.join(d, name+sfx)):
+                            self._apply_companion(conn, d, name+sfx)
+
+    def unregister(self, filepaths):
+        """
+        remove the records for the given files (e.g. because they were removed
+        from the store).
+
+        :param list filepaths:  the paths to the files in the store
+        """
+        if isinstance(filepaths, (str, unicode)):
+            filepaths = [filepaths]
+        with closing(self._connect()) as conn:
+            with conn:
+                for f in filepaths:
+                    f = os.path.abspath(f)
+                    conn.execute("DELETE FROM files WHERE dir=? AND name=?",
+                                 (os.path.dirname(f), os.path.basename(f)))
+
+    def reconcile(self, storedir, names=None):
+        """
+        bring the catalog's entries for the given store directory up to date 
+        with the directory's contents:  files that are not yet cataloged are 
+        registered, and the entries for files that are no longer present are
+        removed.  Unlike rebuild(), this only examines the files that changed.
+
+        :param str storedir:  the store directory to reconcile
+        :param list names:    the names of the files currently in the 
+                              directory, if already listed; if None, the 
+                              directory will be listed.
+        :return tuple:  the numbers of entries added and removed
+        """
+        d = os.path.abspath(storedir)
+        if names is None:
+            names = (os.path.isdir(d) and os.listdir(d)) or []
+        names = set(names)
+        with closing(self._connect()) as conn:
+            known = set([r[0] for r in conn.execute("SELECT name FROM files WHERE dir=?", (d,))])
+        added = [os.path.join(d, n) for n in names if n not in known]
+        gone = [os.path.join(d, n) for n in known if n not in names]
+
+        # guard against files removed since the directory was listed
+        added = [f for f in added if os.path.exists(f)]
+        if added:
+            self.register(added)
+        if gone:
+            self.unregister(gone)
+        with closing(self._connect()) as conn:
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO dirs (dir, scanned) VALUES (?, ?)",
+                             (d, time.time()))
+        if added or gone:
+            log.info("Reconciled bag store catalog for %s: %d added, %d removed",
+                     d, len(added), len(gone))
+        return (len(added), len(gone))
+
+    def list_files(self, storedir, prefix=""):
+        """
+        return the names of the files in the given store directory that start
+        with the given prefix, in sorted order.  This is equivalent to
+        filtering the results of os.listdir().
+        """
+        sql = "SELECT name FROM files WHERE dir=?"
+        args = [os.path.abspath(storedir)]
+        if prefix:
+            # an indexed range query rather than LIKE
+            sql += " AND name >= ? AND name < ?"
+            args += [prefix, prefix[:-1] + unichr(ord(prefix[-1]) + 1)]
+        with closing(self._connect()) as conn:
+            return [r[0] for r in conn.execute(sql + " ORDER BY name", args)]
+
+    def bags_for(self, aipid, version=None, access=None, include_removed=True):
+        """
+        return descriptions of the serialized bags for the given AIP.  Each
+        description is a dictionary with the properties name, dir, size,
+        mtime, aipid, version, seq, access, checksum, and removed.
+
+        :param str aipid:     the AIP identifier
+        :param str version:   if given, return only the bags that are part of
+                              this version (in dot-delimited form)
+        :param str access:    if given, return only the bags with this access
+                              level (PUBLIC or RESTRICTED)
+        :param bool include_removed:  if False, exclude bags that have been
+                              marked as removed
+        :rtype: list of dict
+        """
+        sql = "SELECT name, dir, size, mtime, aipid, version, seq, access, checksum, removed " + \
+              "FROM files WHERE aipid=? AND name NOT LIKE '%.sha256' AND name NOT LIKE '%.removed'"
+        args = [aipid]
+        if version:
+            sql += " AND version=?"
+            args.append(version)
+        if access:
+            sql += " AND access=?"
+            args.append(access)
+        if not include_removed:
+            sql += " AND removed=0"
+        cols = "name dir size mtime aipid version seq access checksum removed".split()
+        with closing(self._connect()) as conn:
+            out = [dict(zip(cols, r)) for r in conn.execute(sql + " ORDER BY seq, name", args)]
+        for bag in out:
+            bag['removed'] = bool(bag['removed'])
+        return out
+
+    def versions_for(self, aipid):
+        """
+        return the versions of the given AIP that have bags in the store
+        :rtype: set of str
+        """
+        with closing(self._connect()) as conn:
+            return set([r[0] for r in
+                        conn.execute("SELECT DISTINCT version FROM files WHERE aipid=?", (aipid,))])
+
+_catalogs = {}
+
+def catalog_for(config):
+    """
+    return the BagStoreCatalog configured via the "store_catalog" parameter in
+    the given configuration (along with "store_dir" and "restricted_store_dir"),
+    or None if the parameter is not set.  Catalog instances are shared within
+    the process.
+    """
+    dbfile = config.get('store_catalog')
+    if not dbfile:
+        return None
+    key = (os.path.abspath(dbfile), config.get('store_dir'), config.get('restricted_store_dir'))
+    if key not in _catalogs:
+        _catalogs[key] = BagStoreCatalog(key[0], key[1], key[2])
+    return _catalogs[key]
+
+def list_store(storecat, storedir, prefix=""):
+    """
+    return the names of the files in a store directory that start with the
+    given prefix, consulting the given catalog if it covers the directory, or
+    listing the directory otherwise.  The files found via the catalog are 
+    checked against the file system; if any are missing (because they have 
+    left the store), their entries are removed from the catalog and the 
+    directory is listed instead.  Because files may have been delivered 
+    without being registered, the directory is also listed when the catalog
+    finds no matching files (any found are then registered) and when the 
+    catalog's entries for the directory have been invalidated (in which case
+    the catalog is reconciled with the listing).  A listing of all the files
+    in the directory (i.e. with no prefix) is always read from the directory.
+
+    :param BagStoreCatalog storecat:  the catalog to consult; may be None
+    :param str storedir:  the directory to list
+    :param str prefix:    the required file name prefix
+    """
+    if not prefix or not storecat or not storecat.covers(storedir):
+        return sorted([f for f in os.listdir(storedir) if f.startswith(prefix)])
+
+    if not storecat.is_current(storedir):
+        log.info("Bag store catalog for %s needs reconciling; listing the directory",
+                 storedir)
+        allnames = os.listdir(storedir)
+        storecat.reconcile(storedir, allnames)
+        return sorted([f for f in allnames if f.startswith(prefix)])
+
+    names = storecat.list_files(storedir, prefix)
+    missing = [os.path.join(storedir, f) for f in names
+                                         if not os.path.exists(os.path.join(storedir, f))]
+    if names and not missing:
+        return names
+    if missing:
+        log.warning("Bag store catalog is out of date for %s (%d files missing); "
+                    "listing the directory", storedir, len(missing))
+        storecat.unregister(missing)
+
+    found = sorted([f for f in os.listdir(storedir) if f.startswith(prefix)])
+    unknown = [os.path.join(storedir, f) for f in found if f not in names]
+    if unknown:
+        log.warning("Bag store catalog is missing %d files in %s with prefix %s; "
+                    "registering them", len(unknown), storedir, prefix)
+        storecat.register(unknown)
+    return found
@@ -9,8 +9,9 @@ from .. import PreservationSystem, read_nerd, read_pod
 from .. import NERDError, PODError, StateException
 from .exceptions import BadBagRequest, ComponentNotFound, BagFormatError
 from ... import def_jq_libdir, def_merge_etcdir
+from ...utils import scan_tree
 from ....nerdm.merge import MergerFactory, Merger
-from ....nerdm.convert import ComponentCounter, HierarchyBuilder
+from .convert import component_counter, hierarchy_builder, DEF_CONVERSION
 
 POD_FILENAME = "pod.json"
 NERDMD_FILENAME = "nerdm.json"
@@ -28,7 +29,11 @@ class NISTBag(PreservationSystem):
     # NOTE: this is an incomplete implementation
     # (what's missing?)
 
-    def __init__(self, rootdir, merge_annots=False, merge_conf_dir=None):
+    # the default implementation ("jq" or "native") used to calculate a record's 
+    # inventory and data hierarchy (see nistoar.pdr.preserv.bagit.convert)
+    conversion = DEF_CONVERSION
+
+    def __init__(self, rootdir, merge_annots=False, merge_conf_dir=None, conversion=None):
         if not os.path.isdir(rootdir):
             raise StateException("Bag directory does not exist as a directory: "+
                                  rootdir, sys=self)
@@ -50,6 +55,9 @@ class NISTBag(PreservationSystem):
             self._mergeconf = MERGECONF
         self._mergerfact = None
 
+        if conversion:
+            self.conversion = conversion
+
     @property
     def dir(self):
         """
@@ -261,41 +269,45 @@ class NISTBag(PreservationSystem):
                 out['components'].append(comp)
 
         if incl_inventory and 'inventory' not in out:
-            self.update_inventory_in(out)
+            self.update_inventory_in(out, self.conversion)
         if incl_hierarchy:
-            self.update_hierarchy_in(out)
+            self.update_hierarchy_in(out, self.conversion)
         
         return out
 
     @classmethod
-    def update_inventory_in(cls, resmd):
+    def update_inventory_in(cls, resmd, conversion=None):
         """
         For the given NERDm record, add or update its 'inventory' 
         property to reflect its current set of components.
+        :param str conversion:  the implementation to use to calculate the inventory, 
+                                "jq" or "native"; if None, the class default is used.
         """
         resmd['inventory'] = {}
 
         if 'components' in resmd:
             components = resmd['components']
-            cc = ComponentCounter(JQLIB)
+            cc = component_counter(conversion or cls.conversion, JQLIB)
             resmd['inventory'] = cc.inventory(components)
 
         return resmd
 
     @classmethod
-    def update_hierarchy_in(cls, resmd):
+    def update_hierarchy_in(cls, resmd, conversion=None):
         """
         For the given NERDm record, add or update its 'dataHierarchy' 
         property to reflect its current set of components.  If the 
         components do not include any DataFile or Subcollection components,
         the 'dataHierarchy' property will be remove from the given record (or
         otherwise not added).  
+        :param str conversion:  the implementation to use to build the hierarchy, 
+                                "jq" or "native"; if None, the class default is used.
         """
         hier = []
         if 'dataHierarchy' in resmd:
             del resmd['dataHierarchy']
         if 'components' in resmd:
-            hb = HierarchyBuilder(JQLIB)
+            hb = hierarchy_builder(conversion or cls.conversion, JQLIB)
             hier = hb.build_hierarchy(resmd['components'])
         if hier:
             resmd['dataHierarchy'] = hier
@@ -411,12 +423,8 @@ class NISTBag(PreservationSystem):
 
         :return generator:  
         """
-        for dir, subdirs, files in os.walk(self.data_dir):
-            reldir = dir[len(self.data_dir)+1:]
-            for f in files:
-                # if f.startswith('.'):
-                #     continue
-                yield os.path.join(reldir, f)
+        for path, ent in scan_tree(self.data_dir):
+            yield path
 
     def iter_data_components(self):
         """
@@ -425,14 +433,9 @@ class NISTBag(PreservationSystem):
 
         :return generator:  
         """
-        for dir, subdirs, files in os.walk(self.metadata_dir):
-            reldir = dir[len(self.metadata_dir)+1:]
-            for f in subdirs:
-                # if f.startswith('.'):
-                #     continue
-                if f.startswith('_'):
-                    continue
-                yield os.path.join(reldir, f)
+        for path, ent in scan_tree(self.metadata_dir, files=False, dirs=True):
+            if not ent.name.startswith('_'):
+                yield path
 
     def iter_fetch_records(self):
         """
@@ -15,7 +15,6 @@ from .. import ConfigurationException, StateException, PODError
 from .exceptions import (BagProfileError, BagWriteError, BadBagRequest,
                          ComponentNotFound)
 from ....nerdm.exceptions import (NERDError, NERDTypeError)
-from ....nerdm.convert import PODds2Res
 from ....nerdm.constants import core_schema_base, schema_versions
 from ....id import PDRMinter
 from ...utils import (build_mime_type_map, checksum_of, measure_dir_size,
@@ -25,6 +24,8 @@ from ....id import PDRMinter
 from ... import def_jq_libdir, def_etc_dir
 from ...config import load_from_file, merge_config
 from .bag import NISTBag
+from .inventory import BagInventory
+from .convert import pod_converter
 from .exceptions import BadBagRequest
 from .validate.nist import NISTAIPValidator
 
@@ -70,6 +71,19 @@ NERDM_CONTEXT = "https://data.nist.gov/od/dm/nerdm-pub-context.jsonld"
 DISTSERV = "https://" + PDR_PUBLIC_SERVER + "/od/ds/"
 DEF_MERGE_CONV = "midas0"
 
+_def_mimetypes = None
+def default_mime_type_map():
+    """
+    return the default map of filename extensions to MIME-types (from the 
+    mime.types file distributed with this package).  The map is loaded once
+    per process and shared; it should not be modified.
+    """
+    global _def_mimetypes
+    if _def_mimetypes is None:
+        mtfile = pkg_resources.resource_filename('nistoar.pdr', 'data/mime.types')
+        _def_mimetypes = build_mime_type_map([mtfile])
+    return _def_mimetypes
+
 class BagBuilder(PreservationSystem):
     """
     A class for building up and populating a BagIt bag compliant with the 
@@ -118,6 +132,11 @@ class BagBuilder(PreservationSystem):
     :prop jq_lib       str:  the full path to the JQ transform library 
                               directory; if not set, the directory is 
                               searched for in a few typical places.
+    :prop nerdm_conversion str ("jq"):  the implementation to use to convert POD
+                              to NERDm and to calculate a resource's inventory
+                              and data hierarchy:  "jq" uses the jq transform 
+                              library; "native" uses the pure-Python versions in 
+                              nistoar.pdr.preserv.bagit.convert.
     :prop merge_etc    str:  the full path to directory containing the NERDm
                               merger annotated schemas;  if not set, the 
                               directory is searched for in a few typical places.
@@ -206,7 +225,8 @@ class BagBuilder(PreservationSystem):
             self._distbase += '/'
 
         jqlib = self.cfg.get('jq_lib', def_jq_libdir)
-        self.pod2nrd = PODds2Res(jqlib)
+        self._conversion = self.cfg.get('nerdm_conversion')
+        self.pod2nrd = pod_converter(self._conversion, jqlib)
 
         self._create_defmd_fn = {
             "Resource": self._create_def_res_md,
@@ -538,7 +558,7 @@ class BagBuilder(PreservationSystem):
         self._bagdir = newdir
 
         if self._bag:
-            self._bag = NISTBag(self._bagdir)
+            self._bag = NISTBag(self._bagdir, conversion=self._conversion)
 
     def ensure_bagdir(self):
         """
@@ -561,7 +581,7 @@ class BagBuilder(PreservationSystem):
         self.connect_logfile()
         if didit:
             self.record("Created bag with name, %s", self.bagname)
-        self._bag = NISTBag(self.bagdir)
+        self._bag = NISTBag(self.bagdir, conversion=self._conversion)
         if (not self._id or not self._ediid) and \
            os.path.exists(self._bag.nerd_file_for("")):
             # load the resource-level metadata that's already there
@@ -1505,9 +1525,7 @@ class BagBuilder(PreservationSystem):
             return 
 
         if not self._mimetypes:
-            mtfile = pkg_resources.resource_filename('nistoar.pdr',
-                                                     'data/mime.types')
-            self._mimetypes = build_mime_type_map([mtfile])
+            self._mimetypes = default_mime_type_map()
         mdata['mediaType'] = self._mimetypes.get(os.path.splitext(dfile)[1][1:],
                                                  defmt)
 
@@ -1865,18 +1883,29 @@ class BagBuilder(PreservationSystem):
         if trim:
             self.trim_data_folders()
 
+        # Inventory the data files once; the remaining steps work from this
+        # inventory rather than re-walking the data directory
+        if not self.bag:
+            self.ensure_bagdir()
+        inv = BagInventory(self.bag)
+        inv.scan_data()
+
         # Make sure all remaining components have metadata
         if finalcfg.get('ensure_component_metadata', True):
-            self.ensure_comp_metadata(updstats=True, extract=False)
-        self.ensure_merged_annotations()
+            self.ensure_comp_metadata(updstats=True, extract=False, inventory=inv)
+
+        # the metadata tree is now complete (apart from merging); inventory it
+        inv.scan_metadata()
+        self.ensure_merged_annotations(inventory=inv)
 
         # Now trim empty metadata folders
         if trim:
             self.trim_metadata_folders()
+            inv.scan_metadata()
 
         self.ensure_bagit_ver()
-        self.write_data_manifest(finalcfg.get('confirm_checksums', False))
-        self.write_mbag_files()
+        self.write_data_manifest(finalcfg.get('confirm_checksums', False), inventory=inv)
+        self.write_mbag_files(inventory=inv)
         # write_ore_file
         # write_pidmapping_file
         self.write_about_file()
@@ -1884,7 +1913,7 @@ class BagBuilder(PreservationSystem):
 
         self.log.error("Implementation of Bag finalization is not complete!")
         self.log.info("Bag does not include PREMIS and ORE files")
-        self.ensure_baginfo()
+        self.ensure_baginfo(inventory=inv)
 
         if stop_logging:
             self._unset_logfile()
@@ -1953,7 +1982,7 @@ class BagBuilder(PreservationSystem):
                     self.log.exception("Failed to remove empty metadata dir: " +
                                        mdir + ": " + str(ex))
 
-    def ensure_comp_metadata(self, updstats=False, extract=False):
+    def ensure_comp_metadata(self, updstats=False, extract=False, inventory=None):
         """
         iterate through all the data files found under the data directory
         and ensure there is metadata describing them.  
@@ -1965,16 +1994,25 @@ class BagBuilder(PreservationSystem):
         :param bool extract:  if True, examine the file and extract metadata
                               from its contents.  If False, no metadata is 
                               extracted.  
+        :param BagInventory inventory:  if provided, iterate through the data
+                              files listed in this inventory (rather than walking
+                              the data directory) and record each file's checksum
+                              into it.
         """
         if not self.bag:
             self.ensure_bagdir()
-        for dfile in self.bag.iter_data_files():
+        if inventory:
+            dfiles = list(inventory.datafiles.keys())
+        else:
+            dfiles = self.bag.iter_data_files()
+
+        for dfile in dfiles:
             mdfile = self.bag.nerd_file_for(dfile)
             dfpath = os.path.join(self.bag.data_dir, dfile)
             if not os.path.exists(mdfile):
                 # no metadata found; start from scratch
                 comptype = self._determine_file_comp_type(dfile)
-                self.register_data_file(dfile, dfpath, extract, comptype)
+                md = self.register_data_file(dfile, dfpath, extract, comptype)
                 if not extract:
                     # register does not do checksum when examine=False;
                     # get it now
@@ -1989,6 +2027,7 @@ class BagBuilder(PreservationSystem):
                 if 'size' not in md or 'mediaType' not in md or \
                    'checksum' not in md:
                     updcstats = True
+                origmd = md
                 md = None
                 if updcstats:
                     md = self.get_file_specs(dfpath, True)
@@ -2001,12 +2040,34 @@ class BagBuilder(PreservationSystem):
                 if md:
                     self.update_metadata_for(dfile, md)
                 self.ensure_ansc_collmd(dfile)
+                if not md or 'checksum' not in md:
+                    md = origmd
 
-    def ensure_merged_annotations(self):
+            if inventory and md and 'hash' in md.get('checksum', {}) and \
+               md['checksum'].get('algorithm', {}).get('tag') == 'sha256':
+                inventory.set_checksum(dfile, md['checksum']['hash'])
+
+    def ensure_merged_annotations(self, inventory=None):
         """
         ensure that the annotations have been merged into the primary 
         NERDm metadata.
-        """
+
+        :param BagInventory inventory:  if provided (and its metadata has been
+                              scanned), take the list of annotated components
+                              from this inventory rather than checking every 
+                              component in the metadata directory.  The sizes
+                              of the updated metadata files will be updated 
+                              in the inventory.
+        """
+        if inventory and inventory.metadata_scanned:
+            mergeconv = self.cfg.get('merge_convention', DEF_MERGE_CONV)
+            self.record("Merging in annotations into all metdata")
+            for comp in inventory.annotated:
+                nerd = self.bag.nerd_metadata_for(comp, mergeconv)
+                self.replace_metadata_for(comp, nerd, message="")
+                inventory.restat(inventory.nerd_file_path(comp))
+            return
+
         # this implementation assumes that merging can be applied multiple
         # times and give the same result.  (It would be better to determine
         # if the annotation's already been applied and not repeat it, for
@@ -2048,7 +2109,7 @@ class BagBuilder(PreservationSystem):
         except OSError, ex:
             raise BagWriteError("Error writing bagit.txt: "+str(ex), cause=ex)
 
-    def write_data_manifest(self, confirm=False):
+    def write_data_manifest(self, confirm=False, inventory=None):
         """
         Write the manifest-<algorithm>.txt file based on the data files that 
         are currently in the data directory.  Each datafile must have a 
@@ -2059,13 +2120,29 @@ class BagBuilder(PreservationSystem):
                               correct and added to the manifest file.  If 
                               True, the checksum will be calculated to ensure
                               the value in the metadata file is correct.
+        :param BagInventory inventory:  if provided, take the list of data
+                              files and (where recorded) their checksums from
+                              this inventory.
         """
         # the checksum should not be part of annotations (?).
         # self.ensure_merged_annotations()
         manfile = os.path.join(self.bagdir, "manifest-sha256.txt")
+        if inventory:
+            dfiles = inventory.datafiles.keys()
+        else:
+            dfiles = self.bag.iter_data_files()
         try:
           with open(manfile, 'w') as fd:
-            for datapath in self.bag.iter_data_files():
+            for datapath in dfiles:
+                checksum = inventory and inventory.checksum_for(datapath)
+                if checksum:
+                    if confirm:
+                        if checksum_of(self._bag._full_dpath(datapath)) != checksum:
+                            raise BagProfileError("Checksum failure for "+datapath)
+                    self._record_manifest_checksum(fd, checksum,
+                                                   os.path.join('data', datapath))
+                    continue
+
                 md = self.bag.nerd_metadata_for(datapath, merge_annots=False)
                 checksum = md.get('checksum')
                 if not checksum or 'hash' not in checksum:
@@ -2094,11 +2171,15 @@ class BagBuilder(PreservationSystem):
         fd.write(filepath)
         fd.write('\n')        
                        
-    def ensure_baginfo(self, overwrite=False, merge_annots=False):
+    def ensure_baginfo(self, overwrite=False, merge_annots=False, inventory=None):
         """
         ensure that a complete bag-info.txt file is written out to the bag.
         Any data that has already been written out will remain, and any missing
         default information will be added.
+
+        :param BagInventory inventory:  if provided, calculate the Payload-Oxum 
+                              and Bag-Size from this inventory rather than 
+                              re-measuring the whole bag.
         """
         if not self._bag:
             self.ensure_bagdir()
@@ -2131,7 +2212,10 @@ format(nerdm['title'].replace('\n', ' '))
             initdata['External-Identifier'].append(nerdm['doi'])
 
         # Calculate the payload Oxum
-        oxum = self._measure_oxum(self._bag._datadir)
+        if inventory and inventory.data_scanned:
+            oxum = inventory.payload_oxum()
+        else:
+            oxum = self._measure_oxum(self._bag._datadir)
         initdata['Payload-Oxum'] = "{0}.{1}".format(oxum[0], oxum[1])
 
         # update the multibag version, deprecation
@@ -2141,7 +2225,10 @@ format(nerdm['title'].replace('\n', ' '))
         self.write_baginfo_data(initdata, overwrite=overwrite)
 
         # calculate and write the size of the bag 
-        oxum = self._measure_oxum(self.bagdir)
+        if inventory and inventory.data_scanned and inventory.metadata_scanned:
+            oxum = inventory.measure_bag()
+        else:
+            oxum = self._measure_oxum(self.bagdir)
         size = self._format_bytes(oxum[0])
         oxum[0] += len("Bag-Size: {0} ".format(size))
         oxum[0] += len("Bag-Oxum: {0}.{1} ".format(oxum[0], oxum[1]))
@@ -2265,9 +2352,13 @@ format(nerdm['title'].replace('\n', ' '))
                     out = textwrap.fill(out, 79, subsequent_indent=' ', expand_tabs=False)
                     print(out.encode('utf-8'), file=fd)
 
-    def write_mbag_files(self, overwrite=False):
+    def write_mbag_files(self, overwrite=False, inventory=None):
         """
         write out tag files for the MultiBag BagIt profile.  
+
+        :param BagInventory inventory:  if provided, take the list of data and
+                              metadata files for the file lookup from this 
+                              inventory rather than walking the bag.
         """
         self.ensure_bagit_ver()
 
@@ -2286,18 +2377,17 @@ format(nerdm['title'].replace('\n', ' '))
         hbag.save_member_bags()
 
         # update the file lookup with the contents of this new bag
-        for dir, sdirs, files in os.walk(self._bag.data_dir):
-            dir = dir[len(self.bagdir)+1:]
-            for f in files:
-                f = os.path.join(dir, f)
-                f = "/".join(f.split(os.sep))
-                hbag.add_file_lookup(f, self.bagname)
-        for dir, sdirs, files in os.walk(self._bag.metadata_dir):
-            dir = dir[len(self.bagdir)+1:]
-            for f in files:
-                f = os.path.join(dir, f)
-                f = "/".join(f.split(os.sep))
+        if inventory and inventory.data_scanned and inventory.metadata_scanned:
+            for f in inventory.iter_lookup_paths():
                 hbag.add_file_lookup(f, self.bagname)
+        else:
+            for root in (self._bag.data_dir, self._bag.metadata_dir):
+                for dir, sdirs, files in os.walk(root):
+                    dir = dir[len(self.bagdir)+1:]
+                    for f in files:
+                        f = os.path.join(dir, f)
+                        f = "/".join(f.split(os.sep))
+                        hbag.add_file_lookup(f, self.bagname)
         for f in "preserv.log ore.txt premis.xml".split():
             if hbag.exists(f):
                 hbag.add_file_lookup(f, self.bagname)
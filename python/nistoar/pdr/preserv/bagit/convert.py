@@ -0,0 +1,390 @@
+"""
+Native (pure-Python) implementations of the NERDm conversions used by the
+bagging framework.
+
+The bagging classes normally rely on the jq-based transforms from
+:py:mod:`nistoar.nerdm.convert`:  :py:class:`~nistoar.nerdm.convert.PODds2Res`
+for converting a POD Dataset record into a NERDm Resource record, and
+:py:class:`~nistoar.nerdm.convert.ComponentCounter` and
+:py:class:`~nistoar.nerdm.convert.HierarchyBuilder` for calculating a resource's
+component inventory and data hierarchy.  Each use of these transforms requires
+executing jq, an overhead that grows with the number of components.  The classes
+in this module offer the same interfaces implemented directly in Python.
+
+Which implementation is used is controlled by a conversion name--either "jq"
+(the default) or "native"--passed to the factory functions
+:py:func:`pod_converter`, :py:func:`component_counter`, and
+:py:func:`hierarchy_builder`.
+"""
+import re, json
+from collections import OrderedDict, Mapping
+from urllib import unquote
+
+from ....nerdm.convert import PODds2Res, ComponentCounter, HierarchyBuilder
+from ....nerdm.constants import core_schema_base, schema_versions
+from .. import ConfigurationException, PODError
+from ... import def_jq_libdir
+
+JQ_CONVERSION = "jq"
+NATIVE_CONVERSION = "native"
+DEF_CONVERSION = JQ_CONVERSION
+CONVERSIONS = [ JQ_CONVERSION, NATIVE_CONVERSION ]
+
+NERDM_CONTEXT = "https://data.nist.gov/od/dm/nerdm-pub-context.jsonld"
+NERDM_SCH_ID = core_schema_base + schema_versions[0] + "#"
+NERD_DEF = NERDM_SCH_ID + "/definitions/"
+NERDPUB_DEF = core_schema_base + "pub/" + schema_versions[0] + "#/definitions/"
+NERDBIB_DEF = core_schema_base + "bib/" + schema_versions[0] + "#/definitions/"
+
+SUBCOLL_TYPE = "nrdp:Subcollection"
+_doi_url_re = re.compile(r'^https?://(dx\.)?doi\.org/')
+_dist_path_re = re.compile(r'/od/ds/(ark:/\w+/)?[\w\-]+/(.+)$')
+_checksum_exts = { "sha256": "SHA-256" }
+
+# POD Dataset properties that are copied into the NERDm record unchanged, in
+# the order they should appear after the properties that require conversion.
+_passthru_props = [ "rights", "issued", "accrualPeriodicity", "dataQuality", "conformsTo",
+                    "describedBy", "describedByType", "isPartOf", "primaryITInvestmentUII",
+                    "spatial", "temporal", "systemOfRecords", "publisher", "language",
+                    "bureauCode", "programCode" ]
+
+def _check_conversion(conversion):
+    if not conversion:
+        conversion = DEF_CONVERSION
+    if conversion not in CONVERSIONS:
+        raise ConfigurationException("Unrecognized NERDm conversion implementation: " +
+                                     str(conversion) + " (should be one of " +
+                                     ", ".join(CONVERSIONS) + ")")
+    return conversion
+
+def pod_converter(conversion=None, jqlib=None):
+    """
+    return a POD-to-NERDm converter of the requested implementation.
+
+    :param str conversion:  the name of the implementation: "jq" or "native"; if
+                            None, "jq" is assumed.
+    :param str jqlib:       the directory containing the jq transform library
+                            (used only with the "jq" implementation)
+    :raise ConfigurationException:  if the conversion name is not recognized
+    """
+    if _check_conversion(conversion) == NATIVE_CONVERSION:
+        return NativePODds2Res()
+    return PODds2Res(jqlib or def_jq_libdir)
+
+def component_counter(conversion=None, jqlib=None):
+    """
+    return a component inventory calculator of the requested implementation.
+
+    :param str conversion:  the name of the implementation: "jq" or "native"; if
+                            None, "jq" is assumed.
+    :param str jqlib:       the directory containing the jq transform library
+                            (used only with the "jq" implementation)
+    :raise ConfigurationException:  if the conversion name is not recognized
+    """
+    if _check_conversion(conversion) == NATIVE_CONVERSION:
+        return NativeComponentCounter()
+    return ComponentCounter(jqlib or def_jq_libdir)
+
+def hierarchy_builder(conversion=None, jqlib=None):
+    """
+    return a data hierarchy builder of the requested implementation.
+
+    :param str conversion:  the name of the implementation: "jq" or "native"; if
+                            None, "jq" is assumed.
+    :param str jqlib:       the directory containing the jq transform library
+                            (used only with the "jq" implementation)
+    :raise ConfigurationException:  if the conversion name is not recognized
+    """
+    if _check_conversion(conversion) == NATIVE_CONVERSION:
+        return NativeHierarchyBuilder()
+    return HierarchyBuilder(jqlib or def_jq_libdir)
+
+class NativePODds2Res(object):
+    """
+    a converter of POD Dataset records into NERDm Resource records, following
+    the mapping implemented by the jq-based :py:class:`~nistoar.nerdm.convert.PODds2Res`.
+    """
+
+    def convert(self, podds, id):
+        """
+        convert the JSON-encoded POD Dataset record into a NERDm record
+
+        :param str podds:  the POD record as a JSON string
+        :param str id:     the identifier to assign to the NERDm record
+        """
+        try:
+            return self.convert_data(json.loads(podds, object_pairs_hook=OrderedDict), id)
+        except ValueError as ex:
+            raise PODError("POD record is not parseable as JSON: " + str(ex))
+
+    def convert_file(self, podfile, id):
+        """
+        convert the POD Dataset record in the given file into a NERDm record
+
+        :param str podfile:  the path to the file containing the POD record
+        :param str id:       the identifier to assign to the NERDm record
+        """
+        with open(podfile) as fd:
+            return self.convert(fd.read(), id)
+
+    def convert_data(self, podds, id):
+        """
+        convert the POD Dataset record into a NERDm record
+
+        :param dict podds:  the POD record as parsed JSON data
+        :param str id:      the identifier to assign to the NERDm record
+        :rtype: OrderedDict
+        """
+        if not isinstance(podds, Mapping):
+            raise PODError("POD record is not a JSON object")
+
+        out = OrderedDict()
+        if id:
+            out['@context'] = [ NERDM_CONTEXT, OrderedDict([("@base", id)]) ]
+        else:
+            out['@context'] = NERDM_CONTEXT
+        out['_schema'] = NERDM_SCH_ID
+        out['_extensionSchemas'] = [ NERDPUB_DEF + "PublicDataResource" ]
+        out['@type'] = [ "nrdp:PublicDataResource" ]
+        out['@id'] = id
+
+        if podds.get('doi'):
+            out['doi'] = doi_to_curie(podds['doi'])
+        for prop in "title contactPoint modified".split():
+            if prop in podds:
+                out[prop] = podds[prop]
+        if 'identifier' in podds:
+            out['ediid'] = podds['identifier']
+        if 'landingPage' in podds:
+            out['landingPage'] = podds['landingPage']
+        if 'description' in podds:
+            out['description'] = split_paragraphs(podds['description'])
+        for prop in "keyword theme".split():
+            if prop in podds:
+                out[prop] = podds[prop]
+        out['topic'] = []
+        if 'references' in podds:
+            out['references'] = [self.convert_reference(r) for r in podds['references']]
+        for prop in "accessLevel license".split():
+            if prop in podds:
+                out[prop] = podds[prop]
+        if 'distribution' in podds:
+            out['components'] = self.convert_distributions(podds['distribution'])
+        for prop in _passthru_props:
+            if prop in podds:
+                out[prop] = podds[prop]
+
+        return out
+
+    def convert_reference(self, url):
+        """
+        convert a POD reference URL into a NERDm reference
+        """
+        out = OrderedDict([
+            ("@type", [ "deo:BibliographicReference" ]),
+            ("@id", "#ref:" + _doi_url_re.sub('', url)),
+            ("refType", "IsReferencedBy"),
+            ("location", url),
+            ("_extensionSchemas", [ NERDBIB_DEF + "DCiteReference" ])
+        ])
+        return out
+
+    def convert_distributions(self, dists):
+        """
+        convert the list of POD distributions into a list of NERDm components.
+        A Subcollection component is inserted ahead of the first file component
+        within it for each folder implied by the files' filepaths.
+        """
+        out = []
+        colls = set()
+        for dist in dists:
+            comp = self.convert_distribution(dist)
+            fp = comp.get('filepath')
+            if fp:
+                parts = fp.split('/')[:-1]
+                for i in range(len(parts)):
+                    coll = "/".join(parts[:i+1])
+                    if coll not in colls:
+                        colls.add(coll)
+                        out.append(self.make_subcollection(coll))
+            out.append(comp)
+        return out
+
+    def make_subcollection(self, filepath):
+        """
+        return a Subcollection component for the given folder filepath
+        """
+        return OrderedDict([
+            ("filepath", filepath),
+            ("@id", "cmps/" + filepath),
+            ("@type", [ SUBCOLL_TYPE ]),
+            ("_extensionSchemas", [ NERDPUB_DEF + "Subcollection" ])
+        ])
+
+    def convert_distribution(self, dist):
+        """
+        convert a POD distribution into a NERDm component
+        """
+        out = OrderedDict([(k, v) for k, v in dist.items() if k != "@type"])
+        if out.get('downloadURL'):
+            fp = filepath_from_url(out['downloadURL'])
+            out['filepath'] = fp
+            out['@id'] = "cmps/" + fp
+            ext = fp.rsplit('.', 1)
+            if len(ext) > 1 and ext[1] in _checksum_exts:
+                out['@type'] = [ "nrdp:ChecksumFile", "nrdp:DownloadableFile",
+                                 "dcat:Distribution" ]
+                out['_extensionSchemas'] = [ NERDPUB_DEF + "ChecksumFile" ]
+                out['algorithm'] = OrderedDict([("@type", "Thing"), ("tag", ext[1])])
+                out['describes'] = "cmps/" + ext[0]
+            else:
+                out['@type'] = [ "nrdp:DataFile", "nrdp:DownloadableFile",
+                                 "dcat:Distribution" ]
+                out['_extensionSchemas'] = [ NERDPUB_DEF + "DataFile" ]
+
+        elif out.get('accessURL'):
+            if _doi_url_re.match(out['accessURL']):
+                out['@type'] = [ "nrd:Hidden", "dcat:Distribution" ]
+                out['@id'] = "#" + doi_to_curie(out['accessURL'])
+            else:
+                out['@type'] = [ "nrdp:AccessPage", "dcat:Distribution" ]
+                out['_extensionSchemas'] = [ NERDPUB_DEF + "AccessPage" ]
+
+        else:
+            out['@type'] = [ "dcat:Distribution" ]
+
+        return out
+
+class NativeComponentCounter(object):
+    """
+    a calculator of the inventory of a NERDm resource's components, producing
+    the same output as the jq-based :py:class:`~nistoar.nerdm.convert.ComponentCounter`.
+    """
+
+    def inventory(self, components):
+        """
+        return the inventories of the resource (as a whole) and of each of its
+        subcollections, in order of the collections' filepaths.
+
+        :param list components:  the list of the resource's components
+        :rtype: list of dict
+        """
+        colls = set([""])
+        for comp in components:
+            if comp.get('filepath') and SUBCOLL_TYPE in comp.get('@type', []):
+                colls.add(comp['filepath'])
+        return [self.inventory_collection(components, c) for c in sorted(colls)]
+
+    def inventory_collection(self, components, collpath):
+        """
+        return the inventory of the collection with the given filepath.  An empty
+        filepath refers to the resource as a whole; in this case, components
+        without a filepath are counted as children of the resource.
+
+        :param list components:  the list of the resource's components
+        :param str collpath:     the filepath of the collection to inventory
+        :rtype: OrderedDict
+        """
+        prefix = (collpath and collpath + '/') or ""
+        childcnt = 0
+        desccnt = 0
+        bytype = {}
+        childcolls = []
+        for comp in components:
+            fp = comp.get('filepath')
+            if not fp:
+                if collpath:
+                    continue
+                ischild = True
+            elif not fp.startswith(prefix):
+                continue
+            else:
+                ischild = '/' not in fp[len(prefix):]
+
+            types = comp.get('@type', [])
+            desccnt += 1
+            if ischild:
+                childcnt += 1
+                if fp and SUBCOLL_TYPE in types:
+                    childcolls.append(fp)
+            for tp in set(types):
+                cnts = bytype.setdefault(tp, [0, 0])
+                cnts[1] += 1
+                if ischild:
+                    cnts[0] += 1
+
+        return OrderedDict([
+            ("forCollection", collpath),
+            ("childCount", childcnt),
+            ("descCount", desccnt),
+            ("byType", [ OrderedDict([("forType", tp), ("childCount", bytype[tp][0]),
+                                      ("descCount", bytype[tp][1])])
+                         for tp in sorted(bytype.keys()) ]),
+            ("childCollections", childcolls)
+        ])
+
+class NativeHierarchyBuilder(object):
+    """
+    a builder of the data hierarchy of a NERDm resource's components, producing
+    the same output as the jq-based :py:class:`~nistoar.nerdm.convert.HierarchyBuilder`.
+    """
+
+    def build_hierarchy(self, components):
+        """
+        return the hierarchy of the given components as a list of the
+        top-level components with filepaths; each subcollection in the
+        hierarchy includes a "children" property listing its members.
+
+        :param list components:  the list of the resource's components
+        :rtype: list of dict
+        """
+        members = OrderedDict()
+        for comp in components:
+            fp = comp.get('filepath')
+            if not fp:
+                continue
+            parent = ""
+            if '/' in fp:
+                parent = fp.rsplit('/', 1)[0]
+            members.setdefault(parent, []).append(comp)
+
+        def build(parent):
+            out = []
+            for comp in members.get(parent, []):
+                node = OrderedDict([("filepath", comp['filepath'])])
+                if SUBCOLL_TYPE in comp.get('@type', []):
+                    node['children'] = build(comp['filepath'])
+                out.append(node)
+            return out
+
+        return build("")
+
+def doi_to_curie(doi):
+    """
+    convert a DOI given as a resolver URL (or a bare DOI) into its "doi:" form
+    """
+    if doi.startswith("doi:"):
+        return doi
+    return "doi:" + _doi_url_re.sub('', doi)
+
+def filepath_from_url(url):
+    """
+    determine a component filepath from its download URL.  If the URL points to
+    the PDR distribution service, the filepath is the portion of the URL path
+    following the dataset identifier (which may be in ARK form); otherwise, it 
+    is the last field in the URL path.
+    """
+    url = url.split('?', 1)[0].split('#', 1)[0]
+    m = _dist_path_re.search(url)
+    if m:
+        return unquote(m.group(2)).strip('/')
+    return unquote(url.rstrip('/').rsplit('/', 1)[-1])
+
+def split_paragraphs(text):
+    """
+    split the given text on blank lines into a list of paragraphs
+    """
+    if not isinstance(text, (str, unicode)):
+        return text
+    out = [p.strip() for p in re.split(r'\n\s*\n', text)]
+    return [p for p in out if p] or [ text ]
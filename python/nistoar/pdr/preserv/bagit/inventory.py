@@ -0,0 +1,169 @@
+"""
+This module provides an in-memory inventory of the contents of a bag that
+can be gathered with a single traversal of its data and metadata directories.
+
+Finalizing a bag (see :py:meth:`~nistoar.pdr.preserv.bagit.builder.BagBuilder.finalize_bag`)
+requires several pieces of information about the bag's files:  the list of data
+files and their checksums (for the manifest), the total size of the payload
+(for the Payload-Oxum), the list of all data and metadata files (for the
+multibag file lookup), and the total size of the bag (for Bag-Size).  Rather
+than walking the bag's directories once for each of these, a
+:py:class:`BagInventory` is built once and consulted by each finalization
+step.
+"""
+import os
+from collections import OrderedDict
+
+from .bag import NERDMD_FILENAME, ANNOTS_FILENAME
+from ...utils import scan_tree
+
+class BagInventory(object):
+    """
+    an inventory of the files in a bag's data and metadata directories.
+
+    The inventory is populated by calling scan_data() and scan_metadata();
+    thereafter, finalization steps can update it (e.g. via set_checksum() or
+    restat()) as they change the bag's contents.
+    """
+
+    def __init__(self, bag):
+        """
+        create an empty inventory for the given bag.
+
+        :param NISTBag bag:  the bag to be inventoried
+        """
+        self.bag = bag
+
+        # data filepath -> [size, checksum-hash]
+        self.datafiles = OrderedDict()
+
+        # bag-relative metadata file path -> size
+        self.metafiles = OrderedDict()
+
+        # component filepaths that have a metadata directory
+        self.components = []
+
+        # component filepaths that have an annotations file ("" for the resource)
+        self.annotated = []
+
+        self._data_scanned = False
+        self._meta_scanned = False
+
+    @property
+    def data_scanned(self):
+        """
+        True if the data directory has been scanned
+        """
+        return self._data_scanned
+
+    @property
+    def metadata_scanned(self):
+        """
+        True if the metadata directory has been scanned
+        """
+        return self._meta_scanned
+
+    def scan_data(self):
+        """
+        walk the data directory, recording each data file and its size.  Any
+        previously recorded data file information is discarded.
+        """
+        self.datafiles = OrderedDict()
+        root = self.bag.data_dir
+        for path, ent in scan_tree(root):
+            self.datafiles[path] = [ent.stat().st_size, None]
+        self._data_scanned = True
+
+    def scan_metadata(self):
+        """
+        walk the metadata directory, recording each metadata file and its
+        size, the components that have metadata, and the components that
+        have annotations.  Any previously recorded metadata information is
+        discarded.
+        """
+        self.metafiles = OrderedDict()
+        self.components = []
+        self.annotated = []
+        root = self.bag.metadata_dir
+        bagdir = self.bag.dir
+        for path, ent in scan_tree(root, dirs=True):
+            if ent.is_dir():
+                if not ent.name.startswith('_'):
+                    self.components.append(path)
+                continue
+            self.metafiles[ent.path[len(bagdir)+1:]] = ent.stat().st_size
+            reldir = os.path.dirname(path)
+            if ent.name == ANNOTS_FILENAME and \
+               not os.path.basename(reldir).startswith('_'):
+                self.annotated.append(reldir)
+        self._meta_scanned = True
+
+    def set_checksum(self, filepath, hash):
+        """
+        record the (SHA-256) checksum hash for a data file
+        """
+        if filepath in self.datafiles:
+            self.datafiles[filepath][1] = hash
+        else:
+            size = os.stat(os.path.join(self.bag.data_dir, filepath)).st_size
+            self.datafiles[filepath] = [size, hash]
+
+    def checksum_for(self, filepath):
+        """
+        return the checksum hash recorded for the given data file or None if
+        one has not been recorded.
+        """
+        return self.datafiles.get(filepath, [None, None])[1]
+
+    def restat(self, bagpath):
+        """
+        update the recorded size of a metadata file after it has been rewritten
+
+        :param str bagpath:  the path to the file relative to the bag's root
+        """
+        self.metafiles[bagpath] = os.stat(os.path.join(self.bag.dir, bagpath)).st_size
+
+    def nerd_file_path(self, comppath):
+        """
+        return the bag-relative path to the NERDm metadata file for the
+        component with the given filepath
+        """
+        return os.path.join(os.path.basename(self.bag.metadata_dir), comppath,
+                            NERDMD_FILENAME)
+
+    def payload_oxum(self):
+        """
+        return the total size in bytes and the number of the data files
+        as a 2-element list.
+        """
+        return [sum([d[0] for d in self.datafiles.values()]), len(self.datafiles)]
+
+    def iter_lookup_paths(self):
+        """
+        iterate through the bag-relative paths (using '/' as the separator)
+        of all the data and metadata files in the inventory.
+        """
+        datadir = os.path.basename(self.bag.data_dir)
+        for f in self.datafiles:
+            yield "/".join([datadir] + f.split(os.sep))
+        for f in self.metafiles:
+            yield "/".join(f.split(os.sep))
+
+    def measure_bag(self):
+        """
+        return the total size in bytes and the number of files in the bag as
+        a 2-element list.  The sizes of the data and metadata files are taken
+        from the inventory; only the remaining parts of the bag (i.e. the tag
+        files) are examined on disk.
+        """
+        oxum = self.payload_oxum()
+        oxum[0] += sum(self.metafiles.values())
+        oxum[1] += len(self.metafiles)
+
+        skip = [self.bag.data_dir, self.bag.metadata_dir]
+        for dir, subdirs, files in os.walk(self.bag.dir):
+            subdirs[:] = [d for d in subdirs if os.path.join(dir, d) not in skip]
+            for f in files:
+                oxum[0] += os.stat(os.path.join(dir, f)).st_size
+                oxum[1] += 1
+        return oxum
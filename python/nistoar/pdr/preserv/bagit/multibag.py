@@ -4,6 +4,7 @@ a single bag into multiple output multbags for preservation.
 """
 from __future__ import print_function, absolute_import
 import os, logging, re, json, shutil
+from collections import OrderedDict
 from functools import cmp_to_key
 
 import multibag
@@ -62,6 +63,13 @@ class MultibagSplitter(object):
                                  multibags.  Default: False
     :prop replace bool:          When splitting, replace the input bag if 
                                  output directory is the same as the input's.
+    :prop split_strategy str:    the algorithm used to assign files to output 
+                                 bags: "neighborly" (the default) fills bags in
+                                 order of the files' sizes; "packed" uses 
+                                 first-fit-decreasing bin packing that keeps 
+                                 the files of a directory together where 
+                                 possible, typically yielding fewer, fuller 
+                                 bags (see OARSplitter).
     """
 
     def __init__(self, source_bagdir, config=None):
@@ -197,7 +205,7 @@ class MultibagSplitter(object):
                 shutil.rmtree(mb)
 
         try:
-            spltr = OARSplitter(self.maxsz, self.trgsz, self.maxhbsz)
+            spltr = self._make_splitter()
             out = spltr.split(self.srcdir, destdir, nameiter, ['Bag-Oxum'],
                               logger=log)
         except:
@@ -228,6 +236,48 @@ class MultibagSplitter(object):
 
         return out
 
+    def _make_splitter(self):
+        return OARSplitter(self.maxsz, self.trgsz, self.maxhbsz,
+                           strategy=self.cfg.get('split_strategy', NEIGHBORLY))
+
+    def plan(self, log=None):
+        """
+        determine how the source bag would be split without writing any output
+        bags and return a summary of the result.  The summary is a dictionary 
+        with the following properties:
+          - members:       the number of output multibags
+          - sizes:         the list of the output bags' sizes, in the order they
+                           would be written (the head bag is last)
+          - headbag_size:  the size of the head bag
+          - total_size:    the total size of all the output bags
+          - split_dirs:    the number of data directories whose files would be 
+                           spread across more than one output bag
+          - strategy:      the splitting strategy used
+        """
+        spltr = self._make_splitter()
+        mfs = list(spltr.plan(self.srcdir).manifests())
+        sizes = [m['totalsize'] for m in mfs]
+
+        dirbags = {}
+        for i, m in enumerate(mfs):
+            for p in m['contents']:
+                p = p.lstrip('/')
+                if p.startswith("data/"):
+                    dirbags.setdefault(os.path.dirname(p), set()).add(i)
+
+        out = OrderedDict([
+            ("members", len(mfs)),
+            ("sizes", sizes),
+            ("headbag_size", (sizes and sizes[-1]) or 0),
+            ("total_size", sum(sizes)),
+            ("split_dirs", len([d for d in dirbags if len(dirbags[d]) > 1])),
+            ("strategy", spltr.strategy)
+        ])
+        if log:
+            log.info("Split plan (%s): %d member bags totaling %d bytes",
+                     spltr.strategy, out['members'], out['total_size'])
+        return out
+
     def _verify_complete(self, srcdir, multidirs):
         headbag = multibag.open_headbag(multidirs[-1])
         if not headbag.is_head_multibag():
@@ -303,13 +353,26 @@ class MultibagSplitter(object):
             self.make_single_multibag()
         return [self.srcdir]
 
+NEIGHBORLY = "neighborly"
+PACKED = "packed"
+
 class OARSplitter(multibag.NeighborlySplitter):
     """
     an implementation of multibag.split.Splitter used to split a source bag
     "the OAR way".  
+
+    With the default "neighborly" strategy, the plan is that of the 
+    NeighborlySplitter, except that the last member bag is merged into the head
+    bag when the result stays within the head bag's size limit.  With the 
+    "packed" strategy, the data files are re-packed using first-fit-decreasing
+    bin packing: the files of each directory are placed together as a group 
+    (largest groups first) into the first bag with room for them, and only 
+    directories larger than a bag are split across bags.  The smallest 
+    resulting bag is merged into the head bag if it fits within the head bag's
+    size limit.  
     """
     def __init__(self, maxsize=60000, targetsize=None, maxhdsize=None,
-                 hbslop=0.05):
+                 hbslop=0.05, strategy=NEIGHBORLY):
         """
         Create the splitter based on the "neighborly" algorithm
 
@@ -325,12 +388,19 @@ class OARSplitter(multibag.NeighborlySplitter):
                              typically smaller than maxsize (for faster 
                              retrieval and cheaper storage).  If not provided
                              (or out of range), it defaults to maxsize.
+        :param str strategy: the packing strategy, either NEIGHBORLY or PACKED
         """
         if not maxhdsize or maxhdsize > maxsize:
             maxhdsize = maxsize
+        if strategy not in (NEIGHBORLY, PACKED):
+            raise ConfigurationException("Unrecognized multibag split strategy: "+str(strategy))
         super(OARSplitter, self).__init__(maxsize, targetsize)
+        self._packsz = targetsize
+        if not self._packsz or self._packsz <= 0 or self._packsz > maxsize:
+            self._packsz = maxsize
         self.maxhdsz = maxhdsize
         self.hbslop = float(hbslop)
+        self.strategy = strategy
 
     def _sorted_files(self, bag):
         datafs = bag._root.subfspath("data")
@@ -343,6 +413,8 @@ class OARSplitter(multibag.NeighborlySplitter):
     
     def _create_plan(self, bagpath):
         out = super(OARSplitter, self)._create_plan(bagpath)
+        if self.strategy == PACKED:
+            return self._repack(out, bagpath)
 
         # the head bag should contain the metadata tree, the preservation log,
         # and other metadata files.  Now check to see if combining the last
@@ -359,6 +431,89 @@ class OARSplitter(multibag.NeighborlySplitter):
 
         return out
 
+    def _repack(self, plan, bagpath):
+        # replace the plan's member manifests with ones created by bin packing
+        # the data files.  Files other than data files (e.g. the metadata 
+        # tree) go into the head bag, which is last.
+        mfs = list(plan.manifests())
+        if not mfs:
+            return plan
+
+        def size_of(p):
+            p = os.path.join(bagpath, p.lstrip('/'))
+            return (os.path.isfile(p) and os.path.getsize(p)) or 0
+        isdata = lambda p: p.lstrip('/').startswith("data/")
+
+        items = []
+        for m in mfs:
+            for p in m['contents']:
+                if isdata(p):
+                    items.append((p, size_of(p), os.path.dirname(p.lstrip('/'))))
+
+        # the head bag's size without data (which may include overhead counted
+        # by the original plan)
+        headonly = [p for p in mfs[-1]['contents'] if not isdata(p)]
+        headsz = mfs[-1]['totalsize'] - sum([size_of(p) for p in mfs[-1]['contents'] if isdata(p)])
+        if headsz < 0:
+            headsz = sum([size_of(p) for p in headonly])
+        for m in mfs[:-1]:
+            other = [p for p in m['contents'] if not isdata(p)]
+            headonly.extend(other)
+            headsz += sum([size_of(p) for p in other])
+
+        bins = self._pack(items, self._packsz)
+        bins.sort(key=lambda b: -b[0])
+
+        # the head bag gets the smallest bin if it fits (or if there are no
+        # head-only files to make up a head bag)
+        head = [headsz, list(headonly)]
+        if bins and (not headonly or bins[-1][0] + headsz <= self.maxhdsz*(1+self.hbslop)):
+            b = bins.pop()
+            head = [headsz + b[0], b[1] + head[1]]
+        bins.append(head)
+
+        plan._manifests = [{"contents": b[1], "totalsize": b[0]} for b in bins]
+        return plan
+
+    def _pack(self, items, capacity):
+        # first-fit-decreasing packing of (path, size, dir) items into bins of
+        # the given capacity, keeping each directory's files together when the
+        # directory fits in a bin.  Each bin is a list: [size, paths, dirs].
+        groups = OrderedDict()
+        for it in items:
+            groups.setdefault(it[2], []).append(it)
+        groups = sorted(groups.values(), key=lambda g: (-sum([i[1] for i in g]), g[0][2]))
+
+        bins = []
+        def place(size, paths, dir, candidates):
+            for b in candidates:
+                if b[0] + size <= capacity:
+                    break
+            else:
+                b = [0, [], set()]
+                bins.append(b)
+            b[0] += size
+            b[1].extend(paths)
+            b[2].add(dir)
+
+        for g in groups:
+            gsz = sum([i[1] for i in g])
+            dir = g[0][2]
+            if gsz <= capacity:
+                place(gsz, [i[0] for i in g], dir, bins)
+                continue
+
+            # too big to keep together: place the files individually, 
+            # preferring bins already holding files from this directory
+            for it in sorted(g, key=lambda i: (-i[1], i[0])):
+                if it[1] >= capacity:
+                    bins.append([it[1], [it[0]], set([dir])])
+                else:
+                    place(it[1], [it[0]], dir,
+                          [b for b in bins if dir in b[2]] + [b for b in bins if dir not in b[2]])
+
+        return [[b[0], b[1]] for b in bins]
+
 class _OARNamer(object):
     """
     A naming iterator that creates bag names matching the NIST-OAR bag 
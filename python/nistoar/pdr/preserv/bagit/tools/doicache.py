@@ -0,0 +1,307 @@
+"""
+a persistent cache of the NERDm metadata produced by resolving DOIs, along with
+a caching wrapper around the DOIResolver that can resolve many DOIs
+concurrently.
+
+Enhancing the references of a dataset (see enhance.ReferenceEnhancer) resolves
+each DOI-identified reference via a remote call each time a SIP's POD is
+applied.  The DOICache saves the NERDm reference and author descriptions
+produced from a DOI in a directory (one JSON file per DOI) that can be shared by
+all the processes on a host.  A cached description is used until it is older
+than the cache's time-to-live; a DOI that was found not to exist is also cached
+(for a shorter time) so that it is not looked up repeatedly.
+
+The CachingDOIResolver is a drop-in replacement for the DOIResolver that
+consults the cache first.  Its prefetch() method resolves a list of DOIs ahead
+of their use, looking up the ones not already cached in parallel using a
+bounded number of threads; requests to any one resolving host are spaced out by
+a minimum interval.
+"""
+import os, re, json, time, hashlib, threading
+from collections import OrderedDict, deque
+from copy import deepcopy
+from urlparse import urlparse
+
+from nistoar.nerdm.convert import DOIResolver
+from nistoar.doi import DOIResolutionException, DOIDoesNotExist
+
+DEF_TTL = 30 * 24 * 3600           # 30 days
+DEF_NEGATIVE_TTL = 24 * 3600       # 1 day
+DEF_ERROR_TTL = 60
+DEF_MAX_WORKERS = 4
+DEF_MIN_INTERVAL = 0.2
+DEF_RESOLVER_URL = "https://doi.org/"
+
+_doipfx = re.compile(r'^((https?://(dx\.)?doi\.org/)|(doi:))', re.I)
+def doi_key(doi):
+    """
+    return the DOI in a normalized form (without a "doi:" or resolver URL
+    prefix and in lower case) suitable for use as a cache key.
+    """
+    return _doipfx.sub('', doi.strip()).lower()
+
+class DOICache(object):
+    """
+    an on-disk cache of NERDm descriptions derived from resolved DOIs.  Each DOI
+    has a JSON file that holds a description for each kind of metadata (e.g.
+    "reference", "authors") derived from it, stamped with the time it was
+    cached.  Files are replaced atomically, so a cache directory can be shared
+    by multiple threads and processes.
+    """
+
+    def __init__(self, cachedir, ttl=DEF_TTL, negative_ttl=DEF_NEGATIVE_TTL):
+        """
+        :param str cachedir:      the directory to store the cached data in; it
+                                  will be created if it does not exist.
+        :param int ttl:           the time, in seconds, that a description
+                                  remains valid
+        :param int negative_ttl:  the time, in seconds, that a record that a
+                                  DOI does not exist remains valid
+        """
+        self.dir = cachedir
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        if not os.path.exists(self.dir):
+            try:
+                os.makedirs(self.dir)
+            except OSError:
+                if not os.path.isdir(self.dir):
+                    raise
+
+    def _file_for(self, doi):
+        h = hashlib.sha1(doi_key(doi).encode('utf-8')).hexdigest()
+        return os.path.join(self.dir, h[:2], h + ".json")
+
+    def _load(self, doi):
+        try:
+            with open(self._file_for(doi)) as fd:
+                return json.load(fd, object_pairs_hook=OrderedDict)
+        except (IOError, ValueError):
+            return OrderedDict()
+
+    def _save(self, doi, data):
+        path = self._file_for(doi)
+        if not os.path.exists(os.path.dirname(path)):
+            try:
+                os.mkdir(os.path.dirname(path))
+            except OSError:
+                pass
+        tmp = "%s.%d.%d.tmp" % (path, os.getpid(), threading.current_thread().ident)
+        with open(tmp, 'w') as fd:
+            json.dump(data, fd)
+        os.rename(tmp, path)
+
+    def get(self, doi, kind):
+        """
+        return the cached entry of the given kind for a DOI, or None if there
+        isn't one or it has expired.  The entry is a dictionary with a "cached"
+        property (the time it was cached) and either a "data" property (the
+        description) or a "missing" property set to True, indicating that the
+        DOI does not exist.
+        """
+        ent = self._load(doi).get(kind)
+        if not ent:
+            return None
+        ttl = self.negative_ttl if ent.get('missing') else self.ttl
+        if time.time() - ent.get('cached', 0) > ttl:
+            return None
+        return ent
+
+    def put(self, doi, kind, data):
+        """
+        cache a description of the given kind for a DOI
+        """
+        self._update(doi, kind, OrderedDict([("cached", time.time()), ("data", data)]))
+
+    def put_missing(self, doi, kind, message=None):
+        """
+        record that the given DOI does not exist
+        """
+        self._update(doi, kind, OrderedDict([("cached", time.time()), ("missing", True),
+                                             ("message", message)]))
+
+    def _update(self, doi, kind, ent):
+        data = self._load(doi)
+        data['doi'] = doi_key(doi)
+        data[kind] = ent
+        self._save(doi, data)
+
+    def forget(self, doi):
+        """
+        remove all cached data for the given DOI
+        """
+        try:
+            os.remove(self._file_for(doi))
+        except OSError:
+            pass
+
+class HostRateLimiter(object):
+    """
+    a thread-safe gate that spaces out the requests made to each host by a
+    minimum interval.
+    """
+
+    def __init__(self, min_interval=DEF_MIN_INTERVAL):
+        self.min_interval = min_interval
+        self._next = {}
+        self._lock = threading.Lock()
+
+    def wait(self, host):
+        """
+        block until a request may be made to the given host
+        """
+        if not self.min_interval:
+            return
+        with self._lock:
+            now = time.time()
+            slot = max(now, self._next.get(host, 0))
+            self._next[host] = slot + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+class CachingDOIResolver(object):
+    """
+    a DOIResolver wrapper that caches the results of resolving DOIs.  It
+    provides the to_reference() and to_authors() methods of the DOIResolver
+    along with prefetch() for resolving many DOIs concurrently.
+
+    This class is configured with the "cache" property of the DOIResolver
+    configuration, a dictionary with the following sub-properties:
+    :prop dir str:  the directory where cached descriptions are kept (required)
+    :prop ttl int (2592000):  the time in seconds that a description is valid
+    :prop negative_ttl int (86400):  the time in seconds to remember that a DOI
+                        does not exist
+    :prop max_workers int (4):  the maximum number of DOIs to resolve at once
+    :prop min_interval float (0.2):  the minimum time in seconds between
+                        requests to the same resolving host
+    The host that DOIs are resolved through is taken from the DOIResolver's
+    "resolver" configuration property (default: "https://doi.org/").
+    """
+
+    def __init__(self, resolver, cache, max_workers=DEF_MAX_WORKERS,
+                 min_interval=DEF_MIN_INTERVAL, resolver_url=DEF_RESOLVER_URL, log=None):
+        """
+        :param DOIResolver resolver:  the resolver to use for uncached DOIs
+        :param DOICache       cache:  the cache to use
+        :param int      max_workers:  the maximum number of DOIs to resolve at once
+        :param float   min_interval:  the minimum time between requests to a host
+        :param str     resolver_url:  the base URL DOIs are resolved through
+        """
+        self.doir = resolver
+        self.cache = cache
+        self.max_workers = max(1, max_workers or 1)
+        self.limiter = HostRateLimiter(min_interval)
+        self.host = urlparse(resolver_url).netloc or resolver_url
+        self.log = log
+
+        # failures other than non-existence are remembered briefly so that a
+        # failed prefetch is not immediately repeated
+        self._errors = {}
+        self._errlock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config, log=None):
+        """
+        create a resolver from a DOIResolver configuration with a "cache" property
+        """
+        ccfg = config.get('cache', {})
+        cache = DOICache(ccfg['dir'], ccfg.get('ttl', DEF_TTL),
+                         ccfg.get('negative_ttl', DEF_NEGATIVE_TTL))
+        return cls(DOIResolver.from_config(config), cache,
+                   ccfg.get('max_workers', DEF_MAX_WORKERS),
+                   ccfg.get('min_interval', DEF_MIN_INTERVAL),
+                   config.get('resolver', DEF_RESOLVER_URL), log)
+
+    def _resolve(self, doi, kind):
+        ent = self.cache.get(doi, kind)
+        if ent:
+            if ent.get('missing'):
+                raise DOIDoesNotExist(doi)
+            return deepcopy(ent['data'])
+
+        key = (doi_key(doi), kind)
+        with self._errlock:
+            err = self._errors.get(key)
+        if err and time.time() - err[0] < DEF_ERROR_TTL:
+            raise err[1]
+
+        self.limiter.wait(self.host)
+        try:
+            if kind == "authors":
+                data = self.doir.to_authors(doi)
+            else:
+                data = self.doir.to_reference(doi)
+        except DOIDoesNotExist as ex:
+            self.cache.put_missing(doi, kind, str(ex))
+            raise
+        except DOIResolutionException as ex:
+            with self._errlock:
+                self._errors[key] = (time.time(), ex)
+            raise
+
+        self.cache.put(doi, kind, data)
+        return deepcopy(data)
+
+    def to_reference(self, doi):
+        """
+        return a NERDm reference description for the given DOI
+        :raises DOIDoesNotExist:  if the DOI is not registered
+        :raises DOIResolutionException:  if the DOI cannot otherwise be resolved
+        """
+        return self._resolve(doi, "reference")
+
+    def to_authors(self, doi):
+        """
+        return a NERDm author list for the given DOI
+        :raises DOIDoesNotExist:  if the DOI is not registered
+        :raises DOIResolutionException:  if the DOI cannot otherwise be resolved
+        """
+        return self._resolve(doi, "authors")
+
+    def prefetch(self, dois, kind="reference"):
+        """
+        ensure that descriptions of the given kind for the given DOIs are
+        cached, resolving the uncached ones concurrently.  Failures are logged
+        and otherwise ignored; they will be raised again when the description
+        is requested.
+
+        :return int:  the number of DOIs that were resolved remotely
+        """
+        todo = deque([d for d in OrderedDict([(doi_key(d), d) for d in dois]).values()
+                        if not self.cache.get(d, kind)])
+        if not todo:
+            return 0
+        count = len(todo)
+
+        def work():
+            while True:
+                try:
+                    doi = todo.popleft()
+                except IndexError:
+                    return
+                try:
+                    self._resolve(doi, kind)
+                except DOIResolutionException as ex:
+                    if self.log:
+                        self.log.warning("Unable to resolve DOI, %s: %s", doi, str(ex))
+                except Exception as ex:
+                    if self.log:
+                        self.log.exception("Unexpected error resolving DOI, %s: %s", doi, str(ex))
+
+        threads = [threading.Thread(target=work) for i in range(min(self.max_workers, count))]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        for t in threads:
+            t.join()
+        return count
+
+def resolver_for(config, log=None):
+    """
+    return a DOI resolver for the given DOIResolver configuration:  a
+    CachingDOIResolver if the configuration includes a "cache" property with a
+    "dir" sub-property; otherwise, a plain DOIResolver.
+    """
+    if config.get('cache', {}).get('dir'):
+        return CachingDOIResolver.from_config(config, log)
+    return DOIResolver.from_config(config)
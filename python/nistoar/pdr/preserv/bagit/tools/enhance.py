@@ -7,6 +7,7 @@ from collections import OrderedDict, Mapping
 
 from nistoar.nerdm.convert import DOIResolver
 from nistoar.doi import is_DOI, DOIResolutionException
+from .doicache import resolver_for
 
 class AuthorFetcher(object):
     """
@@ -20,11 +21,12 @@ class AuthorFetcher(object):
     def __init__(self, cfg=None):
         """
         create a fetcher with the given configuration.  The configuration
-        parameters supported are the same as supported by DOIResolver.
+        parameters supported are the same as supported by DOIResolver, plus 
+        "cache" (see doicache.CachingDOIResolver).
         """
         if cfg == None: cfg = {}
         self.cfg = cfg
-        self.doir = DOIResolver.from_config(self.cfg)
+        self.doir = resolver_for(self.cfg)
 
     def fetch_authors(self, nerd):
         """
@@ -138,11 +140,12 @@ class ReferenceEnhancer(object):
     def __init__(self, cfg=None, log=None):
         """
         create an enhancer with the given configuration.  The configuration
-        parameters supported are the same as supported by DOIResolver.
+        parameters supported are the same as supported by DOIResolver, plus 
+        "cache" (see doicache.CachingDOIResolver).
         """
         if cfg == None: cfg = {}
         self.cfg = cfg
-        self.doir = DOIResolver.from_config(self.cfg)
+        self.doir = resolver_for(self.cfg, log)
         self.log = log
 
     def enhancer_for(self, bagbldr, as_annot=False):
@@ -222,6 +225,7 @@ class ReferenceEnhancer(object):
 
         # Now enhance the ones that are left.  References newly added to
         # the unannotated list will get added to the annotated list.
+        enh.prefetch([loc for loc in unannot if is_DOI(loc)], override)
         for loc in unannot:
             if is_DOI(loc):
                 enh.merge_enhanced_ref(loc, override)
@@ -321,8 +325,23 @@ class ReferenceEnhancer(object):
 
             return True
 
+        def prefetch(self, dois, override=False):
+            """
+            resolve ahead of time (and concurrently) those of the given DOIs 
+            that merge_enhanced_ref() would need to resolve.  This has no 
+            effect unless the DOI resolver supports prefetching (see 
+            doicache.CachingDOIResolver).
+            """
+            if not hasattr(self.doir, 'prefetch'):
+                return
+            need = [d for d in dois if override or
+                                      'citation' not in self.refs.get(normalize_doi(d), {})]
+            if need:
+                self.doir.prefetch(need, "reference")
+
         def enhance_existing(self, override=False):
             locs = self.refs.keys()
+            self.prefetch([loc for loc in locs if is_DOI(loc)], override)
             for loc in locs:
                 if is_DOI(loc):
                     self.merge_enhanced_ref(loc, override)
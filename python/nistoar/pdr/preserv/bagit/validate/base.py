@@ -1,9 +1,12 @@
 """
 This module provides the base validator class
 """
+import os
 from abc import ABCMeta, abstractmethod, abstractproperty
 from collections import Sequence, OrderedDict
 
+from ....utils import scan_tree
+
 ERROR = 1
 WARN  = 2
 REC   = 4
@@ -438,11 +441,8 @@ class ValidatorBase(Validator):
         return out
 
     def _list_payload_files(self, bag):
-        out = set()
-        for root, subdirs, files in os.walk(os.path.join(bag.dir, "data")):
-            root = root[len(bag.dir)+1:]
-            out.update([os.path.join(root, f) for f in files])
-        return out
+        return set([os.path.join("data", p)
+                    for p, ent in scan_tree(os.path.join(bag.dir, "data"))])
 
     def _issue(self, label, message):
         """
@@ -8,6 +8,7 @@ from urlparse import urlparse
 from .base import (Validator, ValidatorBase, ALL, ValidationResults,
                    ERROR, WARN, REC, ALL, PROB)
 from ..bag import NISTBag
+from ....utils import scan_tree
 
 class MultibagValidator(ValidatorBase):
     """
@@ -384,13 +385,12 @@ class MultibagValidator(ValidatorBase):
         
         # get a list of the payload files
         missing = []
-        for root, subdirs, files in os.walk(bag.data_dir):
-            for f in files:
-                if f.startswith(".") or f.startswith("_"):
-                    continue
-                path = os.path.join(root, f)[len(bag.dir)+1:]
-                if path not in paths:
-                    missing.append(path)
+        for path, ent in scan_tree(bag.data_dir):
+            if ent.name.startswith(".") or ent.name.startswith("_"):
+                continue
+            path = ent.path[len(bag.dir)+1:]
+            if path not in paths:
+                missing.append(path)
         
         t = self._issue("3.2-4", "all payload file should "+
                         "be listed in the file-lookup.tsv file")
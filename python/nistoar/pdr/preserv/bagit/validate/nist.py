@@ -13,6 +13,7 @@ from .bagit import BagItValidator
 from .multibag import MultibagValidator
 from ..bag import NISTBag
 from ..... import pdr
+from .....pdr import validation
 from .. import ConfigurationException
 
 DEF_BASE_NERDM_SCHEMA = "https://data.nist.gov/od/dm/nerdm-schema/v0.1#"
@@ -48,8 +49,8 @@ class NISTBagValidator(ValidatorBase):
                 raise ConfigurationException("nerdm_schema_dir directory does "+
                                              "exist: " + schemadir)
             self.mdval = {
-                "_": ejs.ExtValidator.with_schema_dir(schemadir, ejsprefix='_'),
-                "$": ejs.ExtValidator.with_schema_dir(schemadir, ejsprefix='$')
+                "_": validation.get_validator(schemadir, '_'),
+                "$": validation.get_validator(schemadir, '$')
             }
 
     def test_name(self, bag, want=ALL, results=None):
@@ -0,0 +1,18 @@
+"""
+Tools for measuring the performance of the preservation pipeline against synthetic
+submissions.
+
+This package provides two modules:
+* :mod:`synth` -- generates synthetic MIDAS SIPs (data files plus a POD record) with
+  a configurable number of files, size distribution, and directory depth; it can also
+  "churn" the POD record to simulate a user editing the submission.
+* :mod:`run` -- runs the full bagging pipeline (POD application, file examination,
+  finalization, multibag splitting, serialization, and validation) over a synthetic
+  SIP, timing each stage, along with a set of micro-benchmarks.  Results are
+  returned as JSON-ready data that can be compared against a saved baseline.
+
+The ``pdr preserve bench`` command (see :mod:`nistoar.pdr.preserv.cmd.bench`) provides
+a command-line front-end.
+"""
+from .synth import SyntheticSIP, parse_size_dist
+from .run import PipelineBenchmark, compare_to_baseline
@@ -0,0 +1,313 @@
+"""
+This module runs the preservation pipeline over a synthetic SIP and measures the time
+spent in each stage.
+
+The :class:`PipelineBenchmark` class drives a :class:`~nistoar.pdr.preserv.bench.synth.SyntheticSIP`
+through the same sequence of steps that the MIDAS3 publishing and preservation services
+apply to a real submission:
+
+  1. ``pod_apply``  -- the POD record is applied to a new metadata bag
+                       (MIDASMetadataBagger.apply_pod())
+  2. ``examine``    -- the data files are examined for metadata
+                       (MIDASMetadataBagger.enhance_metadata())
+  3. ``churn``      -- (optional) repeated POD updates and re-examination that simulate
+                       a user editing the submission
+  4. ``finalize``   -- the preservation bag is built and finalized
+                       (PreservationBagger.finalize_bag())
+  5. ``split``      -- the bag is split into multibags (MultibagSplitter)
+  6. ``serialize``  -- the output bags are serialized (DefaultSerializer)
+  7. ``validate``   -- the head bag is validated against the NIST profile
+                       (NISTAIPValidator)
+
+After the pipeline completes, a set of micro-benchmarks is run repeatedly over the
+finalized bag (e.g. NISTBag.nerdm_record()).  The results are returned as JSON-ready
+data which can be saved and later used as a baseline with :func:`compare_to_baseline`.
+"""
+import os, time, shutil, tempfile, logging, platform
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from .synth import SyntheticSIP, DEF_FILE_COUNT, DEF_SIZE_DIST, DEF_DIR_DEPTH
+from ..bagger.midas3 import MIDASMetadataBagger, PreservationBagger, MIDASSIP
+from ..bagit import NISTBag
+from ..bagit.multibag import MultibagSplitter
+from ..bagit.serialize import DefaultSerializer
+from ..bagit.validate import NISTAIPValidator
+from ... import utils
+
+DEF_MICRO_REPEAT = 5
+DEF_TOLERANCE = 0.25
+
+class _Timer(object):
+    # a context manager that records the elapsed time of a stage into a dictionary
+    def __init__(self, results, name, log=None):
+        self.results = results
+        self.name = name
+        self.log = log
+        self.data = OrderedDict()
+
+    def __enter__(self):
+        self.start = time.time()
+        self.excluded = 0.0
+        return self.data
+
+    @contextmanager
+    def paused(self):
+        # exclude the time spent within this context from the stage's time
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.excluded += time.time() - start
+
+    def __exit__(self, exc_type, exc_value, tb):
+        out = OrderedDict([("time", time.time() - self.start - self.excluded)])
+        out.update(self.data)
+        if exc_type:
+            out['error'] = str(exc_value)
+        self.results[self.name] = out
+        if self.log:
+            self.log.info("%s: %.3f s", self.name, out['time'])
+        return False
+
+class PipelineBenchmark(object):
+    """
+    a driver for benchmarking the preservation pipeline over a synthetic SIP.
+
+    This class accepts a configuration dictionary with the following properties:
+    :prop filecount int:   the number of data files in the synthetic SIP (default: 100)
+    :prop sizedist str:    the file size distribution specification (see
+                           nistoar.pdr.preserv.bench.synth.parse_size_dist())
+    :prop depth int:       the maximum depth of the SIP's directory hierarchy (default: 2)
+    :prop seed int:        the seed for generating the SIP (default: 0)
+    :prop churn_rounds int:  the number of simulated edits to apply to the POD before
+                           finalization (default: 0)
+    :prop churn_fraction float:  the fraction of files changed in each churn round
+                           (default: 0.1)
+    :prop validate_pod bool:  if True, validate each POD record as it is applied
+                           (default: True)
+    :prop multibag dict:   the configuration for the MultibagSplitter; if not set,
+                           max_bag_size will be set to a quarter of the SIP's size so
+                           that splitting is exercised.
+    :prop serialization str:  the serialization format to apply (default: "zip")
+    :prop micro_repeat int:  the number of times to run each micro-benchmark (default: 5)
+    :prop bagger dict:     additional configuration to pass to the baggers
+    :prop keep_workdir bool:  if True, do not delete the working directory when done
+    """
+
+    def __init__(self, config=None, workdir=None, log=None):
+        """
+        set up the benchmark.
+
+        :param dict config:  the benchmark configuration (see class documentation)
+        :param str workdir:  a directory in which to create the SIP and output bags.  If
+                             not provided, a temporary directory will be created (and
+                             removed when the benchmark is done).
+        :param Logger log:   the logger to send messages to
+        """
+        if config is None:
+            config = {}
+        self.cfg = config
+        self.log = log
+        if not self.log:
+            self.log = logging.getLogger("bench")
+
+        self._tmpwork = not workdir
+        if not workdir:
+            workdir = tempfile.mkdtemp(prefix="pdrbench-")
+        self.workdir = workdir
+
+        self.sip = SyntheticSIP(os.path.join(self.workdir, "sip"),
+                                self.cfg.get('filecount', DEF_FILE_COUNT),
+                                self.cfg.get('sizedist', DEF_SIZE_DIST),
+                                self.cfg.get('depth', DEF_DIR_DEPTH),
+                                seed=self.cfg.get('seed', 0))
+        self.mdbagparent = os.path.join(self.workdir, "mdbags")
+        self.presparent = os.path.join(self.workdir, "presbags")
+        self.serparent = os.path.join(self.workdir, "serialized")
+
+    def _bagger_config(self):
+        cfg = OrderedDict([
+            ('check_data_files', False),
+            ('bag_builder', {
+                'finalize': {
+                    'validate': False,
+                    'check_data_files': False
+                }
+            })
+        ])
+        cfg.update(self.cfg.get('bagger', {}))
+        return cfg
+
+    def _multibag_config(self):
+        cfg = self.cfg.get('multibag')
+        if cfg is None:
+            maxsz = max(self.sip.total_size // 4, 1)
+            cfg = { 'max_bag_size': maxsz, 'max_headbag_size': maxsz,
+                    'verify_complete': True }
+        return cfg
+
+    def run(self):
+        """
+        create the synthetic SIP, run it through the pipeline, and run the
+        micro-benchmarks.
+
+        :return:  the benchmark results
+        :rtype: OrderedDict
+        """
+        results = OrderedDict()
+        results['params'] = self.sip.params()
+        results['params']['churn_rounds'] = self.cfg.get('churn_rounds', 0)
+        results['environment'] = OrderedDict([
+            ("python", platform.python_version()),
+            ("platform", platform.platform()),
+            ("started", time.strftime("%Y-%m-%dT%H:%M:%S"))
+        ])
+        results['stages'] = OrderedDict()
+        results['micro'] = OrderedDict()
+
+        try:
+            for d in (self.mdbagparent, self.presparent, self.serparent):
+                if not os.path.exists(d):
+                    os.makedirs(d)
+
+            with _Timer(results['stages'], "generate", self.log) as data:
+                pod = self.sip.create()
+                data['files'] = len(self.sip.files)
+                data['bytes'] = self.sip.total_size
+
+            bagdir = self.run_pipeline(pod, results['stages'])
+            self.run_micro(bagdir, results['micro'])
+
+        finally:
+            if self._tmpwork and not self.cfg.get('keep_workdir'):
+                shutil.rmtree(self.workdir, ignore_errors=True)
+
+        results['total_time'] = sum([s['time'] for n, s in results['stages'].items()
+                                     if n != "generate"])
+        return results
+
+    def run_pipeline(self, pod, stages):
+        """
+        run the given POD record through the bagging pipeline, recording the time spent
+        in each stage into the given dictionary.
+
+        :return str:  the path to the finalized (but unsplit) preservation bag
+        """
+        bgrcfg = self._bagger_config()
+        validate = self.cfg.get('validate_pod', True)
+
+        mdbagger = MIDASMetadataBagger(self.sip.ediid, self.mdbagparent, self.sip.datadir,
+                                       config=bgrcfg)
+
+        with _Timer(stages, "pod_apply", self.log) as data:
+            mdbagger.apply_pod(pod, validate)
+            data['components'] = len(mdbagger.datafiles or [])
+        with _Timer(stages, "examine", self.log) as data:
+            mdbagger.enhance_metadata(examine="sync")
+            data['files'] = len(mdbagger.datafiles or [])
+
+        rounds = self.cfg.get('churn_rounds', 0)
+        if rounds > 0:
+            timer = _Timer(stages, "churn", self.log)
+            with timer as data:
+                for i in range(rounds):
+                    # generating the changed files is not part of what's measured
+                    with timer.paused():
+                        chgpod = self.sip.churn(self.cfg.get('churn_fraction', 0.1))
+                    mdbagger.apply_pod(chgpod, validate)
+                    mdbagger.enhance_metadata(examine="sync")
+                data['rounds'] = rounds
+                data['files'] = len(mdbagger.datafiles or [])
+        mdbagger.done()
+
+        with _Timer(stages, "finalize", self.log) as data:
+            presbagger = PreservationBagger(mdbagger.bagdir, self.presparent,
+                                            self.sip.datadir, bgrcfg)
+            bagdir = presbagger.finalize_bag()
+            presbagger.done()
+            data['bytes'], data['files'] = utils.measure_dir_size(bagdir)
+
+        # split a copy so that the finalized bag is available for micro-benchmarks
+        splitsrc = os.path.join(self.presparent, "split", os.path.basename(bagdir))
+        shutil.copytree(bagdir, splitsrc)
+        with _Timer(stages, "split", self.log) as data:
+            spltr = MultibagSplitter(splitsrc, self._multibag_config())
+            outbags = spltr.check_and_split(os.path.dirname(splitsrc), self.log)
+            data['bags'] = len(outbags)
+
+        fmt = self.cfg.get('serialization', "zip")
+        with _Timer(stages, "serialize", self.log) as data:
+            ser = DefaultSerializer(self.log)
+            bytes = 0
+            for bag in outbags:
+                bytes += os.stat(ser.serialize(bag, self.serparent, fmt)).st_size
+            data['format'] = fmt
+            data['bytes'] = bytes
+
+        with _Timer(stages, "validate", self.log) as data:
+            res = NISTAIPValidator(self.cfg.get('validator', {})).validate(NISTBag(outbags[-1]))
+            data['issues'] = len(res.failed(res.PROB))
+
+        return bagdir
+
+    def run_micro(self, bagdir, micro):
+        """
+        run the micro-benchmarks over a finalized bag, recording the results in the
+        given dictionary.  Each benchmark is run 'micro_repeat' times, and the minimum,
+        mean, and maximum times are recorded.
+        """
+        bag = NISTBag(bagdir)
+        midassip = MIDASSIP(self.sip.ediid, self.sip.datadir, nerdrec=bag.nerdm_record(True))
+        benches = OrderedDict([
+            ("nerdm_record",     lambda: bag.nerdm_record(True)),
+            ("nerdm_record_inv", lambda: bag.nerdm_record(True, incl_inventory=True)),
+            ("iter_data_files",  lambda: list(bag.iter_data_files())),
+            ("iter_data_comps",  lambda: list(bag.iter_data_components())),
+            ("measure_dir_size", lambda: utils.measure_dir_size(bagdir)),
+            ("available_files",  midassip.available_files),
+            ("registered_files", midassip.registered_files)
+        ])
+
+        n = max(self.cfg.get('micro_repeat', DEF_MICRO_REPEAT), 1)
+        for name, func in benches.items():
+            times = []
+            for i in range(n):
+                start = time.time()
+                func()
+                times.append(time.time() - start)
+            micro[name] = OrderedDict([
+                ("n", n), ("time", sum(times)/n), ("min", min(times)), ("max", max(times))
+            ])
+            if self.log:
+                self.log.info("micro %s: %.4f s", name, micro[name]['time'])
+
+def compare_to_baseline(results, baseline, tolerance=DEF_TOLERANCE, mintime=0.01):
+    """
+    compare benchmark results with those from a baseline run, returning the stages and
+    micro-benchmarks that got slower by more than the given tolerance.  Times below
+    mintime (in seconds) in the baseline are not compared as they are too noisy to be
+    meaningful.
+
+    :param dict results:   the results from PipelineBenchmark.run()
+    :param dict baseline:  previously saved results to compare against
+    :param float tolerance:  the allowed fractional increase in time (e.g. 0.25 allows
+                           a 25% increase)
+    :param float mintime:  the minimum baseline time to consider
+    :return:  a list of regressions, each a dictionary with the properties, "name",
+              "baseline", "current", and "ratio".
+    :rtype: list
+    """
+    out = []
+    for group in ("stages", "micro"):
+        for name, base in baseline.get(group, {}).items():
+            cur = results.get(group, {}).get(name)
+            if not cur or 'time' not in cur or base.get('time', 0) < mintime:
+                continue
+            ratio = cur['time'] / base['time']
+            if ratio > 1.0 + tolerance:
+                out.append(OrderedDict([
+                    ("name", group+"."+name), ("baseline", base['time']),
+                    ("current", cur['time']), ("ratio", ratio)
+                ]))
+    return out
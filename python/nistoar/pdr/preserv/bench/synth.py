@@ -0,0 +1,273 @@
+"""
+This module generates synthetic MIDAS submission information packages (SIPs) for
+benchmarking the preservation pipeline.
+
+A synthetic SIP consists of a MIDAS review directory filled with data files (and their
+SHA-256 checksum files) and a POD record that describes them.  The number of files,
+their sizes, and the depth of the directory hierarchy they are organized into are all
+configurable.  A :class:`SyntheticSIP` can also "churn" its POD record--that is,
+modify, add, and remove files and metadata--to simulate a user editing a submission
+between POD updates.
+
+Generation is deterministic for a given random seed so that benchmark runs over the
+same parameters are comparable.
+"""
+import os, re, math, random, hashlib, time
+from collections import OrderedDict
+from copy import deepcopy
+
+from ...exceptions import ConfigurationException
+from ... import ARK_NAAN
+
+DEF_FILE_COUNT = 100
+DEF_SIZE_DIST = "lognormal:64K:1.5"
+DEF_DIR_DEPTH = 2
+DEF_DIR_BRANCHING = 3
+DEF_RECNUM = "9999"
+DIST_BASE_URL = "https://data.nist.gov/od/ds/"
+
+_sizere = re.compile(r'^(\d+(\.\d*)?)([KMG]?)B?$', re.I)
+_sizemult = { '': 1, 'K': 1024, 'M': 1024**2, 'G': 1024**3 }
+
+def _parse_size(val):
+    m = _sizere.match(val.strip())
+    if not m:
+        raise ConfigurationException("Not a recognized size value: "+val)
+    return int(float(m.group(1)) * _sizemult[m.group(3).upper()])
+
+def parse_size_dist(spec):
+    """
+    convert a file size distribution specification into a function that will produce
+    random sizes according to that distribution.  The specification is a string of the
+    form, NAME:PARAM[:PARAM], where NAME is one of the following:
+      * fixed:SIZE -- all files will have the given SIZE
+      * uniform:MIN:MAX -- sizes are evenly distributed between MIN and MAX
+      * lognormal:MEDIAN:SIGMA -- sizes follow a log-normal distribution with the given
+        median size and (log-space) standard deviation; this mimics the long-tailed
+        distribution typically seen in real datasets.
+    Size values are in bytes and may include a K, M, or G suffix.
+
+    :param str spec:  the distribution specification
+    :return:  a function that takes a random.Random instance and returns a size in bytes
+    :raises ConfigurationException:  if the specification is not recognized
+    """
+    parts = spec.split(':')
+    name = parts[0].lower()
+    try:
+        if name == "fixed" and len(parts) == 2:
+            size = _parse_size(parts[1])
+            return lambda rng: size
+
+        elif name == "uniform" and len(parts) == 3:
+            lo, hi = _parse_size(parts[1]), _parse_size(parts[2])
+            if lo > hi:
+                raise ConfigurationException("uniform size distribution: MIN > MAX")
+            return lambda rng: rng.randint(lo, hi)
+
+        elif name == "lognormal" and len(parts) == 3:
+            mu = math.log(max(_parse_size(parts[1]), 1))
+            sigma = float(parts[2])
+            return lambda rng: int(rng.lognormvariate(mu, sigma))
+
+    except ValueError as ex:
+        raise ConfigurationException("Bad size distribution parameter in "+spec+": "+str(ex))
+
+    raise ConfigurationException("Unrecognized size distribution specification: "+spec)
+
+class SyntheticSIP(object):
+    """
+    a generator of a synthetic MIDAS SIP: a review directory of data files and a POD
+    record describing them.
+
+    The SIP is written under a given root directory in the layout expected by the
+    midas3 baggers:  the data files are written to ``review/RECNUM``, where RECNUM is
+    the record number embedded in the (ARK-based) EDI-ID.
+    """
+
+    def __init__(self, rootdir, filecount=DEF_FILE_COUNT, sizedist=DEF_SIZE_DIST,
+                 depth=DEF_DIR_DEPTH, branching=DEF_DIR_BRANCHING, recnum=DEF_RECNUM,
+                 seed=None):
+        """
+        set up the generator.  No files are written until create() is called.
+
+        :param str rootdir:    the directory to write the SIP under
+        :param int filecount:  the number of data files to create
+        :param str sizedist:   a specification for the distribution of file sizes (see
+                               parse_size_dist())
+        :param int depth:      the maximum depth of the subdirectory hierarchy that files
+                               are organized into; 0 puts all files at the top level.
+        :param int branching:  the number of subdirectories created in each directory
+                               (above the maximum depth)
+        :param str recnum:     the MIDAS record number to assign to the SIP
+        :param int seed:       the seed for the random number generator
+        """
+        self.rootdir = rootdir
+        self.filecount = filecount
+        self.sizedist = sizedist
+        self._sizefor = parse_size_dist(sizedist)
+        self.depth = max(depth, 0)
+        self.branching = max(branching, 1)
+        self.recnum = recnum
+        self.seed = seed
+        self._rng = random.Random(seed)
+        self._next = 0
+        self._block = None
+
+        self.ediid = "ark:/{0}/mds2-{1}".format(ARK_NAAN, recnum)
+        self.reviewdir = os.path.join(rootdir, "review")
+        self.datadir = os.path.join(self.reviewdir, recnum)
+        self.pod = None
+        self.files = OrderedDict()   # filepath -> size
+
+    @property
+    def total_size(self):
+        """
+        the total number of bytes in the data files (excluding checksum files)
+        """
+        return sum(self.files.values())
+
+    def params(self):
+        """
+        return the parameters used to generate this SIP as a JSON-ready dictionary
+        """
+        return OrderedDict([
+            ("filecount", self.filecount),
+            ("sizedist", self.sizedist),
+            ("depth", self.depth),
+            ("branching", self.branching),
+            ("seed", self.seed)
+        ])
+
+    def _dirs(self):
+        out = ['']
+        level = ['']
+        for d in range(self.depth):
+            level = [os.path.join(p, "dir%d" % i) for p in level for i in range(self.branching)]
+            out.extend(level)
+        return out
+
+    def create(self):
+        """
+        write the data files to the SIP's review directory and create its POD record.
+        :return:  the POD record
+        :rtype: OrderedDict
+        """
+        if not os.path.exists(self.datadir):
+            os.makedirs(self.datadir)
+        dirs = self._dirs()
+
+        for i in range(self.filecount):
+            self._add_file(self._rng.choice(dirs))
+
+        self.pod = self._make_pod()
+        return deepcopy(self.pod)
+
+    def _add_file(self, dirpath):
+        self._next += 1
+        filepath = os.path.join(dirpath, "file%05d.dat" % self._next)
+        self._write_file(filepath, max(self._sizefor(self._rng), 0))
+        return filepath
+
+    def _write_file(self, filepath, size):
+        path = os.path.join(self.datadir, filepath)
+        parent = os.path.dirname(path)
+        if not os.path.exists(parent):
+            os.makedirs(parent)
+
+        # vary the content with a header so that every file has a distinct checksum
+        hdr = "{0} {1} {2}\n".format(filepath, self.seed, self._rng.random())
+        if self._block is None:
+            self._block = bytearray(self._rng.getrandbits(8) for i in range(65536))
+        block = self._block
+        csum = hashlib.sha256()
+        with open(path, 'wb') as fd:
+            data = hdr[:size]
+            fd.write(data)
+            csum.update(data)
+            left = size - len(data)
+            while left > 0:
+                data = bytes(block[:left])
+                fd.write(data)
+                csum.update(data)
+                left -= len(data)
+        with open(path+".sha256", 'w') as fd:
+            fd.write(csum.hexdigest())
+            fd.write('\n')
+
+        self.files[filepath] = size
+
+    def _dist_for(self, filepath):
+        url = DIST_BASE_URL + self.ediid + '/' + filepath
+        if filepath.endswith(".sha256"):
+            return OrderedDict([("downloadURL", url), ("mediaType", "text/plain")])
+        return OrderedDict([
+            ("description", "synthetic data file, "+os.path.basename(filepath)),
+            ("downloadURL", url),
+            ("mediaType", "application/octet-stream"),
+            ("title", os.path.basename(filepath))
+        ])
+
+    def _make_pod(self):
+        dists = []
+        for filepath in self.files:
+            dists.append(self._dist_for(filepath))
+            dists.append(self._dist_for(filepath+".sha256"))
+
+        return OrderedDict([
+            ("@type", "dcat:Dataset"),
+            ("accessLevel", "public"),
+            ("bureauCode", ["006:55"]),
+            ("contactPoint", OrderedDict([
+                ("fn", "Synthetic Author"),
+                ("hasEmail", "mailto:synthetic.author@nist.gov")
+            ])),
+            ("description", "A synthetic dataset generated for benchmarking the PDR"),
+            ("distribution", dists),
+            ("identifier", self.ediid),
+            ("keyword", ["benchmark", "synthetic"]),
+            ("landingPage", "https://data.nist.gov/od/id/"+self.ediid),
+            ("language", ["en"]),
+            ("license", "https://www.nist.gov/open/license"),
+            ("modified", time.strftime("%Y-%m-%d")),
+            ("programCode", ["006:045"]),
+            ("publisher", OrderedDict([
+                ("@type", "org:Organization"),
+                ("name", "National Institute of Standards and Technology")
+            ])),
+            ("theme", ["Information Technology"]),
+            ("title", "Synthetic Dataset "+self.recnum)
+        ])
+
+    def churn(self, fraction=0.1):
+        """
+        simulate a user's edits to the submission by modifying, adding, and removing
+        files and updating the POD record accordingly.  Roughly equal numbers of files
+        are rewritten, added, and removed.
+
+        :param float fraction:  the fraction of the current files to change
+        :return:  the updated POD record
+        :rtype: OrderedDict
+        """
+        if self.pod is None:
+            raise RuntimeError("churn(): SIP has not been created yet")
+        nchg = int(math.ceil(fraction * len(self.files)))
+        dirs = self._dirs()
+
+        for i in range(nchg):
+            op = i % 3
+            if op == 0 and self.files:
+                # rewrite an existing file
+                filepath = self._rng.choice(list(self.files.keys()))
+                self._write_file(filepath, max(self._sizefor(self._rng), 0))
+            elif op == 1 or len(self.files) < 2:
+                self._add_file(self._rng.choice(dirs))
+            else:
+                # remove a file from the submission (it stays on disk, as with MIDAS)
+                filepath = self._rng.choice(list(self.files.keys()))
+                del self.files[filepath]
+
+        pod = self._make_pod()
+        pod['title'] = self.pod['title']
+        pod['description'] = self.pod['description'] + " (revised)"
+        self.pod = pod
+        return deepcopy(pod)
@@ -7,8 +7,12 @@ This module defines a set of subcommands to a command called (by default) "prese
 include
   - midas:      preserve an SIP according to the midas3 conventions
   - status:     print information about the preservation status of an SIP
+  - bench:      benchmark the preservation pipeline using a synthetic SIP
+  - log:        print the saved preservation log output for an SIP
+  - audit:      re-verify the checksums of bags in the long-term store
+  - catalog:    update the bag store catalog from the contents of the long-term store
 """
-from . import midas3
+from . import midas3, bench, sublog, fixity, storecat
 from ... import cli
 
 default_name = "preserve"
@@ -32,6 +36,10 @@ def load_into(subparser, as_cmd=None):
         as_cmd = default_name
     out = cli.CommandSuite(as_cmd, p)
     out.load_subcommand(midas3, "midas")
+    out.load_subcommand(bench)
+    out.load_subcommand(sublog)
+    out.load_subcommand(fixity)
+    out.load_subcommand(storecat)
     return out
 
     
@@ -0,0 +1,114 @@
+"""
+CLI command that benchmarks the preservation pipeline using a synthetic SIP
+"""
+from __future__ import print_function
+import logging, argparse, os, sys, json
+
+from nistoar.pdr.exceptions import ConfigurationException
+from nistoar.pdr.preserv.bench import PipelineBenchmark, compare_to_baseline
+from nistoar.pdr.preserv.bench.run import DEF_TOLERANCE
+from nistoar.pdr.utils import read_json, write_json
+from nistoar.pdr.cli import PDRCommandFailure
+
+default_name = "bench"
+help = "benchmark the preservation pipeline with a synthetic SIP"
+description = \
+"""generates a synthetic MIDAS SIP and runs it through the full bagging pipeline (POD application,
+file examination, finalization, multibag splitting, serialization, and validation), timing each stage
+and running micro-benchmarks over the result.  The results are written as JSON and can be compared
+against a previously saved baseline to detect performance regressions.
+"""
+
+def load_into(subparser):
+    """
+    load this command into a CLI by defining the command's arguments and options.
+    :param argparser.ArgumentParser subparser:  the argument parser instance to define this command's
+                                                interface into it
+    :rtype: None
+    """
+    p = subparser
+    p.description = description
+    p.add_argument("-n", "--file-count", metavar="N", type=int, dest="filecount",
+                   help="the number of data files to include in the synthetic SIP")
+    p.add_argument("-s", "--size-dist", metavar="SPEC", type=str, dest="sizedist",
+                   help="the distribution of file sizes, e.g. fixed:1M, uniform:1K:10M, or "+
+                        "lognormal:64K:1.5")
+    p.add_argument("-d", "--depth", metavar="N", type=int, dest="depth",
+                   help="the maximum depth of the SIP's directory hierarchy")
+    p.add_argument("-c", "--churn", metavar="N", type=int, dest="churn_rounds",
+                   help="the number of simulated POD edits to apply before finalization")
+    p.add_argument("-r", "--repeat", metavar="N", type=int, dest="micro_repeat",
+                   help="the number of times to run each micro-benchmark")
+    p.add_argument("--seed", metavar="N", type=int, dest="seed",
+                   help="the seed for generating the synthetic SIP")
+    p.add_argument("-o", "--output", metavar="FILE", type=str, dest="outfile",
+                   help="write the results to FILE (default: standard out)")
+    p.add_argument("-B", "--baseline", metavar="FILE", type=str, dest="baseline",
+                   help="compare the results against the baseline results in FILE; the command "+
+                        "fails if a regression is detected")
+    p.add_argument("-t", "--tolerance", metavar="FRAC", type=float, dest="tolerance",
+                   default=DEF_TOLERANCE,
+                   help="the fractional slow-down allowed before a regression is reported "+
+                        "(default: %(default)s)")
+    p.add_argument("-k", "--keep", action="store_true", dest="keep",
+                   help="do not delete the working directory containing the SIP and output bags")
+
+    return None
+
+def execute(args, config=None, log=None):
+    """
+    execute this command: benchmark the preservation pipeline
+    """
+    if not log:
+        log = logging.getLogger(default_name)
+    if not config:
+        config = {}
+
+    if isinstance(args, list):
+        # cmd-line arguments not parsed yet
+        p = argparse.ArgumentParser()
+        load_into(p)
+        args = p.parse_args(args)
+
+    bcfg = dict(config.get('bench', {}))
+    for param in "filecount sizedist depth churn_rounds micro_repeat seed".split():
+        if getattr(args, param, None) is not None:
+            bcfg[param] = getattr(args, param)
+    if args.keep:
+        bcfg['keep_workdir'] = True
+
+    baseline = None
+    if args.baseline:
+        try:
+            baseline = read_json(args.baseline)
+        except (IOError, ValueError) as ex:
+            raise PDRCommandFailure(default_name, "Unable to read baseline file: "+str(ex), 1, ex)
+
+    workdir = None
+    if args.keep:
+        workdir = os.path.join(config.get('working_dir', os.getcwd()), "pdrbench")
+        if os.path.exists(workdir):
+            raise PDRCommandFailure(default_name, workdir+": working directory already exists", 1)
+        os.mkdir(workdir)
+        log.info("Benchmark working directory: %s", workdir)
+
+    try:
+        results = PipelineBenchmark(bcfg, workdir, log).run()
+    except ConfigurationException as ex:
+        raise PDRCommandFailure(default_name, str(ex), 1, ex)
+
+    if baseline is not None:
+        results['regressions'] = compare_to_baseline(results, baseline, args.tolerance)
+
+    if args.outfile:
+        write_json(results, args.outfile)
+    else:
+        json.dump(results, sys.stdout, indent=4, separators=(',', ': '))
+        print()
+
+    if results.get('regressions'):
+        for reg in results['regressions']:
+            log.error("%s: %.3f s -> %.3f s (x%.2f)", reg['name'], reg['baseline'],
+                      reg['current'], reg['ratio'])
+        raise PDRCommandFailure(default_name, "%d performance regression(s) detected" %
+                                len(results['regressions']), 5)
@@ -0,0 +1,96 @@
+"""
+CLI command that audits the fixity of the bags in the long-term bag store
+"""
+from __future__ import print_function
+import logging, argparse, os, sys, time, json
+
+from nistoar.pdr.exceptions import ConfigurationException
+from nistoar.pdr.preserv.service.fixity import FixityAuditor
+from nistoar.pdr.cli import PDRCommandFailure
+from nistoar.pdr.notify import NotificationService
+
+default_name = "audit"
+help = "re-verify the checksums of bags in the long-term store"
+description = \
+"""re-verifies the checksums of serialized bags in the long-term bag store against their saved 
+checksum files, starting with those that have gone longest without verification.  Each run stops 
+when its budget (configured via the fixity_audit configuration parameter or the options below) is 
+exhausted; the next run resumes where it left off.  This is intended to be run periodically 
+(e.g. via cron) or with the --repeat option.
+"""
+
+def load_into(subparser):
+    """
+    load this command into a CLI by defining the command's arguments and options.
+    :param argparser.ArgumentParser subparser:  the argument parser instance to define this command's
+                                                interface into it
+    :rtype: None
+    """
+    p = subparser
+    p.description = description
+    p.add_argument("-t", "--max-time", metavar="SECS", type=float, dest="maxtime",
+                   help="stop auditing after this many seconds")
+    p.add_argument("-B", "--max-bytes", metavar="BYTES", type=int, dest="maxbytes",
+                   help="stop auditing after reading this many bytes")
+    p.add_argument("-R", "--max-rate", metavar="BYTES", type=float, dest="maxrate",
+                   help="read no more than this many bytes per second")
+    p.add_argument("-r", "--repeat", metavar="SECS", type=float, dest="repeat",
+                   help="after each run, wait this many seconds and run again (until interrupted)")
+    p.add_argument("-c", "--coverage", action="store_true", dest="coverage",
+                   help="print the current coverage metrics (as JSON) rather than auditing")
+
+    return None
+
+def execute(args, config=None, log=None):
+    """
+    execute this command: audit the fixity of the bag store
+    """
+    if not log:
+        log = logging.getLogger(default_name)
+    if not config:
+        config = {}
+
+    if isinstance(args, list):
+        # cmd-line arguments not parsed yet
+        p = argparse.ArgumentParser()
+        load_into(p)
+        args = p.parse_args(args)
+
+    # the auditor configuration is the fixity_audit parameter layered on top of
+    # the store settings
+    cfg = dict([(k, config[k]) for k in ('store_dir', 'restricted_store_dir', 'store_catalog',
+                                         'working_dir') if k in config])
+    cfg.update(config.get('fixity_audit', {}))
+    if args.maxtime is not None:
+        cfg['max_run_time'] = args.maxtime
+    if args.maxbytes is not None:
+        cfg['max_bytes_per_run'] = args.maxbytes
+    if args.maxrate is not None:
+        cfg['max_read_rate'] = args.maxrate
+
+    try:
+        notifier = None
+        if 'notifier' in config:
+            notifier = NotificationService(config['notifier'])
+        auditor = FixityAuditor(cfg, notifier)
+    except ConfigurationException as ex:
+        raise PDRCommandFailure(default_name, "Configuration error: "+str(ex), 2, ex)
+
+    if args.coverage:
+        json.dump(auditor.coverage(), sys.stdout, indent=2)
+        print("")
+        return
+
+    failed = 0
+    while True:
+        summary = auditor.run()
+        failed += summary['failed'] + summary['errors']
+        if not args.repeat:
+            break
+        try:
+            time.sleep(args.repeat)
+        except KeyboardInterrupt:
+            break
+
+    if failed:
+        raise PDRCommandFailure(default_name, "%d bags failed fixity checks" % failed, 4)
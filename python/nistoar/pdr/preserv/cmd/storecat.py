@@ -0,0 +1,72 @@
+"""
+CLI command that brings the bag store catalog up to date with the contents of the long-term bag store
+"""
+from __future__ import print_function
+import logging, argparse, os, sys
+
+from nistoar.pdr.preserv.bagger.storecat import catalog_for
+from nistoar.pdr.cli import PDRCommandFailure
+
+default_name = "catalog"
+help = "update the bag store catalog from the contents of the long-term store"
+description = \
+"""updates the bag store catalog (configured via the store_catalog configuration parameter) so 
+that it reflects the current contents of the long-term bag store directories.  By default, only 
+the files added to or removed from the store since the catalog was last updated are examined; 
+with --rebuild, the catalog entries are regenerated from a full scan of the store.  This is 
+intended to be run after files are moved into or out of the store by means other than the 
+preservation service.
+"""
+
+def load_into(subparser):
+    """
+    load this command into a CLI by defining the command's arguments and options.
+    :param argparser.ArgumentParser subparser:  the argument parser instance to define this command's
+                                                interface into it
+    :rtype: None
+    """
+    p = subparser
+    p.description = description
+    p.add_argument("-r", "--rebuild", action="store_true", dest="rebuild",
+                   help="regenerate the catalog from a full scan of the store")
+    p.add_argument("-d", "--dir", metavar="DIR", type=str, dest="storedir",
+                   help="update the catalog only for this store directory")
+
+    return None
+
+def execute(args, config=None, log=None):
+    """
+    execute this command: update the bag store catalog
+    """
+    if not log:
+        log = logging.getLogger(default_name)
+    if not config:
+        config = {}
+
+    if isinstance(args, list):
+        # cmd-line arguments not parsed yet
+        p = argparse.ArgumentParser()
+        load_into(p)
+        args = p.parse_args(args)
+
+    if not config.get('store_catalog'):
+        raise PDRCommandFailure(default_name, "Configuration error: store_catalog not set", 2)
+    try:
+        storecat = catalog_for(config)
+    except Exception as ex:
+        raise PDRCommandFailure(default_name, "Unable to open store catalog: "+str(ex), 3, ex)
+
+    storedirs = storecat.storedirs
+    if args.storedir:
+        if not storecat.covers(args.storedir):
+            raise PDRCommandFailure(default_name,
+                                    "Not a store directory covered by the catalog: "+args.storedir, 1)
+        storedirs = [os.path.abspath(args.storedir)]
+
+    for d in storedirs:
+        if args.rebuild:
+            count = storecat.rebuild(d)
+            log.info("Rebuilt store catalog for %s: %d files", d, count)
+        else:
+            (added, removed) = storecat.reconcile(d)
+            log.info("Updated store catalog for %s: %d added, %d removed", d, added, removed)
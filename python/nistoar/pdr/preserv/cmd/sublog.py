@@ -0,0 +1,73 @@
+"""
+CLI command that prints the saved preservation log output for an SIP
+"""
+from __future__ import print_function
+import logging, argparse, os, sys, time
+
+from nistoar.pdr.preserv.service.presvlog import PreservationLog, combined_log_path
+from nistoar.pdr.cli import PDRCommandFailure
+
+default_name = "log"
+help = "print the preservation log output for an SIP"
+description = \
+"""looks up the given SIP in the index of the combined preservation log and prints the log output
+saved from its processing.  By default, only the output from the most recent processing is printed.
+"""
+
+def load_into(subparser):
+    """
+    load this command into a CLI by defining the command's arguments and options.
+    :param argparser.ArgumentParser subparser:  the argument parser instance to define this command's
+                                                interface into it
+    :rtype: None
+    """
+    p = subparser
+    p.description = description
+    p.add_argument("sipid", metavar="SIPID", type=str,
+                   help="the ID of the SIP of interest")
+    p.add_argument("-L", "--log-file", metavar="FILE", type=str, dest="logfile",
+                   help="the combined preservation log (default: the log written by the "+
+                        "preservation service, i.e. the logfile config parameter (or "+
+                        "preservation.log) in the logdir directory)")
+    p.add_argument("-a", "--all", action="store_true", dest="all",
+                   help="print the output from every time the SIP was processed")
+    p.add_argument("-l", "--list", action="store_true", dest="list",
+                   help="list the saved log segments for the SIP rather than printing them")
+
+    return None
+
+def execute(args, config=None, log=None):
+    """
+    execute this command: print the preservation log for an SIP
+    """
+    if not log:
+        log = logging.getLogger(default_name)
+    if not config:
+        config = {}
+
+    if isinstance(args, list):
+        # cmd-line arguments not parsed yet
+        p = argparse.ArgumentParser()
+        load_into(p)
+        args = p.parse_args(args)
+
+    logfile = args.logfile or combined_log_path(config)
+    if not os.path.exists(logfile + ".idx"):
+        raise PDRCommandFailure(default_name, logfile+": preservation log index not found", 2)
+    plog = PreservationLog(logfile)
+
+    if args.list:
+        segs = plog.segments(args.sipid)
+        if not segs:
+            raise PDRCommandFailure(default_name, args.sipid+": no log saved for SIP", 3)
+        for seg in segs:
+            print("%s  %s  %d bytes" % (time.strftime("%Y-%m-%d %H:%M:%S",
+                                                      time.localtime(seg['saved'])),
+                                        plog.file_for(seg['gen']) or "(discarded)",
+                                        seg['length']))
+        return
+
+    text = plog.read(args.sipid, not args.all)
+    if text is None:
+        raise PDRCommandFailure(default_name, args.sipid+": no log saved for SIP", 3)
+    sys.stdout.write(text)
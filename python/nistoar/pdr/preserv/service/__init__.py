@@ -31,6 +31,8 @@ This package provides several modules:
 * :mod:`siphandler` -- defines the :class:`~service.SIPHandler` class and 
   implementations appropriate for different SIP types.  
 * :mod:`status` -- manages persistance state for asynchronous preservation tasks
+* :mod:`jobqueue` -- a persistent queue that limits the number of preservation
+  requests processed at once.
 * :mod:`wsgi` -- a REST web service front-end to the preservation service 
   implemented using the Web Service Gateway Interface (WSGI) framework.
 """
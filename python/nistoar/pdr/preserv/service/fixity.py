@@ -0,0 +1,370 @@
+"""
+This module provides an auditor that periodically re-verifies the fixity of
+the serialized bags in the long-term bag store.
+
+When a bag is delivered to the store (see SIPHandler.bagit()), it is
+accompanied by a ".sha256" file containing its checksum.  The FixityAuditor
+recomputes the checksum of each bag and compares it to the one in this file.
+Because the store can be large, each call to run() audits only as much as its
+budget allows--limits can be set on the run's duration and on the number of
+bytes and files it reads--and hashing is throttled to a maximum read rate
+and a maximum fraction of CPU time.  The time each bag was last verified is
+recorded in an SQLite database; each run audits the bags that have gone the
+longest without verification (including those never verified) first, so
+successive runs resume where the previous one left off.
+
+A bag whose checksum does not match (or that cannot be read) triggers a
+"fixity.failure" alert via the NotificationService.  The coverage() method
+summarizes how much of the store has been verified recently; these metrics
+can be written to a JSON file for use by the health checker (see
+nistoar.pdr.health.fixity).
+"""
+import os, time, hashlib, logging, sqlite3
+from collections import OrderedDict
+from contextlib import closing
+
+from ..bagger.utils import is_legal_bag_name
+from ..bagger.storecat import catalog_for
+from .. import ConfigurationException
+from .. import sys as _sys
+from ... import utils
+
+log = logging.getLogger(_sys.system_abbrev).getChild(_sys.subsystem_abbrev).getChild("fixity")
+
+OK = "ok"
+FAILED = "failed"
+UNVERIFIABLE = "unverifiable"   # no (readable) checksum file
+ERROR = "error"                 # bag could not be read
+
+DEF_REVERIFY_DAYS = 90
+CHUNK_SIZE = 1024 * 1024
+
+_schema = """
+CREATE TABLE IF NOT EXISTS bags (
+    path      TEXT PRIMARY KEY,
+    name      TEXT NOT NULL,
+    size      INTEGER,
+    verified  REAL,
+    status    TEXT,
+    message   TEXT,
+    present   INTEGER DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS bags_verified ON bags (present, verified);
+"""
+
+class FixityAuditor(object):
+    """
+    a class that audits the fixity of the bags in the long-term store
+    incrementally, within a resource budget.
+
+    This class is configured with a dictionary supporting the following
+    properties:
+    :prop store_dir str #req:  the directory containing the public bags
+    :prop restricted_store_dir str:  the directory containing the restricted
+                      public bags
+    :prop store_catalog str:  the bag store catalog database (see 
+                      bagger.storecat); if set, the catalog is reconciled with
+                      the contents of the store directories each time they are 
+                      synced.
+    :prop fixity_db str:  the path to the database for recording audit
+                      results (default: fixity.sqlite in working_dir)
+    :prop reverify_after_days float (90):  the number of days after which a
+                      verified bag is due to be verified again
+    :prop max_run_time float (0):  the maximum number of seconds a run may
+                      spend auditing; 0 means no limit
+    :prop max_bytes_per_run int (0):  the maximum number of bytes a run may
+                      read; 0 means no limit
+    :prop max_files_per_run int (0):  the maximum number of bags a run may
+                      verify; 0 means no limit
+    :prop max_read_rate float (0):  the maximum rate, in bytes per second, at
+                      which bags are read; 0 means no limit
+    :prop max_cpu_fraction float (1.0):  the maximum fraction of CPU time the
+                      audit may consume while running
+    :prop metrics_file str:  if set, a file to write coverage metrics to (as
+                      JSON) after each run
+    """
+
+    def __init__(self, config, notifier=None):
+        """
+        create the auditor
+
+        :param dict config:  the auditor configuration
+        :param NotificationService notifier:  the service to send alerts
+                                through; if None, alerts are only logged
+        """
+        self.cfg = config
+        self.notifier = notifier
+
+        self.storedirs = [d for d in [config.get('store_dir'), config.get('restricted_store_dir')]
+                            if d]
+        if not self.storedirs:
+            raise ConfigurationException("FixityAuditor: Missing required property: store_dir")
+        self.storedirs = [os.path.abspath(d) for d in self.storedirs]
+        self.storecat = catalog_for(config)
+
+        self.dbfile = config.get('fixity_db')
+        if not self.dbfile:
+            if not config.get('working_dir'):
+                raise ConfigurationException("FixityAuditor: Missing required property: "+
+                                             "fixity_db (or working_dir)")
+            self.dbfile = os.path.join(config['working_dir'], "fixity.sqlite")
+
+        self.reverify_after = float(config.get('reverify_after_days', DEF_REVERIFY_DAYS)) * 86400
+        self.max_run_time = float(config.get('max_run_time', 0))
+        self.max_bytes = int(config.get('max_bytes_per_run', 0))
+        self.max_files = int(config.get('max_files_per_run', 0))
+        self.max_read_rate = float(config.get('max_read_rate', 0))
+        self.max_cpu = float(config.get('max_cpu_fraction', 1.0))
+        self.metrics_file = config.get('metrics_file')
+
+        with closing(self._connect()) as conn:
+            conn.executescript(_schema)
+
+    def _connect(self):
+        return sqlite3.connect(self.dbfile, timeout=30.0)
+
+    def sync(self):
+        """
+        update the database with the current contents of the store: record
+        newly added bags (as unverified) and mark those no longer present.
+        The bag store catalog, if configured, is also brought up to date.
+
+        :return int:  the number of bags in the store
+        """
+        found = set()
+        for d in self.storedirs:
+            if not os.path.isdir(d):
+                log.warning("Store directory not found: %s", d)
+                continue
+            names = os.listdir(d)
+            if self.storecat and self.storecat.covers(d):
+                try:
+                    self.storecat.reconcile(d, names)
+                except Exception as ex:
+                    log.warning("Failed to reconcile the bag store catalog for %s: %s",
+                                d, str(ex))
+            for name in names:
+                if is_legal_bag_name(name) and not name.endswith(".sha256") and \
+                   not name.endswith(".removed"):
+                    found.add((os.path.join(d, name), name))
+
+        with closing(self._connect()) as conn:
+            with conn:
+                known = set([r[0] for r in conn.execute("SELECT path FROM bags WHERE present=1")])
+                conn.executemany("INSERT OR IGNORE INTO bags (path, name) VALUES (?, ?)",
+                                 [f for f in found if f[0] not in known])
+                conn.executemany("UPDATE bags SET present=1 WHERE path=?",
+                                 [(f[0],) for f in found if f[0] not in known])
+                paths = set([f[0] for f in found])
+                conn.executemany("UPDATE bags SET present=0 WHERE path=?",
+                                 [(p,) for p in known if p not in paths])
+        return len(found)
+
+    def due(self, now=None, limit=None):
+        """
+        return the paths of the bags due for verification, those not verified
+        longest (or ever) first.
+        """
+        if now is None:
+            now = time.time()
+        sql = "SELECT path FROM bags WHERE present=1 AND " + \
+              "(verified IS NULL OR verified < ?) ORDER BY verified IS NOT NULL, verified, path"
+        args = [now - self.reverify_after]
+        if limit:
+            sql += " LIMIT ?"
+            args.append(limit)
+        with closing(self._connect()) as conn:
+            return [r[0] for r in conn.execute(sql, args)]
+
+    def run(self, sync=True):
+        """
+        audit bags that are due for verification until none remain or the
+        run's budget is exhausted.
+
+        :param bool sync:  if True, update the database with the contents of
+                           the store before auditing
+        :return dict:  a summary of the run, with properties, checked, failed,
+                       unverifiable, errors, bytes, elapsed, and remaining
+                       (the number of bags still due)
+        """
+        start = time.time()
+        if sync:
+            self.sync()
+
+        summary = OrderedDict([("started", start), ("checked", 0), ("failed", 0),
+                               ("unverifiable", 0), ("errors", 0), ("bytes", 0)])
+        self._throttle = _Throttle(self.max_read_rate, self.max_cpu)
+        for path in self.due(start):
+            if self._exhausted(summary, start):
+                break
+            status, nbytes = self.verify(path)
+            summary['bytes'] += nbytes
+            if status == OK:
+                summary['checked'] += 1
+            elif status == FAILED:
+                summary['failed'] += 1
+            elif status == UNVERIFIABLE:
+                summary['unverifiable'] += 1
+            else:
+                summary['errors'] += 1
+
+        summary['elapsed'] = time.time() - start
+        summary['remaining'] = len(self.due(start))
+        log.info("Fixity audit: checked %d bags (%d failed) in %.1fs; %d remain due",
+                 summary['checked']+summary['failed'], summary['failed'], summary['elapsed'],
+                 summary['remaining'])
+        if self.metrics_file:
+            self.write_metrics(summary)
+        return summary
+
+    def _exhausted(self, summary, start):
+        done = summary['checked'] + summary['failed'] + summary['unverifiable'] + summary['errors']
+        if self.max_files and done >= self.max_files:
+            return True
+        if self.max_bytes and summary['bytes'] >= self.max_bytes:
+            return True
+        if self.max_run_time and time.time() - start >= self.max_run_time:
+            return True
+        return False
+
+    def verify(self, path):
+        """
+        verify the checksum of the bag at the given path against its ".sha256"
+        file and record the result.
+
+        :return tuple:  the resulting status (one of OK, FAILED, UNVERIFIABLE,
+                        or ERROR) and the number of bytes read
+        """
+        expected = self._read_checksum(path + ".sha256")
+        nbytes = 0
+        msg = None
+        if not expected:
+            status = UNVERIFIABLE
+            msg = "missing or unreadable checksum file"
+            log.warning("%s: %s", os.path.basename(path), msg)
+        else:
+            try:
+                actual, nbytes = self._hash(path)
+                if actual == expected:
+                    status = OK
+                else:
+                    status = FAILED
+                    msg = "checksum mismatch: expected %s, got %s" % (expected, actual)
+            except (IOError, OSError) as ex:
+                status = ERROR
+                msg = "unable to read bag: " + str(ex)
+
+        if status in (FAILED, ERROR):
+            log.error("Fixity check failed for %s: %s", path, msg)
+            if self.notifier:
+                self.notifier.alert("fixity.failure", origin="FixityAuditor",
+                                    summary="Fixity check failed for "+os.path.basename(path),
+                                    desc=msg, file=path)
+
+        with closing(self._connect()) as conn:
+            with conn:
+                conn.execute("UPDATE bags SET verified=?, status=?, message=?, size=? WHERE path=?",
+                             (time.time(), status, msg, nbytes or None, path))
+        return status, nbytes
+
+    def _read_checksum(self, path):
+        try:
+            with open(path) as fd:
+                return (fd.read().split() or [None])[0]
+        except IOError:
+            return None
+
+    def _hash(self, path):
+        throttle = getattr(self, '_throttle', None) or _Throttle(self.max_read_rate, self.max_cpu)
+        sum = hashlib.sha256()
+        nbytes = 0
+        with open(path, 'rb') as fd:
+            while True:
+                buf = fd.read(CHUNK_SIZE)
+                if not buf:
+                    break
+                sum.update(buf)
+                nbytes += len(buf)
+                throttle.consumed(len(buf))
+        return sum.hexdigest(), nbytes
+
+    def coverage(self, now=None):
+        """
+        return metrics describing how much of the store has been verified
+        recently.  The metrics are returned as a dictionary with the
+        properties:
+          - total:          the number of bags in the store (as of the last sync)
+          - verified:       the number of bags verified within the reverification
+                            period
+          - coverage:       the fraction of bags verified within the period
+          - never_verified: the number of bags never verified
+          - failed:         the number of bags whose last check failed
+          - unverifiable:   the number of bags that lack a checksum file
+          - oldest_verified: the epoch time of the least recently verified bag
+          - period_days:    the reverification period in days
+          - failures:       the names of the bags whose last check failed
+        """
+        if now is None:
+            now = time.time()
+        since = now - self.reverify_after
+        with closing(self._connect()) as conn:
+            def count(where, args=()):
+                return conn.execute("SELECT COUNT(*) FROM bags WHERE present=1 AND "+where,
+                                    args).fetchone()[0]
+            total = count("1")
+            out = OrderedDict([
+                ("total", total),
+                ("verified", count("status=? AND verified >= ?", (OK, since))),
+                ("coverage", None),
+                ("never_verified", count("verified IS NULL")),
+                ("failed", count("status IN (?, ?)", (FAILED, ERROR))),
+                ("unverifiable", count("status=?", (UNVERIFIABLE,))),
+                ("oldest_verified", conn.execute("SELECT MIN(verified) FROM bags WHERE present=1")
+                                        .fetchone()[0]),
+                ("period_days", self.reverify_after / 86400),
+                ("failures", [r[0] for r in conn.execute(
+                    "SELECT name FROM bags WHERE present=1 AND status IN (?, ?) ORDER BY name",
+                    (FAILED, ERROR))])
+            ])
+        out['coverage'] = (total and float(out['verified']) / total) or 1.0
+        return out
+
+    def write_metrics(self, lastrun=None):
+        """
+        write the current coverage metrics, along with the given summary of
+        the last run, to the configured metrics file.
+        """
+        metrics = self.coverage()
+        metrics['updated'] = time.time()
+        if lastrun:
+            metrics['last_run'] = lastrun
+        tmp = self.metrics_file + ".tmp"
+        utils.write_json(metrics, tmp)
+        os.rename(tmp, self.metrics_file)
+        return metrics
+
+class _Throttle(object):
+    # keeps reading within a maximum byte rate and CPU fraction by sleeping
+    # as needed
+
+    def __init__(self, max_rate=0, max_cpu=1.0):
+        self.max_rate = max_rate
+        self.max_cpu = max_cpu
+        self.start = time.time()
+        self.cpu0 = self._cpu()
+        self.nbytes = 0
+
+    def _cpu(self):
+        t = os.times()
+        return t[0] + t[1]
+
+    def consumed(self, nbytes):
+        self.nbytes += nbytes
+        elapsed = time.time() - self.start
+        wait = 0
+        if self.max_rate > 0:
+            wait = max(wait, float(self.nbytes) / self.max_rate - elapsed)
+        if 0 < self.max_cpu < 1.0:
+            wait = max(wait, (self._cpu() - self.cpu0) / self.max_cpu - elapsed)
+        if wait > 0:
+            time.sleep(wait)
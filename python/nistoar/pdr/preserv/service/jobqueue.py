@@ -0,0 +1,214 @@
+"""
+This module provides a persistent queue of preservation jobs that is used to
+limit the number of preservation requests that are processed simultaneously.
+
+Each preservation request (i.e. a call to the preservation service's preserve()
+or update()) is added to the queue as a job.  A job may only be started once it
+has been "claimed" from the queue; a claim will only succeed if there are fewer
+than the configured maximum number of jobs running.  When a job's processing
+is complete, it is removed from the queue via finish().
+
+Because the service may run preservation processing in separate processes
+(and a web service may itself run in several processes), the queue's state is
+persisted to a JSON file and updated under an exclusive file lock.  Persisting
+the queue also allows jobs that were waiting or running when the service was
+shut down to be recovered when it restarts (see
+:py:meth:`~nistoar.pdr.preserv.service.service.PreservationService.recover_jobs`).
+"""
+import json, os, fcntl, time
+from collections import OrderedDict
+
+QUEUE_FILE = "_jobqueue.json"
+DEF_MAX_RUNNING = 4
+
+class PreservationJobQueue(object):
+    """
+    a persistent, process-safe queue of preservation jobs.  Each job is
+    represented by a dictionary with the following properties:
+      :prop id str:         the SIP identifier
+      :prop siptype str:    the name of the SIP type (used to create its handler)
+      :prop asupdate bool:  True if the job is an update to an existing AIP
+      :prop queued float:   the epoch time that the job was added to the queue
+      :prop started float:  the epoch time the job was claimed (running jobs only)
+      :prop pid int:        the ID of the process running the job (running jobs
+                            only); this may be None if the job has been claimed
+                            but its process has not yet been launched.
+    """
+
+    def __init__(self, qdir, maxrunning=DEF_MAX_RUNNING):
+        """
+        open the queue.
+
+        :param str qdir:        the directory where the queue's data file is kept;
+                                it will be created if it does not exist.
+        :param int maxrunning:  the maximum number of jobs that may be running at
+                                once; if 0 or None, the number is unlimited.
+        """
+        if not os.path.exists(qdir):
+            os.makedirs(qdir)
+        self._file = os.path.join(qdir, QUEUE_FILE)
+        self._lockfile = self._file + ".lock"
+        self.maxrunning = maxrunning or 0
+
+    def _empty(self):
+        return OrderedDict([("waiting", []), ("running", [])])
+
+    def _load(self):
+        if not os.path.exists(self._file):
+            return self._empty()
+        try:
+            with open(self._file) as fd:
+                return json.load(fd, object_pairs_hook=OrderedDict)
+        except ValueError:
+            return self._empty()
+
+    def _save(self, data):
+        tmpf = self._file + ".tmp"
+        with open(tmpf, 'w') as fd:
+            json.dump(data, fd, indent=2, separators=(',', ': '))
+        os.rename(tmpf, self._file)
+
+    def _update(self, func):
+        # apply func to the queue data under an exclusive lock, saving the data
+        # afterward if func returns a True value as its first return value
+        with open(self._lockfile, 'a') as lockfd:
+            fcntl.flock(lockfd, fcntl.LOCK_EX)
+            try:
+                data = self._load()
+                changed, out = func(data)
+                if changed:
+                    self._save(data)
+                return out
+            finally:
+                fcntl.flock(lockfd, fcntl.LOCK_UN)
+
+    def _read(self):
+        with open(self._lockfile, 'a') as lockfd:
+            fcntl.flock(lockfd, fcntl.LOCK_SH)
+            try:
+                return self._load()
+            finally:
+                fcntl.flock(lockfd, fcntl.LOCK_UN)
+
+    def submit(self, sipid, siptype, asupdate=False, front=False):
+        """
+        add a job to the end of the queue.  If a job for the SIP is already in
+        the queue (waiting or running), the queue is unchanged.
+
+        :param str sipid:     the identifier of the SIP to preserve
+        :param str siptype:   the name of the SIP type
+        :param bool asupdate: True if the job is an update to an existing AIP
+        :param bool front:    if True, add the job to the front of the queue
+                              rather than the end (e.g. when resuming an
+                              interrupted job).
+        :return int:  the job's (1-based) position in the queue of waiting jobs,
+                      or 0 if the job is already running
+        """
+        def add(data):
+            pos = _position(data, sipid)
+            if pos is not None:
+                return (False, pos)
+            job = OrderedDict([("id", sipid), ("siptype", siptype),
+                               ("asupdate", bool(asupdate)), ("queued", time.time())])
+            if front:
+                data['waiting'].insert(0, job)
+                return (True, 1)
+            data['waiting'].append(job)
+            return (True, len(data['waiting']))
+        return self._update(add)
+
+    def position(self, sipid):
+        """
+        return the current position of the job for the given SIP.
+
+        :return:  the (1-based) position in the queue of waiting jobs, 0 if the
+                  job is running, or None if there is no job for the SIP
+        :rtype: int
+        """
+        return _position(self._read(), sipid)
+
+    def claim(self, pid=None):
+        """
+        remove the job at the front of the queue of waiting jobs and mark it
+        as running, if the maximum number of running jobs has not been reached.
+
+        :param int pid:  the ID of the process that will run the job, if known
+        :return:  the claimed job or None if no job may be started now
+        :rtype: dict
+        """
+        def take(data):
+            if not data['waiting']:
+                return (False, None)
+            if self.maxrunning > 0 and len(data['running']) >= self.maxrunning:
+                return (False, None)
+            job = data['waiting'].pop(0)
+            job['started'] = time.time()
+            job['pid'] = pid
+            data['running'].append(job)
+            return (True, job)
+        return self._update(take)
+
+    def set_pid(self, sipid, pid):
+        """
+        record the ID of the process running the given SIP's job
+        """
+        def setpid(data):
+            for job in data['running']:
+                if job['id'] == sipid:
+                    job['pid'] = pid
+                    return (True, True)
+            return (False, False)
+        return self._update(setpid)
+
+    def finish(self, sipid):
+        """
+        remove the job for the given SIP from the queue, whether it is running or
+        still waiting.
+
+        :return:  the removed job or None if there was no job for the SIP
+        :rtype: dict
+        """
+        def remove(data):
+            for jobs in (data['running'], data['waiting']):
+                for i in range(len(jobs)):
+                    if jobs[i]['id'] == sipid:
+                        return (True, jobs.pop(i))
+            return (False, None)
+        return self._update(remove)
+
+    def reap(self, is_alive):
+        """
+        remove from the list of running jobs those whose processing is no
+        longer active.
+
+        :param is_alive:  a function that takes a job dictionary and returns
+                          False if the job's processing is no longer active
+        :return list:  the jobs that were removed
+        """
+        def check(data):
+            dead = [j for j in data['running'] if not is_alive(j)]
+            if dead:
+                data['running'] = [j for j in data['running'] if j not in dead]
+            return (len(dead) > 0, dead)
+        return self._update(check)
+
+    def waiting(self):
+        """
+        return the list of jobs waiting to be started, in order
+        """
+        return self._read()['waiting']
+
+    def running(self):
+        """
+        return the list of jobs currently running
+        """
+        return self._read()['running']
+
+def _position(data, sipid):
+    for job in data['running']:
+        if job['id'] == sipid:
+            return 0
+    for i in range(len(data['waiting'])):
+        if data['waiting'][i]['id'] == sipid:
+            return i+1
+    return None
@@ -0,0 +1,229 @@
+"""
+This module aggregates the timing of preservation processing stages across
+multiple SIPs and processes so that they can be exported as metrics (in the
+Prometheus text exposition format).
+
+Timing spans for individual SIPs are recorded into the SIP's status data
+(see :py:meth:`~nistoar.pdr.preserv.service.status.SIPStatus.end_stage`); as each
+span is completed, it is also folded into a set of per-stage histograms that are
+persisted to a JSON file in the status cache directory.  Because preservation
+is often carried out in separate processes, this file is updated under an
+exclusive file lock.
+"""
+import json, os, fcntl, time
+from collections import OrderedDict
+from copy import deepcopy
+
+METRICS_FILE = "_metrics.json"
+METRICS_PREFIX = "pdr_preserv"
+
+# histogram bucket upper bounds, in seconds
+DEF_BUCKETS = [ 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0 ]
+
+class StageMetrics(object):
+    """
+    a persistent collection of histograms of the time spent in each stage of
+    preservation processing.  For each stage, the following are accumulated:
+    the number of spans recorded, the total elapsed time, a count of spans
+    falling into each of the configured time buckets, the total number of
+    bytes and files processed, and the number of spans that failed.
+    """
+
+    def __init__(self, cachedir, buckets=None):
+        """
+        initialize the collection.  No data is written until record() is called.
+
+        :param str cachedir:  the directory where the metrics data file should be
+                              written
+        :param list buckets:  the upper bounds (in seconds) of the histogram buckets
+        """
+        self._file = os.path.join(cachedir, METRICS_FILE)
+        self._lockfile = self._file + ".lock"
+        if not buckets:
+            buckets = DEF_BUCKETS
+        self.buckets = sorted([float(b) for b in buckets])
+
+    def _empty(self):
+        return OrderedDict([("buckets", self.buckets), ("since", time.time()),
+                            ("stages", OrderedDict())])
+
+    def _load(self):
+        if not os.path.exists(self._file):
+            return self._empty()
+        with open(self._file) as fd:
+            data = json.load(fd, object_pairs_hook=OrderedDict)
+        if data.get('buckets') != self.buckets:
+            # bucket configuration changed; start over
+            return self._empty()
+        return data
+
+    def record(self, stage, elapsed, bytes=None, files=None, failed=False):
+        """
+        add the timing of a completed stage to the histograms
+
+        :param str stage:      the name of the processing stage
+        :param float elapsed:  the time spent in the stage, in seconds
+        :param int bytes:      the number of bytes processed in the stage, if known
+        :param int files:      the number of files processed in the stage, if known
+        :param bool failed:    True if the stage did not complete successfully
+        """
+        with open(self._lockfile, 'a') as lockfd:
+            fcntl.flock(lockfd, fcntl.LOCK_EX)
+            try:
+                try:
+                    data = self._load()
+                except ValueError:
+                    data = self._empty()
+
+                st = data['stages'].setdefault(stage, OrderedDict([
+                    ("count", 0), ("sum", 0.0), ("bucket_counts", [0] * (len(self.buckets)+1)),
+                    ("bytes", 0), ("files", 0), ("failures", 0)
+                ]))
+                st['count'] += 1
+                st['sum'] += elapsed
+                i = 0
+                while i < len(self.buckets) and elapsed > self.buckets[i]:
+                    i += 1
+                st['bucket_counts'][i] += 1
+                if bytes:
+                    st['bytes'] += bytes
+                if files:
+                    st['files'] += files
+                if failed:
+                    st['failures'] += 1
+
+                tmpf = self._file + ".tmp"
+                with open(tmpf, 'w') as fd:
+                    json.dump(data, fd, indent=2, separators=(',', ': '))
+                os.rename(tmpf, self._file)
+            finally:
+                fcntl.flock(lockfd, fcntl.LOCK_UN)
+
+    def read(self):
+        """
+        return the accumulated metrics data
+        """
+        try:
+            return self._load()
+        except ValueError:
+            return self._empty()
+
+    def clear(self):
+        """
+        discard all accumulated metrics
+        """
+        with open(self._lockfile, 'a') as lockfd:
+            fcntl.flock(lockfd, fcntl.LOCK_EX)
+            try:
+                if os.path.exists(self._file):
+                    os.remove(self._file)
+            finally:
+                fcntl.flock(lockfd, fcntl.LOCK_UN)
+
+def merge_metrics(datasets):
+    """
+    combine the data from several StageMetrics collections (as returned by their
+    read() methods) into one.  Collections whose buckets differ from those of
+    the first collection are ignored.
+    """
+    if not datasets:
+        return OrderedDict([("buckets", []), ("stages", OrderedDict())])
+    out = deepcopy(datasets[0])
+    for data in datasets[1:]:
+        if data.get('buckets') != out.get('buckets'):
+            continue
+        out['since'] = min(out.get('since', 0), data.get('since', 0))
+        for stage, st in data.get('stages', {}).items():
+            if stage not in out['stages']:
+                out['stages'][stage] = deepcopy(st)
+                continue
+            tot = out['stages'][stage]
+            for name in "count sum bytes files failures".split():
+                tot[name] = tot.get(name, 0) + st.get(name, 0)
+            tot['bucket_counts'] = [a+b for a, b in zip(tot['bucket_counts'], st['bucket_counts'])]
+    return out
+
+def _fmtnum(val):
+    if isinstance(val, float):
+        return repr(val)
+    return str(val)
+
+def format_prometheus(metrics, prefix=METRICS_PREFIX):
+    """
+    render stage metrics in the Prometheus text exposition format
+
+    :param metrics:     either a StageMetrics instance, the data returned by its
+                        read() method, or a list of either.  If a list is given,
+                        the metrics for like-named stages are summed.
+    :param str prefix:  the prefix to give to all metric names
+    :return:  the formatted metrics
+    :rtype: str
+    """
+    if not isinstance(metrics, (list, tuple)):
+        metrics = [ metrics ]
+    data = merge_metrics([(isinstance(m, StageMetrics) and m.read()) or m for m in metrics])
+    buckets = data.get('buckets', [])
+
+    hist = []
+    counters = OrderedDict([("bytes", []), ("files", []), ("failures", [])])
+    for stage, st in data.get('stages', {}).items():
+        lab = 'stage="%s"' % stage.replace('\\', '\\\\').replace('"', '\\"')
+        cum = 0
+        for le, n in zip(buckets + ["+Inf"], st['bucket_counts']):
+            cum += n
+            hist.append('%s_stage_seconds_bucket{%s,le="%s"} %d' %
+                        (prefix, lab, (le == "+Inf" and le) or _fmtnum(le), cum))
+        hist.append('%s_stage_seconds_sum{%s} %s' % (prefix, lab, _fmtnum(st['sum'])))
+        hist.append('%s_stage_seconds_count{%s} %d' % (prefix, lab, st['count']))
+        for name in counters:
+            counters[name].append('%s_stage_%s_total{%s} %d' %
+                                  (prefix, name, lab, st.get(name, 0)))
+
+    out = [
+        "# HELP %s_stage_seconds Time spent in each preservation processing stage" % prefix,
+        "# TYPE %s_stage_seconds histogram" % prefix
+    ] + hist
+    helps = { "bytes": "Bytes processed in each preservation processing stage",
+              "files": "Files processed in each preservation processing stage",
+              "failures": "Failed executions of each preservation processing stage" }
+    for name, lines in counters.items():
+        out.append("# HELP %s_stage_%s_total %s" % (prefix, name, helps[name]))
+        out.append("# TYPE %s_stage_%s_total counter" % (prefix, name))
+        out.extend(lines)
+
+    return "\n".join(out) + "\n"
+
+def format_lock_stats(stats, prefix=METRICS_PREFIX):
+    """
+    render file lock contention statistics in the Prometheus text exposition
+    format.  
+
+    :param stats:       the statistics by lock class, as returned by 
+                        nistoar.pdr.utils.LockStats.snapshot() (e.g. from 
+                        LockedFile.stats)
+    :param str prefix:  the prefix to give to all metric names
+    :return:  the formatted metrics
+    :rtype: str
+    """
+    metrics = [
+        ("lock_acquisitions_total", "counter", "acquired", 
+         "File lock acquisitions by lock class"),
+        ("lock_slow_acquisitions_total", "counter", "slow", 
+         "File lock acquisitions that exceeded the slow wait threshold"),
+        ("lock_wait_seconds_total", "counter", "wait_total", 
+         "Time spent waiting to acquire file locks"),
+        ("lock_wait_seconds_max", "gauge", "wait_max", 
+         "Longest time spent waiting to acquire a file lock"),
+        ("lock_hold_seconds_total", "counter", "hold_total", 
+         "Time file locks were held"),
+        ("lock_hold_seconds_max", "gauge", "hold_max", 
+         "Longest time a file lock was held")
+    ]
+    out = []
+    for name, mtype, key, help in metrics:
+        out.append("# HELP %s_%s %s" % (prefix, name, help))
+        out.append("# TYPE %s_%s %s" % (prefix, name, mtype))
+        for lockclass, st in stats.items():
+            out.append('%s_%s{class="%s"} %s' % (prefix, name, lockclass.replace('"', '\\"'),
+                                                 _fmtnum(st.get(key, 0))))
+    return "\n".join(out) + "\n"
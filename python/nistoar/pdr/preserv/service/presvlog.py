@@ -0,0 +1,246 @@
+"""
+This module provides the combined preservation log:  a single, rotated log file
+that collects the log output from the processing of each SIP, along with an
+index that allows the log output for a particular SIP to be retrieved directly.
+
+When the preservation of an SIP completes, the log written while processing it
+(the "sub-log") is appended to the combined log as a segment that starts with a
+header line naming the SIP.  To allow many preservation processes to save their
+logs at once, a segment is saved in two steps:  first, under a short-lived
+exclusive lock, space for the segment is reserved at the end of the combined log
+(by extending the file); then, without holding the lock, the sub-log is copied
+into the reserved space.  Once the copy is complete, an entry locating the
+segment is appended to the index, a file of JSON records (one per line) named
+after the combined log with an ".idx" extension.
+
+When the combined log grows beyond a configured size, it is rotated:  it is
+renamed with its generation number appended (e.g. "preservation.log.3"), and a
+new log is started.  (The current generation number is kept in a file with a
+".gen" extension.)  Only a configured number of rotated logs are kept; index
+entries for segments in discarded logs are removed when the index is compacted
+during rotation.
+"""
+import os, fcntl, json, time, re
+from collections import OrderedDict
+
+from ... import config as configmod
+
+DEF_MAX_SIZE = 100 * 1024 * 1024
+DEF_BACKUPS = 10
+DEF_LOGFILE = "preservation.log"
+SEGMENT_HEADER = "----------- Preserving %s --------------\n"
+
+def combined_log_path(config):
+    """
+    return the path to the combined preservation log written by a preservation
+    service with the given configuration:  the 'logfile' property (default: 
+    preservation.log) within the 'logdir' directory (default: the global log 
+    directory).
+    """
+    deflogdir = configmod.global_logdir or configmod.determine_default_logdir()
+    return os.path.join(config.get('logdir', deflogdir), config.get('logfile', DEF_LOGFILE))
+
+class PreservationLog(object):
+    """
+    an interface to a combined preservation log and its index.  This class is
+    safe for use across threads and processes.
+    """
+
+    def __init__(self, logfile, max_size=DEF_MAX_SIZE, backups=DEF_BACKUPS):
+        """
+        :param str logfile:   the path to the combined log file
+        :param int max_size:  the size, in bytes, beyond which the log will be
+                              rotated before a new segment is added; 0 or None
+                              means never rotate.
+        :param int backups:   the number of rotated log files to keep
+        """
+        self.logfile = logfile
+        self.indexfile = logfile + ".idx"
+        self._lockfile = logfile + ".lock"
+        self._genfile = logfile + ".gen"
+        self.max_size = max_size or 0
+        self.backups = backups or 0
+
+        parent = os.path.dirname(os.path.abspath(logfile))
+        if not os.path.isdir(parent):
+            os.makedirs(parent)
+
+    def _lock(self):
+        fd = open(self._lockfile, 'a')
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return fd
+
+    def _unlock(self, fd):
+        try:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            fd.close()
+
+    def _rotated_gens(self):
+        # the generation numbers of the rotated logs, in increasing order
+        pat = re.compile(re.escape(os.path.basename(self.logfile)) + r'\.(\d+)$')
+        out = []
+        for f in os.listdir(os.path.dirname(os.path.abspath(self.logfile))):
+            m = pat.match(f)
+            if m:
+                out.append(int(m.group(1)))
+        return sorted(out)
+
+    def _current_gen(self):
+        # the generation number of the current (unrotated) log
+        try:
+            with open(self._genfile) as fd:
+                return int(fd.read().strip() or 0)
+        except IOError:
+            return 0
+
+    def file_for(self, gen):
+        """
+        return the path to the log file that holds the segments of the given
+        generation, or None if that file has been discarded.
+        """
+        rotated = "%s.%d" % (self.logfile, gen)
+        if os.path.exists(rotated):
+            return rotated
+        if gen == self._current_gen() and os.path.exists(self.logfile):
+            return self.logfile
+        return None
+
+    def _rotate(self):
+        # must be called while holding the lock
+        gen = self._current_gen()
+        if self.backups > 0:
+            os.rename(self.logfile, "%s.%d" % (self.logfile, gen))
+        else:
+            os.remove(self.logfile)
+
+        for old in self._rotated_gens()[:-self.backups or None]:
+            os.remove("%s.%d" % (self.logfile, old))
+        with open(self._genfile, 'w') as fd:
+            fd.write("%d\n" % (gen + 1))
+
+        # drop the index entries for the segments in discarded files
+        keep = set(self._rotated_gens())
+        if os.path.exists(self.indexfile):
+            tmpfile = self.indexfile + ".tmp"
+            with open(self.indexfile) as ifd:
+                with open(tmpfile, 'w') as ofd:
+                    for line in ifd:
+                        try:
+                            if json.loads(line)['gen'] in keep:
+                                ofd.write(line)
+                        except (ValueError, KeyError):
+                            pass
+            os.rename(tmpfile, self.indexfile)
+
+    def _reserve(self, length):
+        # reserve space for a segment of the given length at the end of the
+        # current log, rotating it first if necessary.  The log is returned open
+        # so that the segment lands in it even if it is rotated before the copy
+        # is done.
+        lk = self._lock()
+        try:
+            size = (os.path.exists(self.logfile) and os.stat(self.logfile).st_size) or 0
+            if self.max_size and size > 0 and size + length > self.max_size:
+                self._rotate()
+                size = 0
+            if not os.path.exists(self.logfile):
+                open(self.logfile, 'w').close()
+            fd = open(self.logfile, 'r+')    # not append mode: writes must follow seek()
+            fd.truncate(size + length)
+            return (self._current_gen(), size, fd)
+        finally:
+            self._unlock(lk)
+
+    def _add_to_index(self, entry):
+        lk = self._lock()
+        try:
+            with open(self.indexfile, 'a') as fd:
+                fd.write(json.dumps(entry) + "\n")
+        finally:
+            self._unlock(lk)
+
+    def save(self, sipid, sublog):
+        """
+        append the contents of a sub-log to the combined log as the segment
+        for the given SIP.
+
+        :param str sipid:   the identifier of the SIP that the sub-log describes
+        :param str sublog:  the path to the sub-log file
+        :return dict:  the index entry describing the saved segment
+        """
+        header = SEGMENT_HEADER % sipid
+        with open(sublog) as sfd:
+            # the sub-log may continue to grow; copy only what is there now
+            sublen = os.fstat(sfd.fileno()).st_size
+            length = len(header) + sublen
+            (gen, offset, dfd) = self._reserve(length)
+
+            with dfd:
+                dfd.seek(offset)
+                dfd.write(header)
+                while sublen > 0:
+                    txt = sfd.read(min(sublen, 1024 * 1024))
+                    if not txt:
+                        break
+                    dfd.write(txt)
+                    sublen -= len(txt)
+                if sublen > 0:
+                    # the sub-log shrank; blank out the rest of the reservation
+                    dfd.write(' ' * (sublen - 1) + "\n")
+
+        entry = OrderedDict([("sipid", sipid), ("gen", gen), ("offset", offset),
+                             ("length", length), ("saved", time.time())])
+        self._add_to_index(entry)
+        return entry
+
+    def segments(self, sipid=None):
+        """
+        return the index entries for the saved segments, in the order that they
+        were saved.
+
+        :param str sipid:  if given, return only the entries for this SIP
+        :rtype: list of dict
+        """
+        out = []
+        if not os.path.exists(self.indexfile):
+            return out
+        with open(self.indexfile) as fd:
+            for line in fd:
+                try:
+                    entry = json.loads(line, object_pairs_hook=OrderedDict)
+                except ValueError:
+                    continue
+                if not sipid or entry.get('sipid') == sipid:
+                    out.append(entry)
+        return out
+
+    def read_segment(self, entry):
+        """
+        return the text of the segment described by the given index entry, or
+        None if the log file containing it has been discarded.
+        """
+        logfile = self.file_for(entry['gen'])
+        if not logfile:
+            return None
+        with open(logfile) as fd:
+            fd.seek(entry['offset'])
+            return fd.read(entry['length'])
+
+    def read(self, sipid, latest=False):
+        """
+        return the saved log output for the given SIP.  If the SIP was
+        processed several times, the segments are concatenated in the order
+        they were saved.
+
+        :param str sipid:    the identifier of the SIP of interest
+        :param bool latest:  if True, return only the most recently saved segment
+        :return str:  the log text, or None if there is no saved log for the SIP
+        """
+        ents = self.segments(sipid)
+        if latest:
+            ents = ents[-1:]
+        segs = [s for s in [self.read_segment(e) for e in ents] if s is not None]
+        if not segs:
+            return None
+        return "".join(segs)
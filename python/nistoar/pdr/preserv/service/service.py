@@ -34,11 +34,18 @@ from .. import (PDRException, StateException, IDNotFound,
 from ....id import PDRMinter
 from . import status
 from . import siphandler as hndlr
+from .metrics import StageMetrics, format_prometheus, format_lock_stats
+from .jobqueue import PreservationJobQueue, DEF_MAX_RUNNING
+from . import workerpool as wpool
+from .presvlog import PreservationLog, DEF_MAX_SIZE, DEF_BACKUPS, combined_log_path
+from .trash import Trash
+from ..bagit.builder import default_mime_type_map
 from ...notify import NotificationService
 from ..bagger.prepupd import UpdatePrepService
 from ..bagger.midas3 import midasid_to_bagname
 from ... import config as configmod
-from ... import utils
+from ... import utils, validation
+from ... import def_schema_dir
 
 from .. import PreservationException, sys as _sys
 log = logging.getLogger(_sys.system_abbrev)   \
@@ -49,6 +56,24 @@ log = logging.getLogger(_sys.system_abbrev)   \
 # MultiprocPreservationService
 mp_sync = False
 
+# the time (in seconds) allowed between claiming a job from the queue and 
+# recording the ID of the process running it
+LAUNCH_GRACE_PERIOD = 60
+
+def _pid_is_alive(pid):
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except OSError, e:
+        if e.errno == errno.ESRCH:
+            return False
+        elif e.errno == errno.EPERM:
+            return True
+        else:
+            raise
+    return True
+
 class PreservationService(object):
     """
     A class that asynchronously handles requests to ingest and preserve 
@@ -56,6 +81,37 @@ class PreservationService(object):
     multiple types of SIPs.  Because requests are handled asynchronously 
     (i.e. either via Python threads or subprocesses, depending on the 
     implementation), multiple requests can be managed simultaneously. 
+
+    To avoid overwhelming the system, the number of preservation requests 
+    processed at once is limited:  requests are added to a persistent queue 
+    (see nistoar.pdr.preserv.service.jobqueue) and started only when a slot is 
+    free.  The queue is controlled by the 'job_queue' configuration property, 
+    a dictionary with the following sub-properties:
+    :prop dir str:  the directory where the queue data is kept (default: 
+                    WORKING_DIR/preserv_status)
+    :prop max_concurrent int (4):  the maximum number of preservation requests 
+                    that may be processed at once; 0 means no limit.
+    :prop poll_interval float (5):  the interval, in seconds, at which to check 
+                    for free slots while there are requests waiting in the queue
+    :prop recover_on_start bool (True):  if True, look for requests that were 
+                    interrupted by a previous shutdown of the service at 
+                    construction time (see recover_jobs()).
+    :prop resume_interrupted bool (True):  if True, interrupted requests will be 
+                    restarted; otherwise, they will be marked as failed.
+
+    The top-level 'json_codec' configuration property selects the library used to 
+    read and write JSON metadata and state files: "json" (the standard library), 
+    "simplejson", or "auto" (default; the fastest one installed).  See 
+    nistoar.pdr.utils.set_json_codec().  The 'slow_lock_threshold' property sets 
+    the time, in seconds, that a thread may wait to lock a file before the wait is
+    logged as a warning (see nistoar.pdr.utils.LockedFile).
+
+    Bags and files that are no longer needed after preservation are discarded
+    into a trash area and deleted in the background (see 
+    nistoar.pdr.preserv.service.trash).  The 'cleanup' configuration property 
+    is a dictionary of Trash parameters passed to the SIP handlers; in addition, 
+    its 'collect' sub-property (default: True) controls whether this service 
+    starts threads that empty the handlers' trash areas.  
     """
     __metaclass__ = ABCMeta
 
@@ -64,6 +120,9 @@ class PreservationService(object):
         initialize the service based on the given configuration.
         """
         self.cfg = deepcopy(config)
+        utils.set_json_codec(self.cfg.get('json_codec', 'auto'))
+        if 'slow_lock_threshold' in self.cfg:
+            utils.LockedFile.slow_wait_threshold = self.cfg['slow_lock_threshold']
 
         workdir = self.cfg.get('working_dir')
         if not workdir:
@@ -119,6 +178,23 @@ class PreservationService(object):
         else:
             log.warning("repo_access not configured; can't support updates!")
 
+        # set up the queue that limits the number of simultaneous preservations
+        qcfg = self.cfg.get('job_queue', {})
+        self._queue = PreservationJobQueue(qcfg.get('dir', os.path.join(self.workdir,
+                                                                        'preserv_status')),
+                                           qcfg.get('max_concurrent', DEF_MAX_RUNNING))
+        self._workers = {}
+        self._monitor = None
+        self._qlock = threading.RLock()
+        if qcfg.get('recover_on_start', True):
+            self.recover_jobs()
+
+        # start the threads that delete what the SIP handlers discard; this 
+        # includes anything left in the trash from before a restart.
+        self._collectors = []
+        if self.cfg.get('cleanup', {}).get('collect', True):
+            self._start_trash_collectors()
+
     def _get_def_siptype(self):
         return 'midas3'
 
@@ -203,8 +279,8 @@ class PreservationService(object):
             raise PreservationException("Requested SIP cannot be preserved: " +
                                         hdlr.status.message)
 
-        # we're good to go; launch the handler asynchronously
-        return self._launch_handler(hdlr, timeout)[0]
+        # we're good to go; queue the handler to be launched asynchronously
+        return self._submit_handler(hdlr, timeout)
 
     def update(self, sipid, siptype=None, timeout=None):
         """
@@ -285,8 +361,8 @@ class PreservationService(object):
             raise PreservationException("Requested SIP cannot be preserved: " +
                                         hdlr.status.message)
 
-        # we're good to go; launch the handler asynchronously
-        return self._launch_handler(hdlr, timeout)[0]
+        # we're good to go; queue the handler to be launched asynchronously
+        return self._submit_handler(hdlr, timeout)
 
         
     @abstractmethod
@@ -295,8 +371,193 @@ class PreservationService(object):
         launch the given handler in a separate thread.  After launching, 
         this function will join with the thread for a maximum time given by 
         the timeout value.  
+
+        :return tuple:  a 2-tuple containing the handler's status and the worker 
+                        (e.g. a Thread or Process) running it (or None if it 
+                        was run synchronously).  
         """
         raise NotImplementedError()
+
+    def _submit_handler(self, handler, timeout=None):
+        """
+        add the given handler's SIP to the queue of preservation jobs and launch 
+        it if the maximum number of simultaneous preservations has not been 
+        reached.  If it cannot be launched yet, its status will be updated with 
+        its position in the queue.  
+        """
+        try:
+            self._queue.submit(handler.sipid, handler.name, handler._asupdate)
+        except Exception as ex:
+            log.exception("Failed to queue preservation for sipid=%s: %s",
+                          handler.sipid, str(ex))
+            handler.set_state(status.FAILED,
+                              "Failed to queue preservation due to internal error")
+            return handler.status
+
+        out = self._dispatch(handler, timeout)
+        if out is None:
+            pos = self._queue.position(handler.sipid)
+            if pos:
+                log.info("%s: preservation waiting in queue (position %d)",
+                         handler.sipid, pos)
+                handler._status.set_queue_position(pos)
+                self._start_monitor()
+            out = handler.status
+        return out
+
+    def _dispatch(self, handler=None, timeout=None):
+        """
+        launch as many of the queued preservation jobs as there are free slots 
+        for.  If the job for the given handler is among those launched, this 
+        handler instance will be used to launch it, waiting for up to timeout 
+        seconds for it to finish; all other jobs are launched without waiting.
+
+        :return dict:  the status of the given handler if it was launched; 
+                       None, otherwise
+        """
+        out = None
+        self._reap_jobs()
+        while True:
+            job = self._queue.claim()
+            if not job:
+                break
+
+            if handler and job['id'] == handler.sipid:
+                hdlr, tmo = handler, timeout
+            else:
+                try:
+                    hdlr = self._make_handler(job['id'], job['siptype'], job['asupdate'])
+                except Exception as ex:
+                    log.exception("%s: Unable to launch queued preservation: %s",
+                                  job['id'], str(ex))
+                    self._queue.finish(job['id'])
+                    continue
+                tmo = 0
+
+            log.debug("%s: launching queued preservation", job['id'])
+            (stat, worker) = self._launch_handler(hdlr, tmo)
+            if worker is not None and worker.is_alive():
+                self._workers[job['id']] = worker
+                self._queue.set_pid(job['id'], getattr(worker, 'pid', None) or os.getpid())
+            else:
+                # completed synchronously
+                self._workers.pop(job['id'], None)
+                self._queue.finish(job['id'])
+            if hdlr is handler:
+                out = stat
+
+        return out
+
+    def _job_done(self, sipid):
+        # called when a worker has completed its processing of a job
+        self._workers.pop(sipid, None)
+        self._queue.finish(sipid)
+        self._dispatch()
+
+    def _job_is_alive(self, job):
+        # return True if the given running job appears to still be active
+        worker = self._workers.get(job['id'])
+        if worker is not None:
+            return worker.is_alive()
+
+        pid = job.get('pid')
+        if not pid:
+            # the job has been claimed but not yet launched
+            return time.time() - job.get('started', 0) < LAUNCH_GRACE_PERIOD
+        if pid == os.getpid():
+            # the job may be running in a thread of this process
+            return any([t.name == job['id'] and t.is_alive()
+                        for t in threading.enumerate()])
+        return _pid_is_alive(pid)
+
+    def _reap_jobs(self):
+        # remove jobs from the queue whose processing is no longer active,
+        # marking as failed any that did not finish cleanly
+        with self._qlock:
+            dead = self._queue.reap(self._job_is_alive)
+            for sipid, worker in list(self._workers.items()):
+                if not worker.is_alive():
+                    # (for processes, this also cleans up the exited child)
+                    self._workers.pop(sipid, None)
+        for job in dead:
+            self._workers.pop(job['id'], None)
+            try:
+                hdlr = self._make_handler(job['id'], job['siptype'], job['asupdate'])
+                if hdlr.state == status.IN_PROGRESS or hdlr.state == status.PENDING:
+                    log.error("%s: preservation worker died unexpectedly", job['id'])
+                    hdlr.set_state(status.FAILED,
+                                   "preservation process died for unknown reasons")
+            except Exception as ex:
+                log.warning("%s: Unable to check status of finished job: %s",
+                            job['id'], str(ex))
+
+    def _start_trash_collectors(self):
+        trashdirs = set()
+        for tp in self.siptypes:
+            pcfg = self._get_handler_config(tp)
+            try:
+                trash = Trash(pcfg.get('cleanup', {}), pcfg['working_dir'])
+            except Exception as ex:
+                log.warning("Unable to set up trash area for %s SIPs: %s", tp, str(ex))
+                continue
+            if trash.deferred and trash.dir not in trashdirs:
+                trashdirs.add(trash.dir)
+                self._collectors.append(trash.start_collector())
+
+    def shutdown(self, timeout=None):
+        """
+        stop the background activities of this service.
+
+        :param float timeout:  the maximum time to wait for each background 
+                               thread to exit
+        """
+        for coll in self._collectors:
+            coll.stop(timeout)
+
+    def _start_monitor(self):
+        # start a thread that will launch waiting jobs as slots become free
+        with self._qlock:
+            if self._monitor and self._monitor.is_alive():
+                return
+            interval = self.cfg.get('job_queue', {}).get('poll_interval', 5)
+            self._monitor = _QueueMonitor(self, interval)
+            self._monitor.start()
+
+    def recover_jobs(self):
+        """
+        look for preservation jobs that were interrupted by a previous shutdown 
+        of the service and either requeue them (at the front of the queue) or 
+        mark them as failed, according to the 'resume_interrupted' 
+        configuration parameter.  Any jobs waiting in the queue will then be 
+        launched as slots allow.  This is called automatically at construction
+        time unless the 'recover_on_start' configuration parameter is False.
+        """
+        resume = self.cfg.get('job_queue', {}).get('resume_interrupted', True)
+        with self._qlock:
+            for job in self._queue.reap(self._job_is_alive):
+                try:
+                    hdlr = self._make_handler(job['id'], job['siptype'], job['asupdate'])
+                    if hdlr.state != status.IN_PROGRESS and hdlr.state != status.PENDING:
+                        # finished, even though its job was not cleared
+                        continue
+                    if resume:
+                        log.warning("%s: resuming interrupted preservation", job['id'])
+                        hdlr._status.reset("Resuming preservation interrupted by "+
+                                           "service restart")
+                        self._queue.submit(job['id'], job['siptype'], job['asupdate'],
+                                           front=True)
+                    else:
+                        log.error("%s: preservation was interrupted", job['id'])
+                        hdlr.set_state(status.FAILED,
+                                       "Preservation was interrupted by service restart")
+                except Exception as ex:
+                    log.exception("%s: Unable to recover interrupted preservation: %s",
+                                  job['id'], str(ex))
+
+        if self._queue.waiting():
+            self._dispatch()
+            if self._queue.waiting():
+                self._start_monitor()
         
     def status(self, sipid, siptype=None):
         """
@@ -321,7 +582,12 @@ class PreservationService(object):
             if hdlr.state == status.FORGOTTEN or hdlr.state == status.NOT_READY:
                 hdlr.isready()
 
-            return hdlr.status
+            out = hdlr.status
+            if out['state'] == status.PENDING:
+                pos = self._queue.position(sipid)
+                if pos:
+                    out['queue_position'] = pos
+            return out
 
         except (IDNotFound, SIPDirectoryNotFound) as ex:
             log.debug("Requested status on SIP=%s that is complete: %s", sipid, str(ex))
@@ -377,6 +643,25 @@ class PreservationService(object):
 
         return out
 
+    def metrics(self):
+        """
+        return the histograms of the time spent in each stage of preservation 
+        processing, aggregated over all SIP types, in the Prometheus text 
+        exposition format.  These are followed by the file lock contention 
+        statistics (see nistoar.pdr.utils.LockedFile) accumulated by the current 
+        process.
+        """
+        mets = []
+        seen = set()
+        for tp in self.cfg.get('sip_type', {}).keys():
+            cfg = self._get_handler_config(tp).get('status_manager', {})
+            cachedir = cfg.get('cachedir', os.path.join(self.workdir, 'preserv_status'))
+            if cachedir in seen or not cfg.get('metrics', True):
+                continue
+            seen.add(cachedir)
+            mets.append(StageMetrics(cachedir, cfg.get('metrics_buckets')))
+
+        return format_prometheus(mets) + format_lock_stats(utils.LockedFile.stats.snapshot())
 
     def _make_handler(self, sipid, siptype=None, asupdate=False):
         """
@@ -395,7 +680,9 @@ class PreservationService(object):
             raise PDRException("SIP type not supported: "+siptype, sys=_sys)
 
         pcfg = self._get_handler_config(cls.key)
-            
+        return cls(sipid, pcfg, self._get_minter(cls.key, pcfg), notifier=self._notifier)
+
+    def _get_minter(self, siptype, pcfg):
         # get an IDMinter we can use
         if siptype not in self.minters:
             mntrdir = pcfg.get('id_registry_dir',
@@ -403,8 +690,7 @@ class PreservationService(object):
                                             os.path.join(self.workdir, 'idreg')))
             cfg = pcfg.get('id_minter', {})
             self.minters[siptype] = PDRMinter(mntrdir, cfg)
-
-        return cls(sipid, pcfg, self.minters[siptype], notifier=self._notifier)
+        return self.minters[siptype]
 
     def _get_handler_config(self, siptype):
         # from our service configuration, build a configuration object that
@@ -433,6 +719,8 @@ class PreservationService(object):
                                                  os.path.join(self.workdir, 'mdserv'))
         if 'repo_access' not in pcfg and 'repo_access' in self.cfg:
             pcfg['repo_access'] = deepcopy(self.cfg['repo_access'])
+        if 'cleanup' not in pcfg and 'cleanup' in self.cfg:
+            pcfg['cleanup'] = deepcopy(self.cfg['cleanup'])
 
         return pcfg
 
@@ -451,7 +739,7 @@ class ThreadedPreservationService(PreservationService):
         super(ThreadedPreservationService, self).__init__(config)
 
     class _HandlerThread(threading.Thread):
-        def __init__(self, handler, serialtype, params=None, destdir=None):
+        def __init__(self, handler, serialtype, params=None, destdir=None, ondone=None):
             if params is None:
                 params = {}
             tname = params.get('worker_name')
@@ -460,7 +748,17 @@ class ThreadedPreservationService(PreservationService):
             self._stype = serialtype
             self._dest = destdir
             self._params = params
+            self._ondone = ondone
         def run(self):
+            try:
+                self._run()
+            finally:
+                if self._ondone:
+                    try:
+                        self._ondone(self._hdlr.sipid)
+                    except Exception as ex:
+                        log.exception("Failed to release preservation job: %s", str(ex))
+        def _run(self):
             try:
                 time.sleep(0)
                 self._hdlr.bagit(self._stype, self._dest, self._params)
@@ -505,7 +803,8 @@ class ThreadedPreservationService(PreservationService):
         """
         t = None
         try: 
-            t = self._HandlerThread(handler, 'zip', {'worker-name': handler._sipid})
+            t = self._HandlerThread(handler, 'zip', {'worker_name': handler._sipid},
+                                    ondone=self._job_done)
             t.start()
 
             if timeout is None:
@@ -544,31 +843,61 @@ class MultiprocPreservationService(PreservationService):
     simultaneously. 
 
     This implementation launches preservation requests via a child process
-    (running a standalone bagging script).  
+    (running a standalone bagging script).  If the 'worker_pool' configuration
+    property is set, requests are instead sent to a pool of pre-started worker
+    processes (see nistoar.pdr.preserv.service.workerpool) that each initialize
+    the preservation machinery once and then handle many requests.  The 
+    'worker_pool' property is a dictionary with the following sub-properties:
+    :prop size int:  the number of worker processes (default: the value of
+                     job_queue.max_concurrent)
+    :prop max_jobs int (25):  the number of requests a worker handles before it
+                     is replaced by a fresh process; 0 means no limit.
+    :prop prestart bool (False):  if True, start the workers at construction 
+                     time; otherwise, they are started with the first request.
+    :prop logfile str ("preserv-workers.log"):  the log file that workers write 
+                     to when not handling a request.  
+    If all pool workers are busy, a request is launched in a new child process.
+
+    The log output from each request is saved to a combined preservation log 
+    (named by the 'logfile' property) along with an index that allows the output 
+    for a particular SIP to be retrieved (see 
+    nistoar.pdr.preserv.service.presvlog).  The combined log's rotation is 
+    controlled by the 'combined_log' property, a dictionary with the following 
+    sub-properties:
+    :prop max_size int (104857600):  the size in bytes beyond which the log is 
+                     rotated; 0 means never rotate.
+    :prop backups int (10):  the number of rotated logs to keep.
     """
     def __init__(self, config):
         """
         initialize the service based on the given configuration.
         """
-        super(MultiprocPreservationService, self).__init__(config)
         self._oldlogfile = None
-        deflogdir = configmod.global_logdir or configmod.determine_default_logdir()
-        self.combinedlog = os.path.join(self.cfg.get('logdir', deflogdir),
-                                        self.cfg.get('logfile', 'preservation.log'))
+        self.combinedlog = combined_log_path(config)
+        lcfg = config.get('combined_log', {})
+        self.preservlog = PreservationLog(self.combinedlog, lcfg.get('max_size', DEF_MAX_SIZE),
+                                          lcfg.get('backups', DEF_BACKUPS))
+
+        # the worker pool needs to be in place before super() recovers 
+        # interrupted jobs
+        self._pool = None
+        pcfg = config.get('worker_pool')
+        if pcfg is not None:
+            size = pcfg.get('size', config.get('job_queue', {}).get('max_concurrent',
+                                                                   DEF_MAX_RUNNING))
+            wcfg = deepcopy(config)
+            del wcfg['worker_pool']
+            wcfg.setdefault('job_queue', {})['recover_on_start'] = False
+            self._pool = wpool.WorkerPool(_pool_worker_main,
+                                          (wcfg, pcfg.get('logfile', "preserv-workers.log")),
+                                          size or 1, pcfg.get('max_jobs', wpool.DEF_MAX_JOBS))
+            if pcfg.get('prestart', False):
+                self._pool.start()
+
+        super(MultiprocPreservationService, self).__init__(config)
 
     def _pid_is_alive(self, pid):
-        if pid <= 0:
-            return False
-        try:
-            os.kill(pid, 0)
-        except OSError, e:
-            if e.errno == errno.ESRCH:
-                return False
-            elif e.errno == errno.EPERM:
-                return True
-            else:
-                raise
-        return True
+        return _pid_is_alive(pid)
 
     def _fork(self, sync=False):
         # fork this process so that work can be done in the child.
@@ -629,12 +958,22 @@ class MultiprocPreservationService(PreservationService):
                     if not os.path.exists(os.path.join(hlogd, handler.name)):
                         os.makedirs(os.path.join(hlogd, handler.name))
                     hlog = os.path.join(hlogd, hlog)
+
+                # hand the request to a pooled worker if one is free
+                if self._pool:
+                    proc = self._pool.submit((handler.sipid, handler.name, handler._asupdate,
+                                              hlog, timeout), handler.sipid)
+                    if proc:
+                        log.info("%s: preservation handed to pool worker %d",
+                                 handler.sipid, proc.pid)
             
-                # launch a subprocess
-                proc = multiprocessing.Process(target=_subprocess_handle,
-                                               args=(self.cfg, hlog, handler.sipid, handler.name,
-                                                     handler._asupdate, timeout))
-                proc.start()
+                # otherwise, launch a subprocess
+                if not proc:
+                    proc = multiprocessing.Process(target=_subprocess_handle,
+                                                   args=(self.cfg, hlog, handler.sipid,
+                                                         handler.name, handler._asupdate,
+                                                         timeout))
+                    proc.start()
                 proc.join(timeout)
                     
                 if not proc.is_alive():
@@ -672,19 +1011,66 @@ class MultiprocPreservationService(PreservationService):
             return (handler.status, None)
                 
 
+    def _warm_up(self):
+        # for pool worker processes: load the resources that would otherwise be 
+        # loaded for each preservation request
+        schemadirs = set()
+        for tp in self.siptypes:
+            hcfg = self._get_handler_config(tp)
+            self._get_minter(tp, hcfg)
+            bgrcfg = hcfg.get('bagger', {})
+            schemadirs.add(bgrcfg.get('nerdm_schema_dir', def_schema_dir))
+            schemadirs.add(bgrcfg.get('bag_builder', {}).get('finalize', {})
+                                 .get('validator', {}).get('nerdm_schema_dir', def_schema_dir))
+        default_mime_type_map()
+
+        # the schemas used to validate the POD and NERDm metadata (cached for
+        # the life of the process)
+        for schemadir in schemadirs:
+            if schemadir and os.path.isdir(schemadir):
+                for prefix in "_$":
+                    validation.get_validator(schemadir, prefix)
+
+    def _handle_pooled_job(self, job):
+        # for pool worker processes: preserve the SIP described by the given job
+        (sipid, siptype, asupdate, logfile, timeout) = job
+        worklog = configmod.global_logfile
+        state = None
+        try:
+            configmod.configure_log(logfile, config=self.cfg)
+            log.info("Preserving %s SIP id=%s in pool worker %d", siptype, sipid, os.getpid())
+            handler = self._make_handler(sipid, siptype, asupdate)
+            state = self._launch_handler(handler, timeout, sync=True)[0]['state']
+        except Exception as ex:
+            log.exception("{0} Failure while handling preservation: {1}".format(siptype, str(ex)))
+        finally:
+            self._save_preserv_log(sipid)
+            try:
+                self._queue.finish(sipid)
+            except Exception as ex:
+                log.exception("Failed to release preservation job: %s", str(ex))
+            if worklog:
+                configmod.configure_log(worklog, config=self.cfg)
+        return state
+
+    def shutdown(self, timeout=None):
+        """
+        stop the pool of worker processes, if in use, after they complete their 
+        current requests.  
+
+        :param float timeout:  the maximum time to wait for each worker to exit
+        """
+        if self._pool:
+            self._pool.shutdown(timeout)
+        super(MultiprocPreservationService, self).shutdown(timeout)
+
     def _save_preserv_log(self, sipid, forlog=None):
         mylog = forlog
         if not mylog:
             mylog = configmod.global_logfile
         emsg = None
         try:
-            with utils.LockedFile(self.combinedlog, 'a') as dfd:
-                with open(mylog) as sfd:
-                    dfd.write("----------- Preserving %s --------------\n" % sipid)
-                    txt = sfd.read(10240)
-                    while txt:
-                        dfd.write(txt)
-                        txt = sfd.read(10240)
+            self.preservlog.save(sipid, mylog)
         except Exception as ex:
             emsg = "Trouble saving sublog, %s, to combined log, %s: %s" % \
                    (mylog, self.combinedlog, str(ex))
@@ -735,9 +1121,56 @@ class RerequestException(PreservationException):
         super(RerequestException, self).__init__(msg)
         self.state = request_state
 
+class _QueueMonitor(threading.Thread):
+    # a thread that periodically launches waiting jobs as slots become free; 
+    # it exits once the queue is empty.
+    def __init__(self, service, interval):
+        threading.Thread.__init__(self, name="preserv-queue-monitor")
+        self.daemon = True
+        self._svc = service
+        self._interval = interval
+
+    def run(self):
+        try:
+            while True:
+                time.sleep(self._interval)
+                self._svc._dispatch()
+                if not self._svc._queue.waiting():
+                    break
+        except Exception as ex:
+            # the monitor will be restarted with the next queued request
+            log.exception("Trouble launching queued preservation jobs: %s", str(ex))
+
+def _pool_worker_main(config, logfile, conn, maxjobs):
+    # the main function of a pool worker process:  initialize the service once
+    # and then handle the requests sent by the pool
+    # the parent process takes care of emptying the trash
+    config = deepcopy(config)
+    config.setdefault('cleanup', {})['collect'] = False
+    try:
+        configmod.configure_log(logfile, config=config)
+        svc = MultiprocPreservationService(config)
+        svc._warm_up()
+    except Exception as ex:
+        log.exception("Failed to initialize preservation pool worker: %s", str(ex))
+        try:
+            conn.send((wpool.FAILED, None, str(ex)))
+        except Exception:
+            pass
+        return
+
+    wpool.serve_jobs(conn, svc._handle_pooled_job, maxjobs)
+
 def _subprocess_handle(config, logfile, sipid, siptype, asupdate, timeout):
     svc = None
     shout = config.get('announce_subproc', True)
+
+    # the parent process takes care of recovering interrupted jobs and of
+    # emptying the trash
+    config = deepcopy(config)
+    config.setdefault('job_queue', {})['recover_on_start'] = False
+    config.setdefault('cleanup', {})['collect'] = False
+    config.pop('worker_pool', None)
     try:
         if shout:
             print("{0} preservation process for {1} started".format(siptype, sipid))
@@ -756,5 +1189,9 @@ def _subprocess_handle(config, logfile, sipid, siptype, asupdate, timeout):
     finally:
         if svc:
             svc._save_preserv_log(sipid)
+            try:
+                svc._queue.finish(sipid)
+            except Exception as ex:
+                log.exception("Failed to release preservation job: %s", str(ex))
 
 
@@ -25,12 +25,14 @@ from ..bagit.validate import NISTAIPValidator
 from ..bagit.multibag import MultibagSplitter, restore_bag
 from ..bagger import utils as bagutils
 from ..bagger.base import checksum_of
+from ..bagger.storecat import catalog_for, list_store
 from ..bagger.midas import PreservationBagger, midasid_to_bagname, _midadid_to_dirname
 from ..bagger.midas3 import PreservationBagger as PreservationM3Bagger 
 from .. import (ConfigurationException, StateException, PODError, PreservationException, 
                 PreservationStateError, SIPDirectoryError)
 from .. import sys as _sys
 from . import status
+from .trash import Trash
 from ... import distrib
 from ...ingest.rmm import IngestClient
 from ...doimint import DOIMintingClient
@@ -61,6 +63,16 @@ class SIPHandler(object):
                                  the sub-property 'cachedir' will be set to
                                  a directory call 'preserv_status' just below
                                  the working directory ('working_dir').  
+    :prop store_catalog str:     the path to the database file for the catalog of 
+                                 files in the long-term bag store (see 
+                                 nistoar.pdr.preserv.bagger.storecat).  If not set,
+                                 the store is found by listing its directory.
+    :prop cleanup dict ({}):     configuration for the trash area that unneeded
+                                 bags and files are discarded into for deletion
+                                 in the background (see 
+                                 nistoar.pdr.preserv.service.trash.Trash).  The
+                                 trash directory defaults to "_trash" below the 
+                                 working directory.
     """
     __metaclass__ = ABCMeta
 
@@ -108,6 +120,7 @@ class SIPHandler(object):
         if not os.path.isdir(self.storedir):
             raise StateException("LT-storage directory does not exist as a "+
                                  "directory: " + self.storedir)
+        self.storecat = catalog_for(self.cfg)
 
         # set up the Status manager
         stcfg = self.cfg.get('status_manager', {})
@@ -124,6 +137,9 @@ class SIPHandler(object):
         # set the notification service we can send alerts to
         self.notifier = notifier
 
+        # unneeded bags and files are moved here to be deleted in the background
+        self.trash = Trash(self.cfg.get('cleanup', {}), self.workdir)
+
     @abstractmethod
     def isready(self, _inprogress=False):
         """
@@ -211,6 +227,26 @@ class SIPHandler(object):
         """
         self._status.update(state, message, cache)
 
+    def _catalog_delivered(self, destdir, savefiles):
+        # record the files delivered to long-term storage in the store catalog.
+        # The files have already been delivered, so a failure here is logged but
+        # does not fail the preservation; instead, the catalog's entries for the
+        # directory are invalidated so that lookups rescan it.
+        if not self.storecat:
+            return
+        try:
+            self.storecat.register([os.path.join(destdir, os.path.basename(f))
+                                    for f in savefiles])
+        except Exception as ex:
+            log.error("Failed to record delivered files in the store catalog: %s", str(ex))
+            self._invalidate_catalog(destdir)
+
+    def _invalidate_catalog(self, destdir):
+        try:
+            self.storecat.invalidate(destdir)
+        except Exception as ex:
+            log.error("Failed to invalidate the store catalog for %s: %s", destdir, str(ex))
+
     def _serialize(self, bagdir, destdir, format=None):
         """
         serialize a given bag into a given destination directory.
@@ -231,11 +267,13 @@ class SIPHandler(object):
         maxhbsz = mbcfg.get('max_headbag_size', mbcfg.get('max_bag_size'))
         if maxhbsz:
             log.info("Considering multibagging (max size: %d)", maxhbsz)
-            mbspltr = MultibagSplitter(bagdir, mbcfg)
+            with self._status.stage("multibag_split") as stg:
+                mbspltr = MultibagSplitter(bagdir, mbcfg)
 
-            # check the size of the source bag and split it if it exceeds
-            # limits.  
-            srcbags = mbspltr.check_and_split(os.path.dirname(bagdir), log)
+                # check the size of the source bag and split it if it exceeds
+                # limits.  
+                srcbags = mbspltr.check_and_split(os.path.dirname(bagdir), log)
+                stg.files = len(srcbags)
 
             # TODO: Run NIST validator on output files
         elif not mbcfg:
@@ -244,30 +282,32 @@ class SIPHandler(object):
 
         self._status.data['user']['bagfiles'] = []
         outfiles = []
-        for bagd in srcbags:
-            bagfile = self._ser.serialize(bagd, destdir, format)
-            outfiles.append(bagfile)
-
-            csumfile = bagfile + ".sha256"
-            csum = checksum_of(bagfile)
-            with open(csumfile, 'w') as fd:
-                fd.write(csum)
-                fd.write('\n')
-            outfiles.append(csumfile)
-
-            # write the checksum to our status object
-            self._status.data['user']['bagfiles'].append({
-                'name': os.path.basename(bagfile),
-                'sha256': csum
-            })
-
-        self._status.cache()
+        with self._status.stage("serialize") as stg:
+            stg.bytes = 0
+            for bagd in srcbags:
+                bagfile = self._ser.serialize(bagd, destdir, format)
+                outfiles.append(bagfile)
+                stg.bytes += os.stat(bagfile).st_size
+
+                csumfile = bagfile + ".sha256"
+                csum = checksum_of(bagfile)
+                with open(csumfile, 'w') as fd:
+                    fd.write(csum)
+                    fd.write('\n')
+                outfiles.append(csumfile)
+
+                # write the checksum to our status object
+                self._status.data['user']['bagfiles'].append({
+                    'name': os.path.basename(bagfile),
+                    'sha256': csum
+                })
+            stg.files = len(srcbags)
 
         # remove the source bags
         if self.cfg.get("cleanup_unserialized_bags", True):
             for bagd in srcbags:
                 try:
-                    shutil.rmtree(bagd)
+                    self.trash.discard(bagd)
                 except Exception as ex:
                     log.warn("Trouble removing unserialized bag: "+bagd)
         
@@ -309,7 +349,7 @@ class SIPHandler(object):
         outbag = os.path.join(workdir, outbagname)
         if os.path.isdir(outbag):
             log.warning("Cleaning out remnant of reconstituted bag")
-            shutil.rmtree(outbag)
+            self.trash.discard(outbag)
 
         if not format:
             format = "zip"
@@ -334,14 +374,17 @@ class SIPHandler(object):
             bagcli.save_bag(bagfile, destd)
             return os.path.join(destd, bagfile)
 
-        restore_bag(headbagdir, outbag, destdir, fetch)
+        with self._status.stage("serialize_restricted") as stg:
+            restore_bag(headbagdir, outbag, destdir, fetch)
 
-        bagfile = self._ser.serialize(outbag, destdir, format)
-        csumfile = bagfile + ".sha256"
-        csum = checksum_of(bagfile)
-        with open(csumfile, 'w') as fd:
-            fd.write(csum)
-            fd.write('\n')
+            bagfile = self._ser.serialize(outbag, destdir, format)
+            csumfile = bagfile + ".sha256"
+            csum = checksum_of(bagfile)
+            with open(csumfile, 'w') as fd:
+                fd.write(csum)
+                fd.write('\n')
+            stg.bytes = os.stat(bagfile).st_size
+            stg.files = 1
 
         # write the checksum to our status object
         self._status.data['user'].setdefault('bagfiles',[]).append({
@@ -491,10 +534,14 @@ class MIDASSIPHandler(SIPHandler):
             bgrcfg['store_dir'] = config['store_dir']
         if 'restricted_store_dir' not in bgrcfg and 'restricted_store_dir' in config:
             bgrcfg['restricted_store_dir'] = config['restricted_store_dir']
+        if 'store_catalog' not in bgrcfg and 'store_catalog' in config:
+            bgrcfg['store_catalog'] = config['store_catalog']
         if 'repo_access' not in bgrcfg and 'repo_access' in config:
             bgrcfg['repo_access'] = config['repo_access']
             if 'store_dir' not in bgrcfg['repo_access'] and 'store_dir' in bgrcfg:
                 bgrcfg['repo_access']['store_dir'] = bgrcfg['store_dir']
+            if 'store_catalog' not in bgrcfg['repo_access'] and 'store_catalog' in bgrcfg:
+                bgrcfg['repo_access']['store_catalog'] = bgrcfg['store_catalog']
             if 'restricted_store_dir' not in bgrcfg['repo_access'] and 'restricted_store_dir' in bgrcfg:
                 bgrcfg['repo_access']['restricted_store_dir'] = bgrcfg['restricted_store_dir']
             
@@ -579,12 +626,13 @@ class MIDASSIPHandler(SIPHandler):
         if self.cleanparent and os.path.isdir(self.bagger.bagparent):
             log.warning("Cleaning out previous bagging artifacts (%s)",
                         self.bagger.bagparent)
-            shutil.rmtree(self.bagger.bagparent)
+            self.trash.discard(self.bagger.bagparent)
 
         # Create the bag.  Note: make_bag() can raise exceptions
         self._status.record_progress("Collecting metadata and files")
         try:
-            bagdir = self.bagger.make_bag()
+            with self._status.stage("make_bag"):
+                bagdir = self.bagger.make_bag()
         finally:
             if hasattr(self.bagger, 'bagbldr') and self.bagger.bagbldr:
                 self.bagger.bagbldr.disconnect_logfile() # disengage the internal log
@@ -599,7 +647,8 @@ class MIDASSIPHandler(SIPHandler):
                 ingmd = deepcopy(ingmd)
                 ingmd['components'] = [c for c in ingmd['components'] if 'filepath' not in c]
             try:
-                self._ingester.stage(ingmd, self.bagger.name)
+                with self._status.stage("ingest_stage"):
+                    self._ingester.stage(ingmd, self.bagger.name)
             except Exception as ex:
                 msg = "Failure staging NERDm record for " + self.bagger.name + \
                       " for ingest: " + str(ex)
@@ -634,6 +683,7 @@ class MIDASSIPHandler(SIPHandler):
         log.debug("writing files to %s", destdir)
         errors = []
         saved = []
+        self._status.start_stage("deliver")
         try:
             for f in savefiles:
                 destfile = os.path.join(destdir, os.path.basename(f))
@@ -653,6 +703,7 @@ class MIDASSIPHandler(SIPHandler):
             log.exception("Reason: %s", str(ex))
             log.error("Rolling back successfully copied files")
             msg = "Failed to copy preservation files to long-term storage"
+            self._status.end_stage("deliver", files=len(saved), failed=True, cache=False)
             self.set_state(status.FAILED, msg)
 
             for f in saved:
@@ -662,11 +713,16 @@ class MIDASSIPHandler(SIPHandler):
                     os.remove(fp)
 
             raise PreservationException(msg, [str(ex)])
+        self._status.end_stage("deliver", files=len(saved), cache=False,
+                               bytes=sum([os.stat(f).st_size for f in saved]))
+        self._catalog_delivered(destdir, saved)
 
         # Now write copies of the checksum files to the review SIP dir.
         # MIDAS will scoop these up and save them in its database.
         # The file with sequence number 0 must be written last; this is a
         # signal that preservation is complete.
+        self._status.start_stage("checksum_copy")
+        cksfailed = False
         try:
             sigbase = self._sipid+"_"
             ckspat = re.compile(self._sipid+r'.*-(\d+).\w+.sha256$')
@@ -689,6 +745,7 @@ class MIDASSIPHandler(SIPHandler):
                     log.exception(msg)
                     cpfailures.append(msg)
 
+            cksfailed = bool(cpfailures)
             if cpfailures and self.notifier:
                 # alert subscribers of these failures with an email
                 self.notifier.alert("preserve.failure", origin=self.name,
@@ -697,6 +754,7 @@ class MIDASSIPHandler(SIPHandler):
                                     
                     
         except Exception, ex:
+            cksfailed = True
             msg = "%s: Failure while writing checksum file(s) to " + \
                   "review dir: %s" % (self._sipid, str(ex))
             log.exception(msg)
@@ -705,6 +763,7 @@ class MIDASSIPHandler(SIPHandler):
                                     summary="checksum file write failure",
                                     desc=msg, id=self._sipid,
                                     version=nerdm.get('version', 'unknown'))
+        self._status.end_stage("checksum_copy", failed=cksfailed)
                 
         # remove the metadata bag directory so that that an attempt to update
         # will force a rebuild based on the published version
@@ -713,7 +772,7 @@ class MIDASSIPHandler(SIPHandler):
         if os.path.isdir(mdbag):
             log.debug("removing metadata bag directory...")
             try:
-                shutil.rmtree(mdbag)
+                self.trash.discard(mdbag)
             except Exception as ex:
                 log.error("Failed to clean up the metadata bag directory: "+
                           mdbag + ": "+str(ex))
@@ -775,7 +834,7 @@ class MIDASSIPHandler(SIPHandler):
                 if f.endswith(headbag):
                     continue
                 try:
-                    os.remove(f)
+                    self.trash.discard(f)
                 except Exception, ex:
                     log.error("Trouble cleaning up serialized bag in staging "+
                           "dir:\n  %s\nReason: %s", f, str(ex))
@@ -791,8 +850,7 @@ class MIDASSIPHandler(SIPHandler):
         """
         # look for files in the serialized bag store with names that start
         # with the SIP identifier
-        return len([f for f in os.listdir(self.storedir)
-                      if f.startswith(self.bagger.name+'.')]) > 0
+        return len(list_store(self.storecat, self.storedir, self.bagger.name+'.')) > 0
     
 class MIDAS3SIPHandler(SIPHandler):
     """
@@ -893,10 +951,14 @@ class MIDAS3SIPHandler(SIPHandler):
             bgrcfg['store_dir'] = config['store_dir']
         if 'restricted_store_dir' not in bgrcfg and 'restricted_store_dir' in config:
             bgrcfg['restricted_store_dir'] = config['restricted_store_dir']
+        if 'store_catalog' not in bgrcfg and 'store_catalog' in config:
+            bgrcfg['store_catalog'] = config['store_catalog']
         if 'repo_access' not in bgrcfg and 'repo_access' in config:
             bgrcfg['repo_access'] = config['repo_access']
             if 'store_dir' not in bgrcfg['repo_access'] and 'store_dir' in bgrcfg:
                 bgrcfg['repo_access']['store_dir'] = bgrcfg['store_dir']
+            if 'store_catalog' not in bgrcfg['repo_access'] and 'store_catalog' in bgrcfg:
+                bgrcfg['repo_access']['store_catalog'] = bgrcfg['store_catalog']
 
         isrel = bgrcfg.get('relative_to_indir')
         bagparent = self.cfg.get('bagparent_dir')
@@ -1034,7 +1096,8 @@ class MIDAS3SIPHandler(SIPHandler):
         # Create the bag.  Note: make_bag() can raise exceptions
         self._status.record_progress("Collecting metadata and files from MIDAS session")
         try:
-            bagdir = self.bagger.make_bag()
+            with self._status.stage("make_bag"):
+                bagdir = self.bagger.make_bag()
             self.bagger.bagbldr.record("Preservation bag is built and ready to be serialized.")
         finally:
             if hasattr(self.bagger, 'bagbldr') and self.bagger.bagbldr:
@@ -1050,7 +1113,8 @@ class MIDAS3SIPHandler(SIPHandler):
                 ingmd = deepcopy(ingmd)
                 ingmd['components'] = [c for c in ingmd['components'] if 'filepath' not in c]
             try:
-                self._ingester.stage(ingmd, self.bagger.name)
+                with self._status.stage("ingest_stage"):
+                    self._ingester.stage(ingmd, self.bagger.name)
             except Exception as ex:
                 msg = "Failure staging NERDm record for " + self.bagger.name + \
                       " for ingest: " + str(ex)
@@ -1065,7 +1129,8 @@ class MIDAS3SIPHandler(SIPHandler):
         # Stage the DataCite DOI record for submission to DataCite
         if self._doiminter and 'doi' in nerdm:
             try:
-                self._doiminter.stage(nerdm, name=self.bagger.name)
+                with self._status.stage("doi_stage"):
+                    self._doiminter.stage(nerdm, name=self.bagger.name)
             except Exception as ex:
                 msg = "Failure staging DataCite record for " + self.bagger.name + \
                       " for DOI minting/updating: " + str(ex)
@@ -1097,6 +1162,7 @@ class MIDAS3SIPHandler(SIPHandler):
         log.debug("writing files to %s", destdir)
         errors = []
         saved = []
+        self._status.start_stage("deliver")
         try:
             for f in savefiles:
                 destfile = os.path.join(destdir, os.path.basename(f))
@@ -1113,6 +1179,7 @@ class MIDAS3SIPHandler(SIPHandler):
             log.exception("Reason: %s", str(ex))
             log.error("Rolling back successfully copied files")
             msg = "Failed to copy preservation files to long-term storage"
+            self._status.end_stage("deliver", files=len(saved), failed=True, cache=False)
             self.set_state(status.FAILED, msg)
 
             for f in saved:
@@ -1122,6 +1189,9 @@ class MIDAS3SIPHandler(SIPHandler):
                     os.remove(fp)
 
             raise PreservationException(msg, [str(ex)])
+        self._status.end_stage("deliver", files=len(saved), cache=False,
+                               bytes=sum([os.stat(f).st_size for f in saved]))
+        self._catalog_delivered(destdir, saved)
 
         if nerdm.get('status', 'available') == "removed":
             # This dataset needs to be "deactivated": make this version and previous minor versions
@@ -1132,6 +1202,8 @@ class MIDAS3SIPHandler(SIPHandler):
         # MIDAS will scoop these up and save them in its database.
         # The file with sequence number 0 must be written last; this is a
         # signal that preservation is complete.
+        self._status.start_stage("checksum_copy")
+        cksfailed = False
         try:
             sigbase = self.bagname+"_"
             ckspat = re.compile(self.bagname+r'.*-(\d+).\w+.sha256$')
@@ -1160,6 +1232,7 @@ class MIDAS3SIPHandler(SIPHandler):
                     log.error("Failed to copy checksum file to review dirs: "+msg)
                     cpfailures.append(msg)
 
+            cksfailed = bool(cpfailures)
             if cpfailures and self.notifier:
                 # alert subscribers of these failures with an email
                 cnt = str(len(cpfailures))
@@ -1180,6 +1253,7 @@ class MIDAS3SIPHandler(SIPHandler):
                 raise PreservationException(os.path.basename(donefile)+": "+str(ex), cause=ex)
                     
         except Exception as ex:
+            cksfailed = True
             msg = "%s: Failure while writing checksum file(s) to review dir: %s" \
                   % (self._sipid, str(ex))
             log.exception(msg)
@@ -1188,6 +1262,7 @@ class MIDAS3SIPHandler(SIPHandler):
                                     summary="checksum file write failure",
                                     desc=msg, id=self._sipid,
                                     version=nerdm.get('version', 'unknown'))
+        self._status.end_stage("checksum_copy", failed=cksfailed)
                 
         # cache the latest nerdm record under the staging directory
         try:
@@ -1257,7 +1332,7 @@ class MIDAS3SIPHandler(SIPHandler):
                 if f.endswith(headbag):
                     continue
                 try:
-                    os.remove(f)
+                    self.trash.discard(f)
                 except Exception, ex:
                     log.error("Trouble cleaning up serialized bag in staging "+
                           "dir:\n  %s\nReason: %s", f, str(ex))
@@ -1296,13 +1371,15 @@ class MIDAS3SIPHandler(SIPHandler):
         # not yet migrated to the AWS bucket that the distribution service sees; merge in
         # the bags/versions found locally.
         pfx = aipid+"."
-        localbags = [bagutils.BagName(b) for b in os.listdir(destdir)
-                                         if b.startswith(pfx) and bagutils.is_legal_bag_name(b)
-                                                              and not b.endswith(".sha256")]
+        localbags = [bagutils.BagName(b) for b in list_store(self.storecat, destdir, pfx)
+                                         if bagutils.is_legal_bag_name(b)
+                                            and not b.endswith(".sha256")]
         rmvers.update([b.version for b in localbags if b.version.startswith(majver)])
 
+        touched = []
         def touch_file(filepath):
             open(filepath, 'a').close()
+            touched.append(filepath)
 
         for ver in rmvers:
             bags = set()
@@ -1323,6 +1400,12 @@ class MIDAS3SIPHandler(SIPHandler):
                 if not os.path.exists(sema):
                     touch_file(sema)
 
+        if self.storecat and touched:
+            try:
+                self.storecat.register(touched)
+            except Exception as ex:
+                log.error("Failed to record removed bags in the store catalog: %s", str(ex))
+                self._invalidate_catalog(destdir)
         return
         
     def _is_preserved(self):
@@ -1336,7 +1419,7 @@ class MIDAS3SIPHandler(SIPHandler):
 
         # look for files in the serialized bag store with names that start
         # with the SIP identifier
-        return len([f for f in os.listdir(self.storedir) if f.startswith(bagname+'.')]) > 0
+        return len(list_store(self.storecat, self.storedir, bagname+'.')) > 0
     
     def _midasid_to_bagname(self, id):
         return midasid_to_bagname(id)
@@ -2,12 +2,16 @@
 This module provides tools for managing and retrieving the status of a 
 preservation efforts across multiple processes.  
 """
-import json, os, time, fcntl, re
+import os, time, fcntl, re, logging
 from collections import OrderedDict
 from copy import deepcopy
 
 from ...exceptions import StateException
+from ...utils import get_json_codec, LockedFile
 from .. import sys as preservsys
+from .metrics import StageMetrics
+
+log = logging.getLogger(preservsys.system_abbrev).getChild(preservsys.subsystem_abbrev)
 
 NOT_FOUND   = "not found"
 READY       = "ready"
@@ -37,6 +41,10 @@ user_message = {
 LOCK_WRITE = fcntl.LOCK_EX
 LOCK_READ  = fcntl.LOCK_SH
 
+# the LockedFile lock class that status file lock statistics are aggregated 
+# into (regardless of the configured cache directory)
+STATUS_LOCK_CLASS = "status"
+
 class SIPStatusFile(object):
     """
     a class used to manage locked access to the status data file
@@ -53,6 +61,7 @@ class SIPStatusFile(object):
                               If None, no lock is acquired.  
         """
         self._file = filepath
+        self._lkd = None
         self._fd = None
         self._type = None
 
@@ -81,24 +90,27 @@ class SIPStatusFile(object):
                                    "requesting write lock")
 
         if locktype == LOCK_READ:
-            self._fd = open(self._file)
-            fcntl.flock(self._fd, fcntl.LOCK_SH)
-            self._type = LOCK_READ
+            mode = 'r'
         elif locktype == LOCK_WRITE:
-            self._fd = open(self._file, 'w')
-            fcntl.flock(self._fd, fcntl.LOCK_EX)
-            self._type = LOCK_WRITE
+            mode = 'w'
         else:
             raise ValueError("Not a recognized lock type: "+ str(locktype))
+
+        lkd = LockedFile(self._file, mode, STATUS_LOCK_CLASS)
+        self._fd = lkd.open()
+        self._lkd = lkd
+        self._type = locktype
         return True
 
     def release(self):
-        if self._fd:
-            self._fd.seek(0, os.SEEK_END)
-            fcntl.flock(self._fd, fcntl.LOCK_UN)
-            self._fd.close()
-            self._fd = None
-            self._type = None
+        if self._lkd:
+            try:
+                self._fd.seek(0, os.SEEK_END)
+            finally:
+                self._lkd.close()
+                self._lkd = None
+                self._fd = None
+                self._type = None
 
     def __enter__(self):
         return self
@@ -113,7 +125,7 @@ class SIPStatusFile(object):
         """
         release = self.acquire(LOCK_READ)
         self._fd.seek(0)
-        out = json.load(self._fd, object_pairs_hook=OrderedDict)
+        out = get_json_codec().load(self._fd)
         if release:
             self.release()
         return out
@@ -125,7 +137,7 @@ class SIPStatusFile(object):
         """
         release = self.acquire(LOCK_WRITE)
         self._fd.seek(0)
-        json.dump(data, self._fd, indent=2, separators=(',', ': '))
+        get_json_codec().dump(data, self._fd, indent=2)
         if release:
             self.release()
 
@@ -139,12 +151,8 @@ class SIPStatusFile(object):
 
 def _read_status(filepath):
     try:
-        with open(filepath) as fd:
-            try:
-                fcntl.flock(fd, fcntl.LOCK_SH)
-                return json.load(fd, object_pairs_hook=OrderedDict)
-            finally:
-                fcntl.flock(fd, fcntl.LOCK_UN)
+        with LockedFile(filepath, 'r', STATUS_LOCK_CLASS) as fd:
+            return get_json_codec().load(fd)
     except OSError, ex:
         raise StateException("Can't open preservation status file: "
                              +filepath+": "+str(ex), cause=ex,
@@ -153,12 +161,8 @@ def _read_status(filepath):
 
 def _write_status(filepath, data):
     try:
-        with open(filepath, 'w') as fd:
-            try:
-                fcntl.flock(fd, fcntl.LOCK_EX)
-                json.dump(data, fd, indent=2, separators=(',', ': '))
-            finally:
-                fcntl.flock(fd, fcntl.LOCK_UN)
+        with LockedFile(filepath, 'w', STATUS_LOCK_CLASS) as fd:
+            get_json_codec().dump(data, fd, indent=2)
     except OSError, ex:
         raise StateException("Can't open preservation status file: "
                              +filepath+": "+str(ex), cause=ex,
@@ -170,6 +174,19 @@ class SIPStatus(object):
     preservation).  It encapsulates a dictionary of data that can get updated 
     as the preservation process progresses.  This data is cached to disk so 
     that multiple processes can access it.  
+
+    The time spent in each stage of processing can be recorded as a list of 
+    timing spans (under the 'stages' property of the user data) via 
+    start_stage() and end_stage() (or the stage() context manager).  Completed 
+    spans are also aggregated across all SIPs into histograms (see 
+    nistoar.pdr.preserv.service.metrics).  
+
+    This class supports the following configuration properties:
+    :prop cachedir str ("/tmp/sipstatus"):  the directory where status data is cached
+    :prop metrics bool (True):  if False, do not aggregate completed stage timing 
+                                spans into histograms.
+    :prop metrics_buckets list:  the upper bounds (in seconds) of the histogram 
+                                buckets to use for aggregating stage timings.
     """
 
     def __init__(self, id, config=None, sysdata=None, _data=None):
@@ -195,6 +212,9 @@ class SIPStatus(object):
         cachedir = config.get('cachedir', '/tmp/sipstatus')
         fbase = re.sub(r'^ark:/\d+/', '', id)
         self._cachefile = os.path.join(cachedir, fbase + ".json")
+        self._metrics = None
+        if config.get('metrics', True):
+            self._metrics = StageMetrics(cachedir, config.get('metrics_buckets'))
 
         if _data:
             self._data = deepcopy(_data)
@@ -283,6 +303,8 @@ class SIPStatus(object):
             message = user_message[label]
         self._data['user']['state'] = label
         self._data['user']['message'] = message
+        if label != PENDING:
+            self._data['user'].pop('queue_position', None)
         if cache:
             self.cache()
 
@@ -306,6 +328,22 @@ class SIPStatus(object):
 
         self.update(PENDING, message)
 
+    def set_queue_position(self, position, message=None, cache=True):
+        """
+        record the position of this SIP's request in the queue of preservation
+        jobs waiting to start.  The state will be set to PENDING.  
+
+        :param position int:  the (1-based) position in the queue
+        :param message str:   an optional message for display to the end user; 
+                              if not provided, one indicating the queue 
+                              position is set.  
+        """
+        if not message:
+            message = "Preservation requested; waiting to start (queue position {0})" \
+                      .format(position)
+        self._data['user']['queue_position'] = position
+        self.update(PENDING, message, cache)
+
     def start(self, message=None):
         """
         Set the starting time to now and change the state to IN_PROGRESS.
@@ -316,6 +354,7 @@ class SIPStatus(object):
         """
         self._data['user']['start_time'] = time.time()
         self._data['user']['started'] = time.asctime()
+        self._data['user']['stages'] = []
         self.update(IN_PROGRESS, message)
 
     def record_progress(self, message):
@@ -326,6 +365,73 @@ class SIPStatus(object):
         self._data['user']['message'] = message
         self.cache()
 
+    def start_stage(self, name, cache=False):
+        """
+        record the start of a stage of processing.  A timing span for the stage
+        is added to the list stored in the 'stages' property of the user data.
+
+        :param name  str:  the name of the stage (e.g. "make_bag")
+        :param cache bool: if True, cache the status data to disk
+        :return dict:  the new timing span
+        """
+        span = OrderedDict([('name', name), ('start', time.time())])
+        self._data['user'].setdefault('stages', []).append(span)
+        if cache:
+            self.cache()
+        return span
+
+    def end_stage(self, name, bytes=None, files=None, failed=False, cache=True):
+        """
+        record the end of a stage of processing, completing its timing span.  
+        The span is also aggregated into the stage metrics (if enabled).  
+
+        :param name  str:  the name of the stage given to start_stage()
+        :param bytes int:  the number of bytes processed by the stage, if known
+        :param files int:  the number of files processed by the stage, if known
+        :param failed bool: True if the stage did not complete successfully
+        :param cache bool: if True (default), cache the status data to disk
+        :return dict:  the completed timing span
+        :raises ValueError:  if the stage was not started
+        """
+        span = None
+        for s in reversed(self._data['user'].get('stages', [])):
+            if s.get('name') == name and 'end' not in s:
+                span = s
+                break
+        if not span:
+            raise ValueError("Stage was not started: "+name)
+
+        span['end'] = time.time()
+        span['elapsed'] = span['end'] - span['start']
+        if bytes is not None:
+            span['bytes'] = bytes
+        if files is not None:
+            span['files'] = files
+        if failed:
+            span['failed'] = True
+
+        if self._metrics:
+            try:
+                self._metrics.record(name, span['elapsed'], bytes, files, failed)
+            except Exception as ex:
+                # don't let metrics trouble interfere with preservation
+                log.warning("Failed to record stage metrics for %s: %s", name, str(ex))
+
+        if cache:
+            self.cache()
+        return span
+
+    def stage(self, name):
+        """
+        return a context manager that times a stage of processing.  The
+        object returned upon entering has 'bytes' and 'files' attributes that
+        can be set to record the amount of data processed.  A span is marked
+        as failed if the context exits via an exception.  
+
+        :param name str:  the name of the stage
+        """
+        return _StageTimer(self, name)
+
     def refresh(self):
         """
         Read the cached status data and replace the data in memory.
@@ -368,3 +474,18 @@ class SIPStatus(object):
         return [ os.path.splitext(id)[0] for id in os.listdir(cachedir)
                                          if not id.startswith('_') and
                                             not id.startswith('.')          ]
+
+class _StageTimer(object):
+    def __init__(self, status, name):
+        self.status = status
+        self.name = name
+        self.bytes = None
+        self.files = None
+
+    def __enter__(self):
+        self.status.start_stage(self.name)
+        return self
+
+    def __exit__(self, ex_type, ex_val, ex_tb):
+        self.status.end_stage(self.name, self.bytes, self.files, ex_type is not None)
+        return False
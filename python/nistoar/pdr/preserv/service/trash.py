@@ -0,0 +1,237 @@
+"""
+This module provides a facility for deleting directory trees and files in the
+background.
+
+Removing a large bag from an NFS-mounted file system can take minutes.  Rather
+than deleting such trees inline (e.g. before a preservation request can report
+success), a process can *discard* them into a Trash area:  the tree is
+atomically renamed into the trash directory, which makes it disappear from its
+original location immediately, and is deleted later by a TrashCollector
+thread at a throttled rate.  Because discarded items are simply entries in the
+trash directory, their deletion resumes after a restart of the service (or
+is taken up by another process sharing the trash directory).
+
+A trash directory should be on the same file system as the items discarded
+into it; an item that cannot be renamed into the trash (because it is on
+another file system) is deleted immediately.
+"""
+import os, time, errno, shutil, threading, logging
+
+from .. import sys as _sys
+
+log = logging.getLogger(_sys.system_abbrev).getChild(_sys.subsystem_abbrev).getChild("trash")
+
+TRASH_DIRNAME = "_trash"
+DEF_COLLECT_INTERVAL = 60
+
+class Trash(object):
+    """
+    a holding area for directory trees and files that are to be deleted.
+
+    This class is configured with a dictionary supporting the following
+    properties:
+    :prop trash_dir str:  the directory to hold discarded items (default:
+                      "_trash" below the given base directory)
+    :prop deferred bool (True):  if False, discarded items are deleted
+                      immediately rather than moved to the trash
+    :prop max_delete_rate float (0):  the maximum number of files (and
+                      directories) per second that will be deleted when
+                      emptying the trash; 0 means no limit
+    :prop collect_interval float (60):  the interval, in seconds, at which a
+                      TrashCollector checks for items to delete
+    """
+
+    def __init__(self, config=None, basedir=None):
+        """
+        create the trash area.
+
+        :param dict config:   the configuration properties (see class
+                              documentation)
+        :param str basedir:   the directory to create the default trash
+                              directory under if trash_dir is not configured
+        """
+        if config is None:
+            config = {}
+        self.cfg = config
+        self.dir = self.cfg.get('trash_dir')
+        if not self.dir:
+            if not basedir:
+                raise ValueError("Trash: no trash_dir configured and no basedir given")
+            self.dir = os.path.join(basedir, TRASH_DIRNAME)
+        self.deferred = self.cfg.get('deferred', True)
+        self.max_rate = self.cfg.get('max_delete_rate', 0)
+        if self.deferred and not os.path.isdir(self.dir):
+            try:
+                os.makedirs(self.dir)
+            except OSError:
+                if not os.path.isdir(self.dir):
+                    raise
+        self._seq = 0
+        self._seqlock = threading.Lock()
+        self._wake = None
+
+    def _trash_name_for(self, path):
+        # a unique name for an item in the trash; names sort in the order the
+        # items were discarded.
+        with self._seqlock:
+            self._seq += 1
+            seq = self._seq
+        return "%017.6f.%d.%d.%s" % (time.time(), os.getpid(), seq,
+                                     os.path.basename(path.rstrip('/')))
+
+    def discard(self, path):
+        """
+        remove the given file or directory tree from its current location,
+        deferring the actual deletion of its contents to a later call to
+        empty().
+
+        :param str path:  the file or directory to discard
+        :return bool:  True if the item existed and was discarded
+        """
+        if not os.path.lexists(path):
+            return False
+        if not self.deferred:
+            self._delete(path)
+            return True
+
+        dest = os.path.join(self.dir, self._trash_name_for(path))
+        try:
+            os.rename(path, dest)
+        except OSError as ex:
+            if ex.errno == errno.ENOENT:
+                return False
+            if ex.errno != errno.EXDEV:
+                raise
+            log.debug("Deleting %s immediately (not on the trash's file system)", path)
+            self._delete(path)
+            return True
+
+        log.debug("Discarded %s into the trash", path)
+        if self._wake:
+            self._wake.set()
+        return True
+
+    def items(self):
+        """
+        return the names of the items in the trash awaiting deletion, oldest first
+        """
+        if not os.path.isdir(self.dir):
+            return []
+        return sorted([f for f in os.listdir(self.dir) if not f.startswith('.')])
+
+    def empty(self, max_time=None, stop=None):
+        """
+        delete the items in the trash, oldest first.
+
+        :param float max_time:  the maximum time, in seconds, to spend deleting;
+                                the item being deleted when the time runs out is
+                                finished, but no more are started.
+        :param threading.Event stop:  an event that, when set, causes emptying
+                                to stop after the current item
+        :return int:  the number of items deleted
+        """
+        start = time.time()
+        count = 0
+        for name in self.items():
+            if (stop and stop.is_set()) or \
+               (max_time is not None and time.time() - start >= max_time):
+                break
+            try:
+                self._delete(os.path.join(self.dir, name))
+                count += 1
+            except Exception as ex:
+                log.warning("Trouble deleting %s from the trash: %s", name, str(ex))
+        return count
+
+    def _delete(self, path):
+        # delete a file or tree, bottom up, throttled to the maximum rate.
+        # Entries that disappear (e.g. deleted by another process emptying the
+        # same trash) are ignored.
+        throttle = _Throttle(self.max_rate)
+        if os.path.islink(path) or not os.path.isdir(path):
+            _remove(os.remove, path)
+            return
+        for root, subdirs, files in os.walk(path, topdown=False):
+            for f in files:
+                _remove(os.remove, os.path.join(root, f))
+                throttle.deleted()
+            for d in subdirs:
+                d = os.path.join(root, d)
+                if os.path.islink(d):
+                    _remove(os.remove, d)
+                else:
+                    _remove(os.rmdir, d)
+                throttle.deleted()
+        try:
+            _remove(os.rmdir, path)
+        except OSError:
+            # fall back to a forced removal (which, on NFS, can help with
+            # lingering .nfs files)
+            shutil.rmtree(path, ignore_errors=True)
+
+    def start_collector(self):
+        """
+        start a TrashCollector thread that empties this trash in the background
+        and return it.
+        """
+        coll = TrashCollector(self, self.cfg.get('collect_interval', DEF_COLLECT_INTERVAL))
+        self._wake = coll._wake
+        coll.start()
+        return coll
+
+def _remove(func, path):
+    try:
+        func(path)
+    except OSError as ex:
+        if ex.errno != errno.ENOENT:
+            raise
+
+class _Throttle(object):
+    # keeps deletion within a maximum rate of entries per second by sleeping
+    # as needed
+
+    def __init__(self, max_rate=0):
+        self.max_rate = max_rate
+        self.start = time.time()
+        self.count = 0
+
+    def deleted(self, n=1):
+        self.count += n
+        if self.max_rate > 0:
+            wait = float(self.count) / self.max_rate - (time.time() - self.start)
+            if wait > 0:
+                time.sleep(wait)
+
+class TrashCollector(threading.Thread):
+    """
+    a thread that empties a Trash in the background:  it deletes whatever
+    is in the trash when it starts and then at regular intervals (or sooner,
+    when items are discarded through the Trash instance it serves).
+    """
+
+    def __init__(self, trash, interval=DEF_COLLECT_INTERVAL):
+        threading.Thread.__init__(self, name="trash-collector")
+        self.daemon = True
+        self.trash = trash
+        self.interval = interval
+        self._wake = threading.Event()
+        self._halt = threading.Event()
+
+    def run(self):
+        while not self._halt.is_set():
+            self._wake.clear()
+            try:
+                n = self.trash.empty(stop=self._halt)
+                if n:
+                    log.debug("Deleted %d item(s) from the trash", n)
+            except Exception as ex:
+                log.exception("Trouble emptying the trash: %s", str(ex))
+            self._wake.wait(self.interval)
+
+    def stop(self, timeout=None):
+        """
+        stop the collector after the item currently being deleted
+        """
+        self._halt.set()
+        self._wake.set()
+        self.join(timeout)
@@ -0,0 +1,272 @@
+"""
+This module provides a pool of long-lived worker processes that carry out
+preservation jobs sent to them over a pipe.
+
+Launching a new process for each preservation request requires that the
+preservation machinery--the service configuration, SIP handlers, minters,
+MIME-type maps, etc.--be rebuilt from scratch before any bagging begins.  A
+:py:class:`WorkerPool` instead starts its worker processes ahead of time,
+allowing each to pay that initialization cost once and then process many jobs.
+To bound the memory growth of a long-lived process, each worker exits after
+completing a configured maximum number of jobs; the pool replaces it with a
+fresh one.
+
+The pool is agnostic as to what a job is:  the worker processes run a given
+target function which is expected to initialize itself and then call
+:py:func:`serve_jobs` to receive and execute jobs.
+"""
+import os, time, threading, logging, multiprocessing
+
+from .. import sys as _sys
+log = logging.getLogger(_sys.system_abbrev)   \
+             .getChild(_sys.subsystem_abbrev) \
+             .getChild('workerpool')
+
+DEF_MAX_JOBS = 25
+
+READY   = "ready"
+DONE    = "done"
+FAILED  = "failed"
+
+def serve_jobs(conn, runjob, maxjobs=DEF_MAX_JOBS):
+    """
+    receive and execute jobs sent by the pool.  This is intended to be called
+    within a worker process after it has initialized itself; it returns when
+    the pool asks the worker to stop, the pipe is closed, or the maximum number
+    of jobs has been executed.
+
+    :param Connection conn:  the worker's end of the pipe to the pool
+    :param runjob:     a function that takes a job (as sent to WorkerPool.submit())
+                       and executes it, returning a (picklable) result.
+    :param int maxjobs:  the number of jobs to execute before returning; if 0 or
+                       None, the number is unlimited.
+    """
+    conn.send((READY, os.getpid(), None))
+    n = 0
+    while not maxjobs or n < maxjobs:
+        try:
+            job = conn.recv()
+        except (EOFError, IOError):
+            break
+        if job is None:
+            break
+
+        try:
+            result = runjob(job)
+        except Exception as ex:
+            log.exception("Unexpected failure executing pooled job: %s", str(ex))
+            result = None
+        n += 1
+        conn.send((DONE, result, bool(maxjobs and n >= maxjobs)))
+
+class _Worker(object):
+    # the pool's handle on a worker process
+
+    def __init__(self, target, args, maxjobs):
+        self.conn, child = multiprocessing.Pipe()
+        self.proc = multiprocessing.Process(target=target, args=args + (child, maxjobs))
+        self.proc.daemon = True
+        self.proc.start()
+        child.close()
+        self.job = None
+        self.ready = False
+        self.retiring = False
+        self.jobs_done = 0
+        self.last_result = None
+
+    @property
+    def pid(self):
+        return self.proc.pid
+
+    def is_alive(self):
+        return self.proc.is_alive()
+
+    @property
+    def usable(self):
+        return self.job is None and not self.retiring and self.proc.is_alive()
+
+    def poll(self):
+        # process any messages from the worker process
+        try:
+            while self.conn.poll():
+                msg = self.conn.recv()
+                if msg[0] == READY:
+                    self.ready = True
+                elif msg[0] == DONE:
+                    self.job = None
+                    self.jobs_done += 1
+                    self.last_result = msg[1]
+                    self.retiring = msg[2]
+                elif msg[0] == FAILED:
+                    log.error("Pool worker failed to initialize: %s", msg[2])
+                    self.retiring = True
+        except (EOFError, IOError):
+            self.retiring = True
+
+    def send(self, job):
+        self.conn.send(job)
+
+    def stop(self):
+        try:
+            if self.proc.is_alive():
+                self.conn.send(None)
+        except (EOFError, IOError):
+            pass
+
+class PoolJob(object):
+    """
+    a handle on a job executing in a pool worker.  It supports the subset of
+    the multiprocessing.Process interface--is_alive(), join(), and pid--needed
+    to monitor the job.
+    """
+
+    def __init__(self, pool, worker, jobid):
+        self._pool = pool
+        self._worker = worker
+        self.jobid = jobid
+
+    @property
+    def pid(self):
+        """
+        the ID of the worker process executing the job
+        """
+        return self._worker.pid
+
+    def is_alive(self):
+        """
+        return True if the job is still executing
+        """
+        with self._pool._lock:
+            self._worker.poll()
+            return self._worker.job == self.jobid and self._worker.is_alive()
+
+    def join(self, timeout=None):
+        """
+        wait for the job to complete.
+
+        :param float timeout:  the maximum number of seconds to wait; if None,
+                               wait indefinitely.
+        """
+        end = (timeout is not None and time.time() + timeout) or None
+        while self.is_alive():
+            if end is not None:
+                left = end - time.time()
+                if left <= 0:
+                    break
+                time.sleep(min(left, 0.1))
+            else:
+                time.sleep(0.1)
+
+class WorkerPool(object):
+    """
+    a pool of pre-started worker processes that execute jobs received over a
+    pipe.  Each worker runs target(*args, conn, maxjobs), where conn is the
+    worker's end of the pipe; the target should initialize itself and then
+    call serve_jobs(conn, runjob, maxjobs).
+    """
+
+    def __init__(self, target, args=(), size=1, maxjobs=DEF_MAX_JOBS):
+        """
+        create the pool.  No workers are started until start() or submit() is
+        called.
+
+        :param target:     the function that the worker processes run
+        :param tuple args: the arguments to pass to target (before the pipe
+                           connection and maxjobs)
+        :param int size:   the number of worker processes to keep running
+        :param int maxjobs:  the number of jobs each worker executes before it is
+                           replaced; if 0 or None, the number is unlimited.
+        """
+        self._target = target
+        self._args = tuple(args)
+        self.size = max(size, 1)
+        self.maxjobs = maxjobs
+        self._workers = []
+        self._lock = threading.RLock()
+
+    def _prune(self):
+        # remove workers that have exited or will exit after their current job
+        for w in self._workers:
+            w.poll()
+        keep = []
+        for w in self._workers:
+            if w.is_alive() and not (w.retiring and w.job is None):
+                keep.append(w)
+            else:
+                w.stop()
+                w.proc.join(0)
+        self._workers = keep
+
+    def _replenish(self):
+        # start new workers to bring the pool up to its full size
+        while len([w for w in self._workers if not w.retiring]) < self.size:
+            self._workers.append(_Worker(self._target, self._args, self.maxjobs))
+
+    def start(self):
+        """
+        start the pool's worker processes
+        """
+        with self._lock:
+            self._prune()
+            self._replenish()
+
+    def submit(self, job, jobid=None):
+        """
+        send a job to an idle worker.
+
+        :param job:        the (picklable) job to send to the worker
+        :param jobid:      an identifier for the job; if not provided, job will
+                           be used
+        :return:  a handle on the executing job, or None if all workers are busy
+        :rtype: PoolJob
+        """
+        if jobid is None:
+            jobid = job
+        with self._lock:
+            self._prune()
+            self._replenish()
+            for w in self._workers:
+                if not w.usable:
+                    continue
+                try:
+                    w.send(job)
+                except (EOFError, IOError) as ex:
+                    log.warning("Unable to send job to worker %d: %s", w.pid, str(ex))
+                    w.retiring = True
+                    continue
+                w.job = jobid
+                return PoolJob(self, w, jobid)
+        return None
+
+    @property
+    def busy(self):
+        """
+        the number of workers currently executing a job
+        """
+        with self._lock:
+            for w in self._workers:
+                w.poll()
+            return len([w for w in self._workers if w.job is not None and w.is_alive()])
+
+    @property
+    def workers(self):
+        """
+        the number of live worker processes
+        """
+        with self._lock:
+            return len([w for w in self._workers if w.is_alive()])
+
+    def shutdown(self, timeout=None):
+        """
+        ask all workers to exit once they complete their current jobs and wait
+        for them to do so.
+
+        :param float timeout:  the maximum time to wait for each worker to exit
+        """
+        with self._lock:
+            workers = self._workers
+            self._workers = []
+        for w in workers:
+            w.stop()
+        for w in workers:
+            w.proc.join(timeout)
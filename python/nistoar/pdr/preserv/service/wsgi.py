@@ -142,6 +142,9 @@ class Handler(object):
     def do_GET(self, path):
         # return the status on request or a list of previous requests
         steps = path.split('/')
+        if steps[0] == 'metrics' and len(steps) == 1:
+            return self.metrics()
+
         if steps[0] == '':
             try:
                 out = json.dumps(['midas'])
@@ -197,6 +200,22 @@ class Handler(object):
         self.end_headers()
         return [out]
 
+    def metrics(self):
+        """
+        return the preservation stage timing metrics in Prometheus text format
+        """
+        try:
+            out = self._svc.metrics()
+        except Exception, ex:
+            log.exception("Internal error: "+str(ex))
+            self.send_error(500, "Internal error")
+            return []
+
+        self.set_response(200, "Preservation metrics")
+        self.add_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.end_headers()
+        return [out]
+
     def request_status(self, sipid):
         """
         return the status of a particular preservation request
@@ -8,6 +8,7 @@ include
   - prepupd:    setup a metadata bag based on the last published version of a specified dataset.
   - servenerd:  extract the full NERDm record from a bag and copy it to an export directory (or stdout)
   - fix:        fix various special problems via subcommands
+  - batch:      run one of the other subcommands across many AIPs
 """
 import os
 from ... import cli
@@ -23,7 +24,7 @@ def load_into(subparser, as_cmd=None):
     :param argparser.ArgumentParser subparser:  the argument parser instance to define this command's 
                                                 interface into it 
     """
-    from . import prepupd, servenerd, fix, validate, setver, author, readme
+    from . import prepupd, servenerd, fix, validate, setver, author, readme, batch
     
     subparser.description = description
 
@@ -37,6 +38,7 @@ def load_into(subparser, as_cmd=None):
     out.load_subcommand(validate)
     out.load_subcommand(servenerd)
     out.load_subcommand(fix)
+    out.load_subcommand(batch)
     return out
 
 def define_pub_opts(subparser):
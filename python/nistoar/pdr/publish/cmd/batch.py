@@ -0,0 +1,395 @@
+"""
+CLI command that runs another pub subcommand across many AIPs.
+
+The AIPs to operate on can be given explicitly (on the command line or in a file) or selected from
+the bags found in a directory.  The subcommand is executed for each AIP within this process by a
+pool of worker threads; thus, the configuration is loaded only once, and caches (e.g. of loaded
+schemas and head bags) are shared across all of the executions.  The outcome of each execution is
+recorded to a JSON report file as it completes, along with the full list of AIPs planned for the
+batch; if the batch is interrupted, it can be resumed by re-running the command with --resume,
+which will process the planned AIPs that were not yet successfully processed.
+"""
+import logging, argparse, sys, os, re, json, time, threading
+from collections import OrderedDict, deque
+from copy import deepcopy
+
+from nistoar.pdr.exceptions import PDRException
+from nistoar.pdr.cli import PDRCommandFailure, CommandSuite
+from nistoar.pdr.preserv.bagger.utils import parse_bag_name
+
+default_name = "batch"
+help = "run a pub subcommand across many AIPs"
+description = """
+  This command runs another pub subcommand (e.g. "setver", "validate", "fix topics") once for each
+  of a list of AIPs.  CMD and its arguments are given after all of the batch options (and may be
+  preceded by "--"); the AIP-ID is inserted after the subcommand name(s) for each execution.
+  A JSON report of the outcomes is written as the AIPs are processed.
+"""
+
+DEF_REPORT_FILE = "pdr-batch-report.json"
+
+# the status values recorded in the report
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+def load_into(subparser):
+    """
+    load this command into a CLI by defining the command's arguments and options.
+    :param argparser.ArgumentParser subparser:  the argument parser instance to define this command's
+                                                interface into it
+    :rtype: None
+    """
+    p = subparser
+    p.description = description
+
+    p.add_argument("-i", "--aipid", metavar="AIPID", type=str, action="append", dest='aipids',
+                   help="an AIP-ID to process; this can be repeated, and each value can contain a "+
+                        "comma-separated list of AIP-IDs")
+    p.add_argument("-f", "--aipid-file", metavar="FILE", type=str, dest='idfile',
+                   help="read the AIP-IDs to process from FILE, one per line (- for standard input); "+
+                        "blank lines and lines starting with # are ignored")
+    p.add_argument("-d", "--select-from-dir", metavar="DIR", type=str, dest='fromdir',
+                   help="process the AIPs whose bags (either as directories or serialized files) are "+
+                        "found in DIR")
+    p.add_argument("-p", "--pattern", metavar="REGEX", type=str, dest='pattern',
+                   help="only process the AIPs whose IDs match the regular expression REGEX")
+    p.add_argument("-j", "--workers", metavar="N", type=int, dest='workers',
+                   help="process up to N AIPs at a time (default: 1, or the batch.workers config param)")
+    p.add_argument("-r", "--report", metavar="FILE", type=str, dest='report',
+                   help="write the JSON report to FILE (default: "+DEF_REPORT_FILE+" in the working "+
+                        "directory)")
+    p.add_argument("-R", "--resume", action="store_true", dest='resume',
+                   help="resume a previous batch recorded in the report file, skipping AIPs that were "+
+                        "successfully processed")
+    p.add_argument("-F", "--retry-failed-only", action="store_true", dest='failedonly',
+                   help="with --resume, only re-process the AIPs that previously failed")
+    p.add_argument("subcmd", metavar="CMD", type=str, nargs=argparse.REMAINDER,
+                   help="the subcommand (and its arguments) to execute for each AIP")
+
+    return None
+
+def execute(args, config=None, log=None):
+    if not log:
+        log = logging.getLogger(default_name)
+    if not config:
+        config = {}
+
+    if isinstance(args, list):
+        # cmd-line arguments not parsed yet
+        p = argparse.ArgumentParser()
+        load_into(p)
+        args = p.parse_args(args)
+
+    cmdargs = list(args.subcmd or [])
+    if cmdargs and cmdargs[0] == '--':
+        cmdargs = cmdargs[1:]
+    if not cmdargs:
+        raise PDRCommandFailure(default_name, "No subcommand specified", 1)
+
+    bcfg = config.get('batch', {})
+    workdir = config.get('working_dir', os.getcwd())
+    if getattr(args, 'workdir', None):
+        workdir = args.workdir
+    reportfile = args.report or bcfg.get('report_file') or DEF_REPORT_FILE
+    if not os.path.isabs(reportfile):
+        reportfile = os.path.join(workdir, reportfile)
+
+    report = BatchReport(reportfile, cmdargs)
+    if args.resume:
+        if not report.load():
+            raise PDRCommandFailure(default_name, "No previous batch report to resume: "+reportfile, 1)
+        if report.command != cmdargs:
+            raise PDRCommandFailure(default_name, "Requested subcommand does not match that of the "+
+                                    "batch being resumed: " + " ".join(report.command), 1)
+
+    aipids = select_aipids(args, report if args.resume else None)
+    report.plan(aipids)
+    if args.resume:
+        aipids = report.remaining(aipids, args.failedonly)
+    if not aipids:
+        log.warning("No AIPs to process")
+        report.save()
+        return
+
+    runner = BatchRunner(cmdargs, config, args, log)
+    runner.check(aipids[0])
+    report.save()
+
+    workers = args.workers or bcfg.get('workers', 1)
+    log.info("Running %s on %d AIP%s with %d worker%s", " ".join(cmdargs), len(aipids),
+             (len(aipids) != 1 and "s") or "", workers, (workers != 1 and "s") or "")
+    run_batch(runner, aipids, report, workers, log)
+
+    failed = report.count(FAILED)
+    log.info("Batch complete: %d succeeded, %d failed (report: %s)",
+             report.count(SUCCEEDED), failed, reportfile)
+    if failed:
+        raise PDRCommandFailure(default_name, "%d AIP%s failed processing (see %s)" %
+                                (failed, (failed != 1 and "s") or "", reportfile), 5)
+
+def select_aipids(args, report=None):
+    """
+    assemble the list of AIP-IDs to process according to the command-line arguments.  If no
+    AIP-IDs are specified by the arguments and a report from a previous batch is given, the IDs
+    planned for that batch (or, for a report without a plan, those with recorded outcomes) are
+    returned.
+    """
+    out = []
+    for val in args.aipids or []:
+        out.extend([a.strip() for a in val.split(',') if a.strip()])
+
+    if args.idfile:
+        if args.idfile == '-':
+            out.extend(_read_ids(sys.stdin))
+        else:
+            try:
+                with open(args.idfile) as fd:
+                    out.extend(_read_ids(fd))
+            except IOError as ex:
+                raise PDRCommandFailure(default_name, "Unable to read AIP-ID file: "+str(ex), 2)
+
+    if args.fromdir:
+        if not os.path.isdir(args.fromdir):
+            raise PDRCommandFailure(default_name, "Not an existing directory: "+args.fromdir, 2)
+        out.extend(aipids_in_dir(args.fromdir))
+
+    if not out and report:
+        out = list(report.planned or report.results.keys())
+
+    if args.pattern:
+        try:
+            pat = re.compile(args.pattern)
+        except re.error as ex:
+            raise PDRCommandFailure(default_name, "Bad AIP-ID pattern: "+str(ex), 1)
+        out = [a for a in out if pat.search(a)]
+
+    # remove duplicates, preserving order
+    seen = set()
+    return [a for a in out if not (a in seen or seen.add(a))]
+
+def _read_ids(fd):
+    out = []
+    for line in fd:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            out.append(line)
+    return out
+
+def aipids_in_dir(dirpath):
+    """
+    return the IDs of the AIPs that have bags in the given directory.  Both bag directories and
+    serialized bags are recognized; a file or directory whose name cannot be parsed as a versioned
+    bag name is taken to be a bag named after its AIP-ID.
+    """
+    out = []
+    for name in sorted(os.listdir(dirpath)):
+        if name.startswith('.') or name.startswith('_'):
+            continue
+        try:
+            aipid = parse_bag_name(name)[0]
+        except ValueError:
+            if not os.path.isdir(os.path.join(dirpath, name)):
+                continue
+            aipid = name
+        if aipid not in out:
+            out.append(aipid)
+    return out
+
+class BatchReport(object):
+    """
+    a record of the outcomes of a batch execution that is saved to a JSON file.  The report
+    contains the subcommand that was executed, the IDs of all the AIPs planned for processing,
+    and, for each AIP processed, a record containing
+    its status ("succeeded" or "failed"), an explanatory message (for failures), the exit status
+    (for failures), the time processing completed, and the elapsed processing time.
+    """
+
+    def __init__(self, reportfile, command):
+        self.file = reportfile
+        self.command = list(command)
+        self.started = time.time()
+        self.planned = []
+        self.results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self):
+        """
+        load the contents of a previously saved report.
+        :return bool:  False if the report file does not exist
+        """
+        if not os.path.exists(self.file):
+            return False
+        with open(self.file) as fd:
+            data = json.load(fd, object_pairs_hook=OrderedDict)
+        self.command = data.get('command', [])
+        self.started = data.get('started', self.started)
+        self.planned = data.get('planned', [])
+        self.results = data.get('results', OrderedDict())
+        return True
+
+    def plan(self, aipids):
+        """
+        add the given AIP-IDs to the list of those planned for processing
+        """
+        with self._lock:
+            known = set(self.planned)
+            self.planned.extend([a for a in aipids if a not in known])
+
+    def remaining(self, aipids, failedonly=False):
+        """
+        return the AIP-IDs from the given list that still need to be processed
+        :param bool failedonly:  if True, return only those IDs that previously failed.
+        """
+        if failedonly:
+            return [a for a in aipids if self.results.get(a, {}).get('status') == FAILED]
+        return [a for a in aipids if self.results.get(a, {}).get('status') != SUCCEEDED]
+
+    def record(self, aipid, status, elapsed, message=None, exitstat=None):
+        """
+        record the outcome for an AIP and save the report
+        """
+        res = OrderedDict([("status", status), ("completed", time.time()),
+                           ("elapsed", round(elapsed, 3))])
+        if message:
+            res['message'] = message
+        if exitstat is not None:
+            res['exit_status'] = exitstat
+        with self._lock:
+            self.results[aipid] = res
+            self._save()
+
+    def count(self, status):
+        """
+        return the number of AIPs with the given status
+        """
+        return len([r for r in self.results.values() if r.get('status') == status])
+
+    def save(self):
+        """
+        write the report to its file
+        """
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        data = OrderedDict([
+            ("command", self.command),
+            ("started", self.started),
+            ("updated", time.time()),
+            ("summary", OrderedDict([(SUCCEEDED, self.count(SUCCEEDED)),
+                                     (FAILED, self.count(FAILED))])),
+            ("planned", self.planned),
+            ("results", self.results)
+        ])
+        tmpf = self.file + ".tmp"
+        with open(tmpf, 'w') as fd:
+            json.dump(data, fd, indent=2, separators=(',', ': '))
+        os.rename(tmpf, self.file)
+
+class BatchRunner(object):
+    """
+    a class that executes a pub subcommand for a single AIP.
+    """
+
+    def __init__(self, cmdargs, config, batchargs, log):
+        self.config = config
+        self.log = log
+        self._batchargs = batchargs
+        self._parser = argparse.ArgumentParser(default_name)
+        self._suite = _make_pub_suite(self._parser)
+        self.path, self.rest = _split_command(self._suite, cmdargs)
+        if not self.path:
+            raise PDRCommandFailure(default_name, "Unrecognized subcommand: "+cmdargs[0], 1)
+
+    def parse(self, aipid):
+        """
+        return the parsed arguments for executing the subcommand on the given AIP
+        """
+        try:
+            args = self._parser.parse_args(self.path + [aipid] + self.rest)
+        except SystemExit:
+            raise PDRCommandFailure(default_name, "Bad subcommand arguments: " +
+                                    " ".join(self.path + self.rest), 1)
+
+        # pass on the top-level options (e.g. --workdir)
+        for key, val in vars(self._batchargs).items():
+            if not hasattr(args, key):
+                setattr(args, key, val)
+        return args
+
+    def check(self, aipid):
+        """
+        ensure that the subcommand arguments can be parsed
+        """
+        self.parse(aipid)
+
+    def run(self, aipid):
+        """
+        execute the subcommand on the given AIP
+        """
+        args = self.parse(aipid)
+        self._suite.execute(args, deepcopy(self.config), self.log.getChild(aipid))
+
+def _make_pub_suite(parser):
+    from . import prepupd, servenerd, fix, validate, setver, author, readme
+    suite = CommandSuite("pub", parser)
+    for cmd in (prepupd, author, readme, setver, validate, servenerd, fix):
+        suite.load_subcommand(cmd)
+    return suite
+
+def _split_command(suite, cmdargs):
+    # separate the subcommand name(s) from its arguments
+    path = []
+    while cmdargs and isinstance(suite, CommandSuite) and cmdargs[0] in suite._cmds:
+        path.append(cmdargs[0])
+        suite = suite._cmds[cmdargs[0]]
+        cmdargs = cmdargs[1:]
+    return path, list(cmdargs)
+
+def run_batch(runner, aipids, report, workers=1, log=None):
+    """
+    execute the runner's subcommand for each of the given AIPs, recording the outcomes in the
+    given report.
+    :param BatchRunner runner:  the runner to execute the subcommand with
+    :param list aipids:         the IDs of the AIPs to process
+    :param BatchReport report:  the report to record outcomes to
+    :param int workers:         the number of AIPs to process at a time
+    """
+    if not log:
+        log = logging.getLogger(default_name)
+    queue = deque(aipids)
+    stop = threading.Event()
+    qlock = threading.Lock()
+
+    def work():
+        while not stop.is_set():
+            with qlock:
+                if not queue:
+                    return
+                aipid = queue.popleft()
+
+            start = time.time()
+            try:
+                runner.run(aipid)
+                report.record(aipid, SUCCEEDED, time.time() - start)
+            except PDRCommandFailure as ex:
+                log.error("%s: %s", aipid, str(ex))
+                report.record(aipid, FAILED, time.time() - start, str(ex), ex.stat)
+            except Exception as ex:
+                log.exception("%s: unexpected failure: %s", aipid, str(ex))
+                report.record(aipid, FAILED, time.time() - start, "Unexpected failure: "+str(ex))
+
+    threads = [threading.Thread(target=work, name="batch-%d" % i) for i in range(max(workers, 1))]
+    for t in threads:
+        t.daemon = True
+        t.start()
+    try:
+        for t in threads:
+            while t.is_alive():
+                t.join(0.5)
+    except KeyboardInterrupt:
+        log.warning("Interrupted; waiting for running AIPs to complete (use --resume to continue)")
+        stop.set()
+        for t in threads:
+            t.join()
+        raise PDRCommandFailure(default_name, "Batch interrupted", 4)
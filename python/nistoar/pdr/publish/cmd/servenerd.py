@@ -8,7 +8,7 @@ from copy import deepcopy
 from nistoar.pdr.exceptions import ConfigurationException, PDRException, PDRServerError
 from nistoar.pdr.preserv.bagger.prepupd import UpdatePrepService
 from nistoar.pdr.preserv.bagit.bag import NISTBag
-from nistoar.pdr.utils import write_json
+from nistoar.pdr.publish.midas3.nrdexport import NERDmExporter
 from nistoar.pdr.cli import PDRCommandFailure
 from . import define_pub_opts, determine_bag_path
 
@@ -17,6 +17,9 @@ help = "copy the NERDm record from a bag to NERDm serve directory"
 description = \
 """extracts a full NERDm record from the specified bag and copies it to an output directory.  Unless 
 specified via --nerd-serve-dir, the output directory will be configured prepub_nerd_dir directory.
+The record is exported in the same way as by the publishing service:  a gzip-compressed copy is 
+written alongside it (unless nerdm_serve_compress is configured to false), and the directory's 
+manifest is updated.
 """
 
 def load_into(subparser):
@@ -82,21 +85,30 @@ def execute(args, config=None, log=None):
     if outdir != '-' and not os.path.isdir(outdir):
         raise PDRCommandFailure(default_name, "Output directory does not exist: "+outdir, 1)
 
-    dest = outdir
-    if outdir != '-':
-        dest = os.path.join(outdir, os.path.basename(bagdir)+".json")
-    serve_nerdm(bagdir, dest, log)
+    serve_nerdm(bagdir, outdir, log, config.get('nerdm_serve_compress', True))
 
 
-def serve_nerdm(bagdir, nerdmfile, log=None):
+def serve_nerdm(bagdir, outdir, log=None, compress=True):
+    """
+    export the full NERDm record from the given bag into the given serving directory
+    (via NERDmExporter) under the bag's name.
+
+    :param str bagdir:    the bag to extract the record from
+    :param str outdir:    the export directory; if '-', the record is printed to standard out
+    :param Logger log:    the logger to report to
+    :param bool compress: if True, a gzip-compressed copy of the record is also written
+    """
     bag = NISTBag(bagdir)
     nerdm = bag.nerdm_record(True)
 
-    if nerdmfile == '-':
+    if outdir == '-':
         json.dump(nerdm, sys.stdout, indent=4, separators=(',', ': '))
-    else:
-        write_json(nerdm, nerdmfile)
-    if log:
-        log.info("Updated NERDm record in export directory: %s", os.path.dirname(nerdmfile))
+        return
+
+    if NERDmExporter(outdir, compress).export(nerdm, os.path.basename(bagdir)):
+        if log:
+            log.info("Updated NERDm record in export directory: %s", outdir)
+    elif log:
+        log.info("NERDm record in export directory is unchanged: %s", outdir)
 
 
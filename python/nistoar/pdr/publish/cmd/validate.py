@@ -8,7 +8,7 @@ from nistoar.pdr.exceptions import ConfigurationException, PDRException, PDRServ
 from nistoar.pdr.preserv.bagit import NISTBag, BagBuilder
 from nistoar.pdr.cli import PDRCommandFailure
 from nistoar.pdr import def_schema_dir
-from nistoar.nerdm.validate import validate
+from nistoar.pdr.validation import validate, validate_nerdm_parts
 import nistoar.pdr.preserv.bagit.validate as vald8
 from . import define_pub_opts, determine_bag_path
 
@@ -156,12 +156,17 @@ def validate_nerdm(bag, log, merge=True, success=None, schemadir=None):
     if not schemadir:
         schemadir = def_schema_dir
     nerd = bag.nerdm_record(merge)
-    errs = validate(nerd, schemadir)
-    if errs:
-        log.error("%i validation%s detected in NERDm metadata:",
-                  len(errs), (len(errs) > 1 and "s") or "")
-        for err in errs:
-            log.error(str(err))
+    results = validate_nerdm_parts(nerd, schemadir)
+    nerrs = sum([len(errs) for errs in results.values()])
+    if nerrs:
+        log.error("%i validation error%s detected in NERDm metadata:",
+                  nerrs, (nerrs > 1 and "s") or "")
+        for part, errs in results.items():
+            for err in errs:
+                if part:
+                    log.error("%s: %s", part, str(err))
+                else:
+                    log.error(str(err))
         return False
     else:
         if success is None:
@@ -15,7 +15,7 @@ from ...preserv.bagger import (MIDASMetadataBagger, UpdatePrepService,
 from ...preserv.bagit import NISTBag, BagBuilder
 from ...utils import build_mime_type_map, read_nerd
 from ....id import PDRMinter
-from ....nerdm import validate_nerdm
+from ... import validation
 from ....nerdm.convert import Res2PODds
 from .... import pdr
 from . import midasclient as midas
@@ -533,7 +533,7 @@ class PrePubMetadataService(PublishSystem):
                                              "exist as a directory: " +
                                              self._schemadir)
 
-        return [str(e) for e in validate_nerdm(nerdm, self._schemadir)]
+        return [str(e) for e in validation.validate(nerdm, self._schemadir)]
         
                                            
     def locate_data_file(self, id, filepath):
@@ -0,0 +1,250 @@
+"""
+This module provides the means for coordinating the processing of datasets
+among multiple processes (e.g. uWSGI workers, possibly on different hosts)
+that share the publishing service's working directory.
+
+A process (via one of its threads) processes a dataset's POD queue only while
+it holds that dataset's *lease*.  A lease is recorded as a small JSON file in a
+lease directory; it names its owner and the time it expires.  While a process
+holds leases, a heartbeat thread renews them well before they expire.  If the
+owning process dies, its leases expire and can be taken over by another
+process.  (Expiration assumes that the clocks of hosts sharing the directory
+are reasonably synchronized.)  Updates to lease files are serialized with
+fcntl locks.
+
+This module also provides an InterProcessRLock, a reentrant lock that guards
+a resource (such as a dataset's POD queue files) against simultaneous access
+by threads of the same process as well as by other processes.
+"""
+import os, time, fcntl, socket, threading, logging, uuid
+from collections import OrderedDict
+
+from ...utils import read_json, write_json
+from .. import sys as pdrsys
+
+log = logging.getLogger(pdrsys.system_abbrev)   \
+             .getChild(pdrsys.subsystem_abbrev) \
+             .getChild("leases")
+
+DEF_LEASE_TTL = 60
+DEF_LEASE_WAIT = 30
+
+class InterProcessRLock(object):
+    """
+    a reentrant lock that excludes both other threads and other processes.
+    The inter-process exclusion is accomplished with an fcntl lock on a given
+    file, which is held as long as the lock is held by any thread in this process.
+    """
+
+    def __init__(self, lockfile):
+        self.lockfile = lockfile
+        self._rlock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def acquire(self):
+        self._rlock.acquire()
+        if self._depth == 0:
+            try:
+                fd = open(self.lockfile, 'a')
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            except:
+                self._rlock.release()
+                raise
+            self._fd = fd
+        self._depth += 1
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            fd = self._fd
+            self._fd = None
+            try:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            finally:
+                fd.close()
+        self._rlock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+class LeaseManager(object):
+    """
+    a manager of exclusive, time-limited leases on named resources that are
+    shared among processes.  One instance should be used per process.
+    """
+
+    def __init__(self, leasedir, ttl=DEF_LEASE_TTL):
+        """
+        :param str leasedir:  the directory where lease files are kept; it will
+                              be created if necessary.
+        :param float ttl:     the time in seconds after which an unrenewed
+                              lease expires.  Held leases are renewed at a
+                              third of this interval.
+        """
+        self.dir = leasedir
+        self.ttl = ttl
+        if not os.path.isdir(self.dir):
+            try:
+                os.makedirs(self.dir)
+            except OSError:
+                if not os.path.isdir(self.dir):
+                    raise
+        self.owner = "%s:%d" % (socket.gethostname(), os.getpid())
+        self._held = {}
+        self._heldlock = threading.Lock()
+        self._heartbeat = None
+
+    def _lease_file(self, name):
+        return os.path.join(self.dir, name+".json")
+
+    def _lock(self, name):
+        fd = open(os.path.join(self.dir, name+".lock"), 'a')
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return fd
+
+    def _unlock(self, fd):
+        try:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            fd.close()
+
+    def _read(self, name):
+        lf = self._lease_file(name)
+        if not os.path.exists(lf):
+            return None
+        try:
+            return read_json(lf)
+        except (IOError, ValueError) as ex:
+            log.warning("Ignoring unreadable lease file for %s: %s", name, str(ex))
+            return None
+
+    def _write(self, name, lease):
+        lf = self._lease_file(name)
+        tmp = "%s.%d.%d.tmp" % (lf, os.getpid(), threading.current_thread().ident)
+        write_json(lease, tmp, compact=True)
+        os.rename(tmp, lf)
+
+    def queue_lock(self, name):
+        """
+        return an InterProcessRLock for guarding the given resource's queue
+        """
+        return InterProcessRLock(os.path.join(self.dir, name+".qlock"))
+
+    def holder(self, name):
+        """
+        return a description of the unexpired lease on the named resource or
+        None if it is not currently leased.
+        """
+        lease = self._read(name)
+        if lease and lease.get('expires', 0) > time.time():
+            return lease
+        return None
+
+    def holds(self, name):
+        """
+        return True if this manager currently holds the lease on the named resource
+        """
+        return name in self._held
+
+    def acquire(self, name, timeout=0):
+        """
+        acquire the lease on the named resource.
+
+        :param str name:       the name of the resource to lease
+        :param float timeout:  the maximum time to wait for another owner's lease
+                               to be released or to expire
+        :return bool:  True if the lease was acquired (or is already held by this
+                       manager), False if it is held by another owner
+        """
+        if self.holds(name):
+            return True
+        start = time.time()
+        while True:
+            fd = self._lock(name)
+            try:
+                lease = self.holder(name)
+                if not lease:
+                    now = time.time()
+                    token = uuid.uuid4().hex
+                    self._write(name, OrderedDict([("name", name), ("owner", self.owner),
+                                                   ("token", token), ("acquired", now),
+                                                   ("expires", now + self.ttl)]))
+                    with self._heldlock:
+                        self._held[name] = token
+                    self._ensure_heartbeat()
+                    return True
+            finally:
+                self._unlock(fd)
+
+            if time.time() - start >= timeout:
+                log.debug("%s: leased by %s", name, lease.get('owner'))
+                return False
+            time.sleep(min(0.5, max(timeout / 10.0, 0.05)))
+
+    def renew(self, name):
+        """
+        extend the held lease on the named resource.
+        :return bool:  False if the lease was lost (e.g. because it expired and
+                       was taken by another owner)
+        """
+        token = self._held.get(name)
+        if not token:
+            return False
+        fd = self._lock(name)
+        try:
+            lease = self._read(name)
+            if not lease or lease.get('token') != token:
+                with self._heldlock:
+                    self._held.pop(name, None)
+                return False
+            lease['expires'] = time.time() + self.ttl
+            self._write(name, lease)
+            return True
+        finally:
+            self._unlock(fd)
+
+    def release(self, name):
+        """
+        give up the held lease on the named resource.  This does nothing if the
+        lease is not held.
+        """
+        with self._heldlock:
+            token = self._held.pop(name, None)
+        if not token:
+            return
+        fd = self._lock(name)
+        try:
+            lease = self._read(name)
+            if lease and lease.get('token') == token:
+                os.remove(self._lease_file(name))
+        finally:
+            self._unlock(fd)
+
+    def _ensure_heartbeat(self):
+        with self._heldlock:
+            if self._heartbeat and self._heartbeat.is_alive():
+                return
+            self._heartbeat = threading.Thread(target=self._beat, name="lease-heartbeat")
+            self._heartbeat.daemon = True
+            self._heartbeat.start()
+
+    def _beat(self):
+        # renew held leases periodically; exit when no leases are held
+        while True:
+            time.sleep(self.ttl / 3.0)
+            with self._heldlock:
+                names = list(self._held.keys())
+                if not names:
+                    self._heartbeat = None
+                    return
+            for name in names:
+                try:
+                    if name in self._held and not self.renew(name):
+                        log.warning("%s: lease was lost", name)
+                except Exception as ex:
+                    log.warning("%s: trouble renewing lease: %s", name, str(ex))
@@ -6,8 +6,10 @@ the MIDAS3 convention, the MIDAS3PublishingService handles updates to the metada
 This web service provides the public access to the metadata and the data files provided 
 by the author to MIDAS.  
 """
-import os, sys, logging, json, re
+import os, sys, logging, json, re, time, threading, hashlib, stat, errno
+from copy import deepcopy
 from wsgiref.headers import Headers
+from email.utils import formatdate
 from cgi import parse_qs, escape as escape_qp
 from collections import OrderedDict
 from cStringIO import StringIO
@@ -27,6 +29,94 @@ log = logging.getLogger(pdrsys.system_abbrev)   \
              .getChild("m3mdserv")
 
 DEF_BASE_PATH = "/midas/"
+DEF_CACHE_MAX_RECORDS = 200
+DEF_CACHE_REFRESH_TIME = 60
+
+class RecordCache(object):
+    """
+    a thread-safe, in-memory cache of NERDm records read from disk, along with responses 
+    generated from them.  Each cached entry is keyed on the record's file path and is 
+    considered valid as long as the file's modification time and size have not changed.  
+    Because generated responses can also depend on the state of the SIP's data files, an 
+    entry is also dropped after it has been in the cache longer than a configured refresh 
+    time.  The least-recently used entries are dropped when the cache reaches its 
+    maximum size.  
+    """
+
+    class Entry(object):
+        """
+        a cached record along with generated products derived from it
+        """
+        def __init__(self, path, mtime, size, data):
+            self.path = path
+            self.mtime = mtime
+            self.size = size
+            self.data = data
+            self.loaded = time.time()
+            self.products = {}
+
+        @property
+        def last_modified(self):
+            """
+            the record file's modification time formatted as an HTTP date
+            """
+            return formatdate(self.mtime, usegmt=True)
+
+    def __init__(self, maxsize=DEF_CACHE_MAX_RECORDS, refresh=DEF_CACHE_REFRESH_TIME):
+        """
+        create the cache
+        :param int maxsize:    the maximum number of records to hold; if <= 0, no records
+                               will be cached.
+        :param float refresh:  the maximum number of seconds to keep a record before it is 
+                               reloaded from disk
+        """
+        self.maxsize = maxsize
+        self.refresh = refresh
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        """
+        return the cache entry for the record in the given file, loading it from disk if 
+        necessary.  None is returned if the file does not exist.
+        :raises ValueError:  if the file does not contain parseable JSON
+        """
+        try:
+            st = os.stat(path)
+            if not stat.S_ISREG(st.st_mode):
+                raise OSError(errno.ENOENT, "Not a regular file", path)
+        except OSError:
+            with self._lock:
+                self._entries.pop(path, None)
+            return None
+
+        with self._lock:
+            entry = self._entries.pop(path, None)
+            if entry and (entry.mtime != st.st_mtime or entry.size != st.st_size or 
+                          time.time() - entry.loaded > self.refresh):
+                entry = None
+            if entry:
+                self._entries[path] = entry
+                return entry
+
+        entry = self.Entry(path, st.st_mtime, st.st_size, read_json(path))
+        if self.maxsize > 0:
+            with self._lock:
+                self._entries[path] = entry
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(False)
+        return entry
+
+    def clear(self):
+        """
+        empty the cache of all records
+        """
+        with self._lock:
+            self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
 
 class MIDAS3DataAccessApp(object):
     """
@@ -84,6 +174,10 @@ class MIDAS3DataAccessApp(object):
         mimefiles = self.cfg.get('mimetype_files', [])
         self.mimetypes = build_mime_type_map(mimefiles)
 
+        ccfg = self.cfg.get('record_cache', {})
+        self.reccache = RecordCache(ccfg.get('max_records', DEF_CACHE_MAX_RECORDS),
+                                    ccfg.get('refresh_time', DEF_CACHE_REFRESH_TIME))
+
     def handle_request(self, env, start_resp):
         handler = Handler(self, env, start_resp)
         return handler.handle()
@@ -271,29 +365,68 @@ class Handler(object):
         
             
     def get_metadata(self, dsid):
-        mdata = None
+        entry = self._get_cached_record(dsid)
+        if not entry:
+            return None
+        return deepcopy(entry.data)
+
+    def _get_cached_record(self, dsid):
+        # return the cache entry for the record with the given ID, or None if it's not found
+        entry = None
         mdfile = None
         try:
             for dir in self._dirs:
                 if not dir:
                     continue
                 mdfile = os.path.join(dir, dsid+".json")
-                if os.path.isfile(mdfile):
-                    mdata = read_json(mdfile)
+                found = self.app.reccache.get(mdfile)
+                if found:
+                    entry = found
                     log.info("Retrieving metadata record for id=%s from %s", dsid, mdfile)
 
         except ValueError as ex:
             log.exception("Internal error while parsing JSON file, %s: %s", mdfile, str(ex))
             raise ex
 
-        return mdata
+        return entry
+
+    def _not_modified(self, etag):
+        # return True if the client indicates it has a current copy of the resource with the 
+        # given ETag
+        match = self._env.get('HTTP_IF_NONE_MATCH')
+        if not match:
+            return False
+        tags = [t.strip() for t in match.split(',')]
+        return '*' in tags or etag in tags or ('W/'+etag) in tags
+
+    def send_cached(self, entry, key, body, ctype, message):
+        # send a response body generated from a cached record, honoring If-None-Match
+        etag = entry.products.get(key+":etag")
+        if not etag:
+            etag = '"{0}"'.format(hashlib.sha1(body).hexdigest())
+            entry.products[key+":etag"] = etag
+
+        if self._not_modified(etag):
+            self.set_response(304, "Not Modified")
+            self.add_header('ETag', etag)
+            self.add_header('Last-Modified', entry.last_modified)
+            self.end_headers()
+            return []
+
+        self.set_response(200, message)
+        self.add_header('Content-Type', ctype)
+        self.add_header('Content-Length', str(len(body)))
+        self.add_header('ETag', etag)
+        self.add_header('Last-Modified', entry.last_modified)
+        self.end_headers()
+        return [ body ]
 
     def send_auto_readme(self, dsid, withprompts=True, bebrief=False):
-        mdata = None
+        entry = None
         
         try:
-            mdata = self.get_metadata(dsid)
-            if mdata is None:
+            entry = self._get_cached_record(dsid)
+            if entry is None:
                 log.info("Metadata record not found for ID="+dsid)
                 return self.send_error(404,
                                        "Dataset with ID={0} not being edited".format(dsid))
@@ -303,27 +436,27 @@ class Handler(object):
             log.exception("Internal error: "+str(ex))
             return self.send_error(500, "Internal error")
 
-        out = StringIO()
-        try:
-            gen = ReadmeGenerator()
-            gen.generate(mdata, out, withprompts, bebrief)
-        except Exception as ex:
-            log.exception("Internal error during README generation: "+str(ex))
-            return self.send_error(500, "Internal error")
-
-        self.set_response(200, "File generated")
-        self.add_header('Content-Type', 'text/plain')
-        self.add_header('Content-Length', str(len(out.getvalue())))
-        self.end_headers()
-        return [ln+"\n" for ln in out.getvalue().split("\n")]
+        key = "readme:{0}:{1}".format(int(bool(withprompts)), int(bool(bebrief)))
+        out = entry.products.get(key)
+        if out is None:
+            buf = StringIO()
+            try:
+                gen = ReadmeGenerator()
+                gen.generate(deepcopy(entry.data), buf, withprompts, bebrief)
+            except Exception as ex:
+                log.exception("Internal error during README generation: "+str(ex))
+                return self.send_error(500, "Internal error")
+            out = buf.getvalue()
+            entry.products[key] = out
 
+        return self.send_cached(entry, key, out, 'text/plain', "File generated")
         
     def send_metadata(self, dsid):
 
-        mdata = None
+        entry = None
         try:
-            mdata = self.get_metadata(dsid)
-            if mdata is None:
+            entry = self._get_cached_record(dsid)
+            if entry is None:
                 log.info("Metadata record not found for ID="+dsid)
                 return self.send_error(404,
                                        "Dataset with ID={0} not being edited".format(dsid))
@@ -333,15 +466,13 @@ class Handler(object):
             log.exception("Internal error: "+str(ex))
             return self.send_error(500, "Internal error")
 
-        mdata = self._transform_dlurls(mdata)
-        out = json.dumps(mdata, indent=4, separators=(',', ': '))
-
-        self.set_response(200, "Identifier found")
-        self.add_header('Content-Type', 'application/json')
-        self.add_header('Content-Length', str(len(out)))
-        self.end_headers()
+        out = entry.products.get("nerdm")
+        if out is None:
+            mdata = self._transform_dlurls(deepcopy(entry.data))
+            out = json.dumps(mdata, indent=4, separators=(',', ': '))
+            entry.products["nerdm"] = out
 
-        return [ out ]
+        return self.send_cached(entry, "nerdm", out, 'application/json', "Identifier found")
 
     def _transform_dlurls(self, mdata):
         try: 
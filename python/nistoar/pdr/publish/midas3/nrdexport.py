@@ -0,0 +1,150 @@
+"""
+a module for exporting NERDm records to a directory from which they are served
+to clients such as the pre-publication landing page service.
+
+Each record is written as compact JSON (<name>.json) along with a
+gzip-compressed copy (<name>.json.gz) so that a server can send the compressed
+form without compressing it on each request.  Both files are replaced
+atomically.  A record whose content is unchanged since it was last exported is
+not rewritten.  The directory also holds a manifest (_manifest.json) that
+records, for each exported record, the SHA-256 hash of its JSON content, its
+size (compressed and uncompressed), and the time it was last changed; servers
+can use these as cache validators (e.g. for ETag and Last-Modified headers).
+"""
+import os, gzip, hashlib, time, fcntl, threading
+from collections import OrderedDict
+from io import BytesIO
+
+from ...utils import get_json_codec, read_json, write_json
+
+MANIFEST_FILENAME = "_manifest.json"
+
+class NERDmExporter(object):
+    """
+    a writer of NERDm records into a serving directory.  This is safe to use
+    across threads and processes that share the directory.
+    """
+
+    def __init__(self, exportdir, compress=True):
+        """
+        :param str exportdir:  the directory to write records into
+        :param bool compress:  if True, write a gzip-compressed copy of each
+                               record alongside it
+        """
+        self.dir = exportdir
+        self.compress = compress
+        self.manifest_file = os.path.join(self.dir, MANIFEST_FILENAME)
+        self._lockfile = os.path.join(self.dir, "_manifest.lock")
+        if not os.path.exists(self.dir):
+            os.makedirs(self.dir)
+
+    def _lock(self):
+        fd = open(self._lockfile, 'a')
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return fd
+
+    def _unlock(self, fd):
+        try:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            fd.close()
+
+    def file_for(self, name):
+        """
+        return the path to the (uncompressed) exported record with the given name
+        """
+        return os.path.join(self.dir, name+".json")
+
+    def manifest(self):
+        """
+        return the current manifest of exported records: a dictionary mapping
+        record names to their descriptions (with properties, sha256, size,
+        gzsize, and mtime).
+        """
+        if not os.path.exists(self.manifest_file):
+            return OrderedDict()
+        return read_json(self.manifest_file)
+
+    def _save_manifest(self, mf):
+        tmp = "%s.%d.%d.tmp" % (self.manifest_file, os.getpid(),
+                                threading.current_thread().ident)
+        write_json(mf, tmp, compact=True)
+        os.rename(tmp, self.manifest_file)
+
+    def _write_atomically(self, path, content):
+        tmp = os.path.join(os.path.dirname(path), "_"+os.path.basename(path))
+        tmp += ".%d.%d" % (os.getpid(), threading.current_thread().ident)
+        with open(tmp, 'wb') as fd:
+            fd.write(content)
+        os.rename(tmp, path)
+
+    def _gzip(self, content):
+        # mtime is fixed so that identical content compresses identically
+        buf = BytesIO()
+        gz = gzip.GzipFile(filename="", mode='wb', fileobj=buf, mtime=0)
+        try:
+            gz.write(content)
+        finally:
+            gz.close()
+        return buf.getvalue()
+
+    def export(self, nerdm, name):
+        """
+        write the given NERDm record into the export directory under the given
+        name, unless an identical record has already been exported.
+
+        :param dict nerdm:  the NERDm record to export
+        :param str   name:  the base name for the exported files
+        :return bool:  True if the record was written, or False if it was
+                       unchanged
+        """
+        content = get_json_codec().dumps(nerdm, compact=True)
+        if isinstance(content, unicode):
+            content = content.encode('utf-8')
+        hash = hashlib.sha256(content).hexdigest()
+
+        lk = self._lock()
+        try:
+            mf = self.manifest()
+            prev = mf.get(name)
+            jsonf = self.file_for(name)
+            if prev and prev.get('sha256') == hash and os.path.exists(jsonf) and \
+               (not self.compress or os.path.exists(jsonf+".gz")):
+                return False
+
+            ent = OrderedDict([("sha256", hash), ("size", len(content))])
+            if self.compress:
+                gzcontent = self._gzip(content)
+                self._write_atomically(jsonf+".gz", gzcontent)
+                ent['gzsize'] = len(gzcontent)
+            elif os.path.exists(jsonf+".gz"):
+                os.remove(jsonf+".gz")
+            self._write_atomically(jsonf, content)
+            ent['mtime'] = os.stat(jsonf).st_mtime
+
+            mf[name] = ent
+            self._save_manifest(mf)
+            return True
+        finally:
+            self._unlock(lk)
+
+    def remove(self, name):
+        """
+        remove the exported record with the given name
+        :return bool:  True if the record had been exported
+        """
+        lk = self._lock()
+        try:
+            jsonf = self.file_for(name)
+            found = os.path.exists(jsonf)
+            for f in (jsonf, jsonf+".gz"):
+                if os.path.exists(f):
+                    os.remove(f)
+            mf = self.manifest()
+            if name in mf:
+                del mf[name]
+                self._save_manifest(mf)
+                found = True
+            return found
+        finally:
+            self._unlock(lk)
@@ -0,0 +1,126 @@
+"""
+a module for reading the bodies of web service requests without holding large
+ones in memory.
+
+spool_body() copies a request body from the WSGI input stream into a
+SpooledTemporaryFile:  bodies smaller than a threshold stay in memory while
+larger ones are written to a temporary file on disk.  A maximum body size can
+be enforced; a body that exceeds it (according to either its declared
+Content-Length or the number of bytes actually sent) causes a RequestTooLarge
+exception, which a web service should turn into a 413 response.  The spooled
+body is saved in the WSGI environment so that it can be read again (e.g. by
+both a request recorder and a JSON parser) without re-buffering it; the size
+limit of each caller is applied to the saved body as well.  body_excerpt()
+returns the start of a spooled body for use in log messages.
+"""
+import tempfile
+
+DEF_MAX_BODY_SIZE = 200 * 1024 * 1024
+DEF_SPOOL_THRESHOLD = 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+DEF_EXCERPT_SIZE = 4096
+
+SPOOLED_BODY_KEY = "nistoar.spooled_body"
+TOO_LARGE_KEY = "nistoar.body_too_large"
+
+class RequestTooLarge(Exception):
+    """
+    an exception indicating that the body of a request exceeds the allowed size
+    """
+    def __init__(self, max_size, size=None):
+        msg = "Request body exceeds maximum allowed size (%d bytes)" % max_size
+        if size is not None:
+            msg += ": %d bytes" % size
+        super(RequestTooLarge, self).__init__(msg)
+        self.max_size = max_size
+        self.size = size
+
+def spool_body(wsgienv, max_size=DEF_MAX_BODY_SIZE, threshold=DEF_SPOOL_THRESHOLD,
+               tmpdir=None):
+    """
+    read the body of the request described by the given WSGI environment into a
+    spooled buffer, or return the buffer if the body was already spooled.
+    The returned buffer is positioned at its start, and it replaces the
+    'wsgi.input' stream in the environment.
+
+    :param dict wsgienv:    the WSGI environment for the request
+    :param int max_size:    the maximum allowed size of the body in bytes; if
+                            None or <= 0, the size is not limited.
+    :param int threshold:   the size in bytes above which the body is written
+                            to disk rather than held in memory
+    :param str tmpdir:      the directory to write large bodies to (default:
+                            the system's temporary directory)
+    :return:  a file-like buffer containing the body, or None if the
+              request has no input stream.
+    :raise RequestTooLarge:  if the body exceeds max_size (or if an earlier call
+                             gave up reading it because it was too large)
+    """
+    if wsgienv.get(TOO_LARGE_KEY):
+        # the body was only partially read
+        raise wsgienv[TOO_LARGE_KEY]
+
+    body = wsgienv.get(SPOOLED_BODY_KEY)
+    if body is not None:
+        if max_size and max_size > 0:
+            body.seek(0, 2)
+            if body.tell() > max_size:
+                raise RequestTooLarge(max_size, body.tell())
+        body.seek(0)
+        return body
+
+    bodyin = wsgienv.get('wsgi.input')
+    if bodyin is None:
+        return None
+
+    length = None
+    try:
+        if wsgienv.get('CONTENT_LENGTH'):
+            length = int(wsgienv['CONTENT_LENGTH'])
+    except ValueError:
+        pass
+    if max_size and max_size > 0 and length is not None and length > max_size:
+        # nothing has been read, so a caller with a higher limit can still read it
+        raise RequestTooLarge(max_size, length)
+
+    body = tempfile.SpooledTemporaryFile(threshold, dir=tmpdir)
+    size = 0
+    try:
+        while length is None or size < length:
+            want = CHUNK_SIZE
+            if length is not None:
+                want = min(want, length - size)
+            buf = bodyin.read(want)
+            if not buf:
+                break
+            size += len(buf)
+            if max_size and max_size > 0 and size > max_size:
+                wsgienv[TOO_LARGE_KEY] = RequestTooLarge(max_size)
+                raise wsgienv[TOO_LARGE_KEY]
+            body.write(buf)
+    except:
+        body.close()
+        raise
+
+    body.seek(0)
+    wsgienv[SPOOLED_BODY_KEY] = body
+    wsgienv['wsgi.input'] = body
+    return body
+
+def body_excerpt(wsgienv, size=DEF_EXCERPT_SIZE):
+    """
+    return the start of the request body spooled by spool_body(), up to the given 
+    number of bytes, for use in log messages.  "..." is appended if the body is 
+    longer.  An empty string is returned if the body has not been spooled.
+    """
+    body = wsgienv.get(SPOOLED_BODY_KEY)
+    if body is None:
+        return ""
+    pos = body.tell()
+    try:
+        body.seek(0)
+        out = body.read(size+1)
+    finally:
+        body.seek(pos)
+    if len(out) > size:
+        out = out[:size] + "..."
+    return out
@@ -5,6 +5,7 @@ It is designed to operate on SIP work areas created and managed by MIDAS for pub
 import os, logging, re, json, copy, time, threading, shutil
 from collections import Mapping, OrderedDict
 from copy import deepcopy
+from contextlib import contextmanager
 
 from ...exceptions import (ConfigurationException, StateException, 
                            SIPDirectoryNotFound, IDNotFound, PDRServiceException)
@@ -16,14 +17,17 @@ from ...preserv import PreservationException
 from ...preserv.bagit import NISTBag, DEF_MERGE_CONV
 from ...preserv.service import status as ps
 from ...preserv.service.service import MultiprocPreservationService
+from ...preserv.service.trash import Trash
 from ...utils import build_mime_type_map, read_nerd, write_json, read_pod
 from ... import config as _configmod
 from ....id import PDRMinter
 from ....nerdm.convert import Res2PODds, topics2themes
 from ....nerdm.taxonomy import ResearchTopicsTaxonomy
-from ....nerdm import validate
+from ... import validation
 from .... import pdr
 from .customize import CustomizationServiceClient
+from .nrdexport import NERDmExporter
+from .leases import LeaseManager, DEF_LEASE_TTL, DEF_LEASE_WAIT
 
 import ejsonschema as ejs
 from ejsonschema import schemaloader
@@ -75,6 +79,26 @@ class MIDAS3PublishingService(PublishSystem):
     :prop bagger dict ({}):  a dictionary for configuring the SIPBagger instance
                       used to process the SIP (see SIPBagger implementation 
                       documentation for supported sub-properties).  
+    :prop nerdm_serve_compress bool (True):  if True, NERDm records exported for 
+                      serving (see serve_nerdm()) are accompanied by gzip-compressed
+                      copies.
+    :prop cleanup dict ({}):  configuration for the trash area that metadata bags are
+                      discarded into once they are no longer needed (see 
+                      nistoar.pdr.preserv.service.trash.Trash); they are deleted by a 
+                      background thread unless the 'collect' sub-property is False.
+    :prop leases dict ({}):  configuration for the leases that ensure that only one 
+                      process at a time processes a dataset's POD queue, so that the 
+                      service can run in multiple processes (and hosts) sharing the 
+                      working directory (see nistoar.pdr.publish.midas3.leases).  The 
+                      sub-properties are 'dir', the lease directory (default: 
+                      "leases" in the POD queue directory), 'ttl', the seconds 
+                      after which a lease held by a process that has died expires 
+                      (default: 60), 'wait', the seconds a request that must update a 
+                      dataset will wait for another process to release its lease 
+                      (default: 30), and 'rescan_interval', the seconds between 
+                      checks of the POD queue for queues that need processing (e.g. 
+                      because the process handling them has died; default: the 
+                      'ttl' value).  A rescan_interval <= 0 turns off these checks.
     """
 
     def __init__(self, config, workdir=None, reviewdir=None, uploaddir=None,
@@ -102,6 +126,11 @@ class MIDAS3PublishingService(PublishSystem):
         self.cfg = config
 
         self.log = log.getChild("m3svc")
+        self._collectors = []
+        self._monitor = None
+        self._workerlock = threading.RLock()
+        self._leaselock = threading.Lock()
+        self._leaseusers = {}
 
         # set some working areas
         self.workdir = None     # default location for output/internal data
@@ -148,7 +177,7 @@ class MIDAS3PublishingService(PublishSystem):
         if self.cfg.get('require_valid_pod', True):
             if not self._schemadir:
                 raise ConfigurationException("'require_valid_pod' is set but cannot find schema dir")
-            self._podvalid8r = validate.create_validator(self._schemadir, "_")
+            self._podvalid8r = validation.get_validator(self._schemadir, "_")
 
 
         # used to convert NERDm to POD
@@ -164,6 +193,14 @@ class MIDAS3PublishingService(PublishSystem):
         self._bagging_workers = {}
         self.pressvc = MultiprocPreservationService(self._presv_config())
 
+        # started last so that a failed construction does not leave them running
+        if self.trash.deferred and self.cfg.get('cleanup', {}).get('collect', True):
+            self._collectors.append(self.trash.start_collector())
+        interval = self.cfg.get('leases', {}).get('rescan_interval', self.leases.ttl)
+        if interval > 0:
+            self._monitor = _QueueMonitor(self, interval)
+            self._monitor.start()
+
     def _presv_config(self):
         comm = {
             "review_dir": self.reviewdir
@@ -213,10 +250,18 @@ class MIDAS3PublishingService(PublishSystem):
         if not os.path.isabs(self.nrddir):
             self.nrddir = os.path.join(workdir,self.nrddir)
             if not os.path.exists(self.nrddir):  os.makedirs(self.nrddir)
+        self.nrdexporter = NERDmExporter(self.nrddir, self.cfg.get('nerdm_serve_compress', True))
+        self.trash = Trash(self.cfg.get('cleanup', {}), workdir)
         self.podqdir = self.cfg.get('pod_queue_dir', "podq")
         if not os.path.isabs(self.podqdir):
             self.podqdir = os.path.join(workdir, self.podqdir)
             if not os.path.exists(self.podqdir):  os.makedirs(self.podqdir)
+        lcfg = self.cfg.get('leases', {})
+        leasedir = lcfg.get('dir', os.path.join(self.podqdir, "leases"))
+        if not os.path.isabs(leasedir):
+            leasedir = os.path.join(workdir, leasedir)
+        self.leases = LeaseManager(leasedir, lcfg.get('ttl', DEF_LEASE_TTL))
+        self._lease_wait = lcfg.get('wait', DEF_LEASE_WAIT)
         self.storedir = self.cfg.get('store_dir')
         if not self.storedir:
             self.log.warn("store_dir config param not set; setting it to %s",
@@ -241,9 +286,31 @@ class MIDAS3PublishingService(PublishSystem):
             self.log.warn("Creating new ID minter")
         return out
 
+    def shutdown(self, timeout=None):
+        """
+        stop the background activities of this service (and of its preservation 
+        service).
+
+        :param float timeout:  the maximum time to wait for each background 
+                               thread to exit
+        """
+        if self._monitor:
+            self._monitor.stop(timeout)
+            self._monitor = None
+        for coll in self._collectors:
+            coll.stop(timeout)
+        self._collectors = []
+        if getattr(self, 'pressvc', None):
+            self.pressvc.shutdown(timeout)
+
     def restart_workers(self):
         """
-        Examine the POD queue and restart worker threads for any pending POD files found
+        Examine the POD queue and restart worker threads for any pending POD files found.
+        Queues being processed by other processes are skipped unless their leases have 
+        expired; thus, this can be called periodically to take over the queues of 
+        processes that have died.  (Unless turned off via the 'leases.rescan_interval' 
+        configuration parameter, this is called when the service starts and periodically
+        thereafter.)
         """
         pending = set()
         for qdir in ["current", "next"]:
@@ -255,10 +322,62 @@ class MIDAS3PublishingService(PublishSystem):
                 pending.add(podf[:-len(".json")])
 
         for id in pending:
-            worker = self._get_bagging_worker(id)
-            if not worker.is_working():
-                worker.launch()
-        
+            if self.leases.holder(id) and not self.leases.holds(id):
+                # being processed by another process
+                continue
+            try:
+                with self._workerlock:
+                    worker = self._get_bagging_worker(id)
+                    if not worker.is_working():
+                        worker.launch()
+            except Exception as ex:
+                self.log.error("Unable to restart processing of POD queue for %s: %s", id, str(ex))
+
+    def _hold_lease(self, name, timeout=0):
+        # acquire the lease on the named dataset on behalf of a thread of this
+        # process.  The lease is shared by the threads of this process that need
+        # it; it is released when the last of them calls _release_lease().
+        while True:
+            with self._leaselock:
+                if self._leaseusers.get(name):
+                    self._leaseusers[name] += 1
+                    return True
+            if not self.leases.acquire(name, timeout):
+                return False
+            with self._leaselock:
+                if self.leases.holds(name):
+                    self._leaseusers[name] = self._leaseusers.get(name, 0) + 1
+                    return True
+            # another thread released the lease before it could be counted; try again
+
+    def _release_lease(self, name):
+        with self._leaselock:
+            n = self._leaseusers.get(name, 0) - 1
+            if n > 0:
+                self._leaseusers[name] = n
+                return
+            self._leaseusers.pop(name, None)
+            self.leases.release(name)
+
+    @contextmanager
+    def _leased(self, name, timeout=None):
+        """
+        hold the lease on the named dataset for the duration of a with block so that no 
+        other process updates it at the same time.  
+
+        :param str name:       the (bag) name of the dataset
+        :param float timeout:  the maximum time to wait for another process to release 
+                               the lease (default: the 'leases.wait' configuration value)
+        :raise DatasetBusy:  if the lease could not be acquired within the timeout
+        """
+        if timeout is None:
+            timeout = self._lease_wait
+        if not self._hold_lease(name, timeout):
+            raise DatasetBusy(name, "being updated by another process")
+        try:
+            yield
+        finally:
+            self._release_lease(name)
 
     def wait_for_all_workers(self, timeout):
         """
@@ -323,18 +442,22 @@ class MIDAS3PublishingService(PublishSystem):
         return bagger
 
     def _get_bagging_worker(self, id, replaces=None):
-        worker = self._bagging_workers.get(id)
-        if not worker:
-            bagger = self._create_bagger(id, replaces)
-            # bagger.prepare()
-            worker = self.BaggingWorker(self, id, bagger, self.log)
-            self._bagging_workers[id] = worker
-        return worker
+        with self._workerlock:
+            worker = self._bagging_workers.get(id)
+            if not worker:
+                bagger = self._create_bagger(id, replaces)
+                # bagger.prepare()
+                worker = self.BaggingWorker(self, id, bagger, self.log)
+                self._bagging_workers[id] = worker
+            return worker
 
     def delete(self, id):
         """
         delete the working metadata bag for the given identifier.  Afterward, it must be recreated 
         via a call to update_ds_with_pod(id).
+
+        :raise DatasetBusy:  if another process is updating the dataset and does not finish
+                             in time
         """
         if not id:
             raise ValueError("Empty or null identifier")
@@ -344,15 +467,16 @@ class MIDAS3PublishingService(PublishSystem):
             bagger = self._create_bagger(id)
             worker = self.BaggingWorker(self, id, bagger, self.log)
 
-        if os.path.exists(worker.bagger.bagdir):
-            worker = self._get_bagging_worker(id)
-            worker.delete_bag()
-        self._drop_bagging_worker(worker)
+        try:
+            with self._leased(worker.name):
+                if os.path.exists(worker.bagger.bagdir):
+                    worker = self._get_bagging_worker(id)
+                    worker.delete_bag()
+        finally:
+            self._drop_bagging_worker(worker)
 
         # now delete the built landing page
-        nerdf = os.path.join(self.nrddir, worker.bagger.name+".json")
-        if os.path.exists(nerdf):
-            os.remove(nerdf)
+        self.nrdexporter.remove(worker.bagger.name)
 
     def _drop_bagging_worker(self, worker, timeout=None):
         if worker.is_working() and worker._thread is not threading.current_thread():
@@ -374,18 +498,28 @@ class MIDAS3PublishingService(PublishSystem):
             # shouldn't happen since identifier is required for validity
             raise ValueError("POD record is missing required identifier")
 
-        # is this an update that generated a new EDI-ID?
         replaces = pod.get('replaces')
         worker = self._get_bagging_worker(id, replaces=replaces)
-        if replaces and not os.path.exists(worker.bagger.bagdir):
-            oldworker = self._get_bagging_worker(replaces)
-            if oldworker.is_working() or os.path.exists(oldworker.bagger.bagdir):
-                # make a copy of the bag being replaced, but wait for it to finish its work
-                self._copy_oldbag_when_done(oldworker, worker)
-
         if not os.path.exists(worker.bagger.bagdir):
-            # prep the bag synchronously (in case there's an issue)
-            worker.bagger.prepare()
+            # set up the bag synchronously (in case there's an issue) unless another process 
+            # is processing this dataset; that process will set it up when it processes the 
+            # queued POD.
+            if self._hold_lease(worker.name, (not async and self._lease_wait) or 0):
+                try:
+                    # is this an update that generated a new EDI-ID?
+                    if replaces and not os.path.exists(worker.bagger.bagdir):
+                        oldworker = self._get_bagging_worker(replaces)
+                        if oldworker.is_working() or os.path.exists(oldworker.bagger.bagdir):
+                            # make a copy of the bag being replaced, but wait for it to finish
+                            self._copy_oldbag_when_done(oldworker, worker)
+
+                    if not os.path.exists(worker.bagger.bagdir):
+                        worker.bagger.prepare()
+                finally:
+                    self._release_lease(worker.name)
+
+            elif not async:
+                raise DatasetBusy(id, "being updated by another process")
 
         worker.queue_POD(pod)
 
@@ -439,11 +573,13 @@ class MIDAS3PublishingService(PublishSystem):
     def serve_nerdm(self, nerdm, name=None):
         """
         export the given nerdm data to the export directory where it can be served to 
-        clients (e.g. pre-publication landing page service)
+        clients (e.g. pre-publication landing page service).  The record is not rewritten
+        if its content has not changed since it was last exported (see NERDmExporter).
 
         :param dict nerdm:   the nerdm record of a JSON file containing the data
         :param str   name:   the basename to use to store the data under; if not provided,
                              it will be generated from the EDI identifier.
+        :return bool:  False if the record was unchanged and so not rewritten
         """
         nerdf = None
         if not isinstance(nerdm, Mapping):
@@ -456,12 +592,8 @@ class MIDAS3PublishingService(PublishSystem):
 
         # the NERDm metadata may be under-specified
         self._pad_nerdm(nerdm)
-                        
-        # first stage to a temp file (this helps avoid collisions)
-        nerdf = os.path.join(self.nrddir, "_"+name+".json")
-        write_json(nerdm, nerdf)
 
-        os.rename(nerdf, os.path.join(self.nrddir, name+".json"))
+        return self.nrdexporter.export(nerdm, name)
 
     def _pad_nerdm(self, nerdm):
         if not nerdm.get('contactPoint'):
@@ -547,6 +679,16 @@ class MIDAS3PublishingService(PublishSystem):
         # pull nerdm draft from customization service
         updmd = self._custclient.get_draft(midasid_to_bagname(ediid), True)
 
+        with self._leased(midasid_to_bagname(ediid)):
+            bagger = self._save_cust_updates(ediid, updmd)
+
+        # send delete request
+        self._custclient.delete_draft(ediid)
+        self._lock_out_pod_updates(bagger, False)
+
+    def _save_cust_updates(self, ediid, updmd):
+        # save the updates from a customization draft into the dataset's bag; the 
+        # caller must hold the dataset's lease
         worker = self._bagging_workers.get(ediid)
         if worker:
             bagger = worker.bagger
@@ -585,9 +727,7 @@ class MIDAS3PublishingService(PublishSystem):
             #   save pod -- SHOULD WE MAKE MIDAS apply_pod()?
             bagger.bagbldr.save_pod(pod)
 
-        # send delete request
-        self._custclient.delete_draft(ediid)
-        self._lock_out_pod_updates(bagger, False)
+        return bagger
 
     def _lock_out_pod_updates(self, bagger, lock=True):
         pass
@@ -823,7 +963,7 @@ class MIDAS3PublishingService(PublishSystem):
                                              "exist as a directory: " +
                                              self._schemadir)
 
-        return [str(e) for e in validate.validate(nerdm, self._schemadir)]
+        return [str(e) for e in validation.validate(nerdm, self._schemadir)]
         
     def get_customized_pod(self, ediid):
         """
@@ -1000,6 +1140,13 @@ class MIDAS3PublishingService(PublishSystem):
         """
         return self.pressvc.requests()
 
+    def preservation_metrics(self):
+        """
+        return the timing metrics for the stages of preservation processing in the 
+        Prometheus text exposition format.
+        """
+        return self.pressvc.metrics()
+
 
     class BaggingWorker(object):
 
@@ -1038,15 +1185,30 @@ class MIDAS3PublishingService(PublishSystem):
                 super(MIDAS3PublishingService.BaggingWorker._Thread, self). \
                     __init__(name="bagger:"+worker.bagger.name)
             def run(self):
-                self.worker.run()
+                # the launching thread acquired the lease on the worker's behalf
+                self.worker.run(_leased=True)
         
         def is_working(self):
             return self._thread and self._thread.is_alive()
 
         def launch(self):
-            self._thread = self._Thread(self)
-            self.log.debug("Starting worker thread %s", self._thread.name)
-            self._thread.start()
+            with self.service._workerlock:
+                if self.is_working():
+                    return
+                if not self.service._hold_lease(self.name):
+                    self.log.debug("POD queue for id=%s is being processed by another process",
+                                   self.id)
+                    # the other process does this dataset's work, so this worker is not needed
+                    if not self.bagger.fileExaminer.running():
+                        self.service._drop_bagging_worker(self)
+                    return
+                try:
+                    self._thread = self._Thread(self)
+                    self.log.debug("Starting worker thread %s", self._thread.name)
+                    self._thread.start()
+                except:
+                    self.service._release_lease(self.name)
+                    raise
 
         def queue_POD(self, pod):
             self.ensure_qlock()
@@ -1082,8 +1244,13 @@ class MIDAS3PublishingService(PublishSystem):
                     os.remove(self.next_pod)
 
         def ensure_qlock(self):
+            # the lock excludes other processes as well as other threads
             if not self.qlock:
-                self.qlock = threading.RLock()
+                self.qlock = self.service.leases.queue_lock(self.name)
+
+        def has_queued_pods(self):
+            return os.path.exists(self.working_pod) or os.path.exists(self.next_pod) or \
+                   os.path.exists(self.presv_pod)
 
         def _whendone(self):
             self.service.serve_nerdm(self.bagger.bagbldr.bag.nerdm_record(True))
@@ -1091,11 +1258,38 @@ class MIDAS3PublishingService(PublishSystem):
             # clean up the worker
             self.service._drop_bagging_worker(self)
                 
-        def run(self, examine="async"):
+        def run(self, examine="async", _leased=False):
             whendone = None
             if examine == "async":
                 whendone = self._whendone
-            self.process_queue()
+
+            # only the holder of the dataset's lease may process its queue; a synchronous
+            # caller waits for another process holding it to finish
+            svc = self.service
+            held = _leased or \
+                   svc._hold_lease(self.name, (examine == "sync" and svc._lease_wait) or 0)
+            if not held:
+                if examine == "sync":
+                    raise DatasetBusy(self.id, "POD queue is being processed by another process")
+                self.log.info("POD queue for id=%s is being processed by another process",
+                              self.id)
+                return
+            try:
+                while True:
+                    self.process_queue()
+                    svc._release_lease(self.name)
+                    held = False
+
+                    # another process may have queued a POD after the queue was last
+                    # checked but before the lease was released
+                    if not self.has_queued_pods() or os.path.exists(self.halt_sema):
+                        break
+                    held = svc._hold_lease(self.name)
+                    if not held:
+                        break
+            finally:
+                if held:
+                    svc._release_lease(self.name)
 
             # remove this thread from bagger threads
             # del self.service._bagging_workers[self.id]
@@ -1119,6 +1313,13 @@ class MIDAS3PublishingService(PublishSystem):
                                 os.rename(self.next_pod, self.working_pod)
 
                 if os.path.exists(self.working_pod):
+                    if not self.service.leases.holds(self.name):
+                        # another process may now be updating the bag; leave the
+                        # working POD for whichever process holds the lease
+                        self.log.warning("Lease on %s was lost; stopping POD processing",
+                                         self.name)
+                        return
+
                     try:
                         pod = None
                         with self.qlock:
@@ -1259,7 +1460,7 @@ class MIDAS3PublishingService(PublishSystem):
                         if '_preserve' in pod:
                             # it's safe to clean up metadata bag
                             self.bagger.done()
-                            shutil.rmtree(self.bagger.bagdir)
+                            self.service.trash.discard(self.bagger.bagdir)
 
         def delete_bag(self):
             """
@@ -1271,12 +1472,19 @@ class MIDAS3PublishingService(PublishSystem):
                     self.bagger.done()
                     self.bagger.sip.nerd = None
                     self.bagger.sip.pod = None
-                    shutil.rmtree(self.bagger.bagdir)
+                    self.service.trash.discard(self.bagger.bagdir)
                 
         def preservation_status(self):
             # signal that preservation of this dataset has completed.
             stat = self.service.pressvc.status(self.bagger.midasid, "midas3")
-            self._check_preservation(stat)  # this may clean up the metadata bag
+
+            # this may clean up the metadata bag, so it is skipped while another process
+            # is working on the dataset
+            if self.service._hold_lease(self.name):
+                try:
+                    self._check_preservation(stat)
+                finally:
+                    self.service._release_lease(self.name)
             return stat
 
         def finalize_version(self):
@@ -1298,6 +1506,50 @@ class MIDAS3PublishingService(PublishSystem):
 
 
 
+class _QueueMonitor(threading.Thread):
+    """
+    a thread that calls a service's restart_workers() when it starts and at regular
+    intervals thereafter, so that POD queues left by processes that have died get 
+    processed.
+    """
+
+    def __init__(self, service, interval):
+        threading.Thread.__init__(self, name="podq-monitor")
+        self.daemon = True
+        self.service = service
+        self.interval = interval
+        self._halt = threading.Event()
+
+    def run(self):
+        while not self._halt.is_set():
+            try:
+                self.service.restart_workers()
+            except Exception as ex:
+                log.exception("Trouble checking the POD queue: %s", str(ex))
+            self._halt.wait(self.interval)
+
+    def stop(self, timeout=None):
+        """
+        stop the monitor after its current check
+        """
+        self._halt.set()
+        self.join(timeout)
+
+class DatasetBusy(StateException):
+    """
+    an exception indicating that a dataset could not be updated because another 
+    process is updating it.  
+    """
+
+    def __init__(self, id, message):
+        """
+        create the exception
+        :param str id:  the identifier for the busy dataset
+        :param str message:  an explanation of what is keeping the dataset busy
+        """
+        super(DatasetBusy, self).__init__(id+": "+message)
+        self.id = id
+
 class CustomizationStateException(StateException):
     """
     an exception indicating an attempt to call a function that is incompatible with the 
@@ -4,7 +4,11 @@ a module that manages the recording of web requests so that they can be played b
 import logging, os
 from cStringIO import StringIO
 
+from .reqbody import spool_body, RequestTooLarge
+
 RECORD_FORMAT = "=*= %(asctime)s %(name)s %(message)s"
+DEF_MAX_RECORDED_BODY = 1024 * 1024
+TRUNCATED_HEADER = "X-Record-Body-Truncated"
 
 class WebRequest(object):
     """
@@ -16,6 +20,7 @@ class WebRequest(object):
         self._op = None
         self._res = None
         self._body = StringIO()
+        self._bodyfile = None
         self.time = None
         self.service = None
         
@@ -91,15 +96,64 @@ class WebRequest(object):
     @property
     def body(self):
         """The full text sent in the body of the request"""
+        if self._bodyfile is not None:
+            pos = self._bodyfile.tell()
+            self._bodyfile.seek(0)
+            try:
+                return self._bodyfile.read() + self._body.getvalue()
+            finally:
+                self._bodyfile.seek(pos)
         return self._body.getvalue()
 
     @body.setter
     def body(self, val):
         if val is None:
             val = ''
+        self._bodyfile = None
         self._body = StringIO()
         self._body.write(val)
 
+    def body_excerpt(self, maxsize=None):
+        """
+        return the start of the body text, up to maxsize bytes, along with the full size 
+        of the body.  Unlike the body property, this reads no more of a body file than 
+        is returned.
+        :param int maxsize:  the maximum number of bytes to return; if None or <= 0, the 
+                             entire body is returned.
+        :rtype tuple:  the text and the full size of the body in bytes
+        """
+        if maxsize is not None and maxsize <= 0:
+            maxsize = None
+        extra = self._body.getvalue()
+        if self._bodyfile is None:
+            return (extra[:maxsize], len(extra))
+
+        fd = self._bodyfile
+        pos = fd.tell()
+        try:
+            fd.seek(0, 2)
+            size = fd.tell() + len(extra)
+            fd.seek(0)
+            if maxsize is None:
+                text = fd.read() + extra
+            else:
+                text = fd.read(maxsize)
+                text += extra[:maxsize-len(text)]
+        finally:
+            fd.seek(pos)
+        return (text, size)
+
+    def set_body_file(self, fd):
+        """
+        take the body text from the given seekable file stream (such as a spooled request 
+        body) rather than copying it into this record.  The stream will be read when the 
+        body is needed (e.g. when the request is recorded) and so must not be closed before 
+        then.  
+        """
+        self.body = None
+        self._bodyfile = fd
+        return self
+
     def add_body_text(self, txt):
         """
         append the given text to the internally-held body text.  No additional newline characters are 
@@ -127,12 +181,17 @@ class WebRequest(object):
         self.recorder.record(self)
 
     @classmethod
-    def from_wsgi(cls, recorder, wsgienv, readbody=False):
+    def from_wsgi(cls, recorder, wsgienv, readbody=False, max_size=None):
         """
         create a record given the request information in the environment dictionary provided 
         by the WSGI framework.  By default, the body is not read and inserted into the record; 
         however setting readbody to True will cause the input stream containing the body to be
-        read in its entirety.
+        read in its entirety.  The body is spooled (to disk, if it is large) and the spooled 
+        copy replaces the input stream in the environment so that it can be read again by the 
+        service (see reqbody.spool_body()).
+        :param int max_size:  the maximum body size to accept when readbody is True; if 
+                              None or <= 0, the size is not limited.
+        :raise RequestTooLarge:  if readbody is True and the body exceeds max_size
         """
         out = cls(recorder)
         out.op = wsgienv.get('REQUEST_METHOD')
@@ -140,7 +199,7 @@ class WebRequest(object):
         out.qs = wsgienv.get('QUERY_STRING')
         out.add_header_from_wsgienv(wsgienv)
         if readbody and 'wsgi.input' in wsgienv:
-            out.read_body(wsgienv['wsgi.input'])
+            out.set_body_file(spool_body(wsgienv, max_size))
         return out
 
     def __str__(self):
@@ -151,7 +210,8 @@ class WebRecorder(object):
     a class that will record messages sent to a web service
     """
 
-    def __init__(self, recordfile=None, svcname=None, level=logging.DEBUG):
+    def __init__(self, recordfile=None, svcname=None, level=logging.DEBUG,
+                 max_body_size=DEF_MAX_RECORDED_BODY):
         """
         Create a WebRecorder instance.  If a filename is not provided, no messages will be 
         recorded (unless a handler is added via add_handler()).  
@@ -160,10 +220,15 @@ class WebRecorder(object):
                                     appears in the output record, just before the request method.
                                     The default, if not provided, is "WebRec"
         :param int level:         the logging level for accepting requests by method
+        :param int max_body_size: the maximum number of bytes of a request body to record; 
+                                    longer bodies are truncated (and the record notes this with 
+                                    an X-Record-Body-Truncated header line).  If None or <= 0, 
+                                    whole bodies are recorded.
         """
         if not svcname:
             svcname = "WebRec"
         self.svcname = svcname
+        self.max_body_size = max_body_size
         self._handler = None
         self._recfile = None
         if recordfile:
@@ -239,23 +304,23 @@ class WebRecorder(object):
         """
         return WebRequest(self, op, resource, headers, body, qs)
 
-    def from_wsgi(self, wsgienv, readbody=False):
+    def from_wsgi(self, wsgienv, readbody=False, max_size=None):
         """
         create a record given the request information in the environment dictionary provided 
         by the WSGI framework.  By default, the body is not read and inserted into the record; 
         however setting readbody to True will cause the input stream containing the body to be
-        read in its entirety.
+        read in its entirety (up to max_size bytes; see WebRequest.from_wsgi()).
         """
-        return WebRequest.from_wsgi(self, wsgienv, readbody)
+        return WebRequest.from_wsgi(self, wsgienv, readbody, max_size)
 
-    def record_from_wsgi(self, wsgienv, readbody=False):
+    def record_from_wsgi(self, wsgienv, readbody=False, max_size=None):
         """
         immediately record a the request encapsulated in the environment dictionary provided 
         by the WSGI framework.  By default, the body is not read and, therefore, is not included
         in the record; however setting readbody to True will cause the input stream containing 
-        the body to be read in its entirety.
+        the body to be read in its entirety (up to max_size bytes).
         """
-        self.from_wsgi(wsgienv, readbody).record()
+        self.from_wsgi(wsgienv, readbody, max_size).record()
 
     def record(self, request):
         """
@@ -274,8 +339,11 @@ class WebRecorder(object):
         if req.headers:
             for h in req.headers:
                 msg += "\n{0}".format(h)
-        if req.body:
-            msg += "\n-+-\n" + req.body + "\n"
+        (body, size) = req.body_excerpt(self.max_body_size)
+        if len(body) < size:
+            msg += "\n{0}: {1} of {2} bytes recorded".format(TRUNCATED_HEADER, len(body), size)
+        if body:
+            msg += "\n-+-\n" + body + "\n"
         return msg
         
     def GET(self, resource, headers=None, qs=None):
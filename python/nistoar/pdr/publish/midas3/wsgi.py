@@ -13,10 +13,12 @@ from collections import OrderedDict, Mapping
 
 from .. import PublishSystem, PDRServerError
 from .service import (MIDAS3PublishingService, SIPDirectoryNotFound, IDNotFound,
-                      ConfigurationException, StateException, InvalidRequest)
+                      ConfigurationException, StateException, InvalidRequest, DatasetBusy)
 from ...preserv.service import status as ps
 from ...preserv.service.service import RerequestException, PreservationStateError
-from .webrecord import WebRecorder
+from .webrecord import WebRecorder, DEF_MAX_RECORDED_BODY
+from .reqbody import (spool_body, body_excerpt, RequestTooLarge, DEF_MAX_BODY_SIZE,
+                      DEF_SPOOL_THRESHOLD)
 from ejsonschema import ValidationError
 from ... import config as cfgmod
 from ... import ARK_NAAN
@@ -49,6 +51,22 @@ class MIDAS3PublishingApp(object):
     GET /pod/draft/{dsid} -- retrieves an updated POD record generated from the 
        NERDm record being edited via the landing page
     DELETE /pod/draft/{dsid} -- deletes the NERDm record in the customization service.  
+
+    /metrics
+    GET /metrics -- returns timing metrics for the stages of preservation processing 
+       in the Prometheus text exposition format
+
+    Input POD bodies are spooled rather than held in memory; the following configuration 
+    properties control this:
+    :prop max_body_size int (209715200):  the largest request body, in bytes, that will be 
+                      accepted; larger ones get a 413 response.  A value <= 0 means no limit.
+    :prop body_spool_threshold int (1048576):  the size, in bytes, above which a request 
+                      body is written to a temporary file instead of held in memory
+    :prop body_spool_dir str:  the directory where large request bodies are written 
+                      (default: the system's temporary directory)
+    :prop record_max_body int (1048576):  when requests are being recorded (via the 
+                      record_to property), the largest number of bytes of a request body 
+                      that will be recorded; longer bodies are truncated in the record.
     """
 
     def __init__(self, config):
@@ -70,15 +88,22 @@ class MIDAS3PublishingApp(object):
         if wrlogf:
             if not os.path.isabs(wrlogf) and cfgmod.global_logdir:
                 wrlogf = os.path.join(cfgmod.global_logdir, wrlogf)
-            self._recorder = WebRecorder(wrlogf, "pubserver")
+            self._recorder = WebRecorder(wrlogf, "pubserver",
+                                         max_body_size=config.get('record_max_body',
+                                                                  DEF_MAX_RECORDED_BODY))
 
         self.base_path = asre(config.get('base_path', DEF_BASE_PATH))
         self.draft_res = asre(config.get('draft_path', '/draft/'))
         self.latest_res = asre(config.get('latest_path', '/latest/'))
         self.preserve_res = asre(config.get('preserve_path', '/preserve/'))
+        self.metrics_res = asre(config.get('metrics_path', '/metrics'))
 
         self._authkey = config.get('auth_key')
 
+        self._maxbody = config.get('max_body_size', DEF_MAX_BODY_SIZE)
+        self._spoolthresh = config.get('body_spool_threshold', DEF_SPOOL_THRESHOLD)
+        self._spooldir = config.get('body_spool_dir')
+
         self.pubsvc = MIDAS3PublishingService(config)
 
     def handle_request(self, env, start_resp):
@@ -98,9 +123,15 @@ class MIDAS3PublishingApp(object):
         elif self.preserve_res.match(path):
             path = self.preserve_res.sub('', path)
             handler = PreserveHandler(path, self.pubsvc, env, start_resp, self._authkey, req)
+        elif self.metrics_res.match(path):
+            path = self.metrics_res.sub('', path)
+            handler = MetricsHandler(path, self.pubsvc, env, start_resp, self._authkey, req)
 
         if not handler:
             handler = Handler(path, env, start_resp, self._authkey, req)
+        handler.max_body_size = self._maxbody
+        handler.spool_threshold = self._spoolthresh
+        handler.spool_dir = self._spooldir
         log.debug("handling %s path=%s via %s", env.get('REQUEST_METHOD', 'GET?'),
                   path, repr(handler))
         return handler.handle()
@@ -119,6 +150,9 @@ class Handler(object):
     a default web request handler that also serves as a base class for the 
     handlers specialized for the supported resource paths.
     """
+    max_body_size = DEF_MAX_BODY_SIZE
+    spool_threshold = DEF_SPOOL_THRESHOLD
+    spool_dir = None
 
     def __init__(self, path, wsgienv, start_resp, auth=None, req=None):
         self._path = path
@@ -194,6 +228,30 @@ class Handler(object):
         status = "{0} {1}".format(str(self._code), self._msg)
         self._start(status, self._hdr.items())
 
+    def get_json_body(self):
+        """
+        read and parse the JSON document in the body of the request.  The body is spooled 
+        (to disk if it is large) and the spooled copy is shared with the request record, 
+        if one is being kept.  
+        :raise RequestTooLarge:  if the body exceeds this handler's max_body_size
+        :raise ValueError:       if the body is not parseable as JSON
+        """
+        body = spool_body(self._env, self.max_body_size, self.spool_threshold, self.spool_dir)
+        if body is None:
+            raise ValueError("No JSON document provided")
+        if self._reqrec:
+            self._reqrec.set_body_file(body)
+        return json.load(body, object_pairs_hook=OrderedDict)
+
+    def send_too_large(self, ex):
+        """
+        respond to a request whose body exceeded the maximum allowed size
+        """
+        log.warn("Rejecting request: %s", str(ex))
+        if self._reqrec:
+            self._reqrec.record()
+        return self.send_error(413, "Request body too large", str(ex))
+
     _spdel = re.compile(r'\s+')
     def authorized(self):
         auth = self._spdel.split(self._env.get('HTTP_AUTHORIZATION', ""), 1)
@@ -311,30 +369,29 @@ class DraftHandler(Handler):
                 return self.send_error(400, "Bad identifier syntax")
         
         try:
-            bodyin = self._env.get('wsgi.input')
-            if bodyin is None:
+            if self._env.get('wsgi.input') is None:
                 if self._reqrec:
                     self._reqrec.record()
                 return self.send_error(400, "Missing input POD document")
-            if log.isEnabledFor(logging.DEBUG) or self._reqrec:
-                body = bodyin.read()
-                pod = json.loads(body, object_pairs_hook=OrderedDict)
-            else:
-                pod = json.load(bodyin, object_pairs_hook=OrderedDict)
+
+            pod = self.get_json_body()
             if self._reqrec:
-                self._reqrec.add_body_text(json.dumps(pod, indent=2)).record()
+                self._reqrec.record()
+
+        except RequestTooLarge as ex:
+            return self.send_too_large(ex)
 
         except (ValueError, TypeError) as ex:
             if log.isEnabledFor(logging.DEBUG):
                 log.error("Failed to parse input: %s", str(ex))
-                log.debug("\n%s", body)
+                log.debug("\n%s", body_excerpt(self._env))
             if self._reqrec:
-                self._reqrec.add_body_text(body).record()
+                self._reqrec.record()
             return self.send_error(400, "Input not parseable as JSON")
 
         except Exception as ex:
             if self._reqrec:
-                self._reqrec.add_body_text(body).record()
+                self._reqrec.record()
             raise
 
         if 'identifier' not in pod:
@@ -383,6 +440,9 @@ class DraftHandler(Handler):
 
         except IDNotFound as ex:
             return self.send_error(404, "Draft not found")
+        except DatasetBusy as ex:
+            log.warning(str(ex))
+            return self.send_error(503, "Dataset is busy; try again later")
         except PDRServerError as ex:
             log.exception("Problem accessing customization service: "+str(ex))
             return self.send_error(502, "Customization Service access failure")
@@ -414,26 +474,24 @@ class LatestHandler(Handler):
             return self.send_error(415, "Non-JSON input content type specified")
         
         try:
-            bodyin = self._env.get('wsgi.input')
-            if bodyin is None:
+            if self._env.get('wsgi.input') is None:
                 if self._reqrec:
                     self._reqrec.record()
                 return self.send_error(400, "Missing input POD document")
 
-            if log.isEnabledFor(logging.DEBUG) or self._reqrec:
-                body = bodyin.read()
-                pod = json.loads(body, object_pairs_hook=OrderedDict)
-            else:
-                pod = json.load(bodyin, object_pairs_hook=OrderedDict)
+            pod = self.get_json_body()
             if self._reqrec:
-                self._reqrec.add_body_text(json.dumps(pod, indent=2)).record()
+                self._reqrec.record()
+
+        except RequestTooLarge as ex:
+            return self.send_too_large(ex)
 
         except (ValueError, TypeError) as ex:
             if log.isEnabledFor(logging.DEBUG):
                 log.error("Failed to parse input: %s", str(ex))
-                log.debug("\n%s", body)
+                log.debug("\n%s", body_excerpt(self._env))
             if self._reqrec:
-                self._reqrec.add_body_text(body).record()
+                self._reqrec.record()
             return self.send_error(400, "Input not parseable as JSON")
 
         if not pod.get('identifier'):
@@ -452,6 +510,9 @@ class LatestHandler(Handler):
         except ValidationError as ex:
             log.error("/latest/: Input is not a valid POD record:\n  "+str(ex))
             return self.send_error(400, "Input is not a valid POD record")
+        except DatasetBusy as ex:
+            log.warning(str(ex))
+            return self.send_error(503, "Dataset is busy; try again later")
         except Exception as ex:
             log.exception("Internal error: "+str(ex))
             return self.send_error(500, "Internal error")
@@ -631,26 +692,24 @@ class PreserveHandler(Handler):
     def preserve_sip(self, sipid):
         out = {}
         try:
-            bodyin = self._env.get('wsgi.input')
-            if bodyin is None:
+            if self._env.get('wsgi.input') is None:
                 if self._reqrec:
                     self._reqrec.record()
                 return self.send_error(400, "Missing input POD document")
 
-            if log.isEnabledFor(logging.DEBUG) or self._reqrec:
-                body = bodyin.read()
-                pod = json.loads(body, object_pairs_hook=OrderedDict)
-            else:
-                pod = json.load(bodyin, object_pairs_hook=OrderedDict)
+            pod = self.get_json_body()
             if self._reqrec:
-                self._reqrec.add_body_text(json.dumps(pod, indent=2)).record()
+                self._reqrec.record()
+
+        except RequestTooLarge as ex:
+            return self.send_too_large(ex)
 
         except (ValueError, TypeError) as ex:
             if log.isEnabledFor(logging.DEBUG):
                 log.error("Failed to parse input: %s", str(ex))
-                log.debug("\n%s", body)
+                log.debug("\n%s", body_excerpt(self._env))
             if self._reqrec:
-                self._reqrec.add_body_text(body).record()
+                self._reqrec.record()
             return self.send_error(400, "Input not parseable as JSON",
                                    "Input not parseable as JSON:\n"+str(ex))
 
@@ -763,26 +822,24 @@ class PreserveHandler(Handler):
     def update_sip(self, sipid):
         out = {}
         try: 
-            bodyin = self._env.get('wsgi.input')
-            if bodyin is None:
+            if self._env.get('wsgi.input') is None:
                 if self._reqrec:
                     self._reqrec.record()
                 return self.send_error(400, "Missing input POD document")
 
-            if log.isEnabledFor(logging.DEBUG) or self._reqrec:
-                body = bodyin.read()
-                pod = json.loads(body, object_pairs_hook=OrderedDict)
-            else:
-                pod = json.load(bodyin, object_pairs_hook=OrderedDict)
+            pod = self.get_json_body()
             if self._reqrec:
-                self._reqrec.add_body_text(json.dumps(pod, indent=2)).record()
+                self._reqrec.record()
+
+        except RequestTooLarge as ex:
+            return self.send_too_large(ex)
 
         except (ValueError, TypeError) as ex:
             if log.isEnabledFor(logging.DEBUG):
                 log.error("Failed to parse input: %s", str(ex))
-                log.debug("\n%s", body)
+                log.debug("\n%s", body_excerpt(self._env))
             if self._reqrec:
-                self._reqrec.add_body_text(body).record()
+                self._reqrec.record()
             return self.send_error(400, "Input not parseable as JSON", str(ex))
 
         if sipid != pod.get('identifier'):
@@ -858,4 +915,32 @@ class PreserveHandler(Handler):
 
     
 
+class MetricsHandler(Handler):
+    """
+    The web request handler for exporting service metrics
+    """
+
+    def __init__(self, path, service, wsgienv, start_resp, auth=None, req=None):
+        super(MetricsHandler, self).__init__(path, wsgienv, start_resp, auth, req)
+        self._svc = service
+
+    def do_GET(self, path):
+        if not self.authorized():
+            return self.send_error(401, "Unauthorized")
+        if path.strip('/'):
+            return self.send_error(404, "Resource does not exist")
+
+        try:
+            out = self._svc.preservation_metrics()
+        except Exception, ex:
+            log.exception("Internal error: "+str(ex))
+            return self.send_error(500, "Internal error")
+
+        self.set_response(200, "Preservation metrics")
+        self.add_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.end_headers()
+        return [out]
 
+    def do_HEAD(self, path):
+        self.do_GET(path)
+        return []
@@ -3,12 +3,24 @@ Utility functions useful across the pdr package
 """
 from collections import OrderedDict, Mapping
 import hashlib, json, re, shutil, os, time, subprocess, logging, threading
+from stat import S_ISDIR, S_ISREG, S_ISLNK
 try:
     import fcntl
 except ImportError:
     fcntl = None
+try:
+    from os import scandir as _scandir
+except ImportError:
+    try:
+        from scandir import scandir as _scandir
+    except ImportError:
+        _scandir = None
+try:
+    import Queue as queue
+except ImportError:
+    import queue
 
-from .exceptions import (NERDError, PODError, StateException)
+from .exceptions import (NERDError, PODError, StateException, ConfigurationException)
 
 log = logging.getLogger("pdr.utils")
 BLAB = logging.DEBUG - 1
@@ -27,6 +39,79 @@ def blab(log, msg, *args, **kwargs):
     """
     log.log(BLAB, msg, *args, **kwargs)
 
+# the categories that LockedFile contention statistics are aggregated into:
+# each is a (name, regex) pair that is matched against a file's absolute path.
+# A file that matches none of these belongs to the "other" class.
+lock_classes = [
+    ("status",   re.compile(r'(^|/)preserv_status/')),
+    ("podqueue", re.compile(r'(^|/)podq/')),
+    ("metadata", re.compile(r'(^|/)_?(nerdm|annot|pod)\.json$'))
+]
+
+def lock_class_for(filepath):
+    """
+    return the name of the lock class (from lock_classes) that the given file 
+    belongs to.
+    """
+    filepath = os.path.abspath(filepath)
+    for name, pat in lock_classes:
+        if pat.search(filepath):
+            return name
+    return "other"
+
+class LockStats(object):
+    """
+    a thread-safe accumulator of the times spent waiting for and holding file
+    locks, aggregated by lock class.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = OrderedDict()
+
+    def _new_entry(self):
+        return OrderedDict([("acquired", 0), ("slow", 0),
+                            ("wait_total", 0.0), ("wait_max", 0.0),
+                            ("hold_total", 0.0), ("hold_max", 0.0)])
+
+    def record_wait(self, lockclass, secs, slow=False):
+        """
+        record the time spent waiting to acquire a lock
+        """
+        with self._lock:
+            st = self._stats.setdefault(lockclass, self._new_entry())
+            st['acquired'] += 1
+            st['wait_total'] += secs
+            st['wait_max'] = max(st['wait_max'], secs)
+            if slow:
+                st['slow'] += 1
+
+    def record_hold(self, lockclass, secs):
+        """
+        record the time a lock was held before being released
+        """
+        with self._lock:
+            st = self._stats.setdefault(lockclass, self._new_entry())
+            st['hold_total'] += secs
+            st['hold_max'] = max(st['hold_max'], secs)
+
+    def snapshot(self):
+        """
+        return a copy of the current statistics as a dictionary keyed by lock 
+        class.  Each entry gives the number of acquisitions, the number of 
+        them that were slow, and the total and maximum times (in seconds) 
+        spent waiting for and holding the lock.  
+        """
+        with self._lock:
+            return OrderedDict([(k, OrderedDict(v)) for k, v in self._stats.items()])
+
+    def reset(self):
+        """
+        discard all accumulated statistics
+        """
+        with self._lock:
+            self._stats = OrderedDict()
+
 class LockedFile(object):
     """
     An object representing a file in a locked state.  The file is locked against
@@ -58,12 +143,23 @@ class LockedFile(object):
        with lkdfile as fd:
           json.dump(data, fd)
 
+    The thread-level lock for a file is kept in a class-wide registry only while
+    some LockedFile has that file open (or is waiting to); thus, the registry 
+    does not grow with the number of distinct files that have been accessed.  
+
+    The time spent waiting for and holding each lock is accumulated into 
+    LockedFile.stats by lock class (see lock_classes).  An acquisition that 
+    takes longer than slow_wait_threshold seconds is logged as a warning.
     """
     _thread_locks = {}
     _class_lock = threading.RLock()
 
+    stats = LockStats()
+    slow_wait_threshold = 2.0
+
     class _ThreadLock(object):
         _reader_count = 0
+        refs = 0
         def __init__(self):
             self.ex_lock = threading.Lock()
             self.sh_lock = threading.Lock()
@@ -86,18 +182,52 @@ class LockedFile(object):
             
     @classmethod
     def _get_thread_lock_for(cls, filepath):
+        # return the registered lock for the file, adding a reference to it
         filepath = os.path.abspath(filepath)
         with cls._class_lock:
             if filepath not in cls._thread_locks:
                 cls._thread_locks[filepath] = cls._ThreadLock()
-            return cls._thread_locks[filepath]
+            out = cls._thread_locks[filepath]
+            out.refs += 1
+            return out
+
+    @classmethod
+    def _drop_thread_lock_for(cls, filepath):
+        # remove a reference to the file's lock, unregistering it when unused
+        filepath = os.path.abspath(filepath)
+        with cls._class_lock:
+            tl = cls._thread_locks.get(filepath)
+            if tl:
+                tl.refs -= 1
+                if tl.refs <= 0:
+                    del cls._thread_locks[filepath]
+
+    @classmethod
+    def registered_lock_count(cls):
+        """
+        return the number of files for which thread-level locks are currently
+        registered--i.e. the number that are open or are waiting to be opened.
+        """
+        with cls._class_lock:
+            return len(cls._thread_locks)
 
-    def __init__(self, filename, mode='r'):
+    def __init__(self, filename, mode='r', lock_class=None):
+        """
+        :param str filename:    the path to the file to lock and open
+        :param str mode:        the mode to open the file with
+        :param str lock_class:  the name of the class to aggregate this file's 
+                                lock statistics into; if not provided, it is 
+                                determined from the filename via lock_class_for().
+        """
         self.mode = mode
         self._fo = None
-        self._fname = filename
-        self._thread_lock = self._get_thread_lock_for(filename)
+        self._fname = os.path.abspath(filename)
+        if not lock_class:
+            lock_class = lock_class_for(self._fname)
+        self.lock_class = lock_class
+        self._thread_lock = None
         self._writing = None
+        self._locked_at = None
 
     @property
     def fo(self):
@@ -107,15 +237,26 @@ class LockedFile(object):
         return self._fo
 
     def _acquire_thread_lock(self):
-        if self._writing:
-            self._thread_lock.acquire_exclusive()
-        else:
-            self._thread_lock.acquire_shared()
+        self._thread_lock = self._get_thread_lock_for(self._fname)
+        try:
+            if self._writing:
+                self._thread_lock.acquire_exclusive()
+            else:
+                self._thread_lock.acquire_shared()
+        except:
+            self._drop_thread_lock()
+            raise
     def _release_thread_lock(self):
-        if self._writing:
-            self._thread_lock.release_exclusive()
-        else:
-            self._thread_lock.release_shared()
+        try:
+            if self._writing:
+                self._thread_lock.release_exclusive()
+            else:
+                self._thread_lock.release_shared()
+        finally:
+            self._drop_thread_lock()
+    def _drop_thread_lock(self):
+        self._thread_lock = None
+        self._drop_thread_lock_for(self._fname)
 
     def open(self, mode=None):
         """
@@ -129,9 +270,13 @@ class LockedFile(object):
             self.mode = mode
             
         self._writing = 'a' in self.mode or 'w' in self.mode or '+' in self.mode
+        start = time.time()
         self._acquire_thread_lock()
         try:
             self._fo = open(self._fname, self.mode)
+            if fcntl:
+                lock_type = (self._writing and fcntl.LOCK_EX) or fcntl.LOCK_SH
+                fcntl.lockf(self.fo, lock_type)
         except:
             self._release_thread_lock()
             if self._fo:
@@ -143,11 +288,18 @@ class LockedFile(object):
             self._writing = None
             raise
 
-        if fcntl:
-            lock_type = (self._writing and fcntl.LOCK_EX) or fcntl.LOCK_SH
-            fcntl.lockf(self.fo, lock_type)
+        self._locked_at = time.time()
+        self._record_wait(self._locked_at - start)
         return self.fo
 
+    def _record_wait(self, secs):
+        slow = secs > self.slow_wait_threshold
+        self.stats.record_wait(self.lock_class, secs, slow)
+        if slow:
+            log.warning("Slow %s lock acquisition (%.2f s) for %s file: %s",
+                        (self._writing and "exclusive") or "shared", secs,
+                        self.lock_class, self._fname)
+
     def close(self):
         if not self._fo:
             return
@@ -157,6 +309,9 @@ class LockedFile(object):
             self._fo = None
             self._release_thread_lock()
             self._writing = None
+            if self._locked_at is not None:
+                self.stats.record_hold(self.lock_class, time.time() - self._locked_at)
+                self._locked_at = None
 
     def __enter__(self):
         return self.open()
@@ -199,6 +354,142 @@ def read_pod(podfile):
         raise PODError("Unable to read POD file, " + podfile + ": "+str(ex),
                        cause=ex, src=podfile)
 
+class JSONCodec(object):
+    """
+    an encoder/decoder for the JSON files read and written by the PDR.  
+    Regardless of the backend library used, JSON objects are always decoded into
+    OrderedDicts so that the order of properties is preserved across a 
+    read-write cycle.  
+
+    This implementation uses the json module from the standard library; 
+    subclasses wrap faster libraries with a compatible interface.  
+    """
+    name = "json"
+
+    def __init__(self, module=None):
+        if module is None:
+            module = json
+        self._mod = module
+
+    def loads(self, text):
+        """
+        parse the given JSON-encoded string
+
+        :raise ValueError:  if JSON format errors are detected.
+        """
+        return self._mod.loads(text, object_pairs_hook=OrderedDict)
+
+    def load(self, fd):
+        """
+        parse the JSON data read from the given file object
+        """
+        return self.loads(fd.read())
+
+    def _dump_opts(self, indent, compact):
+        if compact:
+            return { "separators": (',', ':') }
+        return { "indent": indent, "separators": (',', ': ') }
+
+    def dumps(self, data, indent=4, compact=False):
+        """
+        encode the given data as a JSON string
+
+        :param int  indent:   the number of characters to use for indentation 
+                              (default: 4)
+        :param bool compact:  if True, write the data without any whitespace 
+                              (ignoring indent); this is intended for internal
+                              working files that are not meant to be read by people.
+        """
+        return self._mod.dumps(data, **self._dump_opts(indent, compact))
+
+    def dump(self, data, fd, indent=4, compact=False):
+        """
+        write the given data in JSON format to the given file object.  The 
+        data is fully encoded before any of it is written.
+        """
+        fd.write(self.dumps(data, indent, compact))
+
+class SimpleJSONCodec(JSONCodec):
+    """
+    a JSONCodec that uses the simplejson library and its C-accelerated encoder
+    and decoder.
+    """
+    name = "simplejson"
+
+    def __init__(self):
+        import simplejson
+        super(SimpleJSONCodec, self).__init__(simplejson)
+
+    def loads(self, text):
+        # simplejson returns str values for ASCII-only strings in a str 
+        # document; decoding first ensures all strings are unicode as with json
+        if isinstance(text, str):
+            text = text.decode('utf-8')
+        return super(SimpleJSONCodec, self).loads(text)
+
+    def _dump_opts(self, indent, compact):
+        out = super(SimpleJSONCodec, self)._dump_opts(indent, compact)
+        out['namedtuple_as_object'] = False   # encode as arrays, like json
+        return out
+
+json_codecs = OrderedDict([
+    ("simplejson", SimpleJSONCodec),
+    ("json",       JSONCodec)
+])
+_json_codec = None
+
+def get_json_codec(name=None):
+    """
+    return a JSONCodec that uses the named backend library.  
+
+    :param str name:  the name of the backend, one of "json" (the standard 
+                      library) or "simplejson".  If None or "auto", the 
+                      codec currently in use by read_json() and write_json()
+                      is returned.  
+    :raise ConfigurationException:  if the name is not recognized or the 
+                      backend library is not installed.
+    """
+    if not name or name == "auto":
+        if not _json_codec:
+            return _select_json_codec()
+        return _json_codec
+
+    if name not in json_codecs:
+        raise ConfigurationException("Unrecognized JSON codec name: "+name)
+    try:
+        return json_codecs[name]()
+    except ImportError as ex:
+        raise ConfigurationException("JSON codec not available: "+name+": "+str(ex),
+                                     cause=ex)
+
+def _select_json_codec():
+    # pick the first available codec in order of preference
+    global _json_codec
+    for name in json_codecs:
+        try:
+            _json_codec = json_codecs[name]()
+            break
+        except ImportError:
+            pass
+    return _json_codec
+
+def set_json_codec(name=None):
+    """
+    set the JSONCodec used by read_json() and write_json() (and the other 
+    readers and writers of JSON files across the PDR).  
+
+    :param str name:  the name of the backend (see get_json_codec()); if None
+                      or "auto", the fastest one installed will be used.
+    :return JSONCodec:  the codec that was set
+    :raise ConfigurationException:  if the name is not recognized or the 
+                      backend library is not installed.
+    """
+    global _json_codec
+    if not name or name == "auto":
+        return _select_json_codec()
+    _json_codec = get_json_codec(name)
+    return _json_codec
+
 def read_json(jsonfile, nolock=False):
     """
     read the JSON data from the specified file
@@ -213,11 +504,11 @@ def read_json(jsonfile, nolock=False):
     """
     with LockedFile(jsonfile) as fd:
         blab(log, "Acquired shared lock for reading: "+jsonfile)
-        out = json.load(fd, object_pairs_hook=OrderedDict)
+        out = get_json_codec().load(fd)
     blab(log, "released SH")
     return out
 
-def write_json(jsdata, destfile, indent=4, nolock=False):
+def write_json(jsdata, destfile, indent=4, nolock=False, compact=False):
     """
     write out the given JSON data into a file with pretty print formatting
 
@@ -228,12 +519,16 @@ def write_json(jsdata, destfile, indent=4, nolock=False):
     :param bool  nolock:   if False (default), an exclusive lock will be acquired
                            before writing to the file.  A True value writes the 
                            data without a lock
+    :param bool compact:   if True, write the data without any whitespace, 
+                           ignoring indent; use this for internal working files.
     """
     try:
+        # encode before locking so that the lock is held only for the write
+        text = get_json_codec().dumps(jsdata, indent, compact)
         with LockedFile(destfile, 'a') as fd:
             blab(log, "Acquired exclusive lock for writing: "+destfile)
             fd.truncate(0)
-            json.dump(jsdata, fd, indent=indent, separators=(',', ': '))
+            fd.write(text)
         blab(log, "released EX")
     except Exception, ex:
         raise StateException("{0}: Failed to write JSON data to file: {1}"
@@ -322,7 +617,171 @@ def checksum_of(filepath):
             sum.update(buf)
     return sum.hexdigest()
 
-def measure_dir_size(dirpath):
+class StatEntry(object):
+    """
+    a stand-in for the entries returned by scandir() (os.DirEntry) for when a 
+    scandir implementation is not available.  Like os.DirEntry, the results 
+    of stat calls are cached so that the file system is consulted at most 
+    once per entry.
+    """
+    def __init__(self, dirpath, name):
+        self.name = name
+        self.path = os.path.join(dirpath, name)
+        self._lstat = None
+        self._stat = None
+
+    def stat(self, follow_symlinks=True):
+        if self._lstat is None:
+            self._lstat = os.lstat(self.path)
+        if not follow_symlinks or not S_ISLNK(self._lstat.st_mode):
+            return self._lstat
+        if self._stat is None:
+            self._stat = os.stat(self.path)
+        return self._stat
+
+    def is_symlink(self):
+        return S_ISLNK(self.stat(False).st_mode)
+
+    def is_dir(self, follow_symlinks=True):
+        try:
+            return S_ISDIR(self.stat(follow_symlinks).st_mode)
+        except OSError:
+            return False
+
+    def is_file(self, follow_symlinks=True):
+        try:
+            return S_ISREG(self.stat(follow_symlinks).st_mode)
+        except OSError:
+            return False
+
+def scan_dir(dirpath):
+    """
+    return a list of the entries in the given directory.  Each entry has the 
+    interface of os.DirEntry (name and path attributes; stat(), is_dir(), 
+    is_file(), and is_symlink() methods) and caches its stat results.
+    """
+    if _scandir:
+        return list(_scandir(dirpath))
+    return [StatEntry(dirpath, f) for f in os.listdir(dirpath)]
+
+def _scan_one(dirpath, reldir, files, dirs, skip_dot, skip_private):
+    # list one directory, returning the (relpath, entry) pairs to yield and
+    # the (relpath, path) pairs of the subdirectories to descend into
+    out = []
+    subdirs = []
+    for ent in scan_dir(dirpath):
+        if (skip_dot and ent.name.startswith('.')) or \
+           (skip_private and ent.name.startswith('_')):
+            continue
+        relpath = os.path.join(reldir, ent.name)
+        if ent.is_dir():
+            if dirs:
+                out.append((relpath, ent))
+            if not ent.is_symlink():
+                subdirs.append((relpath, ent.path))
+        elif files:
+            out.append((relpath, ent))
+    return out, subdirs
+
+def scan_tree(rootdir, files=True, dirs=False, skip_dot=False, skip_private=False,
+              max_workers=1, onerror=None):
+    """
+    iterate through the entries below a directory, yielding for each a pair 
+    containing its path relative to rootdir and its directory entry (see 
+    scan_dir()).  Because the entry caches the results of the directory 
+    listing and any stat call, this requires fewer file system round trips 
+    than os.walk() followed by calls to os.stat() or os.path.isdir().
+
+    Like os.walk(), symbolic links to directories are reported as directories 
+    but are not descended into, and errors listing a directory are ignored 
+    unless an onerror function is given.  
+
+    :param str rootdir:     the directory to scan
+    :param bool files:      if True, yield entries for files (and other 
+                            non-directories)
+    :param bool dirs:       if True, yield entries for directories
+    :param bool skip_dot:   if True, skip over (and do not descend into) 
+                            entries whose names start with "."
+    :param bool skip_private:  if True, skip over (and do not descend into) 
+                            entries whose names start with "_"
+    :param int max_workers: the number of threads to list directories with; 
+                            if greater than 1, subtrees are scanned in 
+                            parallel, and the order of the entries is not 
+                            deterministic.  
+    :param function onerror:  a function to call with the OSError raised when 
+                            a directory cannot be listed
+    """
+    if max_workers > 1:
+        for out in _scan_tree_parallel(rootdir, files, dirs, skip_dot, skip_private,
+                                       max_workers, onerror):
+            yield out
+        return
+
+    todo = [("", rootdir)]
+    while todo:
+        reldir, dirpath = todo.pop()
+        try:
+            out, subdirs = _scan_one(dirpath, reldir, files, dirs, skip_dot, skip_private)
+        except OSError as ex:
+            if onerror:
+                onerror(ex)
+            continue
+        for ent in out:
+            yield ent
+        todo.extend(reversed(subdirs))
+
+def _scan_tree_parallel(rootdir, files, dirs, skip_dot, skip_private, max_workers,
+                        onerror):
+    work = queue.Queue()
+    results = queue.Queue()
+    pending = [1]
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def worker():
+        while True:
+            item = work.get()
+            if item is None:
+                return
+            out, subdirs, err = [], [], None
+            if not stop.is_set():
+                try:
+                    out, subdirs = _scan_one(item[1], item[0], files, dirs,
+                                             skip_dot, skip_private)
+                except OSError as ex:
+                    err = ex
+            with lock:
+                pending[0] += len(subdirs)
+            for sd in subdirs:
+                work.put(sd)
+            results.put((out, err))
+            with lock:
+                pending[0] -= 1
+                done = pending[0] == 0
+            if done:
+                results.put(None)
+
+    threads = [threading.Thread(target=worker) for i in range(max_workers)]
+    for t in threads:
+        t.daemon = True
+        t.start()
+    work.put(("", rootdir))
+
+    try:
+        while True:
+            res = results.get()
+            if res is None:
+                break
+            if res[1] and onerror:
+                onerror(res[1])
+            for ent in res[0]:
+                yield ent
+    finally:
+        stop.set()
+        for t in threads:
+            work.put(None)
+
+def measure_dir_size(dirpath, max_workers=1):
     """
     return a pair of numbers representing, in order, the totaled size (in bytes)
     of all files below the directory and the total number of files.  
@@ -332,14 +791,14 @@ def measure_dir_size(dirpath):
     up on disk.
 
     :param str dirpath:  the path to the directory of interest
+    :param int max_workers:  the number of threads to scan the directory with
     :rtype:  list containing 2 ints
     """
     size = 0
     count = 0
-    for root, subdirs, files in os.walk(dirpath):
-        count += len(files)
-        for f in files:
-            size += os.stat(os.path.join(root,f)).st_size
+    for path, ent in scan_tree(dirpath, max_workers=max_workers):
+        count += 1
+        size += ent.stat().st_size
     return [size, count]
 
 def rmtree_sys(rootdir):
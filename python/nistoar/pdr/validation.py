@@ -0,0 +1,174 @@
+"""
+Shared, cached support for validating JSON metadata (NERDm and POD) against
+the schemas installed with the PDR.
+
+Loading a directory of schemas into an ejsonschema ``ExtValidator`` is
+expensive relative to the validation itself, and much of the PDR (the MIDAS
+bagger, the publishing services, the ``pdr`` CLI) used to do so for every
+record it validated.  This module keeps a process-wide cache of loaded
+validators, keyed by the schema directory and the meta-property prefix
+("_" or "$") the validator recognizes.  Each cached validator is tagged with the
+modification times of the schema files it was loaded from; if any of those
+files change (or files are added or removed), the validator is reloaded on its
+next use.
+
+The :py:func:`validate_nerdm_parts` function validates a NERDm resource record
+and each of its components in a single call using one cached validator.
+"""
+import os, threading
+from collections import OrderedDict, Mapping
+
+import ejsonschema as ejs
+
+from . import def_schema_dir
+from .exceptions import ConfigurationException
+
+DEF_BASE_NERDM_SCHEMA = "https://data.nist.gov/od/dm/nerdm-schema/v0.1#"
+DEF_NERDM_RESOURCE_SCHEMA = DEF_BASE_NERDM_SCHEMA + "/definitions/Resource"
+DEF_BASE_POD_SCHEMA = "https://data.nist.gov/od/dm/pod-schema/v1.1#"
+DEF_POD_DATASET_SCHEMA = DEF_BASE_POD_SCHEMA + "/definitions/Dataset"
+
+def schema_flavor(data):
+    """
+    return the prefix ("_" or "$") used in the given JSON document to identify
+    meta-properties used for validation (e.g. "_schema", "$extensionSchemas"),
+    or "_" if the document includes none.
+    """
+    if not isinstance(data, Mapping):
+        return "_"
+    for prop in "schema extensionSchemas".split():
+        mpfxs = [k[0] for k in data.keys() if k[1:] == prop and k[0] in "_$"]
+        if len(mpfxs) > 0:
+            return mpfxs[0]
+    return "_"
+
+class ValidatorCache(object):
+    """
+    a cache of ExtValidator instances, each loaded with the schemas from a
+    directory.  A cached validator is reused until the contents of its schema
+    directory change.  This class is thread-safe.
+    """
+
+    def __init__(self):
+        self._validators = {}
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.loads = 0
+
+    def _signature(self, schemadir):
+        # the names and modification times of the schema files in the directory
+        out = []
+        for f in os.listdir(schemadir):
+            if f.endswith(".json"):
+                out.append((f, os.stat(os.path.join(schemadir, f)).st_mtime))
+        return tuple(sorted(out))
+
+    def get(self, schemadir, forschema="_"):
+        """
+        return a validator loaded with the schemas in the given directory
+
+        :param str schemadir:  the directory containing the schemas to load
+        :param forschema:      either the meta-property prefix that the validator
+                               should recognize ("_" or "$") or a sample document
+                               from which the prefix can be determined.
+        :raise ConfigurationException:  if schemadir does not exist as a directory
+        """
+        if not schemadir or not os.path.isdir(schemadir):
+            raise ConfigurationException("Schema directory does not exist as a directory: " +
+                                         str(schemadir))
+        prefix = forschema
+        if not isinstance(prefix, (str, unicode)):
+            prefix = schema_flavor(forschema)
+
+        key = (os.path.abspath(schemadir), prefix)
+        sig = self._signature(key[0])
+        with self._lock:
+            ent = self._validators.get(key)
+            if ent and ent[0] == sig:
+                self.hits += 1
+                return ent[1]
+
+            vld8r = ejs.ExtValidator.with_schema_dir(key[0], ejsprefix=prefix)
+            self._validators[key] = (sig, vld8r)
+            self.loads += 1
+            return vld8r
+
+    def clear(self):
+        """
+        discard all cached validators
+        """
+        with self._lock:
+            self._validators = {}
+
+    def __len__(self):
+        return len(self._validators)
+
+# the process-wide cache
+validators = ValidatorCache()
+
+def get_validator(schemadir=None, forschema="_"):
+    """
+    return a (cached) validator loaded with the schemas in the given directory.
+    The returned validator may be shared with other callers.
+
+    :param str schemadir:  the directory containing the schemas to load; if None,
+                           the default PDR schema directory is used.
+    :param forschema:      either the meta-property prefix that the validator
+                           should recognize ("_" or "$") or a sample document
+                           from which the prefix can be determined.
+    """
+    if not schemadir:
+        schemadir = def_schema_dir
+    return validators.get(schemadir, forschema)
+
+def validate(data, schemadir=None, schemauri=None, strict=True):
+    """
+    validate the given JSON document and return the list of errors found.
+
+    :param dict data:      the document to validate
+    :param str schemadir:  the directory containing the schemas to validate
+                           against; if None, the default PDR schema directory is
+                           used.
+    :param str schemauri:  the URI of the schema to validate against; if None,
+                           the schema given in the document is used.
+    :param bool strict:    if True, the document must validate against all of
+                           its extension schemas.
+    :rtype: list of ValidationError instances
+    """
+    return get_validator(schemadir, data).validate(data, schemauri=schemauri, strict=strict,
+                                                   raiseex=False)
+
+def validate_nerdm_parts(nerdm, schemadir=None, strict=True):
+    """
+    validate a NERDm resource record and each of its components separately,
+    returning the errors found in each part.  The resource-level metadata is
+    validated without its components.  A component that does not specify its own
+    schema is validated against the Component definition of the record's schema.
+
+    :param dict nerdm:     the NERDm resource record to validate
+    :param str schemadir:  the directory containing the schemas to validate
+                           against; if None, the default PDR schema directory is
+                           used.
+    :param bool strict:    if True, each part must validate against all of its
+                           extension schemas.
+    :return:  a mapping of each part to the list of errors found in it.  The
+              resource-level metadata has the key "", and each component is keyed
+              by its filepath or, if it doesn't have one, its @id (or, lacking that,
+              its position in the list of components as "#N").
+    :rtype: OrderedDict
+    """
+    flav = schema_flavor(nerdm)
+    vld8r = get_validator(schemadir, flav)
+
+    resmd = OrderedDict([(k, v) for k, v in nerdm.items() if k != 'components'])
+    out = OrderedDict()
+    out[""] = vld8r.validate(resmd, strict=strict, raiseex=False)
+
+    resschema = nerdm.get(flav+"schema") or DEF_BASE_NERDM_SCHEMA
+    compschema = resschema.split('#', 1)[0] + "#/definitions/Component"
+    for i, comp in enumerate(nerdm.get('components', [])):
+        key = comp.get('filepath') or comp.get('@id') or "#%d" % i
+        out[key] = vld8r.validate(comp, schemauri=comp.get(flav+"schema") or compschema,
+                                  strict=strict, raiseex=False)
+
+    return out
@@ -143,10 +143,19 @@ class SimRMMHandler(object):
             print(str(ex))
             return self.send_error(500, "Internal error")
 
+        body = json.dumps(data, indent=2) + "\n"
+        etag = '"{0}"'.format(hashlib.sha1(body).hexdigest())
+        if self._env.get('HTTP_IF_NONE_MATCH') == etag:
+            self.set_response(304, "Not Modified")
+            self.add_header('ETag', etag)
+            self.end_headers()
+            return []
+
         self.set_response(200, "Identifier exists")
         self.add_header('Content-Type', 'application/json')
+        self.add_header('ETag', etag)
         self.end_headers()
-        return [ json.dumps(data, indent=2) + "\n" ]
+        return [ body ]
             
             
 archdir = uwsgi.opt.get("archive_dir", def_archdir)
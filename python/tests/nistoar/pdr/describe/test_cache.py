@@ -0,0 +1,132 @@
+import os, sys, pdb, time, threading
+import unittest as test
+from collections import OrderedDict
+
+from nistoar.testing import *
+from nistoar.pdr.describe import cache
+from nistoar.pdr.describe.rmm import RMMServerError
+from nistoar.pdr.exceptions import IDNotFound
+
+def setUpModule():
+    ensure_tmpdir()
+
+def tearDownModule():
+    rmtmpdir()
+
+class StubClient(object):
+    # stands in for rmm.MetadataClient
+    baseurl = "http://dummy/rmm/"
+
+    def __init__(self):
+        self.recs = {}
+        self.calls = []
+        self.down = False
+        self._lock = threading.Lock()
+
+    def publish(self, id, version):
+        self.recs[id] = OrderedDict([("ediid", id), ("version", version)])
+
+    def revalidate(self, id, etag=None, last_modified=None):
+        with self._lock:
+            self.calls.append((id, etag))
+        if self.down:
+            raise RMMServerError(id, message="service unavailable")
+        if id not in self.recs:
+            raise IDNotFound(id)
+        rec = self.recs[id]
+        tag = '"%s"' % rec['version']
+        if etag == tag:
+            return (None, tag, None)
+        return (OrderedDict(rec), tag, None)
+
+class TestCachingMetadataClient(test.TestCase):
+
+    def setUp(self):
+        self.tf = Tempfiles()
+        self.cachedir = os.path.join(self.tf.root, "rmmcache")
+        self.tf.track("rmmcache")
+        self.cli = StubClient()
+        self.cli.publish("ABCDEFG", "1.0")
+        self.cache = cache.CachingMetadataClient(self.cli, self.cachedir, 60, 3)
+
+    def tearDown(self):
+        self.tf.clean()
+
+    def test_describe(self):
+        self.assertEqual(self.cache.baseurl, self.cli.baseurl)
+        rec = self.cache.describe("ABCDEFG")
+        self.assertEqual(rec['version'], "1.0")
+        self.assertTrue(os.path.exists(os.path.join(self.cachedir, "ABCDEFG.json")))
+
+        rec['version'] = "goob"
+        self.assertEqual(self.cache.describe("ABCDEFG")['version'], "1.0")
+        self.assertEqual(len(self.cli.calls), 1)
+
+        with self.assertRaises(IDNotFound):
+            self.cache.describe("goober")
+
+    def test_revalidate(self):
+        self.cache.describe("ABCDEFG")
+        self.cache.ttl = 0
+        time.sleep(0.01)
+
+        # unchanged: revalidated with the previous ETag
+        self.assertEqual(self.cache.describe("ABCDEFG")['version'], "1.0")
+        self.assertEqual(self.cli.calls[-1], ("ABCDEFG", '"1.0"'))
+
+        # republished
+        self.cli.publish("ABCDEFG", "1.1")
+        self.assertEqual(self.cache.describe("ABCDEFG")['version'], "1.1")
+
+        # service down: the stale copy is used
+        self.cli.down = True
+        self.assertEqual(self.cache.describe("ABCDEFG")['version'], "1.1")
+        self.cache.serve_stale = False
+        with self.assertRaises(RMMServerError):
+            self.cache.describe("ABCDEFG")
+
+        # record withdrawn
+        self.cli.down = False
+        del self.cli.recs["ABCDEFG"]
+        with self.assertRaises(IDNotFound):
+            self.cache.describe("ABCDEFG")
+        self.assertFalse(os.path.exists(os.path.join(self.cachedir, "ABCDEFG.json")))
+
+    def test_unsafe_id(self):
+        self.cli.publish("ark:/88434/pdr02d4t", "1.0")
+        self.assertEqual(self.cache.describe("ark:/88434/pdr02d4t")['version'], "1.0")
+        self.assertEqual(len(os.listdir(self.cachedir)), 1)
+        self.assertNotIn("/", os.listdir(self.cachedir)[0])
+
+    def test_evict(self):
+        for i in range(5):
+            self.cli.publish("rec%d" % i, "1.0")
+        for i in range(3):
+            self.cache.describe("rec%d" % i)
+            time.sleep(0.01)
+        self.cache.describe("rec0")    # now most recently used
+        time.sleep(0.01)
+        self.cache.describe("rec3")
+        self.assertEqual(sorted(os.listdir(self.cachedir)),
+                         ["rec0.json", "rec2.json", "rec3.json"])
+
+        self.cache.purge()
+        self.assertEqual(os.listdir(self.cachedir), [])
+
+    def test_describe_many(self):
+        for i in range(6):
+            self.cli.publish("rec%d" % i, "1.0")
+        self.cache.max_entries = 0
+        self.cache.describe("rec1")
+
+        recs = self.cache.describe_many(["rec%d" % i for i in range(6)] + ["goober", "rec1"])
+        self.assertEqual(list(recs.keys()), ["rec%d" % i for i in range(6)])
+        self.assertEqual(recs["rec4"]["ediid"], "rec4")
+        self.assertEqual(len(self.cli.calls), 7)
+
+        self.cli.down = True
+        with self.assertRaises(RMMServerError):
+            self.cache.describe_many(["rec1", "rec7"])
+
+if __name__ == '__main__':
+    test.main()
@@ -83,6 +83,23 @@ class TestMetadataClient(test.TestCase):
         data = self.cli.describe("ABCDEFG")
         self.assertEqual(data['@id'], 'ark:/88434/pdr02d4t')
 
+    def test_revalidate(self):
+        data, etag, lastmod = self.cli.revalidate("ABCDEFG")
+        self.assertEqual(data['@id'], 'ark:/88434/pdr02d4t')
+        self.assertTrue(etag)
+
+        data, etag2, lastmod = self.cli.revalidate("ABCDEFG", etag)
+        self.assertIsNone(data)
+        self.assertEqual(etag2, etag)
+
+        data, etag2, lastmod = self.cli.revalidate("ABCDEFG", '"goober"')
+        self.assertEqual(data['@id'], 'ark:/88434/pdr02d4t')
+
+    def test_describe_many(self):
+        data = self.cli.describe_many(["ABCDEFG", "goober", "ark:/88434/pdr02d4t"])
+        self.assertEqual(list(data.keys()), ["ABCDEFG", "ark:/88434/pdr02d4t"])
+        self.assertEqual(data["ABCDEFG"]['ediid'], 'ABCDEFG')
+
         
 
         
@@ -0,0 +1,52 @@
+import os, sys, pdb, time
+import unittest as test
+
+from nistoar.testing import *
+from nistoar.pdr.health import fixity
+from nistoar.pdr.health.servicechecker import CheckResult
+
+class TestFixityFunctions(test.TestCase):
+
+    def metrics(self):
+        return {
+            "total": 10, "verified": 10, "coverage": 1.0, "never_verified": 0,
+            "failed": 0, "unverifiable": 0, "period_days": 90, "failures": [],
+            "updated": time.time() - 3600
+        }
+
+    def test_fixity_problems(self):
+        md = self.metrics()
+        self.assertEqual(fixity.fixity_problems(md), [])
+
+        md['coverage'] = 0.5
+        self.assertEqual(fixity.fixity_problems(md),
+                         ["only 50.0% of bags verified in the last 90 days"])
+        self.assertEqual(fixity.fixity_problems(md, 0.4), [])
+
+        md['failed'] = 1
+        md['failures'] = ["pdr2210.1_0_0.mbag0_4-0.zip"]
+        md['updated'] = 0
+        probs = fixity.fixity_problems(md, 0.4)
+        self.assertEqual(len(probs), 2)
+        self.assertIn("pdr2210.1_0_0.mbag0_4-0.zip", probs[0])
+        self.assertIn("48 hours", probs[1])
+
+    def test_check_fixity_coverage(self):
+        cr = CheckResult("https://v", "GET", data=self.metrics())
+        fixity.check_fixity_coverage(cr, None)
+        self.assertIs(cr.ok, True)
+        self.assertIsNone(cr.message)
+
+        md = self.metrics()
+        md['coverage'] = 0.5
+        cr = CheckResult("https://v", "GET", data=md)
+        fixity.check_fixity_coverage(cr, None, mincoverage=0.9)
+        self.assertIs(cr.ok, False)
+        self.assertEqual(cr.message, "only 50.0% of bags verified in the last 90 days")
+
+        cr = CheckResult("https://v", "GET", data=[])
+        fixity.check_fixity_coverage(cr, None)
+        self.assertIs(cr.ok, False)
+
+if __name__ == '__main__':
+    test.main()
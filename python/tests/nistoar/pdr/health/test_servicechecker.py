@@ -0,0 +1,118 @@
+import os, sys, pdb, shutil, logging, json, time, socket
+import unittest as test
+
+from nistoar.testing import *
+from nistoar.pdr.health import servicechecker as chk
+
+tmpd = None
+
+def setUpModule():
+    global tmpd
+    ensure_tmpdir()
+    tmpd = tmpdir()
+
+def tearDownModule():
+    rmtmpdir()
+
+class FakeNotifier(object):
+    def __init__(self):
+        self.alerts = []
+    def alert(self, target, summary, desc, origin, formatted=False, platform=None):
+        self.alerts.append((target, summary))
+
+class TestCheckServices(test.TestCase):
+
+    def setUp(self):
+        # a server that accepts connections but never responds
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen(5)
+        self.hangurl = "http://127.0.0.1:%d/" % self.sock.getsockname()[1]
+
+        # a URL that refuses connections
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.bind(("127.0.0.1", 0))
+        self.deadurl = "http://127.0.0.1:%d/" % s.getsockname()[1]
+        s.close()
+
+        self.tf = Tempfiles()
+
+    def tearDown(self):
+        self.sock.close()
+        self.tf.clean()
+
+    def test_check_service_timeout(self):
+        res = chk.check_service(self.hangurl, timeout=0.5)
+        self.assertIs(res.ok, False)
+        self.assertEqual(res.status, chk.TIMED_OUT)
+
+        res = chk.check_service(self.deadurl, timeout=0.5)
+        self.assertIs(res.ok, False)
+        self.assertEqual(res.status, chk.CONNECTION_FAILED)
+
+    def test_check_services(self):
+        svcs = [ {"url": self.hangurl}, {"url": self.deadurl}, {"url": self.hangurl} ]
+        start = time.time()
+        res = chk.check_services(svcs, 1.0)
+        self.assertLess(time.time() - start, 2.5)
+        self.assertEqual(len(res), 3)
+        self.assertEqual([r.status for r in res],
+                         [chk.TIMED_OUT, chk.CONNECTION_FAILED, chk.TIMED_OUT])
+        self.assertEqual([r.url for r in res], [s['url'] for s in svcs])
+        self.assertTrue(not any([r.ok for r in res]))
+
+        with self.assertRaises(ValueError):
+            chk.check_services([{"url": None}])
+
+    def test_result_cache(self):
+        cache = chk.CheckResultCache(os.path.join(self.tf.mkdir("health"), "healthcache.json"))
+        self.assertIsNone(cache.get("dist"))
+        self.assertEqual(cache.names(), [])
+
+        res = [ chk.CheckResult("https://d/", "GET", "down", chk.TIMED_OUT, False) ]
+        self.assertIsNone(cache.record("dist", res))
+        out = cache.get("dist")
+        self.assertIs(out['ok'], False)
+        self.assertEqual(out['results'][0]['status'], chk.TIMED_OUT)
+        since = out['since']
+        self.assertEqual(cache.names(), ["dist"])
+
+        self.assertIsNone(cache.get("dist", -1))
+        res = cache.results_for("dist", 60)
+        self.assertEqual(res[0].url, "https://d/")
+        self.assertEqual(res[0].status, chk.TIMED_OUT)
+        self.assertIs(res[0].ok, False)
+
+        time.sleep(0.01)
+        prev = cache.record("dist", res)
+        self.assertIs(prev['ok'], False)
+        self.assertEqual(cache.get("dist")['since'], since)
+
+        res[0].ok = True
+        cache.record("dist", res)
+        self.assertGreater(cache.get("dist")['since'], since)
+
+    def test_notify_on_change(self):
+        cache = chk.CheckResultCache(os.path.join(self.tf.mkdir("health"), "healthcache.json"))
+        notifier = FakeNotifier()
+        svcs = [ {"url": self.deadurl} ]
+
+        self.assertTrue(chk.check_and_notify(svcs, notifier, "fail", None, name="dead",
+                                             cache=cache, changes_only=True, timeout=1))
+        self.assertEqual(len(notifier.alerts), 1)
+        self.assertEqual(notifier.alerts[0][0], "fail")
+
+        # unchanged status:  no new notification
+        self.assertFalse(chk.check_and_notify(svcs, notifier, "fail", None, name="dead",
+                                              cache=cache, changes_only=True, timeout=1))
+        self.assertEqual(len(notifier.alerts), 1)
+
+        # without changes_only, notifications are always sent
+        self.assertTrue(chk.check_and_notify(svcs, notifier, "fail", None, name="dead",
+                                             cache=cache, timeout=1))
+        self.assertEqual(len(notifier.alerts), 2)
+        self.assertIs(cache.get("dead")['ok'], False)
+
+
+if __name__ == '__main__':
+    test.main()
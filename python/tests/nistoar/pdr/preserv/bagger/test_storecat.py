@@ -0,0 +1,167 @@
+import os, sys, pdb, time
+import unittest as test
+
+from nistoar.testing import *
+import nistoar.pdr.preserv.bagger.storecat as sc
+
+def setUpModule():
+    ensure_tmpdir()
+
+def tearDownModule():
+    rmtmpdir()
+
+class TestBagStoreCatalog(test.TestCase):
+
+    def touch(self, dirpath, name, content="x\n"):
+        with open(os.path.join(dirpath, name), 'w') as fd:
+            fd.write(content)
+        return os.path.join(dirpath, name)
+
+    def setUp(self):
+        self.tf = Tempfiles()
+        self.store = self.tf.mkdir("store")
+        self.rstore = self.tf.mkdir("rstore")
+        self.dbfile = os.path.join(self.tf.root, "storecat.sqlite")
+        self.tf.track("storecat.sqlite")
+
+        self.touch(self.store, "pdr2210.1_0_0.mbag0_4-0.zip")
+        self.touch(self.store, "pdr2210.1_0_0.mbag0_4-0.zip.sha256", "abcdef  pdr2210\n")
+        self.touch(self.store, "pdr2210.1_1_0.mbag0_4-1.zip")
+        self.touch(self.store, "pdr22101.1_0_0.mbag0_4-0.zip")
+        self.touch(self.store, "pdr2211.1_0_0.mbag0_4-0.zip")
+        self.touch(self.rstore, "pdr2212.1_0_0.mbag0_4-0.zip")
+
+    def tearDown(self):
+        self.tf.clean()
+
+    def test_build(self):
+        cat = sc.BagStoreCatalog(self.dbfile, self.store, self.rstore)
+        self.assertTrue(os.path.exists(self.dbfile))
+        self.assertEqual(cat.list_files(self.store, "pdr2210."),
+                         ["pdr2210.1_0_0.mbag0_4-0.zip", "pdr2210.1_0_0.mbag0_4-0.zip.sha256",
+                          "pdr2210.1_1_0.mbag0_4-1.zip"])
+        self.assertEqual(len(cat.list_files(self.store)), 5)
+        self.assertEqual(cat.list_files(self.rstore, "pdr2212."), ["pdr2212.1_0_0.mbag0_4-0.zip"])
+        self.assertEqual(cat.list_files(self.store, "pdr2212."), [])
+
+    def test_bags_for(self):
+        cat = sc.BagStoreCatalog(self.dbfile, self.store, self.rstore)
+        bags = cat.bags_for("pdr2210")
+        self.assertEqual([b['name'] for b in bags],
+                         ["pdr2210.1_0_0.mbag0_4-0.zip", "pdr2210.1_1_0.mbag0_4-1.zip"])
+        self.assertEqual(bags[0]['version'], "1.0.0")
+        self.assertEqual(bags[0]['seq'], 0)
+        self.assertEqual(bags[0]['checksum'], "abcdef")
+        self.assertEqual(bags[0]['access'], sc.PUBLIC)
+        self.assertEqual(bags[0]['size'], 2)
+        self.assertFalse(bags[0]['removed'])
+        self.assertIsNone(bags[1]['checksum'])
+
+        self.assertEqual(len(cat.bags_for("pdr2210", "1.1.0")), 1)
+        self.assertEqual(cat.bags_for("pdr2212")[0]['access'], sc.RESTRICTED)
+        self.assertEqual(cat.versions_for("pdr2210"), set(["1.0.0", "1.1.0"]))
+
+    def test_register(self):
+        cat = sc.BagStoreCatalog(self.dbfile, self.store, self.rstore)
+        files = [self.touch(self.store, "pdr2210.1_2_0.mbag0_4-2.zip"),
+                 self.touch(self.store, "pdr2210.1_2_0.mbag0_4-2.zip.sha256", "123456\n")]
+        self.assertEqual(len(cat.bags_for("pdr2210")), 2)
+        cat.register(files)
+        bags = cat.bags_for("pdr2210", "1.2.0")
+        self.assertEqual(len(bags), 1)
+        self.assertEqual(bags[0]['checksum'], "123456")
+
+        cat.register(self.touch(self.store, "pdr2210.1_2_0.mbag0_4-2.zip.removed", ""))
+        self.assertTrue(cat.bags_for("pdr2210", "1.2.0")[0]['removed'])
+        self.assertEqual(len(cat.bags_for("pdr2210", include_removed=False)), 2)
+
+        cat.unregister(files)
+        self.assertEqual(len(cat.bags_for("pdr2210")), 2)
+
+    def test_rebuild(self):
+        cat = sc.BagStoreCatalog(self.dbfile, self.store)
+        self.touch(self.store, "pdr2213.1_0_0.mbag0_4-0.zip")
+        self.assertEqual(cat.list_files(self.store, "pdr2213."), [])
+
+        # reopening does not rescan
+        cat = sc.BagStoreCatalog(self.dbfile, self.store)
+        self.assertEqual(cat.list_files(self.store, "pdr2213."), [])
+        self.assertEqual(cat.rebuild(), 6)
+        self.assertEqual(cat.list_files(self.store, "pdr2213."), ["pdr2213.1_0_0.mbag0_4-0.zip"])
+
+        # a newly covered directory is scanned on open
+        cat = sc.BagStoreCatalog(self.dbfile, self.store, self.rstore)
+        self.assertEqual(len(cat.bags_for("pdr2212")), 1)
+
+    def test_reconcile(self):
+        cat = sc.BagStoreCatalog(self.dbfile, self.store)
+        self.touch(self.store, "pdr2213.1_0_0.mbag0_4-0.zip")
+        self.touch(self.store, "pdr2213.1_0_0.mbag0_4-0.zip.sha256", "fedcba\n")
+        os.remove(os.path.join(self.store, "pdr2211.1_0_0.mbag0_4-0.zip"))
+        self.assertEqual(len(cat.bags_for("pdr2211")), 1)
+
+        self.assertEqual(cat.reconcile(self.store), (2, 1))
+        self.assertEqual(cat.bags_for("pdr2213")[0]['checksum'], "fedcba")
+        self.assertEqual(cat.bags_for("pdr2211"), [])
+        self.assertEqual(len(cat.list_files(self.store)), 6)
+        self.assertEqual(cat.reconcile(self.store), (0, 0))
+
+    def test_list_store(self):
+        self.assertEqual(sc.list_store(None, self.store, "pdr2211."),
+                         ["pdr2211.1_0_0.mbag0_4-0.zip"])
+        cat = sc.BagStoreCatalog(self.dbfile, self.store)
+        self.touch(self.rstore, "pdr2211.1_0_0.mbag0_4-0.zip")
+        self.assertEqual(sc.list_store(cat, self.store, "pdr2211."),
+                         ["pdr2211.1_0_0.mbag0_4-0.zip"])
+        # rstore is not covered by the catalog and is listed directly
+        self.assertEqual(sc.list_store(cat, self.rstore, "pdr2211."),
+                         ["pdr2211.1_0_0.mbag0_4-0.zip"])
+
+    def test_list_store_stale(self):
+        cat = sc.BagStoreCatalog(self.dbfile, self.store)
+        os.remove(os.path.join(self.store, "pdr2210.1_1_0.mbag0_4-1.zip"))
+        self.touch(self.store, "pdr2210.1_2_0.mbag0_4-2.zip")
+
+        # the missing file is detected, dropped from the catalog, and the
+        # directory is listed instead; the uncataloged file is registered
+        self.assertEqual(sc.list_store(cat, self.store, "pdr2210."),
+                         ["pdr2210.1_0_0.mbag0_4-0.zip", "pdr2210.1_0_0.mbag0_4-0.zip.sha256",
+                          "pdr2210.1_2_0.mbag0_4-2.zip"])
+        self.assertEqual(cat.list_files(self.store, "pdr2210."),
+                         ["pdr2210.1_0_0.mbag0_4-0.zip", "pdr2210.1_0_0.mbag0_4-0.zip.sha256",
+                          "pdr2210.1_2_0.mbag0_4-2.zip"])
+
+        # a full listing always comes from the directory
+        os.remove(os.path.join(self.store, "pdr2211.1_0_0.mbag0_4-0.zip"))
+        self.assertNotIn("pdr2211.1_0_0.mbag0_4-0.zip", sc.list_store(cat, self.store))
+
+    def test_list_store_unregistered(self):
+        cat = sc.BagStoreCatalog(self.dbfile, self.store)
+
+        # files delivered without being registered are found when the catalog
+        # knows of none for the prefix...
+        self.touch(self.store, "pdr2299.1_0_0.mbag0_4-0.zip")
+        self.assertEqual(sc.list_store(cat, self.store, "pdr2299."),
+                         ["pdr2299.1_0_0.mbag0_4-0.zip"])
+        self.assertEqual(cat.list_files(self.store, "pdr2299."),
+                         ["pdr2299.1_0_0.mbag0_4-0.zip"])
+
+        # ...or when the catalog has been invalidated
+        self.touch(self.store, "pdr2210.1_2_0.mbag0_4-2.zip")
+        self.assertTrue(cat.is_current(self.store))
+        cat.invalidate(self.store)
+        self.assertFalse(cat.is_current(self.store))
+        self.assertIn("pdr2210.1_2_0.mbag0_4-2.zip", sc.list_store(cat, self.store, "pdr2210."))
+        self.assertTrue(cat.is_current(self.store))
+        self.assertIn("pdr2210.1_2_0.mbag0_4-2.zip", cat.list_files(self.store, "pdr2210."))
+
+    def test_catalog_for(self):
+        self.assertIsNone(sc.catalog_for({"store_dir": self.store}))
+        cfg = {"store_dir": self.store, "store_catalog": self.dbfile}
+        cat = sc.catalog_for(cfg)
+        self.assertTrue(isinstance(cat, sc.BagStoreCatalog))
+        self.assertIs(sc.catalog_for(cfg), cat)
+
+
+if __name__ == '__main__':
+    test.main()
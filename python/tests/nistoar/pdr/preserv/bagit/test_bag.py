@@ -211,6 +211,18 @@ class TestNISTBag(test.TestCase):
         for comp in data['dataHierarchy']:
             self.assertIn(comp, baghier)
 
+    def test_nerdm_record_native(self):
+        self.bag = bag.NISTBag(bagdir, conversion="native")
+        data = self.bag.nerdm_record(None, True, True)
+        self.assertEqual(len(data['inventory']), 2)
+        self.assertEqual(data['inventory'][0]['forCollection'], "")
+        self.assertEqual(data['inventory'][0]['childCount'], 4)
+        self.assertEqual(data['inventory'][0]['descCount'], 5)
+
+        self.assertEqual(len(data['dataHierarchy']), len(baghier))
+        for comp in data['dataHierarchy']:
+            self.assertIn(comp, baghier)
+
     def test_nerdm_record_withannots(self):
         self.bag = bag.NISTBag(metabagdir)
         nerd = self.bag.nerdm_record()
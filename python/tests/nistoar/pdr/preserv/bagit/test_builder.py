@@ -1858,7 +1858,47 @@ class TestBuilder2(test.TestCase):
         self.assertTrue(os.path.isfile(os.path.join(self.bag.bagdir, "about.txt")))
         self.assertTrue(os.path.isdir(os.path.join(self.bag.bagdir, "multibag")))
         
-        
+    def test_finalize_inventory(self):
+        # the single-pass inventory should yield the same results as
+        # measuring the bag directly
+        path = os.path.join("trial1","gold","trial1.json")
+        datafile = os.path.join(datadir,"trial1.json")
+        podfile = os.path.join(datadir, "_pod.json")
+
+        self.bag.assign_id("mds00kkd13")
+        self.bag.add_data_file(path, datafile)
+        path = os.path.join("trial1","trial2.json")
+        self.bag.add_data_file(path, datafile)
+        with open(podfile) as fd:
+            pod = json.load(fd)
+        self.bag.add_ds_pod(pod, convert=True, savefilemd=False)
+        self.bag.update_annotations_for("trial1", {"foo": "bar"})
+
+        self.bag.finalize_bag(stop_logging=True)
+
+        baginfo = self.bag.bag.get_baginfo()
+        oxum = bldr.measure_dir_size(self.bag.bag.data_dir)
+        self.assertEqual(baginfo['Payload-Oxum'], ["{0}.{1}".format(*oxum)])
+        oxum = bldr.measure_dir_size(self.bag.bagdir)
+        self.assertEqual(baginfo['Bag-Oxum'][0].split('.')[1], str(oxum[1]))
+
+        manfile = os.path.join(self.bag.bagdir, "manifest-sha256.txt")
+        with open(manfile) as fd:
+            lines = [l.strip().split(' ', 1) for l in fd]
+        self.assertEqual(len(lines), 2)
+        for csum, f in lines:
+            self.assertEqual(csum, bldr.checksum_of(os.path.join(self.bag.bagdir, f)))
+
+        mdata = self.bag.bag.nerd_metadata_for("trial1", False)
+        self.assertEqual(mdata['foo'], "bar")
+
+        fltag = os.path.join(self.bag.bagdir,"multibag", "file-lookup.tsv")
+        with open(fltag) as fd:
+            lookup = set([line.strip().split('\t')[0] for line in fd])
+        self.assertIn("data/trial1/gold/trial1.json", lookup)
+        self.assertIn("metadata/trial1/nerdm.json", lookup)
+        self.assertIn("metadata/trial1/annot.json", lookup)
+
 
     def test_matches_type(self):
         types = ["nrdp:DataFile", "Downloadable", "dcat:Distribution"]
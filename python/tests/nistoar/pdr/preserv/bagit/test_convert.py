@@ -0,0 +1,188 @@
+import os, sys, pdb, json
+import unittest as test
+from collections import OrderedDict
+from distutils.spawn import find_executable
+
+from nistoar.testing import *
+from nistoar.pdr import def_jq_libdir
+from nistoar.pdr.exceptions import ConfigurationException
+import nistoar.pdr.preserv.bagit.convert as cvt
+
+# datadir = nistoar/pdr/preserv/data
+datadir = os.path.join( os.path.dirname(os.path.dirname(__file__)), "data" )
+goldenfile = os.path.join(datadir, "3A1EE2F169DD3B8CE0531A570681DB5D1491.json")
+podfile = os.path.join(datadir, "simplesip", "_pod.json")
+arkid = "ark:/88434/edi00hw91c"
+
+have_jq = bool(find_executable("jq")) and def_jq_libdir and os.path.isdir(def_jq_libdir)
+
+def read_json(path):
+    with open(path) as fd:
+        return json.load(fd, object_pairs_hook=OrderedDict)
+
+def plain(data):
+    # normalize away the differences between OrderedDicts and dicts
+    return json.loads(json.dumps(data))
+
+class TestFactories(test.TestCase):
+
+    def test_native(self):
+        self.assertIsInstance(cvt.pod_converter("native"), cvt.NativePODds2Res)
+        self.assertIsInstance(cvt.component_counter("native"), cvt.NativeComponentCounter)
+        self.assertIsInstance(cvt.hierarchy_builder("native"), cvt.NativeHierarchyBuilder)
+
+    def test_bad_name(self):
+        with self.assertRaises(ConfigurationException):
+            cvt.pod_converter("goober")
+        with self.assertRaises(ConfigurationException):
+            cvt.component_counter("goober")
+
+class TestNativeComponentCounter(test.TestCase):
+
+    def test_inventory_golden(self):
+        golden = read_json(goldenfile)
+        inv = cvt.NativeComponentCounter().inventory(golden['components'])
+        self.assertEqual(plain(inv), plain(golden['inventory']))
+
+    def test_inventory_collection(self):
+        golden = read_json(goldenfile)
+        inv = cvt.NativeComponentCounter().inventory_collection(golden['components'], "trial3")
+        self.assertEqual(inv['forCollection'], "trial3")
+        self.assertEqual(inv['childCount'], 2)
+        self.assertEqual(inv['descCount'], 2)
+        self.assertEqual(inv['childCollections'], [])
+
+    def test_empty(self):
+        inv = cvt.NativeComponentCounter().inventory([])
+        self.assertEqual(len(inv), 1)
+        self.assertEqual(inv[0]['forCollection'], "")
+        self.assertEqual(inv[0]['childCount'], 0)
+        self.assertEqual(inv[0]['byType'], [])
+
+class TestNativeHierarchyBuilder(test.TestCase):
+
+    def test_build_hierarchy_golden(self):
+        golden = read_json(goldenfile)
+        hier = cvt.NativeHierarchyBuilder().build_hierarchy(golden['components'])
+        self.assertEqual(plain(hier), plain(golden['dataHierarchy']))
+
+    def test_empty(self):
+        self.assertEqual(cvt.NativeHierarchyBuilder().build_hierarchy([]), [])
+
+class TestNativePODds2Res(test.TestCase):
+
+    def setUp(self):
+        self.cvtr = cvt.NativePODds2Res()
+
+    def test_convert_data(self):
+        pod = read_json(podfile)
+        pod['references'] = [ "https://doi.org/10.1364/OE.24.014100" ]
+        nerd = self.cvtr.convert_data(pod, arkid)
+        golden = read_json(goldenfile)
+
+        self.assertEqual(nerd['@id'], arkid)
+        self.assertEqual(nerd['@context'][1]['@base'], arkid)
+        self.assertEqual(nerd['@type'], ["nrdp:PublicDataResource"])
+        self.assertTrue(nerd['_extensionSchemas'][0].endswith("#/definitions/PublicDataResource"))
+        for prop in "doi title contactPoint modified ediid landingPage description keyword " \
+                    "theme topic accessLevel license publisher language bureauCode " \
+                    "programCode".split():
+            self.assertEqual(plain(nerd[prop]), plain(golden[prop]), prop)
+
+        ref = nerd['references'][0]
+        for prop in "@type @id refType location".split():
+            self.assertEqual(ref[prop], golden['references'][0][prop])
+
+        comps = nerd['components']
+        self.assertEqual([c.get('filepath') for c in comps],
+                         ["trial1.json", "trial2.json", "trial3", "trial3/trial3a.json", None])
+        bypath = dict([(c['filepath'], c) for c in golden['components'] if 'filepath' in c])
+        for comp in comps[:-1]:
+            gold = bypath[comp['filepath']]
+            self.assertEqual(comp['@id'], gold['@id'])
+            self.assertEqual(comp['@type'], gold['@type'])
+        self.assertEqual(comps[-1]['@id'], "#doi:10.18434/T4SW26")
+        self.assertEqual(comps[-1]['@type'], ["nrd:Hidden", "dcat:Distribution"])
+
+    def test_convert_file(self):
+        nerd = self.cvtr.convert_file(podfile, "")
+        self.assertEqual(nerd['@context'], cvt.NERDM_CONTEXT)
+        self.assertEqual(nerd['ediid'], "3A1EE2F169DD3B8CE0531A570681DB5D1491")
+        self.assertEqual(len(nerd['components']), 5)
+
+    def test_checksum_dist(self):
+        comp = self.cvtr.convert_distribution({
+            "downloadURL": "https://data.nist.gov/od/ds/ABCD/a%20b/c.dat.sha256"
+        })
+        self.assertEqual(comp['filepath'], "a b/c.dat.sha256")
+        self.assertEqual(comp['@type'][0], "nrdp:ChecksumFile")
+        self.assertEqual(comp['algorithm']['tag'], "sha256")
+        self.assertEqual(comp['describes'], "cmps/a b/c.dat")
+
+        comp = self.cvtr.convert_distribution({
+            "downloadURL": "https://s3.amazonaws.com/nist-midas/1491/sim%2B%2B.json"
+        })
+        self.assertEqual(comp['filepath'], "sim++.json")
+        self.assertEqual(comp['@type'][0], "nrdp:DataFile")
+
+    def test_filepath_from_url(self):
+        self.assertEqual(cvt.filepath_from_url("https://data.nist.gov/od/ds/ABCD/a%20b/c.dat"),
+                         "a b/c.dat")
+        self.assertEqual(cvt.filepath_from_url("https://data.nist.gov/od/ds/mds2-9999/dir0/file.dat"),
+                         "dir0/file.dat")
+        self.assertEqual(
+            cvt.filepath_from_url("https://data.nist.gov/od/ds/ark:/88434/mds2-9999/dir0/file.dat"),
+            "dir0/file.dat")
+        self.assertEqual(
+            cvt.filepath_from_url("https://data.nist.gov/od/ds/ark:/88434/mds2-9999/file.dat?a=b"),
+            "file.dat")
+        self.assertEqual(cvt.filepath_from_url("https://s3.amazonaws.com/nist-midas/1491/c.dat"),
+                         "c.dat")
+
+    def test_ark_distributions(self):
+        comps = self.cvtr.convert_distributions([
+            { "downloadURL": "https://data.nist.gov/od/ds/ark:/88434/mds2-9999/dir0/sub/file.dat" },
+            { "downloadURL": "https://data.nist.gov/od/ds/ark:/88434/mds2-9999/dir0/file.dat.sha256" }
+        ])
+        self.assertEqual([c['filepath'] for c in comps],
+                         ["dir0", "dir0/sub", "dir0/sub/file.dat", "dir0/file.dat.sha256"])
+        self.assertEqual(comps[0]['@type'], [cvt.SUBCOLL_TYPE])
+        self.assertEqual(comps[2]['@id'], "cmps/dir0/sub/file.dat")
+        self.assertEqual(comps[3]['describes'], "cmps/dir0/file.dat")
+
+    def test_split_paragraphs(self):
+        self.assertEqual(cvt.split_paragraphs("One.\n\n  Two.\n"), ["One.", "Two."])
+        self.assertEqual(cvt.split_paragraphs("One."), ["One."])
+
+@test.skipIf(not have_jq, "jq or the jq library is not available")
+class TestAgainstJq(test.TestCase):
+
+    def test_inventory(self):
+        comps = read_json(goldenfile)['components']
+        self.assertEqual(plain(cvt.component_counter("native").inventory(comps)),
+                         plain(cvt.component_counter("jq").inventory(comps)))
+
+    def test_hierarchy(self):
+        comps = read_json(goldenfile)['components']
+        self.assertEqual(plain(cvt.hierarchy_builder("native").build_hierarchy(comps)),
+                         plain(cvt.hierarchy_builder("jq").build_hierarchy(comps)))
+
+    def test_pod2nerdm(self):
+        pod = read_json(podfile)
+        native = cvt.pod_converter("native").convert_data(pod, arkid)
+        jq = cvt.pod_converter("jq").convert_data(pod, arkid)
+        self.assertEqual(plain(native), plain(jq))
+
+    def test_pod2nerdm_ark_urls(self):
+        pod = read_json(podfile)
+        for dist in pod['distribution']:
+            if 'downloadURL' in dist:
+                dist['downloadURL'] = dist['downloadURL'].replace(
+                    "/od/ds/3A1EE2F169DD3B8CE0531A570681DB5D1491/", "/od/ds/ark:/88434/mds2-1491/")
+        native = cvt.pod_converter("native").convert_data(pod, arkid)
+        jq = cvt.pod_converter("jq").convert_data(pod, arkid)
+        self.assertEqual(plain(native), plain(jq))
+
+
+if __name__ == '__main__':
+    test.main()
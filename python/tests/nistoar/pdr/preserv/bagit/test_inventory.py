@@ -0,0 +1,75 @@
+import os, sys, pdb, shutil, logging
+import unittest as test
+
+from nistoar.testing import *
+from nistoar.pdr.preserv.bagit.bag import NISTBag
+from nistoar.pdr.preserv.bagit.inventory import BagInventory
+from nistoar.pdr.utils import measure_dir_size
+
+# datadir = tests/nistoar/pdr/preserv/data
+datadir = os.path.join( os.path.dirname(os.path.dirname(__file__)), "data" )
+bagdir = os.path.join(datadir, "samplembag")
+
+def setUpModule():
+    ensure_tmpdir()
+
+def tearDownModule():
+    rmtmpdir()
+
+class TestBagInventory(test.TestCase):
+
+    def setUp(self):
+        self.bag = NISTBag(bagdir)
+        self.inv = BagInventory(self.bag)
+
+    def test_ctor(self):
+        self.assertIs(self.inv.bag, self.bag)
+        self.assertEqual(len(self.inv.datafiles), 0)
+        self.assertEqual(len(self.inv.metafiles), 0)
+        self.assertFalse(self.inv.data_scanned)
+        self.assertFalse(self.inv.metadata_scanned)
+
+    def test_scan_data(self):
+        self.inv.scan_data()
+        self.assertTrue(self.inv.data_scanned)
+        self.assertEqual(sorted(self.inv.datafiles.keys()),
+                         sorted(self.bag.iter_data_files()))
+        self.assertEqual(self.inv.payload_oxum(), measure_dir_size(self.bag.data_dir))
+        self.assertIsNone(self.inv.checksum_for("trial1.json"))
+
+        self.inv.set_checksum("trial1.json", "abcdef")
+        self.assertEqual(self.inv.checksum_for("trial1.json"), "abcdef")
+        self.assertIsNone(self.inv.checksum_for("goober.json"))
+
+    def test_scan_metadata(self):
+        self.inv.scan_metadata()
+        self.assertTrue(self.inv.metadata_scanned)
+        self.assertEqual(sorted(self.inv.components),
+                         sorted(self.bag.iter_data_components()))
+        self.assertEqual(self.inv.annotated, ["trial2.json"])
+        self.assertIn("metadata/nerdm.json", self.inv.metafiles)
+        self.assertIn("metadata/trial2.json/annot.json", self.inv.metafiles)
+        self.assertEqual(sum(self.inv.metafiles.values()),
+                         measure_dir_size(self.bag.metadata_dir)[0])
+
+        self.assertEqual(self.inv.nerd_file_path("trial2.json"),
+                         os.path.join("metadata", "trial2.json", "nerdm.json"))
+        self.assertEqual(self.inv.nerd_file_path(""),
+                         os.path.join("metadata", "nerdm.json"))
+
+    def test_lookup_paths(self):
+        self.inv.scan_data()
+        self.inv.scan_metadata()
+        paths = list(self.inv.iter_lookup_paths())
+        self.assertIn("data/trial3/trial3a.json", paths)
+        self.assertIn("metadata/trial3/trial3a.json/nerdm.json", paths)
+        self.assertEqual(len(paths), len(self.inv.datafiles) + len(self.inv.metafiles))
+
+    def test_measure_bag(self):
+        self.inv.scan_data()
+        self.inv.scan_metadata()
+        self.assertEqual(self.inv.measure_bag(), measure_dir_size(bagdir))
+
+
+if __name__ == '__main__':
+    test.main()
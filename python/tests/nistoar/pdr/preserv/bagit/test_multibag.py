@@ -123,6 +123,55 @@ class TestOARSplitter(test.TestCase):
         for mf in mfs:
             self.assertLess(mf['totalsize'], 1.05*400000)
 
+    def test_plan_packed(self):
+        bagdir = os.path.join(self.workdir,"dataset")
+        mkbag(bagdir)
+
+        nbr = list(multibag.OARSplitter(400000, maxhdsize=50000).plan(bagdir).manifests())
+        spltr = multibag.OARSplitter(400000, maxhdsize=50000, strategy=multibag.PACKED)
+        plan = spltr.plan(bagdir)
+        self.assertTrue(plan.is_complete())
+        mfs = list(plan.manifests())
+        self.assertGreater(len(mfs), 1)
+        self.assertLessEqual(len(mfs), len(nbr))
+
+        # all metadata files are in the last output multibag
+        for i in range(len(mfs)-1):
+            self.assertEqual(len([p for p in mfs[i]['contents']
+                                    if p.startswith("metadata/")]), 0)
+        self.assertEqual(len([p for p in mfs[-1]['contents']
+                              if p.startswith("metadata/")]), 22)
+
+        # all data files are accounted for exactly once
+        ndata = lambda ms: sorted([p for m in ms for p in m['contents']
+                                     if p.lstrip('/').startswith("data/")])
+        self.assertEqual(ndata(mfs), ndata(nbr))
+
+        for mf in mfs[:-1]:
+            self.assertLessEqual(mf['totalsize'], 400000)
+
+        with self.assertRaises(multibag.ConfigurationException):
+            multibag.OARSplitter(400000, strategy="goob")
+
+    def test_pack(self):
+        spltr = multibag.OARSplitter(100, strategy=multibag.PACKED)
+        items = [("data/a/1", 40, "data/a"), ("data/a/2", 30, "data/a"),
+                 ("data/b/1", 60, "data/b"), ("data/c/1", 25, "data/c"),
+                 ("data/d/1", 150, "data/d"), ("data/e/1", 70, "data/e"),
+                 ("data/e/2", 50, "data/e")]
+        bins = spltr._pack(items, 100)
+        self.assertEqual(sum([b[0] for b in bins]), 425)
+        self.assertEqual(len(bins), 5)
+        # each directory smaller than a bag stays together
+        for dir in "abc":
+            self.assertEqual(len([b for b in bins
+                                  if any([p.startswith("data/"+dir) for p in b[1]])]), 1)
+        # an oversized file gets a bag to itself
+        self.assertIn([150, ["data/d/1"]], bins)
+        for b in bins:
+            if b[1] != ["data/d/1"]:
+                self.assertLessEqual(b[0], 100)
+
 class TestMultibagSplitter(test.TestCase):
 
     def setUp(self):
@@ -239,6 +288,29 @@ class TestMultibagSplitter(test.TestCase):
         self.assertEqual(len(bags), 4)
         self.assertTrue(os.path.exists(os.path.join(bags[-1], "multibag")))
 
+    def test_plan(self):
+        cfg = {
+            "max_bag_size": 400000,
+            "max_headbag_size": 50000,
+            "split_strategy": "packed"
+        }
+        self.spltr = multibag.MultibagSplitter(self.bagdir, cfg)
+        before = sorted(os.listdir(self.workdir))
+
+        plan = self.spltr.plan()
+        self.assertEqual(plan['strategy'], "packed")
+        self.assertGreater(plan['members'], 1)
+        self.assertEqual(len(plan['sizes']), plan['members'])
+        self.assertEqual(plan['headbag_size'], plan['sizes'][-1])
+        self.assertEqual(plan['total_size'], sum(plan['sizes']))
+        self.assertEqual(plan['split_dirs'], 0)
+
+        # nothing was written
+        self.assertEqual(sorted(os.listdir(self.workdir)), before)
+
+        bags = self.spltr.check_and_split(self.workdir)
+        self.assertEqual(len(bags), plan['members'])
+
     def test_check_and_split_too_small(self):
         cfg = {
             "max_bag_size": 400000000,
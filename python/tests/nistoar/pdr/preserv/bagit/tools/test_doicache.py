@@ -0,0 +1,156 @@
+import os, sys, pdb, time, threading
+import unittest as test
+
+from nistoar.testing import *
+import nistoar.pdr.preserv.bagit.tools.doicache as dc
+from nistoar.doi import DOIResolutionException, DOIDoesNotExist
+
+def setUpModule():
+    ensure_tmpdir()
+
+def tearDownModule():
+    rmtmpdir()
+
+class StubResolver(object):
+    # stands in for nistoar.nerdm.convert.DOIResolver
+    def __init__(self, delay=0):
+        self.calls = []
+        self.delay = delay
+        self.active = 0
+        self.maxactive = 0
+        self._lock = threading.Lock()
+
+    def _call(self, doi):
+        with self._lock:
+            self.calls.append(doi)
+            self.active += 1
+            self.maxactive = max(self.maxactive, self.active)
+        try:
+            if self.delay:
+                time.sleep(self.delay)
+            if "missing" in doi:
+                raise DOIDoesNotExist(doi)
+            if "broken" in doi:
+                raise DOIResolutionException("server error")
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def to_reference(self, doi):
+        self._call(doi)
+        return {"@id": "doi:"+doi, "location": "https://doi.org/"+doi, "citation": "Gurn"}
+
+    def to_authors(self, doi):
+        self._call(doi)
+        return [{"fn": "Gurn Cranston"}]
+
+class TestDOICache(test.TestCase):
+
+    def setUp(self):
+        self.tf = Tempfiles()
+        self.cachedir = os.path.join(self.tf.root, "doicache")
+        self.tf.track("doicache")
+        self.cache = dc.DOICache(self.cachedir, 60, 10)
+
+    def tearDown(self):
+        self.tf.clean()
+
+    def test_doi_key(self):
+        self.assertEqual(dc.doi_key("doi:10.18434/ABC"), "10.18434/abc")
+        self.assertEqual(dc.doi_key("https://doi.org/10.18434/abc"), "10.18434/abc")
+        self.assertEqual(dc.doi_key("10.18434/abc"), "10.18434/abc")
+
+    def test_put_get(self):
+        self.assertTrue(os.path.isdir(self.cachedir))
+        self.assertIsNone(self.cache.get("10.18434/abc", "reference"))
+        self.cache.put("doi:10.18434/abc", "reference", {"citation": "Gurn"})
+        ent = self.cache.get("10.18434/ABC", "reference")
+        self.assertEqual(ent['data'], {"citation": "Gurn"})
+        self.assertIsNone(self.cache.get("10.18434/abc", "authors"))
+
+        self.cache.put_missing("10.18434/xyz", "reference")
+        self.assertTrue(self.cache.get("10.18434/xyz", "reference")['missing'])
+
+        self.cache.forget("10.18434/abc")
+        self.assertIsNone(self.cache.get("10.18434/abc", "reference"))
+
+    def test_expire(self):
+        self.cache.put("10.18434/abc", "reference", {"citation": "Gurn"})
+        self.cache.put_missing("10.18434/xyz", "reference")
+        self.cache.negative_ttl = 0
+        self.assertIsNotNone(self.cache.get("10.18434/abc", "reference"))
+        time.sleep(0.01)
+        self.assertIsNone(self.cache.get("10.18434/xyz", "reference"))
+        self.cache.ttl = 0
+        self.assertIsNone(self.cache.get("10.18434/abc", "reference"))
+
+class TestCachingDOIResolver(test.TestCase):
+
+    def setUp(self):
+        self.tf = Tempfiles()
+        self.tf.track("doicache")
+        self.stub = StubResolver()
+        self.cache = dc.DOICache(os.path.join(self.tf.root, "doicache"))
+        self.doir = dc.CachingDOIResolver(self.stub, self.cache, 3, 0)
+
+    def tearDown(self):
+        self.tf.clean()
+
+    def test_to_reference(self):
+        ref = self.doir.to_reference("10.18434/abc")
+        self.assertEqual(ref['citation'], "Gurn")
+        ref['citation'] = "Hank"
+        ref = self.doir.to_reference("doi:10.18434/abc")
+        self.assertEqual(ref['citation'], "Gurn")
+        self.assertEqual(len(self.stub.calls), 1)
+
+        self.assertEqual(self.doir.to_authors("10.18434/abc")[0]['fn'], "Gurn Cranston")
+        self.assertEqual(len(self.stub.calls), 2)
+
+        # another resolver sharing the cache
+        doir = dc.CachingDOIResolver(StubResolver(), dc.DOICache(self.cache.dir))
+        self.assertEqual(doir.to_reference("10.18434/abc")['citation'], "Gurn")
+        self.assertEqual(len(doir.doir.calls), 0)
+
+    def test_missing(self):
+        with self.assertRaises(DOIDoesNotExist):
+            self.doir.to_reference("10.18434/missing")
+        with self.assertRaises(DOIDoesNotExist):
+            self.doir.to_reference("10.18434/missing")
+        self.assertEqual(len(self.stub.calls), 1)
+
+        with self.assertRaises(DOIResolutionException):
+            self.doir.to_reference("10.18434/broken")
+        with self.assertRaises(DOIResolutionException):
+            self.doir.to_reference("10.18434/broken")
+        self.assertEqual(len(self.stub.calls), 2)
+        self.assertIsNone(self.cache.get("10.18434/broken", "reference"))
+
+    def test_prefetch(self):
+        self.stub.delay = 0.05
+        dois = ["10.18434/a%d" % i for i in range(8)] + ["doi:10.18434/A0", "10.18434/missing"]
+        self.assertEqual(self.doir.prefetch(dois), 9)
+        self.assertEqual(len(self.stub.calls), 9)
+        self.assertLessEqual(self.stub.maxactive, 3)
+        self.assertGreater(self.stub.maxactive, 1)
+
+        self.assertEqual(self.doir.to_reference("10.18434/a5")['citation'], "Gurn")
+        self.assertEqual(self.doir.prefetch(dois), 0)
+        self.assertEqual(len(self.stub.calls), 9)
+
+    def test_rate_limit(self):
+        self.doir.limiter.min_interval = 0.05
+        start = time.time()
+        self.doir.prefetch(["10.18434/a%d" % i for i in range(4)])
+        self.assertGreaterEqual(time.time() - start, 0.15)
+
+    def test_resolver_for(self):
+        cfg = {"cache": {"dir": self.cache.dir, "max_workers": 2}}
+        doir = dc.resolver_for(cfg)
+        self.assertTrue(isinstance(doir, dc.CachingDOIResolver))
+        self.assertEqual(doir.max_workers, 2)
+        self.assertEqual(doir.host, "doi.org")
+        self.assertFalse(isinstance(dc.resolver_for({}), dc.CachingDOIResolver))
+
+if __name__ == '__main__':
+    test.main()
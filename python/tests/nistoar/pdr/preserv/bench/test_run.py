@@ -0,0 +1,72 @@
+import os, sys, pdb, shutil, logging, json
+import unittest as test
+
+from nistoar.testing import *
+from nistoar.pdr.preserv.bench import run
+
+class TestCompareToBaseline(test.TestCase):
+
+    def test_compare(self):
+        base = { "stages": { "finalize": { "time": 1.0 }, "split": { "time": 0.5 },
+                             "examine": { "time": 0.001 } },
+                 "micro": { "nerdm_record": { "time": 0.1 } } }
+        res = { "stages": { "finalize": { "time": 1.1 }, "split": { "time": 1.0 },
+                            "examine": { "time": 0.01 } },
+                "micro": { "nerdm_record": { "time": 0.2 } } }
+
+        regs = run.compare_to_baseline(res, base)
+        names = sorted([r['name'] for r in regs])
+        self.assertEqual(names, ["micro.nerdm_record", "stages.split"])
+        split = [r for r in regs if r['name'] == "stages.split"][0]
+        self.assertAlmostEqual(split['ratio'], 2.0)
+        self.assertEqual(split['baseline'], 0.5)
+        self.assertEqual(split['current'], 1.0)
+
+        self.assertEqual(run.compare_to_baseline(res, base, 1.5), [])
+        self.assertEqual(run.compare_to_baseline(res, {}), [])
+
+class TestTimer(test.TestCase):
+
+    def test_paused(self):
+        stages = {}
+        timer = run._Timer(stages, "goob")
+        with timer as data:
+            data['n'] = 1
+            with timer.paused():
+                run.time.sleep(0.1)
+        self.assertLess(stages['goob']['time'], 0.05)
+        self.assertEqual(stages['goob']['n'], 1)
+
+class TestPipelineBenchmark(test.TestCase):
+
+    def setUp(self):
+        self.tf = Tempfiles()
+        self.workdir = self.tf.mkdir("bench")
+
+    def tearDown(self):
+        self.tf.clean()
+
+    def test_run(self):
+        bench = run.PipelineBenchmark({ "filecount": 8, "sizedist": "fixed:2K", "depth": 1,
+                                        "churn_rounds": 1, "micro_repeat": 2 },
+                                      self.workdir)
+        res = bench.run()
+
+        self.assertEqual(res['params']['filecount'], 8)
+        self.assertEqual(list(res['stages'].keys()),
+                         ["generate", "pod_apply", "examine", "churn", "finalize", "split",
+                          "serialize", "validate"])
+        for stage in res['stages'].values():
+            self.assertNotIn('error', stage)
+        self.assertGreater(res['stages']['split']['bags'], 1)
+        self.assertEqual(res['stages']['validate']['issues'], 0)
+        self.assertIn("nerdm_record", res['micro'])
+        self.assertEqual(res['micro']['nerdm_record']['n'], 2)
+        self.assertGreater(res['total_time'], 0)
+
+        # results should be JSON-serializable
+        json.dumps(res)
+
+
+if __name__ == '__main__':
+    test.main()
@@ -0,0 +1,98 @@
+import os, sys, pdb, shutil, logging, json
+import unittest as test
+
+from nistoar.testing import *
+from nistoar.pdr.preserv.bench import synth
+from nistoar.pdr.exceptions import ConfigurationException
+
+class TestParseSizeDist(test.TestCase):
+
+    def test_fixed(self):
+        sz = synth.parse_size_dist("fixed:2K")
+        self.assertEqual(sz(None), 2048)
+        sz = synth.parse_size_dist("fixed:10")
+        self.assertEqual(sz(None), 10)
+
+    def test_uniform(self):
+        rng = synth.random.Random(3)
+        sz = synth.parse_size_dist("uniform:1K:2K")
+        for i in range(20):
+            s = sz(rng)
+            self.assertGreaterEqual(s, 1024)
+            self.assertLessEqual(s, 2048)
+
+    def test_lognormal(self):
+        rng = synth.random.Random(3)
+        sz = synth.parse_size_dist("lognormal:1M:0")
+        self.assertEqual(sz(rng), 1024**2)
+
+    def test_bad(self):
+        with self.assertRaises(ConfigurationException):
+            synth.parse_size_dist("goob:1K")
+        with self.assertRaises(ConfigurationException):
+            synth.parse_size_dist("fixed:1Q")
+        with self.assertRaises(ConfigurationException):
+            synth.parse_size_dist("uniform:2K:1K")
+        with self.assertRaises(ConfigurationException):
+            synth.parse_size_dist("lognormal:1K:x")
+
+class TestSyntheticSIP(test.TestCase):
+
+    def setUp(self):
+        self.tf = Tempfiles()
+        self.root = self.tf.mkdir("sip")
+        self.sip = synth.SyntheticSIP(self.root, 10, "uniform:10:100", depth=1, seed=5)
+
+    def tearDown(self):
+        self.tf.clean()
+
+    def test_ctor(self):
+        self.assertEqual(self.sip.ediid, "ark:/88434/mds2-9999")
+        self.assertEqual(self.sip.datadir, os.path.join(self.root, "review", "9999"))
+        self.assertEqual(len(self.sip.files), 0)
+        self.assertIsNone(self.sip.pod)
+        self.assertEqual(self.sip.params()['filecount'], 10)
+
+    def test_create(self):
+        pod = self.sip.create()
+        self.assertEqual(len(self.sip.files), 10)
+        self.assertEqual(len(pod['distribution']), 20)
+        self.assertEqual(pod['identifier'], self.sip.ediid)
+
+        for filepath, size in self.sip.files.items():
+            path = os.path.join(self.sip.datadir, filepath)
+            self.assertTrue(os.path.isfile(path))
+            self.assertTrue(os.path.isfile(path+".sha256"))
+            self.assertEqual(os.stat(path).st_size, size)
+            self.assertTrue(filepath.count('/') <= 1)
+        self.assertEqual(self.sip.total_size, sum(self.sip.files.values()))
+
+        url = pod['distribution'][0]['downloadURL']
+        self.assertTrue(url.startswith(synth.DIST_BASE_URL + self.sip.ediid + '/'))
+
+    def test_churn(self):
+        with self.assertRaises(RuntimeError):
+            self.sip.churn()
+        pod = self.sip.create()
+        before = list(self.sip.files.keys())
+
+        pod2 = self.sip.churn(0.3)
+        self.assertEqual(pod2['title'], pod['title'])
+        self.assertNotEqual(pod2['description'], pod['description'])
+        self.assertEqual(len(pod2['distribution']), 2*len(self.sip.files))
+        self.assertNotEqual(list(self.sip.files.keys()), before)
+
+    def test_deterministic(self):
+        self.sip.create()
+        sip2 = synth.SyntheticSIP(self.tf.mkdir("sip2"), 10, "uniform:10:100", depth=1, seed=5)
+        sip2.create()
+        self.assertEqual(list(sip2.files.items()), list(self.sip.files.items()))
+        for filepath in self.sip.files:
+            with open(os.path.join(self.sip.datadir, filepath+".sha256")) as fd:
+                csum = fd.read()
+            with open(os.path.join(sip2.datadir, filepath+".sha256")) as fd:
+                self.assertEqual(fd.read(), csum)
+
+
+if __name__ == '__main__':
+    test.main()
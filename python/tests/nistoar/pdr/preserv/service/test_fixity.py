@@ -0,0 +1,154 @@
+import os, sys, pdb, time, json, hashlib
+import unittest as test
+
+from nistoar.testing import *
+from nistoar.pdr.preserv.service import fixity as fx
+
+def setUpModule():
+    ensure_tmpdir()
+
+def tearDownModule():
+    rmtmpdir()
+
+class StubNotifier(object):
+    def __init__(self):
+        self.alerts = []
+    def alert(self, type, summary, desc=None, origin=None, **md):
+        self.alerts.append((type, summary, md))
+
+class TestFixityAuditor(test.TestCase):
+
+    def mkbag(self, dirpath, name, content, sidecar=True):
+        path = os.path.join(dirpath, name)
+        with open(path, 'w') as fd:
+            fd.write(content)
+        if sidecar:
+            with open(path+".sha256", 'w') as fd:
+                fd.write(hashlib.sha256(content).hexdigest())
+        return path
+
+    def setUp(self):
+        self.tf = Tempfiles()
+        self.store = self.tf.mkdir("store")
+        self.rstore = self.tf.mkdir("rstore")
+        self.workdir = self.tf.mkdir("work")
+        self.mkbag(self.store, "pdr2210.1_0_0.mbag0_4-0.zip", "a" * 1000)
+        self.mkbag(self.store, "pdr2210.1_1_0.mbag0_4-1.zip", "b" * 1000)
+        self.mkbag(self.store, "pdr2211.1_0_0.mbag0_4-0.zip", "c" * 1000)
+        self.mkbag(self.rstore, "pdr2212.1_0_0.mbag0_4-0.zip", "d" * 1000)
+        self.config = {
+            "store_dir": self.store,
+            "restricted_store_dir": self.rstore,
+            "working_dir": self.workdir
+        }
+        self.notifier = StubNotifier()
+        self.aud = fx.FixityAuditor(self.config, self.notifier)
+
+    def tearDown(self):
+        self.tf.clean()
+
+    def test_ctor(self):
+        self.assertEqual(self.aud.dbfile, os.path.join(self.workdir, "fixity.sqlite"))
+        self.assertTrue(os.path.exists(self.aud.dbfile))
+        self.assertEqual(len(self.aud.storedirs), 2)
+        with self.assertRaises(fx.ConfigurationException):
+            fx.FixityAuditor({"working_dir": self.workdir})
+
+    def test_sync(self):
+        self.assertEqual(self.aud.sync(), 4)
+        self.assertEqual(len(self.aud.due()), 4)
+        os.remove(os.path.join(self.store, "pdr2211.1_0_0.mbag0_4-0.zip"))
+        self.assertEqual(self.aud.sync(), 3)
+        self.assertEqual(len(self.aud.due()), 3)
+        self.assertEqual(self.aud.coverage()['total'], 3)
+
+    def test_sync_catalog(self):
+        self.config['store_catalog'] = os.path.join(self.workdir, "storecat.sqlite")
+        self.aud = fx.FixityAuditor(self.config, self.notifier)
+        self.assertEqual(len(self.aud.storecat.bags_for("pdr2211")), 1)
+        os.remove(os.path.join(self.store, "pdr2211.1_0_0.mbag0_4-0.zip"))
+        self.mkbag(self.store, "pdr2213.1_0_0.mbag0_4-0.zip", "e" * 1000)
+
+        self.assertEqual(self.aud.sync(), 4)
+        self.assertEqual(self.aud.storecat.bags_for("pdr2211"), [])
+        self.assertEqual(len(self.aud.storecat.bags_for("pdr2213")), 1)
+
+    def test_run(self):
+        summary = self.aud.run()
+        self.assertEqual(summary['checked'], 4)
+        self.assertEqual(summary['failed'], 0)
+        self.assertEqual(summary['bytes'], 4000)
+        self.assertEqual(summary['remaining'], 0)
+        self.assertEqual(self.notifier.alerts, [])
+
+        cov = self.aud.coverage()
+        self.assertEqual(cov['total'], 4)
+        self.assertEqual(cov['verified'], 4)
+        self.assertEqual(cov['coverage'], 1.0)
+        self.assertEqual(cov['never_verified'], 0)
+
+        # nothing is due again until the reverification period has passed
+        self.assertEqual(self.aud.run()['checked'], 0)
+
+    def test_resume(self):
+        self.aud.max_files = 3
+        summary = self.aud.run()
+        self.assertEqual(summary['checked'], 3)
+        self.assertEqual(summary['remaining'], 1)
+        self.assertEqual(self.aud.coverage()['never_verified'], 1)
+
+        # the next run picks up the bag not yet verified
+        self.aud.max_files = 1
+        self.assertEqual(self.aud.run()['checked'], 1)
+        self.assertEqual(self.aud.coverage()['never_verified'], 0)
+
+        # once all are due again, the least recently verified go first
+        self.aud.reverify_after = 0
+        time.sleep(0.01)
+        first = self.aud.due()
+        self.assertEqual(len(first), 4)
+        self.aud.run()
+        self.assertEqual(self.aud.due()[-1], first[0])
+
+    def test_failure(self):
+        bag = os.path.join(self.store, "pdr2211.1_0_0.mbag0_4-0.zip")
+        with open(bag, 'a') as fd:
+            fd.write("corrupted")
+        self.mkbag(self.store, "pdr2213.1_0_0.mbag0_4-0.zip", "e", False)
+
+        summary = self.aud.run()
+        self.assertEqual(summary['checked'], 3)
+        self.assertEqual(summary['failed'], 1)
+        self.assertEqual(summary['unverifiable'], 1)
+        self.assertEqual(len(self.notifier.alerts), 1)
+        self.assertEqual(self.notifier.alerts[0][0], "fixity.failure")
+        self.assertEqual(self.notifier.alerts[0][2]['file'], bag)
+
+        cov = self.aud.coverage()
+        self.assertEqual(cov['failed'], 1)
+        self.assertEqual(cov['unverifiable'], 1)
+        self.assertEqual(cov['failures'], ["pdr2211.1_0_0.mbag0_4-0.zip"])
+        self.assertAlmostEqual(cov['coverage'], 0.6)
+
+    def test_budget(self):
+        self.aud.max_bytes = 1500
+        self.assertEqual(self.aud.run()['checked'], 2)
+
+        self.aud.max_bytes = 0
+        self.aud.max_read_rate = 10000.0
+        start = time.time()
+        summary = self.aud.run()
+        self.assertEqual(summary['checked'], 2)
+        self.assertGreaterEqual(time.time() - start, 0.15)
+
+    def test_metrics(self):
+        self.aud.metrics_file = os.path.join(self.workdir, "fixity.json")
+        self.aud.run()
+        with open(self.aud.metrics_file) as fd:
+            metrics = json.load(fd)
+        self.assertEqual(metrics['total'], 4)
+        self.assertEqual(metrics['last_run']['checked'], 4)
+        self.assertIn('updated', metrics)
+
+if __name__ == '__main__':
+    test.main()
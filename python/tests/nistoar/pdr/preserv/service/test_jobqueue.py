@@ -0,0 +1,94 @@
+import os, pdb, sys, json
+import unittest as test
+
+from nistoar.testing import *
+from nistoar.pdr.preserv.service import jobqueue as jq
+
+def setUpModule():
+    ensure_tmpdir()
+def tearDownModule():
+    rmtmpdir()
+
+class TestPreservationJobQueue(test.TestCase):
+
+    def setUp(self):
+        self.tf = Tempfiles()
+        self.qdir = os.path.join(self.tf.root, "queue")
+        self.tf.track("queue")
+        self.q = jq.PreservationJobQueue(self.qdir, 2)
+
+    def tearDown(self):
+        self.tf.clean()
+
+    def test_ctor(self):
+        self.assertTrue(os.path.isdir(self.qdir))
+        self.assertEqual(self.q.maxrunning, 2)
+        self.assertEqual(self.q.waiting(), [])
+        self.assertEqual(self.q.running(), [])
+        self.assertEqual(jq.PreservationJobQueue(self.qdir, None).maxrunning, 0)
+
+    def test_submit(self):
+        self.assertEqual(self.q.submit("a", "midas3"), 1)
+        self.assertEqual(self.q.submit("b", "midas3", True), 2)
+        self.assertEqual(self.q.submit("a", "midas3"), 1)
+        self.assertEqual(self.q.submit("c", "midas3", front=True), 1)
+        self.assertEqual([j['id'] for j in self.q.waiting()], ["c", "a", "b"])
+        self.assertEqual(self.q.position("a"), 2)
+        self.assertIsNone(self.q.position("d"))
+
+        job = self.q.waiting()[2]
+        self.assertEqual(job['siptype'], "midas3")
+        self.assertTrue(job['asupdate'])
+        self.assertIn('queued', job)
+
+        # the queue persists
+        self.assertEqual(len(jq.PreservationJobQueue(self.qdir).waiting()), 3)
+        self.assertTrue(os.path.isfile(os.path.join(self.qdir, jq.QUEUE_FILE)))
+
+    def test_claim(self):
+        self.assertIsNone(self.q.claim())
+        for id in "abc":
+            self.q.submit(id, "midas3")
+
+        job = self.q.claim(42)
+        self.assertEqual(job['id'], "a")
+        self.assertEqual(job['pid'], 42)
+        self.assertIn('started', job)
+        self.assertEqual(self.q.position("a"), 0)
+        self.assertEqual(self.q.position("b"), 1)
+
+        self.assertEqual(self.q.claim()['id'], "b")
+        self.assertIsNone(self.q.claim())
+        self.assertEqual(self.q.position("c"), 1)
+        self.assertTrue(self.q.set_pid("b", 43))
+        self.assertFalse(self.q.set_pid("c", 43))
+        self.assertEqual([j['pid'] for j in self.q.running()], [42, 43])
+
+        self.assertEqual(self.q.finish("a")['id'], "a")
+        self.assertIsNone(self.q.finish("a"))
+        self.assertEqual(self.q.claim()['id'], "c")
+        self.assertEqual(self.q.waiting(), [])
+
+    def test_unlimited(self):
+        self.q = jq.PreservationJobQueue(self.qdir, 0)
+        for id in "abcde":
+            self.q.submit(id, "midas3")
+        for id in "abcde":
+            self.assertEqual(self.q.claim()['id'], id)
+        self.assertEqual(len(self.q.running()), 5)
+
+    def test_reap(self):
+        for id in "abc":
+            self.q.submit(id, "midas3")
+        self.q.claim(1)
+        self.q.claim(2)
+
+        dead = self.q.reap(lambda j: j['pid'] != 1)
+        self.assertEqual([j['id'] for j in dead], ["a"])
+        self.assertEqual([j['id'] for j in self.q.running()], ["b"])
+        self.assertEqual(self.q.reap(lambda j: True), [])
+        self.assertEqual(self.q.position("c"), 1)
+
+
+if __name__ == '__main__':
+    test.main()
@@ -0,0 +1,98 @@
+import os, pdb, sys, json
+import unittest as test
+
+from nistoar.testing import *
+from nistoar.pdr.preserv.service import metrics
+
+def setUpModule():
+    ensure_tmpdir()
+def tearDownModule():
+    rmtmpdir()
+
+class TestStageMetrics(test.TestCase):
+
+    def setUp(self):
+        self.tf = Tempfiles()
+        self.cachedir = self.tf.mkdir("status")
+        self.mets = metrics.StageMetrics(self.cachedir, [1, 10])
+
+    def tearDown(self):
+        self.tf.clean()
+
+    def test_ctor(self):
+        self.assertEqual(self.mets.buckets, [1.0, 10.0])
+        self.assertEqual(self.mets._file, os.path.join(self.cachedir, metrics.METRICS_FILE))
+        self.assertFalse(os.path.exists(self.mets._file))
+        data = self.mets.read()
+        self.assertEqual(data['stages'], {})
+
+        mets = metrics.StageMetrics(self.cachedir)
+        self.assertEqual(mets.buckets, metrics.DEF_BUCKETS)
+
+    def test_record(self):
+        self.mets.record("make_bag", 0.5, bytes=1000, files=4)
+        self.mets.record("make_bag", 5.0)
+        self.mets.record("make_bag", 50.0, failed=True)
+        self.mets.record("serialize", 2.0, bytes=500)
+        self.assertTrue(os.path.exists(self.mets._file))
+
+        data = metrics.StageMetrics(self.cachedir, [1, 10]).read()
+        st = data['stages']['make_bag']
+        self.assertEqual(st['count'], 3)
+        self.assertAlmostEqual(st['sum'], 55.5)
+        self.assertEqual(st['bucket_counts'], [1, 1, 1])
+        self.assertEqual(st['bytes'], 1000)
+        self.assertEqual(st['files'], 4)
+        self.assertEqual(st['failures'], 1)
+        self.assertEqual(data['stages']['serialize']['bucket_counts'], [0, 1, 0])
+
+        # changing the buckets resets the metrics
+        data = metrics.StageMetrics(self.cachedir, [2]).read()
+        self.assertEqual(data['stages'], {})
+
+        self.mets.clear()
+        self.assertFalse(os.path.exists(self.mets._file))
+
+    def test_format_prometheus(self):
+        self.mets.record("make_bag", 0.5, bytes=1000, files=4)
+        self.mets.record("make_bag", 5.0)
+        out = metrics.format_prometheus(self.mets, "test")
+        lines = out.splitlines()
+
+        self.assertIn("# TYPE test_stage_seconds histogram", lines)
+        self.assertIn('test_stage_seconds_bucket{stage="make_bag",le="1.0"} 1', lines)
+        self.assertIn('test_stage_seconds_bucket{stage="make_bag",le="10.0"} 2', lines)
+        self.assertIn('test_stage_seconds_bucket{stage="make_bag",le="+Inf"} 2', lines)
+        self.assertIn('test_stage_seconds_count{stage="make_bag"} 2', lines)
+        self.assertIn('test_stage_seconds_sum{stage="make_bag"} 5.5', lines)
+        self.assertIn('test_stage_bytes_total{stage="make_bag"} 1000', lines)
+        self.assertIn('test_stage_files_total{stage="make_bag"} 4', lines)
+        self.assertIn('test_stage_failures_total{stage="make_bag"} 0', lines)
+
+        # merged metrics
+        other = metrics.StageMetrics(self.tf.mkdir("other"), [1, 10])
+        other.record("make_bag", 20.0)
+        out = metrics.format_prometheus([self.mets, other], "test")
+        lines = out.splitlines()
+        self.assertIn('test_stage_seconds_count{stage="make_bag"} 3', lines)
+        self.assertIn('test_stage_seconds_bucket{stage="make_bag",le="10.0"} 2', lines)
+        self.assertIn('test_stage_seconds_bucket{stage="make_bag",le="+Inf"} 3', lines)
+
+    def test_format_empty(self):
+        out = metrics.format_prometheus([])
+        self.assertIn("# TYPE pdr_preserv_stage_seconds histogram", out)
+        self.assertEqual(len([l for l in out.splitlines() if not l.startswith('#')]), 0)
+
+    def test_format_lock_stats(self):
+        stats = { "status": { "acquired": 3, "slow": 1, "wait_total": 2.5, "wait_max": 2.0,
+                              "hold_total": 0.5, "hold_max": 0.25 } }
+        lines = metrics.format_lock_stats(stats, "test").splitlines()
+        self.assertIn("# TYPE test_lock_acquisitions_total counter", lines)
+        self.assertIn('test_lock_acquisitions_total{class="status"} 3', lines)
+        self.assertIn('test_lock_slow_acquisitions_total{class="status"} 1', lines)
+        self.assertIn('test_lock_wait_seconds_total{class="status"} 2.5', lines)
+        self.assertIn('test_lock_hold_seconds_max{class="status"} 0.25', lines)
+
+
+if __name__ == '__main__':
+    test.main()
@@ -0,0 +1,99 @@
+import os, sys, pdb, json, time, threading
+import unittest as test
+
+from nistoar.testing import *
+from nistoar.pdr.preserv.service import presvlog as plog
+
+class TestPreservationLog(test.TestCase):
+
+    def setUp(self):
+        self.tf = Tempfiles()
+        self.logdir = self.tf.mkdir("logs")
+        self.logfile = os.path.join(self.logdir, "preservation.log")
+        self.log = plog.PreservationLog(self.logfile, 0, 2)
+
+    def tearDown(self):
+        self.tf.clean()
+
+    def make_sublog(self, name, text):
+        out = os.path.join(self.logdir, name)
+        with open(out, 'w') as fd:
+            fd.write(text)
+        return out
+
+    def test_save(self):
+        sub = self.make_sublog("sub1.log", "INFO: goob\nINFO: gurn\n")
+        ent = self.log.save("mds2-1000", sub)
+        self.assertEqual(ent['sipid'], "mds2-1000")
+        self.assertEqual(ent['gen'], 0)
+        self.assertEqual(ent['offset'], 0)
+
+        sub = self.make_sublog("sub2.log", "INFO: hank\n")
+        ent2 = self.log.save("mds2-1001", sub)
+        self.assertEqual(ent2['offset'], ent['length'])
+
+        with open(self.logfile) as fd:
+            text = fd.read()
+        self.assertEqual(text, (plog.SEGMENT_HEADER % "mds2-1000") + "INFO: goob\nINFO: gurn\n" +
+                               (plog.SEGMENT_HEADER % "mds2-1001") + "INFO: hank\n")
+
+        self.assertEqual(len(self.log.segments()), 2)
+        self.assertEqual(self.log.read("mds2-1001"),
+                         (plog.SEGMENT_HEADER % "mds2-1001") + "INFO: hank\n")
+        self.assertIsNone(self.log.read("mds2-1002"))
+
+    def test_read_multiple(self):
+        self.log.save("mds2-1000", self.make_sublog("a.log", "first\n"))
+        self.log.save("mds2-1001", self.make_sublog("b.log", "other\n"))
+        self.log.save("mds2-1000", self.make_sublog("c.log", "second\n"))
+
+        self.assertEqual(len(self.log.segments("mds2-1000")), 2)
+        text = self.log.read("mds2-1000")
+        self.assertIn("first\n", text)
+        self.assertIn("second\n", text)
+        self.assertNotIn("other", text)
+        self.assertEqual(self.log.read("mds2-1000", True),
+                         (plog.SEGMENT_HEADER % "mds2-1000") + "second\n")
+
+    def test_rotate(self):
+        self.log.max_size = 100
+        sub = self.make_sublog("sub.log", "x" * 50 + "\n")
+        for i in range(5):
+            self.log.save("mds2-100%d" % i, sub)
+
+        # each segment is > 50 bytes, so each one starts a new log; only the 2
+        # most recent rotated logs are kept
+        self.assertEqual(self.log._rotated_gens(), [2, 3])
+        self.assertEqual(self.log._current_gen(), 4)
+        self.assertIsNone(self.log.read("mds2-1000"))
+        self.assertIsNone(self.log.read("mds2-1001"))
+        for i in range(2, 5):
+            self.assertIn("x" * 50, self.log.read("mds2-100%d" % i))
+        self.assertEqual([s['sipid'] for s in self.log.segments()],
+                         ["mds2-1002", "mds2-1003", "mds2-1004"])
+        self.assertEqual(self.log.file_for(4), self.logfile)
+        self.assertEqual(self.log.file_for(3), self.logfile + ".3")
+        self.assertIsNone(self.log.file_for(1))
+
+    def test_concurrent(self):
+        subs = [self.make_sublog("s%d.log" % i, ("line %d\n" % i) * 2000) for i in range(6)]
+        threads = [threading.Thread(target=self.log.save, args=("mds2-10%d" % i, subs[i]))
+                   for i in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(self.log.segments()), 6)
+        for i in range(6):
+            self.assertEqual(self.log.read("mds2-10%d" % i),
+                             (plog.SEGMENT_HEADER % ("mds2-10%d" % i)) + ("line %d\n" % i) * 2000)
+    def test_combined_log_path(self):
+        self.assertEqual(plog.combined_log_path({"logdir": self.logdir}), self.logfile)
+        self.assertEqual(plog.combined_log_path({"logdir": self.logdir, "logfile": "p.log"}),
+                         os.path.join(self.logdir, "p.log"))
+        deflogdir = plog.configmod.global_logdir or plog.configmod.determine_default_logdir()
+        self.assertEqual(plog.combined_log_path({}), os.path.join(deflogdir, "preservation.log"))
+
+if __name__ == '__main__':
+    test.main()
@@ -6,7 +6,7 @@ from nistoar.pdr.preserv.service import service as serv
 from nistoar.pdr.preserv.service import status
 from nistoar.pdr.preserv.service.siphandler import SIPHandler, MIDASSIPHandler
 from nistoar.pdr.exceptions import PDRException, StateException
-from nistoar.pdr import config
+from nistoar.pdr import config, validation
 
 # datadir = nistoar/preserv/data
 datadir = os.path.join( os.path.dirname(os.path.dirname(__file__)), "data" )
@@ -280,6 +280,71 @@ class TestThreadedPreservationService(test.TestCase):
         stat = self.svc.status(self.midasid, 'goob')
         self.assertEqual(stat['state'], status.FAILED)
 
+    def test_preserve_queued(self):
+        self.config['job_queue'] = { "max_concurrent": 1, "poll_interval": 0.1 }
+        self.svc = serv.ThreadedPreservationService(self.config)
+
+        # fill the only slot with a job from another (live) process
+        self.svc._queue.submit("goober", "midas")
+        self.svc._queue.claim(os.getppid())
+
+        stat = self.svc.preserve(self.midasid, 'midas', 2)
+        self.assertEqual(stat['state'], status.PENDING)
+        self.assertEqual(stat['queue_position'], 1)
+        stat = self.svc.status(self.midasid, 'midas')
+        self.assertEqual(stat['state'], status.PENDING)
+        self.assertEqual(stat['queue_position'], 1)
+        with self.assertRaises(serv.RerequestException):
+            self.svc.preserve(self.midasid, 'midas', 2)
+
+        # free the slot; the queue monitor should launch the waiting job
+        self.svc._queue.finish("goober")
+        try:
+            for i in range(100):
+                if self.svc._queue.position(self.midasid) is None:
+                    break
+                time.sleep(0.1)
+        finally:
+            for t in threading.enumerate():
+                if t.name == self.midasid:
+                   t.join()
+        stat = self.svc.status(self.midasid, "midas")
+        self.assertEqual(stat['state'], status.SUCCESSFUL)
+        self.assertNotIn('queue_position', stat)
+        self.assertIsNone(self.svc._queue.position(self.midasid))
+
+    def test_recover_fail(self):
+        hndlr = self.svc._make_handler(self.midasid, 'midas')
+        hndlr.set_state(status.IN_PROGRESS)
+        self.svc._queue.submit(self.midasid, "midas")
+        self.svc._queue.claim()
+        self.svc._queue.set_pid(self.midasid, 999999999)
+
+        self.config['job_queue'] = { "resume_interrupted": False }
+        self.svc = serv.ThreadedPreservationService(self.config)
+        self.assertIsNone(self.svc._queue.position(self.midasid))
+        stat = self.svc.status(self.midasid, 'midas')
+        self.assertEqual(stat['state'], status.FAILED)
+        self.assertIn("interrupted", stat['message'])
+
+    def test_recover_resume(self):
+        hndlr = self.svc._make_handler(self.midasid, 'midas')
+        hndlr.set_state(status.IN_PROGRESS)
+        self.svc._queue.submit(self.midasid, "midas")
+        self.svc._queue.claim()
+        self.svc._queue.set_pid(self.midasid, 999999999)
+
+        try:
+            self.svc = serv.ThreadedPreservationService(self.config)
+        finally:
+            for t in threading.enumerate():
+                if t.name == self.midasid:
+                   t.join()
+        stat = self.svc.status(self.midasid, 'midas')
+        self.assertEqual(stat['state'], status.SUCCESSFUL)
+        self.assertEqual(stat['history'][0]['state'], status.IN_PROGRESS)
+        self.assertIsNone(self.svc._queue.position(self.midasid))
+
     def test_requests(self):
         reqs = self.svc.requests()
         self.assertEqual(len(reqs), 0)
@@ -408,6 +473,32 @@ class TestMultiprocPreservationService(test.TestCase):
         self.assertTrue(os.path.exists(os.path.join(self.store,
                                     self.midasid+".1_0_0.mbag0_4-0.zip.sha256")))
         
+    def test_launch_pooled(self):
+        self.config['worker_pool'] = { "size": 1, "max_jobs": 1 }
+        self.svc = serv.MultiprocPreservationService(self.config)
+        try:
+            hndlr = self.svc._make_handler(self.midasid, 'midas')
+            self.assertTrue(hndlr.isready())
+
+            (stat, proc) = self.svc._launch_handler(hndlr, 10)
+            self.assertIsNotNone(proc)
+            self.assertTrue(isinstance(proc, serv.wpool.PoolJob))
+            self.assertNotEqual(proc.pid, os.getpid())
+            proc.join()
+            self.assertFalse(proc.is_alive())
+
+            hndlr.refresh_state()
+            self.assertEqual(hndlr.state, status.SUCCESSFUL)
+            self.assertTrue(os.path.exists(os.path.join(self.store,
+                                               self.midasid+".1_0_0.mbag0_4-0.zip")))
+        finally:
+            self.svc.shutdown(10)
+
+    def test_warm_up(self):
+        validation.validators.clear()
+        self.svc._warm_up()
+        self.assertEqual(len(validation.validators), 2)
+
     def test_subprocess_handle(self):
         try: 
             serv._subprocess_handle(self.svc.cfg, "SUBDIR/pres.log", self.midasid, "MIDAS-SIP", False, 5)
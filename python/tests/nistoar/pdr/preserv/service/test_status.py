@@ -107,6 +107,14 @@ class TestSIPStatusFile(test.TestCase):
         self.assertEqual(d, data)
         self.assertIn('goob', d)
             
+    def test_lock_stats(self):
+        stats = status.LockedFile.stats
+        before = stats.snapshot().get(status.STATUS_LOCK_CLASS, {}).get('acquired', 0)
+        sf = status.SIPStatusFile(self.cachefile)
+        sf.write_data(sf.read_data())
+        status._read_status(self.cachefile)
+        self.assertEqual(stats.snapshot()[status.STATUS_LOCK_CLASS]['acquired'], before+3)
+
 class TestReadWrite(test.TestCase):
 
     cachefile = os.path.join(tmpdir(), "status.json")
@@ -363,6 +371,73 @@ class TestSIPStatus(test.TestCase):
         self.assertEquals(data['user']['state'], status.IN_PROGRESS)
         self.assertEquals(data['user']['message'], "started")
 
+    def test_set_queue_position(self):
+        self.status.set_queue_position(3)
+        data = self.read_data(self.status._cachefile)
+        self.assertEquals(data['user']['state'], status.PENDING)
+        self.assertEquals(data['user']['queue_position'], 3)
+        self.assertIn("position 3", data['user']['message'])
+        self.assertEquals(self.status.user_export()['queue_position'], 3)
+
+        self.status.start()
+        data = self.read_data(self.status._cachefile)
+        self.assertEquals(data['user']['state'], status.IN_PROGRESS)
+        self.assertNotIn('queue_position', data['user'])
+
+    def test_stages(self):
+        self.status.start()
+        self.assertEqual(self.status.data['user']['stages'], [])
+
+        span = self.status.start_stage("make_bag")
+        self.assertEqual(span['name'], "make_bag")
+        self.assertIn('start', span)
+        self.assertNotIn('end', span)
+
+        span = self.status.end_stage("make_bag", bytes=100, files=3)
+        self.assertIn('end', span)
+        self.assertGreaterEqual(span['elapsed'], 0)
+        self.assertEqual(span['bytes'], 100)
+        self.assertEqual(span['files'], 3)
+        self.assertNotIn('failed', span)
+
+        with self.assertRaises(ValueError):
+            self.status.end_stage("make_bag")
+
+        with self.status.stage("serialize") as stg:
+            stg.files = 2
+        try:
+            with self.status.stage("deliver"):
+                raise OSError("oops")
+        except OSError:
+            pass
+
+        data = self.read_data(self.status._cachefile)
+        stages = data['user']['stages']
+        self.assertEqual([s['name'] for s in stages], ["make_bag", "serialize", "deliver"])
+        self.assertEqual(stages[1]['files'], 2)
+        self.assertNotIn('bytes', stages[1])
+        self.assertTrue(stages[2]['failed'])
+
+        # spans are aggregated into the metrics
+        mets = status.StageMetrics(self.cachedir).read()
+        self.assertEqual(mets['stages']['make_bag']['count'], 1)
+        self.assertEqual(mets['stages']['make_bag']['bytes'], 100)
+        self.assertEqual(mets['stages']['deliver']['failures'], 1)
+        self.assertNotIn("_metrics", status.SIPStatus.requests(self.cfg))
+
+        # starting again clears the spans
+        self.status.start()
+        self.assertEqual(self.status.data['user']['stages'], [])
+
+    def test_stages_nometrics(self):
+        self.cfg['metrics'] = False
+        self.status = status.SIPStatus("ffff", self.cfg)
+        self.status.start()
+        with self.status.stage("make_bag"):
+            pass
+        self.assertEqual(len(self.status.data['user']['stages']), 1)
+        self.assertFalse(os.path.exists(os.path.join(self.cachedir, "_metrics.json")))
+
 
 
         
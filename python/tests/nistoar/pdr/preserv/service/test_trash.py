@@ -0,0 +1,104 @@
+import os, sys, pdb, time
+import unittest as test
+
+from nistoar.testing import *
+from nistoar.pdr.preserv.service import trash
+
+def setUpModule():
+    ensure_tmpdir()
+
+def tearDownModule():
+    rmtmpdir()
+
+class TestTrash(test.TestCase):
+
+    def setUp(self):
+        self.tf = Tempfiles()
+        self.workdir = self.tf.mkdir("work")
+        self.trash = trash.Trash({}, self.workdir)
+        self.coll = None
+
+    def tearDown(self):
+        if self.coll:
+            self.coll.stop(5)
+        self.tf.clean()
+
+    def mktree(self, name, nfiles=3):
+        root = os.path.join(self.workdir, name)
+        os.makedirs(os.path.join(root, "data", "sub"))
+        for i in range(nfiles):
+            for d in ["data", "data/sub"]:
+                with open(os.path.join(root, d, "f%d.txt" % i), 'w') as fd:
+                    fd.write("goober!")
+        return root
+
+    def test_ctor(self):
+        self.assertEqual(self.trash.dir, os.path.join(self.workdir, "_trash"))
+        self.assertTrue(os.path.isdir(self.trash.dir))
+        self.assertTrue(self.trash.deferred)
+        self.assertEqual(self.trash.items(), [])
+
+        tr = trash.Trash({"trash_dir": os.path.join(self.workdir, "goob")})
+        self.assertEqual(tr.dir, os.path.join(self.workdir, "goob"))
+        with self.assertRaises(ValueError):
+            trash.Trash({})
+
+    def test_discard(self):
+        bag = self.mktree("bag")
+        self.assertFalse(self.trash.discard(os.path.join(self.workdir, "goob")))
+
+        self.assertTrue(self.trash.discard(bag))
+        self.assertFalse(os.path.exists(bag))
+        items = self.trash.items()
+        self.assertEqual(len(items), 1)
+        self.assertTrue(items[0].endswith(".bag"))
+
+        # discarding a second tree with the same name
+        bag = self.mktree("bag")
+        self.assertTrue(self.trash.discard(bag+'/'))
+        f = os.path.join(self.workdir, "bag.zip")
+        with open(f, 'w') as fd:
+            fd.write("goober!")
+        self.assertTrue(self.trash.discard(f))
+        self.assertFalse(os.path.exists(f))
+        self.assertEqual(len(self.trash.items()), 3)
+        self.assertTrue(self.trash.items()[-1].endswith(".bag.zip"))
+
+        self.assertEqual(self.trash.empty(), 3)
+        self.assertEqual(self.trash.items(), [])
+        self.assertEqual(os.listdir(self.trash.dir), [])
+
+    def test_not_deferred(self):
+        tr = trash.Trash({"deferred": False, "trash_dir": os.path.join(self.workdir, "goob")})
+        bag = self.mktree("bag")
+        self.assertTrue(tr.discard(bag))
+        self.assertFalse(os.path.exists(bag))
+        self.assertFalse(os.path.exists(tr.dir))
+
+    def test_empty_throttled(self):
+        self.trash.max_rate = 100
+        for i in range(3):
+            self.trash.discard(self.mktree("bag%d" % i, 4))
+
+        # each bag has 11 entries; the time limit is checked between bags
+        start = time.time()
+        self.assertEqual(self.trash.empty(max_time=0.05), 1)
+        self.assertGreaterEqual(time.time() - start, 0.09)
+        self.assertEqual(len(self.trash.items()), 2)
+        self.assertTrue(self.trash.items()[0].endswith(".bag1"))
+
+    def test_collector(self):
+        # a restarted collector finds what was left in the trash
+        self.trash.discard(self.mktree("bag0"))
+        self.coll = self.trash.start_collector()
+        self.trash.discard(self.mktree("bag1"))
+        for i in range(50):
+            if not self.trash.items():
+                break
+            time.sleep(0.1)
+        self.assertEqual(self.trash.items(), [])
+        self.coll.stop(5)
+        self.assertFalse(self.coll.is_alive())
+
+if __name__ == '__main__':
+    test.main()
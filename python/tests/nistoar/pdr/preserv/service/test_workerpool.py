@@ -0,0 +1,72 @@
+import os, pdb, sys, time
+import unittest as test
+
+from nistoar.pdr.preserv.service import workerpool as wp
+
+def _run(job):
+    if isinstance(job, float):
+        time.sleep(job)
+    return (os.getpid(), job)
+
+def _worker(tag, conn, maxjobs):
+    wp.serve_jobs(conn, _run, maxjobs)
+
+class TestWorkerPool(test.TestCase):
+
+    def setUp(self):
+        self.pool = wp.WorkerPool(_worker, ("test",), size=2, maxjobs=2)
+
+    def tearDown(self):
+        self.pool.shutdown(5)
+
+    def test_ctor(self):
+        self.assertEqual(self.pool.size, 2)
+        self.assertEqual(self.pool.maxjobs, 2)
+        self.assertEqual(self.pool.workers, 0)
+        self.assertEqual(self.pool.busy, 0)
+
+    def test_start(self):
+        self.pool.start()
+        self.assertEqual(self.pool.workers, 2)
+        self.assertEqual(self.pool.busy, 0)
+        self.pool.shutdown(5)
+        self.assertEqual(self.pool.workers, 0)
+
+    def test_submit(self):
+        j1 = self.pool.submit(0.5, "a")
+        j2 = self.pool.submit(0.5, "b")
+        self.assertIsNotNone(j1)
+        self.assertIsNotNone(j2)
+        self.assertNotEqual(j1.pid, j2.pid)
+        self.assertTrue(j1.is_alive())
+        self.assertEqual(self.pool.busy, 2)
+
+        # all workers are busy
+        self.assertIsNone(self.pool.submit(0.5, "c"))
+
+        j1.join(5)
+        j2.join(5)
+        self.assertFalse(j1.is_alive())
+        self.assertFalse(j2.is_alive())
+        self.assertEqual(self.pool.busy, 0)
+        self.assertEqual(j1._worker.last_result, (j1.pid, 0.5))
+
+    def test_recycle(self):
+        pids = set()
+        for i in range(4):
+            job = self.pool.submit(0.1*i, i)
+            self.assertIsNotNone(job)
+            job.join(5)
+            pids.add(job.pid)
+
+        # each worker is replaced after 2 jobs; with sequential submission,
+        # the first worker is reused until it retires.
+        self.assertEqual(len(pids), 2)
+        job = self.pool.submit(0.1, "x")
+        job.join(5)
+        self.assertNotIn(job.pid, pids)
+        self.assertEqual(self.pool.workers, 2)
+
+
+if __name__ == '__main__':
+    test.main()
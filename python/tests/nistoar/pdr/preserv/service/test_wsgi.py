@@ -289,6 +289,38 @@ class TestApp(test.TestCase):
         self.assertTrue(isinstance(data, list))
         self.assertEqual(len(data), 0)
 
+    def test_metrics(self):
+        req = {
+            'PATH_INFO': '/metrics',
+            'REQUEST_METHOD': 'GET'
+        }
+
+        body = self.svc(req, self.start)
+        self.assertIn("200", self.resp[0])
+        self.assertIn("Content-Type: text/plain; version=0.0.4; charset=utf-8", self.resp)
+        self.assertIn("# TYPE pdr_preserv_stage_seconds histogram", body[0])
+        self.assertNotIn("make_bag", body[0])
+
+        self.resp = []
+        req = {
+            'PATH_INFO': '/midas/'+self.midasid+'/',
+            'REQUEST_METHOD': 'PUT'
+        }
+        body = self.svc(req, self.start)
+        self.assertIn("201", self.resp[0])
+        data = json.loads(body[0])
+        self.assertIn("make_bag", [s['name'] for s in data['stages']])
+
+        self.resp = []
+        req = {
+            'PATH_INFO': '/metrics',
+            'REQUEST_METHOD': 'GET'
+        }
+        body = self.svc(req, self.start)
+        self.assertIn("200", self.resp[0])
+        self.assertIn('pdr_preserv_stage_seconds_count{stage="make_bag"} 1', body[0])
+        self.assertIn('pdr_preserv_stage_seconds_count{stage="serialize"} 1', body[0])
+
     def test_bad_put(self):
         req = {
             'PATH_INFO': '/',
@@ -0,0 +1,132 @@
+import os, sys, logging, argparse, pdb, time, json, shutil
+import unittest as test
+from copy import deepcopy
+
+from nistoar.testing import *
+from nistoar.pdr import cli
+from nistoar.pdr.publish import cmd as pub
+from nistoar.pdr.publish.cmd import batch
+from nistoar.pdr.preserv.bagit import NISTBag
+
+testdir = os.path.dirname(os.path.abspath(__file__))
+pdrmoddir = os.path.dirname(os.path.dirname(testdir))
+datadir = os.path.join(pdrmoddir, "preserv", "data")
+
+class TestBatchCmd(test.TestCase):
+
+    def setUp(self):
+        self.tf = Tempfiles()
+        self.workdir = self.tf.mkdir("work")
+        self.config = {}
+        self.cmd = cli.PDRCLI()
+        self.cmd.load_subcommand(pub)
+
+        for aipid in "pdr2210 pdr2211".split():
+            shutil.copytree(os.path.join(datadir, "metadatabag"), os.path.join(self.workdir, aipid))
+        self.report = os.path.join(self.workdir, batch.DEF_REPORT_FILE)
+
+    def tearDown(self):
+        self.tf.clean()
+
+    def version_of(self, aipid):
+        return NISTBag(os.path.join(self.workdir, aipid)).nerd_metadata_for('', False)['version']
+
+    def test_parse(self):
+        args = self.cmd.parse_args("-q pub batch -i pdr2210,pdr2211 -i pdr2212 -j 3 setver -m".split())
+        self.assertEqual(args.cmd, "pub")
+        self.assertEqual(args.pub_subcmd, "batch")
+        self.assertEqual(args.aipids, ["pdr2210,pdr2211", "pdr2212"])
+        self.assertEqual(args.workers, 3)
+        self.assertFalse(args.resume)
+        self.assertEqual(args.subcmd, ["setver", "-m"])
+        self.assertEqual(batch.select_aipids(args), ["pdr2210", "pdr2211", "pdr2212"])
+
+        args = self.cmd.parse_args("pub batch -d goob -p 11$ -R -- fix topics -V".split())
+        self.assertEqual(args.fromdir, "goob")
+        self.assertEqual(args.pattern, "11$")
+        self.assertTrue(args.resume)
+        self.assertEqual(args.subcmd, ["--", "fix", "topics", "-V"])
+
+    def test_split_command(self):
+        suite = batch._make_pub_suite(argparse.ArgumentParser())
+        self.assertEqual(batch._split_command(suite, ["fix", "topics", "-V"]),
+                         (["fix", "topics"], ["-V"]))
+        self.assertEqual(batch._split_command(suite, ["setver", "-m"]), (["setver"], ["-m"]))
+        self.assertEqual(batch._split_command(suite, ["goob", "-m"]), ([], ["goob", "-m"]))
+
+    def test_aipids_in_dir(self):
+        for name in "pdr2212.1_0_0.mbag0_4-0.zip pdr2212.1_1_0.mbag0_4-3.zip junk.txt".split():
+            with open(os.path.join(self.workdir, name), 'w') as fd:
+                fd.write("\n")
+        self.assertEqual(batch.aipids_in_dir(self.workdir), ["pdr2210", "pdr2211", "pdr2212"])
+
+    def test_execute(self):
+        argline = "-q -w " + self.workdir + " pub batch -i pdr2210,pdr2211,pdr2299 -j 2 setver -m"
+        with self.assertRaises(cli.PDRCommandFailure) as ctx:
+            self.cmd.execute(argline.split(), deepcopy(self.config))
+        self.assertIn("1 AIP failed", str(ctx.exception))
+
+        self.assertEqual(self.version_of("pdr2210"), "1.0.1")
+        self.assertEqual(self.version_of("pdr2211"), "1.0.1")
+        with open(self.report) as fd:
+            rep = json.load(fd)
+        self.assertEqual(rep['command'], ["setver", "-m"])
+        self.assertEqual(rep['summary'], {"succeeded": 2, "failed": 1})
+        self.assertEqual(rep['results']['pdr2210']['status'], "succeeded")
+        self.assertEqual(rep['results']['pdr2299']['status'], "failed")
+        self.assertIn("exit_status", rep['results']['pdr2299'])
+
+        # resume after fixing the problem:  only the failed AIP is re-processed
+        shutil.copytree(os.path.join(datadir, "metadatabag"), os.path.join(self.workdir, "pdr2299"))
+        argline = "-q -w " + self.workdir + " pub batch -R setver -m"
+        self.cmd.execute(argline.split(), deepcopy(self.config))
+        self.assertEqual(self.version_of("pdr2210"), "1.0.1")
+        self.assertEqual(self.version_of("pdr2299"), "1.0.1")
+        with open(self.report) as fd:
+            rep = json.load(fd)
+        self.assertEqual(rep['summary'], {"succeeded": 3, "failed": 0})
+
+        # resuming requires the same subcommand
+        argline = "-q -w " + self.workdir + " pub batch -R setver -d"
+        with self.assertRaises(cli.PDRCommandFailure):
+            self.cmd.execute(argline.split(), deepcopy(self.config))
+
+    def test_resume_interrupted(self):
+        # simulate an interruption after the first AIP is processed
+        run_batch = batch.run_batch
+        def interrupted(runner, aipids, report, workers=1, log=None):
+            run_batch(runner, aipids[:1], report, workers, log)
+            raise cli.PDRCommandFailure(batch.default_name, "Batch interrupted", 4)
+        batch.run_batch = interrupted
+        try:
+            argline = "-q -w " + self.workdir + " pub batch -i pdr2210,pdr2211 setver -m"
+            with self.assertRaises(cli.PDRCommandFailure):
+                self.cmd.execute(argline.split(), deepcopy(self.config))
+        finally:
+            batch.run_batch = run_batch
+
+        self.assertEqual(self.version_of("pdr2210"), "1.0.1")
+        self.assertEqual(self.version_of("pdr2211"), "1.0.0")
+        with open(self.report) as fd:
+            rep = json.load(fd)
+        self.assertEqual(rep['planned'], ["pdr2210", "pdr2211"])
+        self.assertEqual(list(rep['results'].keys()), ["pdr2210"])
+
+        # resuming processes the AIP that was never started (and only it)
+        argline = "-q -w " + self.workdir + " pub batch -R setver -m"
+        self.cmd.execute(argline.split(), deepcopy(self.config))
+        self.assertEqual(self.version_of("pdr2210"), "1.0.1")
+        self.assertEqual(self.version_of("pdr2211"), "1.0.1")
+        with open(self.report) as fd:
+            rep = json.load(fd)
+        self.assertEqual(rep['summary'], {"succeeded": 2, "failed": 0})
+
+    def test_execute_badcmd(self):
+        argline = "-q -w " + self.workdir + " pub batch -i pdr2210 goober"
+        with self.assertRaises(cli.PDRCommandFailure):
+            self.cmd.execute(argline.split(), deepcopy(self.config))
+        self.assertEqual(self.version_of("pdr2210"), "1.0.0")
+
+
+if __name__ == '__main__':
+    test.main()
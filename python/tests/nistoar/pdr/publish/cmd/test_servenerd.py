@@ -57,6 +57,25 @@ class TestServenerdCmd(test.TestCase):
         self.assertIn('@id', nerd)
         self.assertIn('components', nerd)
 
+        # exported just as the publishing service does
+        self.assertTrue(os.path.isfile(outrec+".gz"))
+        with open(os.path.join(self.workdir, "_manifest.json")) as fd:
+            mf = json.load(fd)
+        self.assertIn("metadatabag", mf)
+        self.assertEqual(mf["metadatabag"]["size"], os.stat(outrec).st_size)
+
+    def test_execute_nocompress(self):
+        bagdir = os.path.join(datadir, "metadatabag")
+        self.config['nerdm_serve_compress'] = False
+        argline = "-q -w "+self.workdir+" servenerd "+bagdir+" -n "+self.workdir
+        self.cmd.execute(argline.split(), deepcopy(self.config))
+
+        outrec = os.path.join(self.workdir, "metadatabag.json")
+        self.assertTrue(os.path.isfile(outrec))
+        self.assertFalse(os.path.exists(outrec+".gz"))
+        with open(os.path.join(self.workdir, "_manifest.json")) as fd:
+            self.assertIn("metadatabag", json.load(fd))
+
 
 
 if __name__ == '__main__':
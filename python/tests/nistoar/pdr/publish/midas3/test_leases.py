@@ -0,0 +1,105 @@
+import os, sys, pdb, time, threading
+import unittest as test
+
+from nistoar.testing import *
+from nistoar.pdr import utils
+from nistoar.pdr.publish.midas3 import leases
+
+def setUpModule():
+    ensure_tmpdir()
+
+def tearDownModule():
+    rmtmpdir()
+
+class TestInterProcessRLock(test.TestCase):
+
+    def setUp(self):
+        self.tf = Tempfiles()
+        self.lockfile = self.tf.track("test.lock")
+
+    def tearDown(self):
+        self.tf.clean()
+
+    def test_reentrant(self):
+        lk = leases.InterProcessRLock(self.lockfile)
+        with lk:
+            with lk:
+                self.assertEqual(lk._depth, 2)
+            self.assertIsNotNone(lk._fd)
+        self.assertEqual(lk._depth, 0)
+        self.assertIsNone(lk._fd)
+
+    def test_excludes(self):
+        lk1 = leases.InterProcessRLock(self.lockfile)
+        lk2 = leases.InterProcessRLock(self.lockfile)
+        order = []
+        def other():
+            with lk2:
+                order.append("other")
+
+        with lk1:
+            t = threading.Thread(target=other)
+            t.start()
+            time.sleep(0.1)
+            order.append("this")
+        t.join(5)
+        self.assertEqual(order, ["this", "other"])
+
+class TestLeaseManager(test.TestCase):
+
+    def setUp(self):
+        self.tf = Tempfiles()
+        self.leasedir = os.path.join(self.tf.root, "leases")
+        self.tf.track("leases")
+        self.mgr = leases.LeaseManager(self.leasedir, 0.3)
+        self.other = leases.LeaseManager(self.leasedir, 0.3)
+        self.other.owner = "otherhost:1"
+
+    def tearDown(self):
+        self.mgr._held = {}
+        self.other._held = {}
+        self.tf.clean()
+
+    def test_acquire_release(self):
+        self.assertTrue(os.path.isdir(self.leasedir))
+        self.assertIsNone(self.mgr.holder("mds2-1491"))
+        self.assertTrue(self.mgr.acquire("mds2-1491"))
+        self.assertTrue(self.mgr.holds("mds2-1491"))
+        self.assertTrue(self.mgr.acquire("mds2-1491"))
+        self.assertEqual(self.mgr.holder("mds2-1491")['owner'], self.mgr.owner)
+
+        self.assertFalse(self.other.acquire("mds2-1491"))
+        self.assertTrue(self.other.acquire("mds2-1492"))
+
+        self.mgr.release("mds2-1491")
+        self.assertFalse(self.mgr.holds("mds2-1491"))
+        self.assertIsNone(self.mgr.holder("mds2-1491"))
+        self.assertTrue(self.other.acquire("mds2-1491"))
+
+        # releasing a lease not held does nothing
+        self.mgr.release("mds2-1491")
+        self.assertEqual(self.mgr.holder("mds2-1491")['owner'], "otherhost:1")
+
+    def test_heartbeat(self):
+        self.assertTrue(self.mgr.acquire("mds2-1491"))
+        time.sleep(0.5)
+        # still held, thanks to renewal
+        self.assertFalse(self.other.acquire("mds2-1491"))
+        self.assertTrue(self.mgr.renew("mds2-1491"))
+        self.mgr.release("mds2-1491")
+        self.assertFalse(self.mgr.renew("mds2-1491"))
+
+    def test_expire(self):
+        self.assertTrue(self.other.acquire("mds2-1491"))
+        self.other._held = {}    # simulate the death of the owner
+        self.assertFalse(self.mgr.acquire("mds2-1491"))
+        self.assertTrue(self.mgr.acquire("mds2-1491", 1.0))
+        self.assertEqual(self.mgr.holder("mds2-1491")['owner'], self.mgr.owner)
+
+        # the original owner has lost its lease
+        self.other._held["mds2-1491"] = "goob"
+        self.assertFalse(self.other.renew("mds2-1491"))
+        self.assertFalse(self.other.holds("mds2-1491"))
+
+if __name__ == '__main__':
+    test.main()
@@ -1,4 +1,4 @@
-import os, sys, pdb, shutil, logging, json
+import os, sys, pdb, shutil, logging, json, time
 from StringIO import StringIO
 import unittest as test
 from nistoar.testing import *
@@ -121,6 +121,103 @@ class TestApp(test.TestCase):
             if 'downloadURL' in cmp:
                 self.assertNotIn("/od/ds/", cmp['downloadURL'])
         
+    def test_etag(self):
+        req = {
+            'PATH_INFO': '/3A1EE2F169DD3B8CE0531A570681DB5D1491',
+            'REQUEST_METHOD': 'GET'
+        }
+        body = self.svc(req, self.start)
+        self.assertIn("200", self.resp[0])
+        etag = [r for r in self.resp if r.startswith("ETag:")]
+        self.assertEqual(len(etag), 1)
+        etag = etag[0].split(': ', 1)[1]
+        self.assertTrue(etag.startswith('"'))
+        self.assertEqual(len([r for r in self.resp if r.startswith("Last-Modified:")]), 1)
+        self.assertEqual(len(self.svc.reccache), 1)
+
+        # same response from the cache
+        self.resp = []
+        body2 = self.svc(req, self.start)
+        self.assertIn("200", self.resp[0])
+        self.assertEqual(body2, body)
+        self.assertIn("ETag: "+etag, self.resp)
+
+        self.resp = []
+        req['HTTP_IF_NONE_MATCH'] = etag
+        body = self.svc(req, self.start)
+        self.assertIn("304", self.resp[0])
+        self.assertEqual(body, [])
+        self.assertIn("ETag: "+etag, self.resp)
+
+        self.resp = []
+        req['HTTP_IF_NONE_MATCH'] = '"goob", W/'+etag
+        body = self.svc(req, self.start)
+        self.assertIn("304", self.resp[0])
+
+        self.resp = []
+        req['HTTP_IF_NONE_MATCH'] = '"goob"'
+        body = self.svc(req, self.start)
+        self.assertIn("200", self.resp[0])
+        self.assertGreater(len(body), 0)
+
+    def test_readme_etag(self):
+        req = {
+            'PATH_INFO': '/3A1EE2F169DD3B8CE0531A570681DB5D1491/README.txt',
+            'REQUEST_METHOD': 'GET',
+            'QUERY_STRING': "auto=true"
+        }
+        body = self.svc(req, self.start)
+        self.assertIn("200", self.resp[0])
+        etag = [r for r in self.resp if r.startswith("ETag:")][0].split(': ', 1)[1]
+
+        self.resp = []
+        req['HTTP_IF_NONE_MATCH'] = etag
+        body = self.svc(req, self.start)
+        self.assertIn("304", self.resp[0])
+
+        # brief version has a different tag
+        self.resp = []
+        req['QUERY_STRING'] = "auto=true&flags=b"
+        body = self.svc(req, self.start)
+        self.assertIn("200", self.resp[0])
+        self.assertNotIn("ETag: "+etag, self.resp)
+
+    def test_cache_update(self):
+        nerddir = self.tf.mkdir("nerd")
+        nerdfile = os.path.join(nerddir, self.midasid+".json")
+        shutil.copy(os.path.join(datadir, self.midasid+".json"), nerdfile)
+        self.config['prepub_nerd_dir'] = nerddir
+        self.svc = wsgi.app(self.config)
+        
+        req = {
+            'PATH_INFO': '/'+self.midasid,
+            'REQUEST_METHOD': 'GET'
+        }
+        body = self.svc(req, self.start)
+        self.assertIn("200", self.resp[0])
+        self.assertNotEqual(json.loads(body[0])['title'], "Goober")
+        etag = [r for r in self.resp if r.startswith("ETag:")][0].split(': ', 1)[1]
+
+        with open(nerdfile) as fd:
+            data = json.load(fd)
+        data['title'] = "Goober"
+        with open(nerdfile, 'w') as fd:
+            json.dump(data, fd, indent=2)
+        os.utime(nerdfile, (time.time()+2, time.time()+2))
+
+        self.resp = []
+        req['HTTP_IF_NONE_MATCH'] = etag
+        body = self.svc(req, self.start)
+        self.assertIn("200", self.resp[0])
+        self.assertEqual(json.loads(body[0])['title'], "Goober")
+        self.assertNotIn("ETag: "+etag, self.resp)
+
+        os.remove(nerdfile)
+        self.resp = []
+        body = self.svc(req, self.start)
+        self.assertIn("404", self.resp[0])
+        self.assertEqual(len(self.svc.reccache), 0)
+
     def test_head_good_id(self):
         req = {
             'PATH_INFO': '/3A1EE2F169DD3B8CE0531A570681DB5D1491',
@@ -385,6 +482,55 @@ class TestApp(test.TestCase):
         self.assertNotIn("###", body)
         
 
+class TestRecordCache(test.TestCase):
+
+    def setUp(self):
+        self.tf = Tempfiles()
+        self.wrkdir = self.tf.mkdir("cache")
+        self.files = []
+        for i in range(3):
+            self.files.append(os.path.join(self.wrkdir, "rec%d.json" % i))
+            with open(self.files[-1], 'w') as fd:
+                json.dump({"@id": "rec%d" % i}, fd)
+        self.cache = wsgi.RecordCache(2, 60)
+
+    def tearDown(self):
+        self.tf.clean()
+
+    def test_get(self):
+        entry = self.cache.get(self.files[0])
+        self.assertEqual(entry.data, {"@id": "rec0"})
+        self.assertEqual(entry.path, self.files[0])
+        self.assertTrue(entry.last_modified.endswith("GMT"))
+        self.assertIs(self.cache.get(self.files[0]), entry)
+        self.assertEqual(len(self.cache), 1)
+
+        self.assertIsNone(self.cache.get(os.path.join(self.wrkdir, "goob.json")))
+
+    def test_lru(self):
+        e0 = self.cache.get(self.files[0])
+        e1 = self.cache.get(self.files[1])
+        self.assertIs(self.cache.get(self.files[0]), e0)
+        e2 = self.cache.get(self.files[2])
+        self.assertEqual(len(self.cache), 2)
+        self.assertIs(self.cache.get(self.files[0]), e0)
+        self.assertIsNot(self.cache.get(self.files[1]), e1)
+
+        self.cache.clear()
+        self.assertEqual(len(self.cache), 0)
+
+    def test_refresh(self):
+        self.cache.refresh = 0
+        e0 = self.cache.get(self.files[0])
+        time.sleep(0.01)
+        self.assertIsNot(self.cache.get(self.files[0]), e0)
+
+    def test_nocache(self):
+        self.cache = wsgi.RecordCache(0)
+        e0 = self.cache.get(self.files[0])
+        self.assertEqual(e0.data, {"@id": "rec0"})
+        self.assertEqual(len(self.cache), 0)
+
 
 if __name__ == '__main__':
     test.main()
@@ -0,0 +1,87 @@
+import os, sys, pdb, json, gzip, time
+import unittest as test
+
+from nistoar.testing import *
+from nistoar.pdr.publish.midas3 import nrdexport as nx
+
+def setUpModule():
+    ensure_tmpdir()
+
+def tearDownModule():
+    rmtmpdir()
+
+class TestNERDmExporter(test.TestCase):
+
+    def setUp(self):
+        self.tf = Tempfiles()
+        self.nrddir = os.path.join(self.tf.root, "nrdserv")
+        self.tf.track("nrdserv")
+        self.exp = nx.NERDmExporter(self.nrddir)
+        self.nerdm = {"@id": "ark:/88434/mds2-1000", "ediid": "mds2-1000", "title": "Goob"}
+
+    def tearDown(self):
+        self.tf.clean()
+
+    def test_export(self):
+        self.assertTrue(os.path.isdir(self.nrddir))
+        self.assertEqual(self.exp.manifest(), {})
+
+        self.assertTrue(self.exp.export(self.nerdm, "mds2-1000"))
+        jsonf = os.path.join(self.nrddir, "mds2-1000.json")
+        self.assertEqual(self.exp.file_for("mds2-1000"), jsonf)
+        with open(jsonf) as fd:
+            content = fd.read()
+        self.assertNotIn("\n", content)
+        self.assertEqual(json.loads(content), self.nerdm)
+
+        gz = gzip.open(jsonf+".gz")
+        try:
+            self.assertEqual(gz.read(), content)
+        finally:
+            gz.close()
+
+        ent = self.exp.manifest()["mds2-1000"]
+        self.assertEqual(ent['size'], len(content))
+        self.assertEqual(ent['gzsize'], os.stat(jsonf+".gz").st_size)
+        self.assertEqual(ent['mtime'], os.stat(jsonf).st_mtime)
+        self.assertEqual(len(ent['sha256']), 64)
+
+        # no temporary files left behind
+        self.assertEqual(sorted([f for f in os.listdir(self.nrddir) if not f.endswith(".lock")]),
+                         ["_manifest.json", "mds2-1000.json", "mds2-1000.json.gz"])
+
+    def test_unchanged(self):
+        self.assertTrue(self.exp.export(self.nerdm, "mds2-1000"))
+        jsonf = self.exp.file_for("mds2-1000")
+        os.utime(jsonf, (1000, 1000))
+        self.assertFalse(self.exp.export(dict(self.nerdm), "mds2-1000"))
+        self.assertEqual(os.stat(jsonf).st_mtime, 1000)
+
+        self.nerdm['title'] = "Gurn"
+        self.assertTrue(self.exp.export(self.nerdm, "mds2-1000"))
+        self.assertNotEqual(os.stat(jsonf).st_mtime, 1000)
+
+        # a missing file is restored even if the content is unchanged
+        os.remove(jsonf+".gz")
+        self.assertTrue(self.exp.export(self.nerdm, "mds2-1000"))
+        self.assertTrue(os.path.exists(jsonf+".gz"))
+
+    def test_nocompress(self):
+        self.exp.export(self.nerdm, "mds2-1000")
+        self.exp = nx.NERDmExporter(self.nrddir, False)
+        self.nerdm['title'] = "Gurn"
+        self.assertTrue(self.exp.export(self.nerdm, "mds2-1000"))
+        self.assertFalse(os.path.exists(self.exp.file_for("mds2-1000")+".gz"))
+        self.assertNotIn('gzsize', self.exp.manifest()["mds2-1000"])
+
+    def test_remove(self):
+        self.exp.export(self.nerdm, "mds2-1000")
+        self.exp.export(self.nerdm, "mds2-1001")
+        self.assertTrue(self.exp.remove("mds2-1000"))
+        self.assertFalse(os.path.exists(self.exp.file_for("mds2-1000")))
+        self.assertFalse(os.path.exists(self.exp.file_for("mds2-1000")+".gz"))
+        self.assertEqual(list(self.exp.manifest().keys()), ["mds2-1001"])
+        self.assertFalse(self.exp.remove("mds2-1000"))
+
+if __name__ == '__main__':
+    test.main()
@@ -0,0 +1,94 @@
+import os, sys, pdb, json
+from StringIO import StringIO
+import unittest as test
+
+from nistoar.testing import *
+from nistoar.pdr.publish.midas3 import reqbody
+
+def setUpModule():
+    ensure_tmpdir()
+
+def tearDownModule():
+    rmtmpdir()
+
+class TestSpoolBody(test.TestCase):
+
+    def setUp(self):
+        self.tf = Tempfiles()
+        self.spooldir = self.tf.mkdir("spool")
+        self.text = json.dumps({"identifier": "goob", "title": "gurn"*100})
+
+    def tearDown(self):
+        self.tf.clean()
+
+    def test_no_input(self):
+        self.assertIsNone(reqbody.spool_body({}))
+
+    def test_small(self):
+        env = { 'wsgi.input': StringIO(self.text) }
+        body = reqbody.spool_body(env, threshold=10000, tmpdir=self.spooldir)
+        self.assertEqual(json.load(body)['identifier'], "goob")
+        self.assertIs(env['wsgi.input'], body)
+        self.assertEqual(os.listdir(self.spooldir), [])
+
+        # a second call returns the same buffer, rewound
+        self.assertIs(reqbody.spool_body(env), body)
+        self.assertEqual(body.read(), self.text)
+
+    def test_spooled_to_disk(self):
+        env = { 'wsgi.input': StringIO(self.text) }
+        body = reqbody.spool_body(env, threshold=100, tmpdir=self.spooldir)
+        self.assertTrue(body._rolled)
+        self.assertEqual(json.load(body)['title'], "gurn"*100)
+        body.close()
+
+    def test_content_length(self):
+        env = { 'wsgi.input': StringIO(self.text+"goober"),
+                'CONTENT_LENGTH': str(len(self.text)) }
+        body = reqbody.spool_body(env)
+        self.assertEqual(body.read(), self.text)
+
+    def test_too_large(self):
+        env = { 'wsgi.input': StringIO(self.text),
+                'CONTENT_LENGTH': str(len(self.text)) }
+        with self.assertRaises(reqbody.RequestTooLarge):
+            reqbody.spool_body(env, 100)
+        self.assertEqual(env['wsgi.input'].tell(), 0)
+
+        # no declared length
+        del env['CONTENT_LENGTH']
+        with self.assertRaises(reqbody.RequestTooLarge):
+            reqbody.spool_body(env, 100)
+        self.assertNotIn(reqbody.SPOOLED_BODY_KEY, env)
+
+        # no limit
+        body = reqbody.spool_body({ 'wsgi.input': StringIO(self.text) }, 0, 100)
+        self.assertEqual(body.read(), self.text)
+
+        # a partially read body stays rejected
+        with self.assertRaises(reqbody.RequestTooLarge):
+            reqbody.spool_body(env, 0)
+
+    def test_too_large_after_spooled(self):
+        env = { 'wsgi.input': StringIO(self.text) }
+        body = reqbody.spool_body(env, None)
+        self.assertEqual(body.read(), self.text)
+
+        # the limit applies to a body spooled earlier without one
+        with self.assertRaises(reqbody.RequestTooLarge) as cm:
+            reqbody.spool_body(env, 100)
+        self.assertEqual(cm.exception.size, len(self.text))
+        self.assertIs(reqbody.spool_body(env, len(self.text)), body)
+        self.assertEqual(body.read(), self.text)
+
+    def test_body_excerpt(self):
+        env = { 'wsgi.input': StringIO(self.text) }
+        self.assertEqual(reqbody.body_excerpt(env), "")
+        body = reqbody.spool_body(env)
+        body.read(5)
+        self.assertEqual(reqbody.body_excerpt(env, 10), self.text[:10]+"...")
+        self.assertEqual(reqbody.body_excerpt(env), self.text)
+        self.assertEqual(body.tell(), 5)
+
+if __name__ == '__main__':
+    test.main()
@@ -7,6 +7,7 @@ from copy import deepcopy
 from nistoar.testing import *
 from nistoar.pdr import utils
 from nistoar.pdr.publish.midas3 import service as mdsvc
+from nistoar.pdr.publish.midas3 import leases
 from nistoar.pdr.preserv.bagit import builder as bldr
 from nistoar.pdr.preserv.bagit import NISTBag
 from ejsonschema import ValidationError
@@ -68,6 +69,7 @@ class TestMIDAS3PublishingService(test.TestCase):
 
     def tearDown(self):
         self.svc._drop_all_workers(300)
+        self.svc.shutdown(5)
         self.tf.clean()
 
     def test_ctor(self):
@@ -80,6 +82,14 @@ class TestMIDAS3PublishingService(test.TestCase):
 
         self.assertIsNotNone(self.svc._podvalid8r)
 
+    def test_shutdown(self):
+        self.assertEqual(len(self.svc._collectors), 1)
+        coll = self.svc._collectors[0]
+        self.assertTrue(coll.is_alive())
+        self.svc.shutdown(5)
+        self.assertFalse(coll.is_alive())
+        self.assertEqual(self.svc._collectors, [])
+
     def test_get_bagging_thread(self):
         bagdir = os.path.join(self.svc.mddir, "mds2-1491")
         self.assertTrue(not os.path.exists(bagdir))
@@ -250,9 +260,14 @@ class TestMIDAS3PublishingService(test.TestCase):
         self.assertTrue(not os.path.exists(os.path.join(self.nrddir, "pdr0-1000.json")))
         nerdm = {"foo": "bar", "ediid": "pdr0-1000"}
 
-        self.svc.serve_nerdm(nerdm, "gramma")
+        self.assertTrue(self.svc.serve_nerdm(nerdm, "gramma"))
         self.assertTrue(os.path.isfile(os.path.join(self.nrddir, "gramma.json")))
+        self.assertTrue(os.path.isfile(os.path.join(self.nrddir, "gramma.json.gz")))
         self.assertTrue(not os.path.exists(os.path.join(self.nrddir, "pdr0-1000.json")))
+        self.assertIn("gramma", self.svc.nrdexporter.manifest())
+
+        # unchanged record is not rewritten
+        self.assertFalse(self.svc.serve_nerdm(nerdm, "gramma"))
 
         # see if we properly padded the record
         nerd = utils.read_json(os.path.join(self.nrddir, "gramma.json"))
@@ -314,6 +329,93 @@ class TestMIDAS3PublishingService(test.TestCase):
         self.assertTrue(not os.path.isdir(os.path.join(bagdir,"metadata","sim++.json")))
         self.assertTrue(os.path.isdir(os.path.join(bagdir,"metadata","sim.json")))
 
+    def test_leased_elsewhere(self):
+        w = self.svc._get_bagging_worker(self.midasid)
+        self.assertTrue(os.path.isdir(self.svc.leases.dir))
+
+        # another process is processing this dataset
+        other = leases.LeaseManager(self.svc.leases.dir)
+        other.owner = "otherhost:1"
+        self.assertTrue(other.acquire(w.name))
+
+        pod = utils.read_json(os.path.join(w.bagger.sip.revdatadir, "_pod.json"))
+
+        # a synchronous update cannot be applied while the other process holds the lease
+        self.svc._lease_wait = 0.2
+        with self.assertRaises(mdsvc.DatasetBusy):
+            self.svc.update_ds_with_pod(pod, False)
+        self.assertFalse(os.path.exists(w.next_pod))
+        with self.assertRaises(mdsvc.DatasetBusy):
+            self.svc.delete(self.midasid)
+
+        # an asynchronous one is queued for the other process to process
+        self.svc.update_ds_with_pod(pod)
+        self.assertTrue(os.path.exists(w.next_pod))
+        self.assertFalse(os.path.exists(w.bagger.bagdir))
+        self.assertFalse(w.is_working())
+        self.assertNotIn(self.midasid, self.svc._bagging_workers)
+
+        # the other process dies without releasing its lease
+        self.svc.restart_workers()
+        self.assertTrue(os.path.exists(w.next_pod))
+        self.assertNotIn(self.midasid, self.svc._bagging_workers)
+        lease = utils.read_json(os.path.join(other.dir, w.name+".json"))
+        lease['expires'] = time.time() - 1
+        utils.write_json(lease, os.path.join(other.dir, w.name+".json"))
+        other._held = {}
+
+        self.svc.restart_workers()
+        self.svc.wait_for_all_workers(5)
+        self.assertFalse(w.has_queued_pods())
+        self.assertFalse(self.svc.leases.holds(w.name))
+        self.assertIsNone(self.svc.leases.holder(w.name))
+
+    def test_lease_lost(self):
+        w = self.svc._get_bagging_worker(self.midasid)
+        pod = utils.read_json(os.path.join(w.bagger.sip.revdatadir, "_pod.json"))
+        utils.write_json(pod, w.next_pod)
+        self.assertTrue(self.svc._hold_lease(w.name))
+
+        # the lease lapses (e.g. it could not be renewed) before the POD is applied
+        self.svc.leases._held.pop(w.name)
+        w.process_queue()
+        self.assertFalse(os.path.exists(w.bagger.bagdir))
+        self.assertTrue(w.has_queued_pods())
+        self.svc._release_lease(w.name)
+
+    def test_shared_lease(self):
+        other = leases.LeaseManager(self.svc.leases.dir)
+        self.assertTrue(self.svc._hold_lease("mds2-1491"))
+        self.assertTrue(self.svc._hold_lease("mds2-1491"))
+        self.svc._release_lease("mds2-1491")
+        self.assertTrue(self.svc.leases.holds("mds2-1491"))
+        self.assertFalse(other.acquire("mds2-1491"))
+        self.svc._release_lease("mds2-1491")
+        self.assertFalse(self.svc.leases.holds("mds2-1491"))
+
+        with self.svc._leased("mds2-1491"):
+            self.assertTrue(self.svc.leases.holds("mds2-1491"))
+        self.assertFalse(self.svc.leases.holds("mds2-1491"))
+
+        self.assertTrue(other.acquire("mds2-1491"))
+        with self.assertRaises(mdsvc.DatasetBusy):
+            with self.svc._leased("mds2-1491", 0.1):
+                pass
+        other.release("mds2-1491")
+
+    def test_queue_monitor(self):
+        self.assertTrue(self.svc._monitor.is_alive())
+        self.svc.shutdown(5)
+        self.assertIsNone(self.svc._monitor)
+
+        cfg = dict(self.defcfg)
+        cfg['leases'] = {'rescan_interval': 0}
+        svc = mdsvc.MIDAS3PublishingService(cfg, self.workdir, self.revdir, self.upldir)
+        try:
+            self.assertIsNone(svc._monitor)
+        finally:
+            svc.shutdown(5)
+
     def test_get_pod(self):
         podf = os.path.join(self.revdir, "1491", "_pod.json")
         pod = utils.read_json(podf)
@@ -99,6 +99,7 @@ class TestMIDAS3PublishingServiceDraft(test.TestCase):
 
     def tearDown(self):
         self.svc.wait_for_all_workers(300)
+        self.svc.shutdown(5)
         requests.delete(custbaseurl, headers={'Authorization': 'Bearer SECRET'})
         self.tf.clean()
 
@@ -164,6 +164,7 @@ class TestMIDAS3PublishingServicePreserve(test.TestCase):
 
     def tearDown(self):
         self.svc._drop_all_workers(300)
+        self.svc.shutdown(5)
         self.tf.clean()
         for f in os.listdir(mdarchive):
             os.remove(os.path.join(mdarchive, f))
@@ -199,6 +199,7 @@ class TestMIDAS3PublishingServiceOnUpdate(test.TestCase):
     def tearDown(self):
         if self.svc:
             self.svc._drop_all_workers(300)
+            self.svc.shutdown(5)
         self.tf.clean()
 
     def test_copy_oldbag_when_done(self):
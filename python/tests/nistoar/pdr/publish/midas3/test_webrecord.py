@@ -212,6 +212,66 @@ class TestWebRecorder(test.TestCase):
         self.assertEqual(data['a'], 1)
         self.assertEqual(data['b'], 2)
 
+    def test_set_body_file(self):
+        body = StringIO(json.dumps({"a": 1, "b": 2}, indent=2) + "\n")
+        body.read()
+
+        rec = self.rcrdr.start_record("POST", "/goob/gurn/")
+        rec.set_body_file(body)
+        data = json.loads(rec.body)
+        self.assertEqual(data['a'], 1)
+        rec.record()
+
+        recs = self.readlog()
+        self.assertEqual(len(recs), 1)
+        self.assertEqual(json.loads(recs[0]['body'])['b'], 2)
+
+    def test_from_wsgi_readbody(self):
+        env = {
+            'REQUEST_METHOD': "POST",
+            'PATH_INFO': '/goob/gurn/',
+            'CONTENT_LENGTH': '8',
+            'wsgi.input': StringIO('"goober" and more')
+        }
+        rec = self.rcrdr.from_wsgi(env, True)
+        self.assertEqual(rec.body, '"goober"')
+
+        # the body can be read again by the service
+        self.assertEqual(env['wsgi.input'].read(), '"goober"')
+
+    def test_from_wsgi_max_size(self):
+        env = {
+            'REQUEST_METHOD': "POST",
+            'PATH_INFO': '/goob/gurn/',
+            'wsgi.input': StringIO('"goober" and more')
+        }
+        with self.assertRaises(webrec.RequestTooLarge):
+            self.rcrdr.from_wsgi(env, True, 8)
+
+    def test_body_excerpt(self):
+        rec = self.rcrdr.start_record("POST", "/goob/gurn/", body="goober")
+        self.assertEqual(rec.body_excerpt(), ("goober", 6))
+        self.assertEqual(rec.body_excerpt(3), ("goo", 6))
+
+        body = StringIO("gurn and more")
+        body.read(2)
+        rec.set_body_file(body)
+        self.assertEqual(rec.body_excerpt(4), ("gurn", 13))
+        self.assertEqual(rec.body_excerpt(0), ("gurn and more", 13))
+        self.assertEqual(body.tell(), 2)
+
+    def test_record_truncated(self):
+        self.rcrdr.max_body_size = 10
+        self.rcrdr.recPOST("/foo/bar", body="0123456789abcdef")
+        self.rcrdr.recPOST("/foo/bar", body="0123456789")
+
+        recs = self.readlog()
+        self.assertEqual(len(recs), 2)
+        self.assertEqual(recs[0]['body'].strip(), "0123456789")
+        self.assertIn(webrec.TRUNCATED_HEADER+": 10 of 16 bytes recorded\n", recs[0]['headers'])
+        self.assertEqual(recs[1]['body'].strip(), "0123456789")
+        self.assertNotIn('headers', recs[1])
+
 
     def test_parser_ctor(self):
         self.rcrdr.recGET("/foo/bar?view=sum")
@@ -109,6 +109,7 @@ class TestDraftHandler(test.TestCase):
 
     def tearDown(self):
         self.svc._drop_all_workers(300)
+        self.svc.shutdown(5)
         requests.delete(custbaseurl, headers={'Authorization': 'Bearer SECRET'})
         self.tf.clean()
 
@@ -425,6 +426,7 @@ class TestMIDAS3PublishingApp(test.TestCase):
 
     def tearDown(self):
         self.svc._drop_all_workers(300)
+        self.svc.shutdown(5)
         requests.delete(custbaseurl, headers={'Authorization': 'Bearer SECRET'})
         self.tf.clean()
 
@@ -493,6 +495,26 @@ class TestMIDAS3PublishingApp(test.TestCase):
         self.assertIn("401 ", self.resp[0])
         self.assertEqual(body, [])
 
+    def test_metrics(self):
+        req = {
+            'REQUEST_METHOD': "GET",
+            'PATH_INFO': '/metrics',
+        }
+        body = self.web(req, self.start)
+        self.assertIn("401 ", self.resp[0])
+
+        self.resp = []
+        req['HTTP_AUTHORIZATION'] = 'Bearer secret'
+        body = self.web(req, self.start)
+        self.assertIn("200 ", self.resp[0])
+        self.assertIn("Content-Type: text/plain; version=0.0.4; charset=utf-8", self.resp)
+        self.assertIn("# TYPE pdr_preserv_stage_seconds histogram", body[0])
+
+        self.resp = []
+        req['PATH_INFO'] = '/metrics/goober'
+        body = self.web(req, self.start)
+        self.assertIn("404 ", self.resp[0])
+
     def test_latest_get(self):
         self.test_latest_post()
         self.resp = []
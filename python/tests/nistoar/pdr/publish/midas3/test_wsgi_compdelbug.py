@@ -90,6 +90,7 @@ class TestLatestHandlerBug(test.TestCase):
 
     def tearDown(self):
         self.svc.wait_for_all_workers(300)
+        self.svc.shutdown(5)
         self.tf.clean()
 
     def gethandler(self, path, env):
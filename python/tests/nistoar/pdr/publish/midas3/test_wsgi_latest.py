@@ -69,6 +69,7 @@ class TestLatestHandler(test.TestCase):
 
     def tearDown(self):
         self.svc.wait_for_all_workers(300)
+        self.svc.shutdown(5)
         self.tf.clean()
 
     def gethandler(self, path, env):
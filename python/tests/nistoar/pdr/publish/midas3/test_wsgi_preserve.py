@@ -172,6 +172,7 @@ class TestPreserveHandler(test.TestCase):
 
     def tearDown(self):
         self.svc._drop_all_workers(300)
+        self.svc.shutdown(5)
         self.tf.clean()
         for f in os.listdir(mdarchive):
             os.remove(os.path.join(mdarchive, f))
@@ -236,6 +237,30 @@ class TestPreserveHandler(test.TestCase):
         self.assertIn("400 ", self.resp[0])
         self.assertIn("Input not parseable as JSON:", "\n".join(body))
 
+    def test_preserve_toolarge(self):
+        req = {
+            'REQUEST_METHOD': "PUT",
+            'CONTENT_TYPE': 'application/json',
+            'CONTENT_LENGTH': '1000',
+            'PATH_INFO': 'midas/'+self.midasid,
+            'HTTP_AUTHORIZATION': 'Bearer secret'
+        }
+        req['wsgi.input'] = StringIO('{"identifier": "%s"}' % self.midasid)
+        self.hdlr = self.gethandler(req['PATH_INFO'], req)
+        self.hdlr.max_body_size = 100
+
+        # rejected based on the declared length
+        body = self.hdlr.handle()
+        self.assertIn("413 ", self.resp[0])
+        self.assertEqual(req['wsgi.input'].tell(), 0)
+
+        # rejected while reading
+        del req['CONTENT_LENGTH']
+        self.resp = []
+        self.hdlr.max_body_size = 10
+        body = self.hdlr.handle()
+        self.assertIn("413 ", self.resp[0])
+
 
     def test_preserve_wrongid(self):
         req = {
@@ -114,6 +114,7 @@ class TestMIDAS3PublishingApp(test.TestCase):
 
     def tearDown(self):
         self.svc._drop_all_workers(300)
+        self.svc.shutdown(5)
         requests.delete(custbaseurl, headers={'Authorization': 'Bearer SECRET'})
 
         if self.web._recorder:
@@ -1,5 +1,6 @@
-import os, sys, pdb, shutil, logging, json, re
+import os, sys, pdb, shutil, logging, json, re, time
 import unittest as test
+from copy import deepcopy
 from nistoar.testing import *
 from nistoar.pdr import def_jq_libdir
 
@@ -406,6 +407,170 @@ class TestConfigService(test.TestCase):
         self.assertEqual(config.ConfigService.extract(data, flat=True), out)
         
 
+    class FakeSession(object):
+        # stands in for a requests.Session, serving a configuration
+        class Resp(object):
+            def __init__(self, code, data=None, etag=None):
+                self.status_code = code
+                self._data = data
+                self.headers = {}
+                if etag:
+                    self.headers['ETag'] = etag
+            def raise_for_status(self):
+                if self.status_code >= 400:
+                    raise config.requests.exceptions.HTTPError(str(self.status_code))
+            def json(self):
+                return deepcopy(self._data)
+
+        def __init__(self, data):
+            self.data = data
+            self.etag = '"1"'
+            self.down = False
+            self.delay = 0
+            self.calls = []
+        def get(self, url, headers=None, timeout=None):
+            self.calls.append((url, dict(headers or {})))
+            if self.delay:
+                time.sleep(self.delay)
+            if self.down:
+                raise config.requests.exceptions.ConnectionError("service is down")
+            if headers and headers.get('If-None-Match') == self.etag:
+                return self.Resp(304)
+            return self.Resp(200, self.data, self.etag)
+
+    rawdata = {
+        "name": "pdr-publish", "profiles": ["test"],
+        "propertySources": [
+            { "name": "pdr-publish-test.yml",
+              "source": { "working_dir": "/data/pdr", "sip_type.midas.common.review_dir": "/rev" } },
+            { "name": "pdr-publish.yml",
+              "source": { "working_dir": "/tmp", "store_dir": "/store" } }
+        ]
+    }
+
+    def test_cached_get(self):
+        srvc = config.ConfigService("https://config.org/oar/", "test", ttl=3600)
+        sess = self.FakeSession(self.rawdata)
+        srvc._session = sess
+
+        cfg = srvc.get("pdr-publish")
+        self.assertEqual(cfg['working_dir'], "/data/pdr")
+        self.assertEqual(cfg['store_dir'], "/store")
+        self.assertEqual(cfg['sip_type']['midas']['common']['review_dir'], "/rev")
+        self.assertEqual(len(sess.calls), 1)
+
+        # served from the cache; changes to the returned data do not affect the cache
+        cfg['working_dir'] = "/goob"
+        cfg = srvc.get("pdr-publish")
+        self.assertEqual(cfg['working_dir'], "/data/pdr")
+        self.assertEqual(srvc.get("pdr-publish", flat=True)['sip_type.midas.common.review_dir'],
+                         "/rev")
+        self.assertEqual(len(sess.calls), 1)
+
+        # a forced refresh makes a conditional request
+        cfg = srvc.get("pdr-publish", refresh=True)
+        self.assertEqual(len(sess.calls), 2)
+        self.assertEqual(sess.calls[-1][1].get('If-None-Match'), '"1"')
+        self.assertEqual(cfg['working_dir'], "/data/pdr")
+
+        # falls back to the cached version when the service is down
+        sess.down = True
+        cfg = srvc.get("pdr-publish", refresh=True)
+        self.assertEqual(cfg['working_dir'], "/data/pdr")
+        with self.assertRaises(ConfigurationException):
+            srvc.get("pdr-goob")
+
+    def test_ttl(self):
+        srvc = config.ConfigService("https://config.org/oar/", "test", ttl=0)
+        sess = self.FakeSession(self.rawdata)
+        srvc._session = sess
+        srvc.get("pdr-publish")
+        srvc.get("pdr-publish")
+        srvc.wait_for_updates(5)
+        self.assertEqual(len(sess.calls), 2)
+
+        # a stale configuration is returned without waiting on the service
+        sess.delay = 1
+        start = time.time()
+        self.assertEqual(srvc.get("pdr-publish")['working_dir'], "/data/pdr")
+        self.assertLess(time.time() - start, 0.5)
+        srvc.wait_for_updates(5)
+        self.assertEqual(len(sess.calls), 3)
+
+    def test_snapshot(self):
+        tf = Tempfiles()
+        try:
+            cachedir = os.path.join(tf.mkdir("cfgcache"), "snaps")
+            srvc = config.ConfigService("https://config.org/oar/", "test", cachedir)
+            srvc._session = self.FakeSession(self.rawdata)
+            self.assertFalse(srvc.has_snapshot("pdr-publish"))
+            srvc.get("pdr-publish")
+            self.assertTrue(srvc.has_snapshot("pdr-publish"))
+            self.assertTrue(os.path.isfile(os.path.join(cachedir, "pdr-publish-test.json")))
+
+            # a new client can start from the snapshot while the service is down
+            srvc = config.ConfigService("https://config.org/oar/", "test", cachedir)
+            sess = self.FakeSession(self.rawdata)
+            sess.down = True
+            srvc._session = sess
+            cfg = srvc.get("pdr-publish")
+            self.assertEqual(cfg['working_dir'], "/data/pdr")
+            srvc.wait_for_updates(5)
+            self.assertEqual(len(sess.calls), 1)
+
+            # once the service has failed, the snapshot is used without waiting
+            cfg = srvc.get("pdr-publish")
+            self.assertEqual(cfg['working_dir'], "/data/pdr")
+            srvc.wait_for_updates(5)
+            self.assertEqual(len(sess.calls), 2)
+        finally:
+            tf.clean()
+
+    def test_snapshot_stale(self):
+        tf = Tempfiles()
+        try:
+            cachedir = os.path.join(tf.mkdir("cfgcache"), "snaps")
+            srvc = config.ConfigService("https://config.org/oar/", "test", cachedir)
+            srvc._session = self.FakeSession(self.rawdata)
+            srvc.get("pdr-publish")
+
+            # a new client consults the service rather than trust the snapshot
+            data = deepcopy(self.rawdata)
+            data['propertySources'][0]['source']['working_dir'] = "/data/pdr2"
+            srvc = config.ConfigService("https://config.org/oar/", "test", cachedir)
+            sess = self.FakeSession(data)
+            sess.etag = '"2"'
+            srvc._session = sess
+            cfg = srvc.get("pdr-publish")
+            self.assertEqual(cfg['working_dir'], "/data/pdr2")
+            self.assertEqual(len(sess.calls), 1)
+        finally:
+            tf.clean()
+
+    def test_watch(self):
+        srvc = config.ConfigService("https://config.org/oar/", "test", ttl=3600)
+        sess = self.FakeSession(self.rawdata)
+        srvc._session = sess
+        changes = []
+        srvc.watch("pdr-publish", lambda c, d: changes.append((c, d)))
+
+        srvc.get("pdr-publish")
+        srvc.refresh()
+        self.assertEqual(changes, [])
+
+        data = deepcopy(self.rawdata)
+        data['propertySources'][0]['source']['working_dir'] = "/data/pdr2"
+        sess.data = data
+        sess.etag = '"2"'
+        srvc.refresh()
+        self.assertEqual(len(changes), 1)
+        self.assertEqual(changes[0][0], "pdr-publish")
+        self.assertEqual(changes[0][1]['working_dir'], "/data/pdr2")
+        self.assertEqual(srvc.get("pdr-publish")['working_dir'], "/data/pdr2")
+
+        srvc.refresh()
+        self.assertEqual(len(changes), 1)
+
     def test_defservice(self):
         self.assertNotIn('OAR_CONFIG_SERVICE', os.environ)
         self.assertIsNone(config.service)
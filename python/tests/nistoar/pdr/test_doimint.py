@@ -169,6 +169,33 @@ class TestDOIMintingClientQuiet(test.TestCase):
         self.assertEqual(dcmd['url'], nerd['landingPage'])
         self.assertNotIn('event', dcmd)
 
+    def test_stage_all(self):
+        nerd = read_nerd(tstnerd)
+        nerd['doi'] = "doi:10.88888/goob"
+        nerd2 = read_nerd(tstnerd)
+        nerd2['@id'] = "ark:/88434/mds3-1001"
+        nerd2['doi'] = "doi:10.88888/gurn"
+
+        names = self.dmcli.stage_all([nerd, nerd2], False)
+        self.assertEqual(names, [os.path.basename(nerd['@id']), "mds3-1001"])
+        self.assertEqual(set(self.dmcli.staged_names()), set(names))
+
+        dcmd = read_json(os.path.join(self.workdir, "staging", names[0]+".json"))
+        self.assertEqual(dcmd['doi'], "10.88888/goob")
+        self.assertEqual(dcmd['url'], nerd['landingPage'])
+        self.assertNotIn('event', dcmd)
+        dcmd = read_json(os.path.join(self.workdir, "staging", "mds3-1001.json"))
+        self.assertEqual(dcmd['doi'], "10.88888/gurn")
+        self.assertNotIn('event', dcmd)
+
+        self.assertEqual(self.dmcli.stage_all([]), [])
+
+        # one bad record keeps all from getting staged
+        nerd3 = { "@id": "ark:/88434/mds3-1002" }
+        with self.assertRaises(NERDError):
+            self.dmcli.stage_all([nerd, nerd3])
+        self.assertNotIn("mds3-1002", self.dmcli.staged_names())
+
     def test_stage_names(self):
         nerd = read_nerd(tstnerd)
         nerd['doi'] = "doi:10.88888/goob"
@@ -259,6 +286,27 @@ class TestDOIMintingClientQuiet(test.TestCase):
 
         
 
+class TestRateLimiter(test.TestCase):
+
+    def test_wait(self):
+        lim = dm.RateLimiter(20)
+        self.assertAlmostEqual(lim.interval, 0.05)
+        start = time.time()
+        for i in range(5):
+            lim.wait()
+        self.assertGreaterEqual(time.time() - start, 0.19)
+
+    def test_burst(self):
+        lim = dm.RateLimiter(2, 4)
+        start = time.time()
+        for i in range(4):
+            lim.wait()
+        self.assertLess(time.time() - start, 0.4)
+
+    def test_badrate(self):
+        with self.assertRaises(ValueError):
+            dm.RateLimiter(0)
+
 class TestDOIMintingClientMockSrvr(test.TestCase):
 
     @classmethod
@@ -394,6 +442,34 @@ class TestDOIMintingClientMockSrvr(test.TestCase):
         self.assertTrue(doi.exists)
         self.assertEqual(doi.state, "draft")
 
+    def test_submit_all_threaded(self):
+        self.cfg['submit_threads'] = 3
+        self.cfg['max_request_rate'] = 50
+        self.dmcli = dm.DOIMintingClient(self.cfg)
+        self.assertEqual(self.dmcli._submit_threads, 3)
+        self.assertIsNotNone(self.dmcli._throttle)
+
+        nerds = []
+        for i in range(5):
+            nerd = read_nerd(tstnerd)
+            nerd['@id'] = "ark:/88434/mds3-200%d" % i
+            nerd['doi'] = "doi:10.88434/goob4%d" % i
+            nerds.append(nerd)
+        names = self.dmcli.stage_all(nerds, publish=False)
+        self.assertEqual(len(self.dmcli.staged_names()), 5)
+
+        res = self.dmcli.submit_all()
+        self.assertEqual(set(res['succeeded']), set(names))
+        self.assertEqual(len(res['failed']), 0)
+        self.assertEqual(len(res['skipped']), 0)
+        self.assertEqual(self.dmcli.staged_names(), [])
+
+        for i in range(5):
+            doi = self.dmcli.dccli.lookup("goob4%d" % i, relax=True)
+            self.assertTrue(doi.exists)
+            self.assertEqual(doi.state, "draft")
+            self.assertIn('reserved', self.dmcli.find_named(names[i]))
+
 
 if __name__ == '__main__':
     test.main()
@@ -1,5 +1,6 @@
 import os, sys, pdb, json, subprocess, threading, time, logging
 import unittest as test
+from collections import OrderedDict
 
 from nistoar.testing import *
 import nistoar.pdr.utils as utils
@@ -118,6 +119,64 @@ class TestMeausreDirSize(test.TestCase):
         self.assertEqual(vals[1], 5)
         self.assertEqual(vals[0], 9322)
 
+    def test_measure_parallel(self):
+        vals = utils.measure_dir_size(testdatadir2, max_workers=3)
+        self.assertEqual(vals[1], 5)
+        self.assertEqual(vals[0], 9322)
+
+class TestScanTree(test.TestCase):
+
+    def setUp(self):
+        self.tf = Tempfiles()
+        self.root = self.tf.mkdir("root")
+        for d in ["a/b", "a/_c", ".d", "e"]:
+            os.makedirs(os.path.join(self.root, d))
+        for f in ["x", ".y", "_z", "a/x", "a/b/x", "a/_c/x", ".d/x"]:
+            with open(os.path.join(self.root, f), 'w') as fd:
+                fd.write("goober!")
+        os.symlink(os.path.join(self.root, "a"), os.path.join(self.root, "e/link"))
+
+    def tearDown(self):
+        self.tf.clean()
+
+    def test_scan_dir(self):
+        ents = dict([(e.name, e) for e in utils.scan_dir(self.root)])
+        self.assertEqual(sorted(ents.keys()), [".d", ".y", "_z", "a", "e", "x"])
+        self.assertTrue(ents['a'].is_dir())
+        self.assertTrue(ents['x'].is_file())
+        self.assertEqual(ents['x'].stat().st_size, 7)
+        self.assertEqual(ents['x'].path, os.path.join(self.root, "x"))
+
+        ent = utils.StatEntry(os.path.join(self.root, "e"), "link")
+        self.assertTrue(ent.is_symlink())
+        self.assertTrue(ent.is_dir())
+        self.assertFalse(ent.is_dir(False))
+
+    def test_scan_tree(self):
+        files = sorted([p for p, e in utils.scan_tree(self.root)])
+        self.assertEqual(files, [".d/x", ".y", "_z", "a/_c/x", "a/b/x", "a/x", "x"])
+
+        dirs = sorted([p for p, e in utils.scan_tree(self.root, files=False, dirs=True)])
+        self.assertEqual(dirs, [".d", "a", "a/_c", "a/b", "e", "e/link"])
+
+        files = sorted([p for p, e in utils.scan_tree(self.root, skip_dot=True,
+                                                      skip_private=True)])
+        self.assertEqual(files, ["a/b/x", "a/x", "x"])
+
+        self.assertEqual(list(utils.scan_tree(os.path.join(self.root, "goob"))), [])
+        errs = []
+        list(utils.scan_tree(os.path.join(self.root, "goob"), onerror=errs.append))
+        self.assertEqual(len(errs), 1)
+
+    def test_scan_tree_parallel(self):
+        files = sorted([p for p, e in utils.scan_tree(self.root, dirs=True, max_workers=3)])
+        self.assertEqual(files, sorted([p for p, e in utils.scan_tree(self.root, dirs=True)]))
+
+        # abandoning the iteration early
+        it = utils.scan_tree(self.root, max_workers=2)
+        next(it)
+        it.close()
+
 class TestRmtree(test.TestCase):
 
     def setUp(self):
@@ -258,6 +317,101 @@ class TestLockedFile(test.TestCase):
 
         self.assertEqual(data, "tatroaor")
 
+    def test_registry_released(self):
+        base = utils.LockedFile.registered_lock_count()
+        lf = utils.LockedFile(self.lfile, 'w')
+        self.assertEqual(utils.LockedFile.registered_lock_count(), base)
+        with lf:
+            self.assertEqual(utils.LockedFile.registered_lock_count(), base+1)
+            with utils.LockedFile(self.rfile, 'w'):
+                self.assertEqual(utils.LockedFile.registered_lock_count(), base+2)
+            self.assertEqual(utils.LockedFile.registered_lock_count(), base+1)
+        self.assertEqual(utils.LockedFile.registered_lock_count(), base)
+
+        for i in range(20):
+            with utils.LockedFile(self.tf("f%d.txt" % i), 'w') as fd:
+                fd.write("x")
+        self.assertEqual(utils.LockedFile.registered_lock_count(), base)
+
+        # a failed open does not leave a lock behind
+        with self.assertRaises(IOError):
+            utils.LockedFile(os.path.join(self.tf.root, "goob", "gurn.txt")).open()
+        self.assertEqual(utils.LockedFile.registered_lock_count(), base)
+
+    def test_registry_shared_while_waiting(self):
+        # both threads must use the same lock even though the first releases it
+        # while the second is waiting
+        base = utils.LockedFile.registered_lock_count()
+        def f(who):
+            self.lockedop(who, 'w', 0.2)
+        t = self.OtherThread(f, 0.05)
+        with open(self.rfile,'w') as self.rfd:
+            t.start()
+            self.lockedop('t', 'w', 0.2)
+            t.join()
+        with open(self.rfile) as self.rfd:
+            self.assertEqual(self.rfd.read(), "tatroaor")
+        self.assertEqual(utils.LockedFile.registered_lock_count(), base)
+
+class TestLockStats(test.TestCase):
+
+    def setUp(self):
+        self.tf = Tempfiles()
+        self.statdir = self.tf.mkdir("preserv_status")
+        utils.LockedFile.stats.reset()
+        self.thresh = utils.LockedFile.slow_wait_threshold
+
+    def tearDown(self):
+        utils.LockedFile.slow_wait_threshold = self.thresh
+        utils.LockedFile.stats.reset()
+        self.tf.clean()
+
+    def test_lock_class_for(self):
+        self.assertEqual(utils.lock_class_for("/work/preserv_status/mds2-1000.json"), "status")
+        self.assertEqual(utils.lock_class_for("/work/podq/current/mds2-1000.json"), "podqueue")
+        self.assertEqual(utils.lock_class_for("/work/mdbags/mds2-1000/metadata/nerdm.json"),
+                         "metadata")
+        self.assertEqual(utils.lock_class_for("/work/sip/_pod.json"), "metadata")
+        self.assertEqual(utils.lock_class_for("/work/preserv.log"), "other")
+        self.assertEqual(utils.LockedFile("/work/goob.json", lock_class="goob").lock_class,
+                         "goob")
+
+    def test_stats(self):
+        sfile = os.path.join(self.statdir, "mds2-1000.json")
+        utils.write_json({"a": 1}, sfile)
+        utils.read_json(sfile)
+        with utils.LockedFile(self.tf("data.txt"), 'w') as fd:
+            time.sleep(0.1)
+
+        stats = utils.LockedFile.stats.snapshot()
+        self.assertEqual(list(stats.keys()), ["status", "other"])
+        self.assertEqual(stats['status']['acquired'], 2)
+        self.assertEqual(stats['status']['slow'], 0)
+        self.assertEqual(stats['other']['acquired'], 1)
+        self.assertGreaterEqual(stats['other']['hold_max'], 0.1)
+        self.assertGreaterEqual(stats['other']['hold_total'], stats['other']['hold_max'])
+
+        utils.LockedFile.stats.reset()
+        self.assertEqual(utils.LockedFile.stats.snapshot(), {})
+
+    def test_slow_wait(self):
+        utils.LockedFile.slow_wait_threshold = 0.1
+        lfile = self.tf("data.txt")
+        def f():
+            with utils.LockedFile(lfile, 'w'):
+                time.sleep(0.3)
+        t = threading.Thread(target=f)
+        t.start()
+        time.sleep(0.05)
+        with utils.LockedFile(lfile) as fd:
+            pass
+        t.join()
+
+        stats = utils.LockedFile.stats.snapshot()
+        self.assertEqual(stats['other']['acquired'], 2)
+        self.assertEqual(stats['other']['slow'], 1)
+        self.assertGreater(stats['other']['wait_max'], 0.1)
+
 class TestJsonIO(test.TestCase):
     # this class focuses on testing the locking of JSON file IO
     
@@ -347,6 +501,72 @@ class TestJsonIO(test.TestCase):
         self.assertIn('@id', self.td)
         self.assertEqual(self.td['foo'], 'bar')
 
+class TestJSONCodec(test.TestCase):
+
+    testdata = os.path.join(testdatadir3,
+                            "3A1EE2F169DD3B8CE0531A570681DB5D1491.json")
+
+    def setUp(self):
+        self.tf = Tempfiles()
+        self.jfile = self.tf("data.json")
+        self.codec = utils.get_json_codec()
+
+    def tearDown(self):
+        utils.set_json_codec("auto")
+        self.tf.clean()
+
+    def available_codecs(self):
+        out = []
+        for name in utils.json_codecs:
+            try:
+                out.append(utils.get_json_codec(name))
+            except utils.ConfigurationException:
+                pass
+        return out
+
+    def test_get(self):
+        self.assertTrue(isinstance(utils.get_json_codec("json"), utils.JSONCodec))
+        self.assertIs(utils.get_json_codec("auto"), self.codec)
+        self.assertIs(utils.get_json_codec(), self.codec)
+        with self.assertRaises(utils.ConfigurationException):
+            utils.get_json_codec("goober")
+
+    def test_set(self):
+        codec = utils.set_json_codec("json")
+        self.assertEqual(codec.name, "json")
+        self.assertIs(utils.get_json_codec(), codec)
+
+    def test_roundtrip(self):
+        with open(self.testdata) as fd:
+            orig = json.load(fd, object_pairs_hook=OrderedDict)
+
+        for codec in self.available_codecs():
+            utils.set_json_codec(codec.name)
+            for compact in (False, True):
+                utils.write_json(orig, self.jfile, compact=compact)
+                data = utils.read_json(self.jfile)
+                self.assertEqual(data, orig)
+                self.assertEqual(list(data.keys()), list(orig.keys()))
+                self.assertEqual(list(data['components'][1].keys()),
+                                 list(orig['components'][1].keys()))
+                self.assertTrue(isinstance(data['title'], unicode))
+
+    def test_compact(self):
+        data = utils.read_json(self.testdata)
+        for codec in self.available_codecs():
+            pretty = codec.dumps(data)
+            compact = codec.dumps(data, compact=True)
+            self.assertLess(len(compact), len(pretty))
+            self.assertNotIn("\n", compact)
+            self.assertTrue(pretty.startswith('{\n    "'))
+            self.assertEqual(codec.loads(compact), codec.loads(pretty))
+
+    def test_same_output(self):
+        # all backends should write byte-identical files
+        data = utils.read_json(self.testdata)
+        outs = set([c.dumps(data) for c in self.available_codecs()])
+        self.assertEqual(len(outs), 1)
+
     
 
 
@@ -0,0 +1,102 @@
+import os, sys, pdb, json, shutil, time
+import unittest as test
+from collections import OrderedDict
+
+from nistoar.testing import *
+from nistoar.pdr import def_schema_dir
+from nistoar.pdr.exceptions import ConfigurationException
+import nistoar.pdr.validation as val
+
+# datadir = nistoar/pdr/preserv/data
+datadir = os.path.join(os.path.dirname(__file__), "preserv", "data")
+nerdfile = os.path.join(datadir, "3A1EE2F169DD3B8CE0531A570681DB5D1491.json")
+podfile = os.path.join(datadir, "simplesip", "_pod.json")
+
+def setUpModule():
+    ensure_tmpdir()
+
+def tearDownModule():
+    rmtmpdir()
+
+def read_json(path):
+    with open(path) as fd:
+        return json.load(fd, object_pairs_hook=OrderedDict)
+
+class TestSchemaFlavor(test.TestCase):
+
+    def test_schema_flavor(self):
+        self.assertEqual(val.schema_flavor({"_schema": "x"}), "_")
+        self.assertEqual(val.schema_flavor({"$schema": "x"}), "$")
+        self.assertEqual(val.schema_flavor({"$extensionSchemas": []}), "$")
+        self.assertEqual(val.schema_flavor({"title": "x"}), "_")
+        self.assertEqual(val.schema_flavor("_"), "_")
+
+class TestValidatorCache(test.TestCase):
+
+    def setUp(self):
+        self.tf = Tempfiles()
+        self.schemadir = os.path.join(self.tf.mkdir("schemas"), "model")
+        shutil.copytree(def_schema_dir, self.schemadir)
+        self.cache = val.ValidatorCache()
+
+    def tearDown(self):
+        self.tf.clean()
+
+    def test_bad_dir(self):
+        with self.assertRaises(ConfigurationException):
+            self.cache.get(os.path.join(self.tf.root, "goober"))
+
+    def test_get(self):
+        v = self.cache.get(self.schemadir, "_")
+        self.assertEqual(self.cache.loads, 1)
+        self.assertIs(self.cache.get(self.schemadir, "_"), v)
+        self.assertIs(self.cache.get(self.schemadir, {"_schema": "x"}), v)
+        self.assertEqual(self.cache.loads, 1)
+        self.assertEqual(self.cache.hits, 2)
+
+        v2 = self.cache.get(self.schemadir, "$")
+        self.assertIsNot(v2, v)
+        self.assertEqual(self.cache.loads, 2)
+        self.assertEqual(len(self.cache), 2)
+
+        self.cache.clear()
+        self.assertEqual(len(self.cache), 0)
+        self.assertIsNot(self.cache.get(self.schemadir, "_"), v)
+
+    def test_reload_on_change(self):
+        v = self.cache.get(self.schemadir, "_")
+        schfile = [f for f in os.listdir(self.schemadir) if f.endswith(".json")][0]
+        schfile = os.path.join(self.schemadir, schfile)
+        mtime = os.stat(schfile).st_mtime
+        os.utime(schfile, (mtime+5, mtime+5))
+
+        self.assertIsNot(self.cache.get(self.schemadir, "_"), v)
+        self.assertEqual(self.cache.loads, 2)
+
+class TestValidate(test.TestCase):
+
+    def test_validate_pod(self):
+        pod = read_json(podfile)
+        self.assertEqual(val.validate(pod, schemauri=val.DEF_POD_DATASET_SCHEMA), [])
+
+        del pod['title']
+        self.assertNotEqual(val.validate(pod, schemauri=val.DEF_POD_DATASET_SCHEMA), [])
+
+    def test_validate_nerdm_parts(self):
+        nerd = read_json(nerdfile)
+        res = val.validate_nerdm_parts(nerd)
+        self.assertEqual(list(res.keys())[0], "")
+        self.assertEqual(len(res), len(nerd['components']) + 1)
+        self.assertIn("trial3/trial3a.json", res)
+        self.assertIn("#doi:10.18434/T4SW26", res)
+
+        del nerd['components'][1]['filepath']
+        del nerd['title']
+        res2 = val.validate_nerdm_parts(nerd)
+        self.assertGreater(len(res2[""]), len(res[""]))
+        self.assertGreater(len(res2["cmps/trial1.json"]), len(res["trial1.json"]))
+        self.assertEqual(len(res2["trial2.json"]), len(res["trial2.json"]))
+
+
+if __name__ == '__main__':
+    test.main()
@@ -19,6 +19,10 @@ These include:
                               If empty, the default configuration is returned.
    :param oar_config_appname str:  the application/component name for the 
                               configuration. 
+   :param oar_config_cache_dir str:  a directory where snapshots of the 
+                              configuration retrieved from the configuration 
+                              service are saved; if a snapshot exists, it will
+                              be used if the service is not available.
    :param oar_config_timeout int:  the number of seconds to wait for the 
                               configuration service to come up.
    :param oar_config_file str:  a local file path or remote URL that holds the 
@@ -60,6 +64,10 @@ This script also pays attention to the following environment variables:
    OAR_CONFIG_APP      The name of the component/application to retrieve 
                           configuration data for (default: pdr-publish);
                           this is only used if OAR_CONFIG_SERVICE is used.
+   OAR_CONFIG_CACHE_DIR  A directory where snapshots of the configuration are 
+                          saved and used as a fallback when the configuration
+                          service is unavailable; this is overridden by the 
+                          oar_config_cache_dir uwsgi variable.
 """
 import os, sys, logging, copy
 from copy import deepcopy
@@ -137,14 +145,22 @@ if confsrc:
     cfg = config.resolve_configuration(confsrc)
 elif 'oar_config_service' in uwsgi.opt:
     srvc = config.ConfigService(uwsgi.opt.get('oar_config_service'),
-                                uwsgi.opt.get('oar_config_env'))
-    srvc.wait_until_up(int(uwsgi.opt.get('oar_config_timeout', 10)),
-                       True, sys.stderr)
-    cfg = srvc.get(uwsgi.opt.get('oar_config_appname', 'pdr-publish'))
+                                uwsgi.opt.get('oar_config_env'),
+                                uwsgi.opt.get('oar_config_cache_dir',
+                                             os.environ.get('OAR_CONFIG_CACHE_DIR')))
+    appname = uwsgi.opt.get('oar_config_appname', 'pdr-publish')
+    if not srvc.has_snapshot(appname):
+        # with no saved snapshot to fall back on, we need the service up
+        srvc.wait_until_up(int(uwsgi.opt.get('oar_config_timeout', 10)), True, sys.stderr)
+    # ask the service for the current configuration; the snapshot is used 
+    # only if the service cannot be reached
+    cfg = srvc.get(appname, refresh=True)
 elif config.service:
-    config.service.wait_until_up(int(os.environ.get('OAR_CONFIG_TIMEOUT', 10)),
-                                 True, sys.stderr)
-    cfg = config.service.get(os.environ.get('OAR_CONFIG_APP', 'pdr-publish'))
+    appname = os.environ.get('OAR_CONFIG_APP', 'pdr-publish')
+    if not config.service.has_snapshot(appname):
+        config.service.wait_until_up(int(os.environ.get('OAR_CONFIG_TIMEOUT', 10)),
+                                     True, sys.stderr)
+    cfg = config.service.get(appname, refresh=True)
     cfg = extract_mdserv_config(cfg)
 elif is_in_test_mode():
     cfg = {}